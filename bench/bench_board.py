@@ -0,0 +1,52 @@
+# --- START OF FILE bench_board.py ---
+
+"""
+Бенчмарк табло отправлений.
+
+Запуск из корня проекта: python -m bench.bench_board
+Берёт остановки с наибольшим числом маршрутов и замеряет upcoming()
+для разных моментов суток.
+"""
+
+import argparse
+import time
+
+import utils
+from timetable.board import DepartureBoard
+from timetable.stop_index import StopIndex
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--stops", type=int, default=5, help="сколько самых загруженных остановок замерять")
+    arg_parser.add_argument("--iterations", type=int, default=20000)
+    arg_parser.add_argument("--limit", type=int, default=12)
+    args = arg_parser.parse_args()
+
+    sources = {"bus": utils.getBusSchedule(), "trolleybus": utils.getTrolleybusSchedule()}
+
+    started = time.perf_counter()
+    index = StopIndex(sources)
+    index_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    board = DepartureBoard(index, sources)
+    board_ms = (time.perf_counter() - started) * 1000
+    print(f"StopIndex: {len(index)} остановок за {index_ms:.1f} мс, DepartureBoard: {board_ms:.1f} мс")
+
+    hubs = sorted(range(len(index)), key=lambda key_id: -len(board.lines(key_id, "wd")))[:args.stops]
+    moments = [6 * 60, 8 * 60 + 30, 13 * 60, 17 * 60 + 45, 23 * 60 + 40, 24 * 60 + 30]
+
+    print(f"{'остановка':40} {'маршрутов':>9} {'мкс/запрос':>11}")
+    for key_id in hubs:
+        lines = len(board.lines(key_id, "wd"))
+        started = time.perf_counter()
+        for i in range(args.iterations):
+            board.upcoming(key_id, "wd", moments[i % len(moments)], args.limit)
+        per_query_us = (time.perf_counter() - started) / args.iterations * 1e6
+        print(f"{index.names[key_id][:40]:40} {lines:>9} {per_query_us:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_board.py ---
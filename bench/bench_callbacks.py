@@ -0,0 +1,175 @@
+# --- START OF FILE bench_callbacks.py ---
+
+"""
+Фаззинг и бенчмарк формата callback data (handlers/callbacks.py).
+
+Запуск из корня проекта: python -m bench.bench_callbacks [--cases 20000] [--seed 1]
+  - все кнопки по текущим снапшотам: encode -> decode возвращает тот же
+    объект, длина не больше 64 байт (максимум и средняя против строк
+    старого формата);
+  - случайные объекты всех действий (большие числа, номера с буквами):
+    обратимость;
+  - случайные и испорченные строки (обрезка, замена символа, мусор):
+    decode либо возвращает объект, либо бросает ValueError - и ничего другого;
+  - время encode, decode и прежнего разбора split("_") с проверками.
+"""
+
+import argparse
+import random
+import string
+import time
+
+from handlers import callbacks
+from timetable import snapshot
+
+NUMBER_ALPHABET = string.digits + "кдКДаб "
+
+
+def _legacy_string(payload) -> str | None:
+    """Строка старого формата для того же действия (для сравнения длины)."""
+    if isinstance(payload, callbacks.Stop):
+        return f"stop_{payload.transport_type}_{payload.number}_{payload.route_idx}_{payload.stop_ref}_{payload.day_type}"
+    if isinstance(payload, callbacks.ToggleDay):
+        return (f"toggle_day_{payload.transport_type}_{payload.number}_{payload.route_idx}_"
+                f"{payload.stop_ref}_{payload.day_type}_{int(payload.from_favorites)}")
+    if isinstance(payload, callbacks.Route):
+        return f"route_{payload.transport_type}_{payload.number}_{payload.route_idx}"
+    return None
+
+
+def _legacy_parse(data: str):
+    """Как разбирали toggle_day_... хендлеры до общего формата."""
+    parts = data.split("_")
+    if len(parts) != 8:
+        raise ValueError("Incorrect toggle callback data parts")
+    if parts[6] not in ("wd", "we"):
+        raise ValueError(parts[6])
+    return parts[3], int(parts[4]), parts[5], parts[6], bool(int(parts[7]))
+
+
+def snapshot_payloads() -> list:
+    """Кнопки остановок и переключения дня для всех остановок текущих снапшотов."""
+    payloads = []
+    for kind, name in ((snapshot.KIND_BUS, "bus_schedule"), (snapshot.KIND_TROLLEYBUS, "trolleybus_schedule")):
+        # Снапшоты не хранятся в git - при первом запуске собираются из JSON
+        snap = snapshot.load_or_convert(f"data/{name}.snap", f"data/{name}.json", kind)
+        if snap is None:
+            print(f"data/{name}.snap: не открыт, пропускаем")
+            continue
+        for number in snap:
+            for day_type in callbacks.DAY_TYPES:
+                for route_idx, route in enumerate(snap.vehicle(number).routes(day_type)):
+                    payloads.append(callbacks.Route(kind, number, route_idx))
+                    for stop_idx, stop in enumerate(route.stops):
+                        ref = f"s{stop.stop_id}" if stop.stop_id else str(stop_idx)
+                        payloads.append(callbacks.Stop(kind, number, route_idx, ref, day_type))
+                        payloads.append(callbacks.ToggleDay(kind, number, route_idx, ref, day_type, True))
+    return payloads
+
+
+def _random_value(rng: random.Random, kind: str):
+    big = rng.choice((10, 1000, 1 << 20))
+    if kind == "uint":
+        return rng.randrange(big)
+    if kind == "bool":
+        return rng.random() < 0.5
+    if kind == "transport":
+        return rng.choice(callbacks.TRANSPORT_TYPES)
+    if kind == "day":
+        return rng.choice(callbacks.DAY_TYPES)
+    if kind == "number":
+        if rng.random() < 0.5:
+            return str(rng.randrange(big))
+        return "".join(rng.choice(NUMBER_ALPHABET) for _ in range(rng.randint(1, 6)))
+    if kind == "ref":
+        return f"s{rng.randrange(big)}" if rng.random() < 0.7 else str(rng.randrange(big))
+    raise ValueError(kind)
+
+
+def random_payloads(rng: random.Random, count: int) -> list:
+    actions = list(callbacks._FIELD_KINDS.items())
+    payloads = []
+    for _ in range(count):
+        cls, kinds = rng.choice(actions)
+        payloads.append(cls(*(_random_value(rng, kind) for kind in kinds)))
+    return payloads
+
+
+def mutations(rng: random.Random, data: str) -> list[str]:
+    alphabet = string.ascii_letters + string.digits + "-_=+/ ёж"
+    position = rng.randrange(len(data))
+    return [
+        data[:position],
+        data[:position] + rng.choice(alphabet) + data[position + 1:],
+        data + rng.choice(alphabet),
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 70))),
+    ]
+
+
+def fuzz(rng: random.Random, cases: int) -> tuple[int, int, int]:
+    """(проверено объектов, испорченных строк, из них разобрано без ошибки)."""
+    payloads = snapshot_payloads() + random_payloads(rng, cases)
+    checked = corrupted = accepted = 0
+    for payload in payloads:
+        try:
+            data = callbacks.encode(payload)
+        except ValueError:
+            # Допустимо только для слишком длинных номеров
+            assert len(payload) and any(isinstance(value, str) and len(value.encode()) > 30 for value in payload), payload
+            continue
+        assert len(data) <= callbacks.MAX_CALLBACK_BYTES, (payload, data)
+        assert callbacks.decode(data) == payload, (payload, data)
+        checked += 1
+        for broken in mutations(rng, data):
+            corrupted += 1
+            try:
+                result = callbacks.parse(broken)
+            except ValueError:
+                continue
+            assert type(result) in callbacks._FIELD_KINDS, (broken, result)
+            accepted += 1
+    return checked, corrupted, accepted
+
+
+def _per_call(function, items, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            function(item)
+    return (time.perf_counter() - started) / (repeat * len(items)) * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--cases", type=int, default=20000, help="случайных объектов для фаззинга")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--repeat", type=int, default=5, help="проходов при замере времени")
+    args = arg_parser.parse_args()
+    rng = random.Random(args.seed)
+
+    checked, corrupted, accepted = fuzz(rng, args.cases)
+    print(f"фаззинг: {checked} объектов обратимы; {corrupted} испорченных строк - "
+          f"{corrupted - accepted} отклонены ValueError, {accepted} разобраны в корректные объекты")
+
+    buttons = snapshot_payloads()
+    if not buttons:
+        return
+    encoded = [callbacks.encode(payload) for payload in buttons]
+    legacy = [text for text in map(_legacy_string, buttons) if text]
+    print(f"кнопки снапшотов: {len(buttons)}, длина нового формата: макс {max(map(len, encoded))}, "
+          f"средняя {sum(map(len, encoded)) / len(encoded):.1f}; старого: макс {max(map(len, legacy))}, "
+          f"средняя {sum(map(len, legacy)) / len(legacy):.1f} байт")
+
+    toggles = [payload for payload in buttons if isinstance(payload, callbacks.ToggleDay)]
+    toggle_data = [callbacks.encode(payload) for payload in toggles]
+    toggle_legacy = [_legacy_string(payload) for payload in toggles]
+    print(f"encode: {_per_call(callbacks.encode, toggles, args.repeat):.2f} мкс, "
+          f"decode: {_per_call(callbacks.decode, toggle_data, args.repeat):.2f} мкс, "
+          f"разбор старой строки (decode_legacy): {_per_call(callbacks.decode_legacy, toggle_legacy, args.repeat):.2f} мкс, "
+          f"split('_') в хендлере: {_per_call(_legacy_parse, toggle_legacy, args.repeat):.2f} мкс")
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_callbacks.py ---
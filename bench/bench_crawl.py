@@ -0,0 +1,109 @@
+# --- START OF FILE bench_crawl.py ---
+
+"""
+Бенчмарк обхода сайта на записанных страницах.
+
+Запуск из корня проекта: python -m bench.bench_crawl [--fixture DIR] [--latency 50]
+Без --fixture страницы собираются из сохранённого расписания во временный
+каталог (см. bench.replay). Поднимает локальный сервер воспроизведения и
+замеряет для каждого бэкенда разбора:
+  - полный обход (fetcher.refresh без текущих данных) и повторный
+    инкрементальный обход (304 / совпадение хэша);
+  - совпадение результата с reference.json (исходный парсер, bs4);
+и затем время разбора каждой страницы обоими бэкендами и пиковую память
+(RSS процесса и процессов пула разбора).
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from bench import bench_parsers
+from bench.replay import KINDS, Fixture, ReplayServer, synthesize
+from parsers import crawl_state, fetcher, html_backend
+
+
+def _peak_rss_mb(who) -> float:
+    return resource.getrusage(who).ru_maxrss / 1024  # в Linux ru_maxrss в килобайтах
+
+
+def _crawl(server: ReplayServer, kind: str, state_dir: str, current=None):
+    index_path, parse_index, process_page = KINDS[kind]
+    state = crawl_state.CrawlState(os.path.join(state_dir, f"{kind}.crawl.json"))
+    requests_before = server.requests
+    started = time.perf_counter()
+    results, changed = fetcher.run(
+        fetcher.refresh(index_path, parse_index, process_page, current, state, base_url=server.base_url)
+    )
+    return results, changed, time.perf_counter() - started, server.requests - requests_before
+
+
+def _same(results: list, expected: list) -> bool:
+    dump = lambda value: json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return dump(results) == dump(expected)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--fixture", help="каталог, записанный python -m bench.replay capture")
+    arg_parser.add_argument("--latency", type=float, default=50.0, help="задержка ответа сервера, мс")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="повторов при замере разбора страниц")
+    args = arg_parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_crawl_")
+    if args.fixture:
+        fixture = Fixture(args.fixture)
+    else:
+        fixture = synthesize(os.path.join(work_dir, "fixture"))
+    if fixture.load_reference() is None:
+        fixture.write_reference()
+    reference = fixture.load_reference()
+    print(f"Страниц в записи: {len(fixture.manifest)}, задержка сервера {args.latency:.0f} мс")
+
+    server = ReplayServer(fixture, latency=args.latency / 1000).start_in_thread()
+    ok = True
+    print(f"{'бэкенд':8} {'тип':12} {'полный, с':>10} {'запросов':>9} {'повторный, с':>13} {'304':>5} {'совпадает':>10}")
+    try:
+        for backend in html_backend.BACKENDS:
+            html_backend.set_backend(backend)  # пул разбора создаётся fork-ом и наследует выбор
+            for kind in KINDS:
+                state_dir = os.path.join(work_dir, backend)
+                os.makedirs(state_dir, exist_ok=True)
+                results, _, full_time, full_requests = _crawl(server, kind, state_dir)
+                not_modified_before = server.not_modified
+                current = {result["number"]: result for result in results}
+                again, changed, again_time, _ = _crawl(server, kind, state_dir, current)
+                same = _same(results, reference[kind]) and _same(again, results) and changed == 0
+                ok &= same
+                print(f"{backend:8} {kind:12} {full_time:>10.2f} {full_requests:>9} {again_time:>13.2f} "
+                      f"{server.not_modified - not_modified_before:>5} {'да' if same else 'НЕТ':>10}")
+    finally:
+        server.stop_thread()
+        html_backend.set_backend(html_backend.BACKENDS[0])
+
+    print()
+    timings, mismatches = bench_parsers.measure(
+        bench_parsers.pages_from_dir(os.path.join(fixture.directory, "pages")), args.repeat
+    )
+    bench_parsers.print_timings(timings)
+    if mismatches:
+        ok = False
+        print(f"Результаты бэкендов различаются: {', '.join(mismatches)}")
+
+    print()
+    print(f"Пиковая память: процесс {_peak_rss_mb(resource.RUSAGE_SELF):.0f} МБ, "
+          f"процессы разбора {_peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} МБ")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_crawl.py ---
@@ -0,0 +1,111 @@
+# --- START OF FILE bench_delivery.py ---
+
+"""
+Исходящие запросы под нагрузкой: напрямую и через delivery.outbound.OutboundQueue.
+
+Запуск из корня проекта: python -m bench.bench_delivery [--chats 40] [--bulk 200]
+В процессе поднимается bench/fake_bot_api.py (лимиты как у Telegram: 1/с на чат
+с запасом 3, 30/с всего; превышение - 429 с retry_after). Одновременно:
+  - --chats пользователей открывают список (2 новых сообщения, NORMAL) и
+    быстро листают его (--edits правок, INTERACTIVE, каждые 0.1 с);
+  - рассылка по --bulk чатам (по сообщению, BULK).
+Для каждого режима печатаются ответы 429 от сервера, запросы, завершившиеся
+ошибкой, общее время и задержка от вызова до ответа (p50/p99) по видам
+запросов. Без очереди часть запросов теряется на 429; с очередью 429 нет, а
+правки не ждут окончания рассылки.
+"""
+
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from bench.fake_bot_api import FakeBotAPI, start_server
+from delivery import outbound
+
+
+def _percentile(samples: list[float], share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] * 1000 if ordered else 0.0
+
+
+async def _timed(results: dict, kind: str, call):
+    started = time.perf_counter()
+    try:
+        await call
+    except Exception:
+        results[kind]["failed"] += 1
+    else:
+        results[kind]["latency"].append(time.perf_counter() - started)
+
+
+async def _user(bot: Bot, results: dict, chat_id: int, edits: int):
+    await _timed(results, "send", bot.send_message(chat_id, "Выберите автобус"))
+    await _timed(results, "send", bot.send_message(chat_id, "Список, стр. 1"))
+    edit_tasks = []
+    for page in range(edits):
+        edit_tasks.append(asyncio.create_task(
+            _timed(results, "edit", bot.edit_message_text(f"Список, стр. {page + 2}", chat_id=chat_id, message_id=1))))
+        await asyncio.sleep(0.1)
+    await asyncio.gather(*edit_tasks)
+
+
+async def _broadcast(bot: Bot, results: dict, first_chat: int, count: int):
+    with outbound.priority(outbound.BULK):
+        await asyncio.gather(*(_timed(results, "bulk", bot.send_message(first_chat + i, "Напоминание"))
+                               for i in range(count)))
+
+
+async def run_mode(with_queue: bool, chats: int, bulk: int, edits: int, latency: float):
+    api = FakeBotAPI(latency=latency)
+    runner, base_url = await start_server(api)
+    bot = Bot("42:BENCH", session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+    queue = None
+    if with_queue:
+        queue = outbound.OutboundQueue()
+        bot.session.middleware(queue)
+    results = {kind: {"latency": [], "failed": 0} for kind in ("edit", "send", "bulk")}
+    started = time.perf_counter()
+    try:
+        # Рассылка стартует первой и забивает общий лимит - пользователи приходят во время неё
+        broadcast = asyncio.create_task(_broadcast(bot, results, 10_000, bulk))
+        await asyncio.sleep(0.05)
+        await asyncio.gather(*(_user(bot, results, 1 + i, edits) for i in range(chats)), broadcast)
+        total = time.perf_counter() - started
+        if queue is not None:
+            await queue.close()
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+    print(f"{'очередь' if with_queue else 'напрямую'}: {len(api.log)} запросов к API, "
+          f"429: {api.count(429)}, общее время {total:.1f} с"
+          + (f", повторов {queue.retried}, max глубина {queue.max_depth}" if queue else ""))
+    for kind, result in results.items():
+        samples = result["latency"]
+        print(f"  {kind:>5}: ok {len(samples):>4}, ошибок {result['failed']:>4}, "
+              f"p50 {_percentile(samples, 0.5):>7.0f} мс, p99 {_percentile(samples, 0.99):>7.0f} мс")
+
+
+async def run(args):
+    for with_queue in (False, True):
+        await run_mode(with_queue, args.chats, args.bulk, args.edits, args.latency_ms / 1000)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--chats", type=int, default=40, help="пользователей, листающих список")
+    arg_parser.add_argument("--edits", type=int, default=4, help="правок на пользователя")
+    arg_parser.add_argument("--bulk", type=int, default=200, help="чатов в рассылке")
+    arg_parser.add_argument("--latency-ms", type=float, default=30.0, help="задержка ответа сервера")
+    args = arg_parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_delivery.py ---
@@ -0,0 +1,121 @@
+# --- START OF FILE bench_dispatch.py ---
+
+"""
+Стоимость выбора хендлера колбэка в зависимости от числа хендлеров.
+
+Запуск из корня проекта: python -m bench.bench_dispatch [--sizes 10,50,200,1000] [--updates 2000]
+Для каждого N регистрируются N хендлеров тремя способами и через
+Dispatcher.feed_update (без сети, хендлер ничего не делает) прогоняются
+колбэки к первому, среднему и последнему из них:
+  startswith - прежняя схема: F.data.startswith(префикс) на роутерах aiogram;
+  On         - разобранный payload и фильтр callbacks.On на роутерах aiogram;
+  router     - callbacks.CallbackRouter: выбор по словарю в middleware.
+Печатается время на апдейт (мкс) - с ростом N у первых двух оно растёт
+линейно (для последнего хендлера), у router остаётся постоянным.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from handlers import callbacks
+
+ROUTERS = 3  # хендлеры делятся между роутерами, как bus/trolleybus/favorites
+USER = User(id=1, is_bot=False, first_name="bench")
+
+
+async def _noop(callback: CallbackQuery):
+    return True
+
+
+def _number(i: int) -> str:
+    return str(i)
+
+
+def build_startswith(size: int) -> tuple[Dispatcher, list[str]]:
+    dp = Dispatcher()
+    routers = [Router() for _ in range(ROUTERS)]
+    data = []
+    for i in range(size):
+        routers[i % ROUTERS].callback_query.register(_noop, F.data.startswith(f"h{i}_"))
+        data.append(f"h{i}_{_number(i)}_0_s12_wd")
+    for router in routers:
+        dp.include_router(router)
+    return dp, data
+
+
+def build_filters(size: int) -> tuple[Dispatcher, list[str]]:
+    dp = Dispatcher()
+    dp.callback_query.outer_middleware(callbacks.PayloadMiddleware())
+    routers = [Router() for _ in range(ROUTERS)]
+    data = []
+    for i in range(size):
+        routers[i % ROUTERS].callback_query.register(_noop, callbacks.On(callbacks.Vehicle, number=_number(i)))
+        data.append(callbacks.encode(callbacks.Vehicle("bus", _number(i))))
+    for router in routers:
+        dp.include_router(router)
+    return dp, data
+
+
+def build_router(size: int) -> tuple[Dispatcher, list[str]]:
+    dp = Dispatcher()
+    callback_router = callbacks.CallbackRouter()
+    data = []
+    for i in range(size):
+        callback_router.register(callbacks.Vehicle, _noop, number=_number(i))
+        data.append(callbacks.encode(callbacks.Vehicle("bus", _number(i))))
+    callback_router.setup(dp)
+    return dp, data
+
+
+SCHEMES = {"startswith": build_startswith, "On": build_filters, "router": build_router}
+
+
+def _update(update_id: int, data: str, bot: Bot) -> Update:
+    message = Message(message_id=1, date=0, chat=Chat(id=1, type="private"), text="x")
+    callback = CallbackQuery(id=str(update_id), from_user=USER, chat_instance="bench", data=data, message=message)
+    return Update(update_id=update_id, callback_query=callback).as_(bot)
+
+
+async def measure(dp: Dispatcher, bot: Bot, data: str, updates: int) -> float:
+    batch = [_update(i, data, bot) for i in range(updates)]
+    result = await dp.feed_update(bot, batch[0])
+    assert result is True, f"Хендлер не вызван для {data!r}: {result!r}"
+    started = time.perf_counter()
+    for update in batch:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / updates * 1e6
+
+
+async def run(sizes: list[int], updates: int, repeat: int):
+    bot = Bot("42:BENCH")
+    try:
+        print(f"{'N':>6} {'схема':>11} {'первый':>9} {'средний':>9} {'последний':>10}   мкс на апдейт")
+        for size in sizes:
+            for name, build in SCHEMES.items():
+                dp, data = build(size)
+                cells = []
+                for target in (data[0], data[size // 2], data[-1]):
+                    cells.append(statistics.median([await measure(dp, bot, target, updates) for _ in range(repeat)]))
+                print(f"{size:>6} {name:>11} {cells[0]:>9.1f} {cells[1]:>9.1f} {cells[2]:>10.1f}")
+    finally:
+        await bot.session.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sizes", default="10,50,200,1000", help="числа хендлеров через запятую")
+    arg_parser.add_argument("--updates", type=int, default=2000, help="апдейтов на замер")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="замеров (берётся медиана)")
+    args = arg_parser.parse_args()
+    asyncio.run(run([int(size) for size in args.sizes.split(",")], args.updates, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_dispatch.py ---
@@ -0,0 +1,145 @@
+# --- START OF FILE bench_model.py ---
+
+"""
+Память и скорость доступа: словари из JSON против снапшота.
+
+Запуск из корня проекта: python -m bench.bench_model [--iterations 3]
+Для каждого типа транспорта сравнивает:
+  - память (tracemalloc) дерева словарей из JSON-файла парсеров и
+    снапшота после обхода всех названий (таблица строк раскодирована);
+    сам файл снапшота отображён через mmap и в tracemalloc не виден -
+    его размер показан отдельно (страницы общие для всех процессов);
+  - сколько объектов-строк занимают названия и времена в словарях и сколько
+    уникальных значений хранит снапшот;
+  - время доступа к остановке, как в show_schedule_details: цепочка ключей
+    словарей, те же ключи через Mapping снапшота и типизированный доступ.
+"""
+
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from parsers import bus_parser, trolleybus_parser
+from timetable import departures, snapshot
+
+SOURCES = {
+    snapshot.KIND_BUS: bus_parser.BUS_SCHEDULE,
+    snapshot.KIND_TROLLEYBUS: trolleybus_parser.TROLLEYBUS_SCHEDULE,
+}
+DAY_KEYS = {"wd": "route_weekdays", "we": "route_weekends"}
+
+
+def _traced(build):
+    """Результат build() и прирост памяти в tracemalloc, пока результат жив."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def load_dicts(path: str) -> dict:
+    """Как загружал старый utils: {номер: транспорт} из JSON-файла парсеров."""
+    with open(path, "r", encoding="utf-8") as f:
+        return {vehicle["number"]: vehicle for vehicle in json.load(f)}
+
+
+def open_snapshot(path: str) -> snapshot.Snapshot:
+    snap = snapshot.Snapshot.open(path)
+    for number in snap:  # раскодировать все строки, как после работы бота
+        vehicle = snap.vehicle(number)
+        vehicle.route_name
+        for day_type in DAY_KEYS:
+            for route in vehicle.routes(day_type):
+                route.name
+                for stop in route.stops:
+                    stop.name
+    return snap
+
+
+def stop_keys(snap: snapshot.Snapshot) -> list[tuple]:
+    keys = []
+    for number in snap:
+        vehicle = snap.vehicle(number)
+        for day_type in DAY_KEYS:
+            for route_idx, route in enumerate(vehicle.routes(day_type)):
+                keys.extend((number, day_type, route_idx, stop_idx) for stop_idx in range(len(route.stops)))
+    return keys
+
+
+def _dict_stop(data, number, day_type, route_idx, stop_idx):
+    stop = data[number].get(DAY_KEYS[day_type], [])[route_idx].get("stops", [])[stop_idx]
+    return stop.get("name"), departures.stop_minutes(stop)
+
+
+def _typed_stop(snap, number, day_type, route_idx, stop_idx):
+    stop = snap.stop(number, day_type, route_idx, stop_idx)
+    return stop.name, stop.minutes
+
+
+def _time_lookups(lookup, data, keys, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for key in keys:
+            lookup(data, *key)
+    return (time.perf_counter() - started) / (iterations * len(keys)) * 1e6
+
+
+def _count_strings(data: dict) -> tuple[int, int, int, int]:
+    """(объектов-названий, уникальных названий, объектов-времён, уникальных массивов времён)."""
+    names, times, runs = [], 0, set()
+    for vehicle in data.values():
+        names.append(vehicle.get("route_name"))
+        for routes_key in DAY_KEYS.values():
+            for route in vehicle.get(routes_key) or []:
+                names.append(route.get("name"))
+                for stop in route.get("stops") or []:
+                    names.append(stop.get("name"))
+                    times += len(stop.get("times") or [])
+                    runs.add(tuple(snapshot.normalize_times(stop.get("times") or [])))
+    return len(names), len(set(names)), times, len(runs)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--iterations", type=int, default=3, help="проходов по всем остановкам при замере доступа")
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_model_")
+    for kind, json_path in SOURCES.items():
+        if not json_path or not os.path.exists(json_path):
+            print(f"{kind}: нет JSON-файла расписания, пропускаем")
+            continue
+        snap_path = snapshot.convert_json(json_path, os.path.join(work_dir, f"{kind}.snap"), kind)
+        dicts, dicts_size = _traced(lambda: load_dicts(json_path))
+        snap, snap_size = _traced(lambda: open_snapshot(snap_path))
+        names, unique_names, times, unique_runs = _count_strings(dicts)
+        stored_times = len(snap._times)
+
+        print(f"=== {kind}: {len(snap)} маршрутов ===")
+        print(f"  словари из JSON:   {dicts_size / 1024:>8.0f} КБ в куче")
+        print(f"  снапшот:           {snap_size / 1024:>8.0f} КБ в куче + {os.path.getsize(snap_path) / 1024:.0f} КБ mmap (общие)")
+        print(f"  названия: {names} строк в словарях, {unique_names} уникальных (интернированы в снапшоте)")
+        print(f"  времена: {times} строк 'HH:MM' в словарях, в снапшоте {stored_times} uint16 "
+              f"({unique_runs} уникальных массивов)")
+
+        keys = stop_keys(snap)
+        dict_us = _time_lookups(_dict_stop, dicts, keys, args.iterations)
+        mapping_us = _time_lookups(_dict_stop, snap, keys, args.iterations)
+        typed_us = _time_lookups(_typed_stop, snap, keys, args.iterations)
+        print(f"  доступ к остановке (мкс): словари {dict_us:.2f}, снапшот через ключи {mapping_us:.2f}, "
+              f"типизированный {typed_us:.2f}")
+        snap.close()
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_model.py ---
@@ -0,0 +1,105 @@
+# --- START OF FILE bench_parsers.py ---
+
+"""
+Бенчмарк HTML-бэкендов парсеров (bs4 и lxml).
+
+Запуск из корня проекта: python -m bench.bench_parsers [--pages DIR]
+Без --pages страницы собираются из сохранённого расписания (bench.synthetic_pages),
+с --pages разбираются записанные страницы *.html из каталога. Для каждой
+страницы результат обоих бэкендов сравнивается побайтно (JSON), время
+разбора - медиана по повторам.
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+from bench import synthetic_pages
+from parsers import bus_parser, trolleybus_parser, html_backend
+
+
+def pages_from_dir(path: str) -> list[tuple[str, str, str]]:
+    pages = []
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.endswith(".html"):
+            continue
+        with open(os.path.join(path, file_name), "r", encoding="utf-8") as f:
+            html = f.read()
+        if bus_parser.TITLE_RE.search(html):
+            pages.append(("bus", file_name, html))
+        elif trolleybus_parser.TITLE_RE.search(html):
+            pages.append(("trolleybus", file_name, html))
+    return pages
+
+
+def synthetic_pages_list() -> list[tuple[str, str, str]]:
+    pages = [("bus", bus["number"], synthetic_pages.bus_page(bus))
+             for bus in synthetic_pages.load_json(bus_parser.BUS_SCHEDULE)]
+    pages += [("trolleybus", trolleybus["number"], synthetic_pages.trolleybus_page(trolleybus))
+              for trolleybus in synthetic_pages.load_json(trolleybus_parser.TROLLEYBUS_SCHEDULE)]
+    return pages
+
+
+def _parse(kind: str, html: str, backend: str):
+    if kind == "bus":
+        return bus_parser.parseSchedule(html, backend=backend)
+    return trolleybus_parser.parseSchedule(html, "", backend=backend)
+
+
+def measure(pages: list[tuple[str, str, str]], repeat: int = 5):
+    """Медианное время разбора каждой страницы обоими бэкендами и список страниц, где результаты различаются."""
+    timings = {backend: {"bus": [], "trolleybus": []} for backend in html_backend.BACKENDS}
+    mismatches = []
+    for kind, name, html in pages:
+        outputs = {}
+        for backend in html_backend.BACKENDS:
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                outputs[backend] = _parse(kind, html, backend)
+                samples.append(time.perf_counter() - started)
+            timings[backend][kind].append(statistics.median(samples) * 1000)
+        dumps = {json.dumps(result, ensure_ascii=False) for result in outputs.values()}
+        if len(dumps) != 1:
+            mismatches.append(f"{kind} {name}")
+    return timings, mismatches
+
+
+def print_timings(timings: dict):
+    print(f"{'бэкенд':8} {'тип':12} {'страниц':>7} {'мс/стр (медиана)':>17} {'мс/стр (макс)':>14} {'всего, мс':>10}")
+    for backend, kinds in timings.items():
+        for kind, values in kinds.items():
+            if values:
+                print(f"{backend:8} {kind:12} {len(values):>7} {statistics.median(values):>17.2f} "
+                      f"{max(values):>14.2f} {sum(values):>10.1f}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--pages", help="каталог с записанными страницами *.html")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+    # Предупреждения парсеров о неполных таблицах одинаковы для обоих бэкендов
+    logging.getLogger().setLevel(logging.ERROR)
+
+    pages = pages_from_dir(args.pages) if args.pages else synthetic_pages_list()
+    if not pages:
+        sys.exit("Нет страниц для разбора")
+
+    timings, mismatches = measure(pages, args.repeat)
+    print(f"Страниц: {len(pages)} ({sum(len(html) for _, _, html in pages) / 1024:.0f} КБ)")
+    print_timings(timings)
+    if mismatches:
+        print(f"Результаты бэкендов различаются: {', '.join(mismatches)}")
+        sys.exit(1)
+    print("Результаты бэкендов совпадают на всех страницах.")
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_parsers.py ---
@@ -0,0 +1,231 @@
+# --- START OF FILE bench_reminders.py ---
+
+"""
+Накладные расходы планировщика напоминаний (delivery/reminders.py).
+
+Запуск из корня проекта: python -m bench.bench_reminders [--sizes 1000,10000,50000] [--fire 2000]
+Три части:
+  1. Планирование в памяти для каждого размера: добавление, отмена 10%,
+     извлечение всех сработавших (pop_due) - мкс на операцию и память
+     (tracemalloc) - против одной задачи asyncio.sleep на напоминание
+     (создание, память, отмена).
+  2. SQLite (storage/reminders.py) на наибольшем размере: вставка по одной,
+     загрузка всех при старте, забирание пачками по CLAIM_BATCH.
+  3. Срабатывание: --fire напоминаний на настоящие рейсы из data/ срабатывают
+     в одну секунду и отправляются через очередь outbound в
+     bench/fake_bot_api.py. Печатаются задержка от fire_at до ответа Bot API
+     (p50/p99), время на всё и наибольшая задержка event loop за это время.
+     Лимиты Bot API по умолчанию сняты (--telegram-limits - как у Telegram,
+     тогда темп - 30 сообщений/с).
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from bench.fake_bot_api import FakeBotAPI, start_server
+from delivery import outbound
+from delivery.reminders import CLAIM_BATCH, ReminderScheduler
+from storage.reminders import Reminder, SqliteReminderStore
+
+UNLIMITED = 1e9
+
+
+def _reminders(count: int, start: float, spread: float, seed: int, first_id: int = 1) -> list[Reminder]:
+    rng = random.Random(seed)
+    return [
+        Reminder(first_id + i, 1 + i, 1 + i, "bus", str(1 + i % 40), i % 2, f"s{i % 300}", "wd",
+                 300 + i % 1200, 10, bool(i % 2), start + rng.random() * spread, "🚌 №1, ост. Центр")
+        for i in range(count)
+    ]
+
+
+def _render(reminder: Reminder):
+    return "⏰", None
+
+
+def _filled(reminders: list[Reminder]) -> ReminderScheduler:
+    scheduler = ReminderScheduler(None, None, _render)
+    for reminder in reminders:
+        scheduler.add(reminder)
+    return scheduler
+
+
+async def _memory_of(build) -> tuple[object, float]:
+    """Результат build() и сколько памяти он удерживает, МБ."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    await asyncio.sleep(0)  # задачи успевают стартовать и уснуть
+    used = (tracemalloc.get_traced_memory()[0] - before) / 1024 / 1024
+    tracemalloc.stop()
+    return result, used
+
+
+async def bench_in_memory(sizes: list[int]):
+    print("1. Планирование в памяти, мкс на напоминание")
+    print(f"{'размер':>7} | {'куча: доб.':>10} {'отмена':>7} {'pop_due':>8} {'МБ':>6} | "
+          f"{'задачи: созд.':>13} {'отмена':>7} {'МБ':>6}")
+    for size in sizes:
+        reminders = _reminders(size, time.time() + 3600, 3600, size)
+        scheduler = ReminderScheduler(None, None, _render)
+        started = time.perf_counter()
+        for reminder in reminders:
+            scheduler.add(reminder)
+        add_us = (time.perf_counter() - started) / size * 1e6
+        _, heap_mb = await _memory_of(lambda: _filled(reminders))
+        cancelled = reminders[::10]
+        started = time.perf_counter()
+        for reminder in cancelled:
+            scheduler.cancel(reminder.id)
+        cancel_us = (time.perf_counter() - started) / len(cancelled) * 1e6
+        started = time.perf_counter()
+        popped = 0
+        while True:
+            due = scheduler.pop_due(time.time() + 7200)
+            if not due:
+                break
+            popped += len(due)
+        pop_us = (time.perf_counter() - started) / popped * 1e6
+
+        # Одна задача на напоминание
+        now = time.time()
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(asyncio.sleep(reminder.fire_at - now)) for reminder in reminders]
+        create_us = (time.perf_counter() - started) / size * 1e6
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        tasks, tasks_mb = await _memory_of(
+            lambda: [asyncio.create_task(asyncio.sleep(reminder.fire_at - now)) for reminder in reminders])
+        started = time.perf_counter()
+        for task in tasks[::10]:
+            task.cancel()
+        await asyncio.sleep(0)
+        task_cancel_us = (time.perf_counter() - started) / len(tasks[::10]) * 1e6
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        print(f"{size:>7} | {add_us:>10.2f} {cancel_us:>7.2f} {pop_us:>8.2f} {heap_mb:>6.1f} | "
+              f"{create_us:>13.2f} {task_cancel_us:>7.2f} {tasks_mb:>6.1f}")
+
+
+async def bench_store(size: int, workdir: str):
+    print(f"\n2. SQLite, {size} напоминаний")
+    store = SqliteReminderStore(os.path.join(workdir, "bench.sqlite3"))
+    try:
+        reminders = _reminders(size, time.time() + 3600, 3600, 1)
+        started = time.perf_counter()
+        saved = [store.add(reminder) for reminder in reminders]
+        add_us = (time.perf_counter() - started) / size * 1e6
+        started = time.perf_counter()
+        loaded = store.load_pending()
+        load_ms = (time.perf_counter() - started) * 1000
+        claims = [(reminder.id, reminder.fire_at, None if not reminder.daily else reminder.fire_at + 86400)
+                  for reminder in saved]
+        started = time.perf_counter()
+        claimed = 0
+        for i in range(0, len(claims), CLAIM_BATCH):
+            claimed += len(store.claim(claims[i:i + CLAIM_BATCH]))
+        claim_us = (time.perf_counter() - started) / size * 1e6
+        print(f"  вставка {add_us:.1f} мкс/шт; загрузка при старте {load_ms:.0f} мс ({len(loaded)}); "
+              f"забирание {claim_us:.1f} мкс/шт пачками по {CLAIM_BATCH} ({claimed})")
+    finally:
+        store.close()
+
+
+async def _loop_lag(stop: asyncio.Event) -> float:
+    """Наибольшая задержка пробуждения тикера с периодом 10 мс, с."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - started - 0.01)
+    return worst
+
+
+async def bench_fire(count: int, workdir: str, latency: float, telegram_limits: bool):
+    import utils
+    from handlers import reminders as reminder_handlers
+
+    await utils.load_schedules()
+    bus = utils.getBusSchedule()
+    departures = []
+    for number in bus:
+        for route_idx, route in enumerate(bus.vehicle(number).routes("wd")):
+            for stop_idx, stop in enumerate(route.stops):
+                ref = f"s{stop.stop_id}" if stop.stop_id else str(stop_idx)
+                departures.extend((number, route_idx, ref, minute) for minute in stop.minutes[:3])
+    rng = random.Random(1)
+
+    api = FakeBotAPI(latency=latency, **({} if telegram_limits else
+                     {"chat_rate": UNLIMITED, "chat_burst": UNLIMITED, "global_rate": UNLIMITED}))
+    runner, base_url = await start_server(api)
+    bot = Bot("42:BENCH", session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+    queue = outbound.OutboundQueue() if telegram_limits else outbound.OutboundQueue(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED)
+    bot.session.middleware(queue)
+    store = SqliteReminderStore(os.path.join(workdir, "fire.sqlite3"))
+    scheduler = ReminderScheduler(bot, store, reminder_handlers.render)
+    try:
+        await scheduler.start()
+        fire_at = time.time() + 1.0
+        for i in range(count):
+            number, route_idx, ref, minute = rng.choice(departures)
+            # Рейс настоящий - render найдёт его в расписании; срабатывание - в ближайшие секунды
+            scheduler.add(store.add(Reminder(0, 100 + i, 100 + i, "bus", number, route_idx, ref, "wd", minute, 10,
+                                             False, fire_at + rng.random(), f"🚌 №{number}")))
+        stop = asyncio.Event()
+        lag = asyncio.create_task(_loop_lag(stop))
+        while scheduler.sent + scheduler.failed + scheduler.missed < count:
+            await asyncio.sleep(0.05)
+        total = time.time() - fire_at
+        stop.set()
+        stats = scheduler.stats()
+        print(f"\n3. Срабатывание {count} напоминаний за 1 с ({'лимиты Telegram' if telegram_limits else 'без лимитов'}): "
+              f"отправлено {stats['sent']}, ошибок {stats['failed']}, пропущено {stats['missed']}, "
+              f"всё за {total:.1f} с")
+        print(f"  задержка от fire_at: p50 {stats['lateness_p50_ms']:.0f} мс, p99 {stats['lateness_p99_ms']:.0f} мс; "
+              f"наибольшая задержка event loop {await lag * 1000:.1f} мс; запросов 429: {api.count(429)}")
+    finally:
+        await scheduler.close()
+        store.close()
+        await queue.close(timeout=1)
+        await bot.session.close()
+        await runner.cleanup()
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_reminders_")
+    try:
+        await bench_in_memory(args.sizes)
+        await bench_store(args.sizes[-1], workdir)
+        await bench_fire(args.fire, workdir, args.latency_ms / 1000, args.telegram_limits)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sizes", default="1000,10000,50000", help="числа ожидающих напоминаний через запятую")
+    arg_parser.add_argument("--fire", type=int, default=2000, help="напоминаний, срабатывающих одновременно")
+    arg_parser.add_argument("--latency-ms", type=float, default=30.0, help="задержка ответа Bot API")
+    arg_parser.add_argument("--telegram-limits", action="store_true", help="лимиты частоты Bot API как у Telegram")
+    args = arg_parser.parse_args()
+    args.sizes = [int(value) for value in args.sizes.split(",")]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_reminders.py ---
@@ -0,0 +1,144 @@
+# --- START OF FILE bench_startup.py ---
+
+"""
+Бенчмарк запуска бота по фазам.
+
+Запуск из корня проекта: python -m bench.bench_startup [--repeat 5] [--webhook-ms 150]
+Каждый замер - отдельный процесс интерпретатора (холодные импорты). Фазы:
+импорт aiogram, utils и модулей хендлеров, затем подготовка к опросу:
+  parallel   - как в main.py: utils.startup() (снапшоты, избранное и
+               delete_webhook одновременно, прогрев индексов в фоне);
+  sequential - прежний порядок: снапшоты, прогрев, избранное, delete_webhook.
+delete_webhook заменён задержкой --webhook-ms (сеть не нужна), избранное
+открывается во временном каталоге. "готов к опросу" - время от запуска
+процесса до вызова start_polling.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("parallel", "sequential")
+SCRAPER_MODULES = ("bs4", "requests", "urllib3", "lxml", "parsers.fetcher")
+
+
+# --- Дочерний процесс ---
+
+async def _timed(phases: dict, name: str, awaitable):
+    started = time.perf_counter()
+    result = await awaitable
+    phases[name] = time.perf_counter() - started
+    return result
+
+
+async def _prepare(mode: str, webhook_delay: float, phases: dict):
+    import utils
+
+    started = time.perf_counter()
+    if mode == "parallel":
+        # Те же корутины, что в utils.startup(), но каждая со своим таймером
+        await asyncio.gather(
+            _timed(phases, "снапшоты расписаний", utils.load_schedules()),
+            _timed(phases, "избранное", utils.start_favorites()),
+            _timed(phases, "delete_webhook", asyncio.sleep(webhook_delay)),
+        )
+        warmup_task = asyncio.create_task(asyncio.to_thread(utils.run_warmups))
+        phases["готов к опросу"] = time.perf_counter() - started
+        await _timed(phases, "прогрев индексов (фон)", warmup_task)
+    else:
+        await _timed(phases, "снапшоты расписаний", utils.load_schedules())
+        await _timed(phases, "прогрев индексов", asyncio.to_thread(utils.run_warmups))
+        await _timed(phases, "избранное", utils.start_favorites())
+        await _timed(phases, "delete_webhook", asyncio.sleep(webhook_delay))
+        phases["готов к опросу"] = time.perf_counter() - started
+    await utils.close_favorites()
+
+
+def child(mode: str, webhook_delay: float):
+    import logging
+    logging.disable(logging.CRITICAL)
+    phases = {}
+    started = time.perf_counter()
+    phase_started = started
+    for name, modules in (
+        ("импорт aiogram", ("aiogram",)),
+        ("импорт utils", ("utils",)),
+        ("импорт хендлеров", ("handlers.bus", "handlers.trolleybus", "handlers.favorites",
+                              "handlers.journey", "handlers.search", "handlers.common_handlers")),
+    ):
+        for module in modules:
+            __import__(module)
+        now = time.perf_counter()
+        phases[name] = now - phase_started
+        phase_started = now
+    imports = time.perf_counter() - started
+    asyncio.run(_prepare(mode, webhook_delay, phases))
+    phases["готов к опросу"] += imports
+    loaded = [module for module in SCRAPER_MODULES if module in sys.modules]
+    print(json.dumps({"phases": phases, "scrapers": loaded}))
+
+
+# --- Замер ---
+
+def run_once(mode: str, webhook_delay: float, favorites_dir: str) -> dict:
+    env = dict(os.environ, FAVORITES_PATH=os.path.join(favorites_dir, f"{mode}.json"), REFRESH_WORKER="0")
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "bench.bench_startup", "--child", mode, "--webhook-ms", str(webhook_delay * 1000)],
+        check=True, capture_output=True, text=True, env=env,
+    ).stdout
+    wall = time.perf_counter() - started
+    result = json.loads(output.strip().splitlines()[-1])
+    phases = result["phases"]
+    # Всё, что процесс провёл до первой фазы: запуск интерпретатора и site
+    phases["запуск интерпретатора"] = wall - phases["готов к опросу"] - phases.get("прогрев индексов (фон)", 0.0)
+    phases["готов к опросу"] += phases["запуск интерпретатора"]
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--repeat", type=int, default=5, help="запусков на режим (берётся медиана)")
+    arg_parser.add_argument("--webhook-ms", type=float, default=150.0, help="задержка вместо delete_webhook, мс")
+    arg_parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.child:
+        child(args.child, args.webhook_ms / 1000)
+        return
+
+    favorites_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    medians, scrapers, order = {}, {}, []
+    for mode in MODES:
+        runs = [run_once(mode, args.webhook_ms / 1000, favorites_dir) for _ in range(args.repeat)]
+        scrapers[mode] = runs[-1]["scrapers"]
+        for name in ["запуск интерпретатора", *runs[0]["phases"]]:
+            if name not in order:
+                order.append(name)
+        medians[mode] = {
+            name: statistics.median(run["phases"][name] for run in runs)
+            for name in runs[0]["phases"]
+        }
+
+    print(f"{'фаза, мс':28}" + "".join(f"{mode:>12}" for mode in MODES))
+    for name in order:
+        if name == "готов к опросу":
+            continue
+        cells = "".join(
+            f"{medians[mode][name] * 1000:>12.0f}" if name in medians[mode] else f"{'-':>12}" for mode in MODES
+        )
+        print(f"{name:28}{cells}")
+    print(f"{'готов к опросу':28}" + "".join(f"{medians[mode]['готов к опросу'] * 1000:>12.0f}" for mode in MODES))
+    for mode in MODES:
+        print(f"{mode}: модули обхода сайта загружены: {', '.join(scrapers[mode]) or 'нет'}")
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_startup.py ---
@@ -0,0 +1,195 @@
+# --- START OF FILE bench_webhook.py ---
+
+"""
+Нагрузочный тест режима вебхука (webhook.py) на настоящих хендлерах бота.
+
+Запуск из корня проекта: python -m bench.bench_webhook [--updates 1000] [--connections 40] [--in-flight 4,16,64]
+Бот (main.dp) работает против bench/fake_bot_api.py, снапшоты - из data/,
+избранное - во временном каталоге. Синтетические апдейты (кнопка списка,
+выбор маршрута, остановки, поиск по тексту) от разных пользователей
+отправляются POST-запросами на локальный вебхук по --connections соединений,
+как это делает Telegram. Для каждого WEBHOOK_MAX_IN_FLIGHT печатается
+пропускная способность, время ответа на POST и задержка обработки апдейта
+(от получения до конца хендлера), p50/p99. Лимиты Bot API по умолчанию сняты,
+чтобы мерить сами хендлеры (--telegram-limits возвращает их).
+
+В конце - проверка остановки: сервер останавливают посреди потока, и каждый
+апдейт должен быть либо обработан, либо получить 503 (Telegram пришлёт его снова).
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+import aiohttp
+
+from bench.fake_bot_api import FakeBotAPI, start_server
+
+UNLIMITED = 1e9
+
+
+def _percentile_ms(samples: list[float], share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] * 1000 if ordered else 0.0
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def _message(update_id: int, user_id: int, text: str) -> dict:
+    return {"message_id": update_id, "date": int(time.time()), "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id), "text": text}
+
+
+def synthetic_updates(count: int, users: int, seed: int) -> list[dict]:
+    """Смесь апдейтов по текущим снапшотам: текст и нажатия кнопок."""
+    from handlers import callbacks, common_handlers
+    from timetable import snapshot
+    import utils
+
+    rng = random.Random(seed)
+    bus = utils.getBusSchedule()
+    numbers = list(bus)
+    stop_names = []
+    buttons = []
+    for number in numbers:
+        for route_idx, route in enumerate(bus.vehicle(number).routes("wd")):
+            buttons.append(callbacks.Route(snapshot.KIND_BUS, number, route_idx))
+            for stop_idx, stop in enumerate(route.stops):
+                ref = f"s{stop.stop_id}" if stop.stop_id else str(stop_idx)
+                buttons.append(callbacks.Stop(snapshot.KIND_BUS, number, route_idx, ref, "wd"))
+                stop_names.append(stop.name)
+    list_button = f"{common_handlers.TRANSPORT_CONFIG[common_handlers.TYPE_BUS]['emoji']} " \
+                  f"{common_handlers.TRANSPORT_CONFIG[common_handlers.TYPE_BUS]['name_plural']}"
+
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = rng.randint(1, users)
+        roll = rng.random()
+        if roll < 0.1:
+            updates.append({"update_id": update_id, "message": _message(update_id, user_id, list_button)})
+        elif roll < 0.25:
+            updates.append({"update_id": update_id, "message": _message(update_id, user_id, rng.choice(stop_names))})
+        else:
+            if roll < 0.4:
+                payload = callbacks.Vehicle(snapshot.KIND_BUS, rng.choice(numbers))
+            else:
+                payload = rng.choice(buttons)
+            updates.append({"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": _user(user_id), "chat_instance": "bench",
+                "data": callbacks.encode(payload), "message": _message(update_id, user_id, "x"),
+            }})
+    return updates
+
+
+async def post_all(url: str, updates: list[dict], connections: int, secret: str) -> tuple[list[float], dict]:
+    """Отправляет апдейты по connections параллельным соединениям; время ответа и коды ответов."""
+    latencies = []
+    statuses = {}
+    queue = iter(updates)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+
+    async def connection(session: aiohttp.ClientSession):
+        for update in queue:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=update, headers=headers) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError:
+                status = "error"
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=connections)) as session:
+        await asyncio.gather(*(connection(session) for _ in range(connections)))
+    return latencies, statuses
+
+
+async def run(args):
+    telegram_limits = args.telegram_limits
+    api = FakeBotAPI(latency=args.latency_ms / 1000, **({} if telegram_limits else
+                     {"chat_rate": UNLIMITED, "chat_burst": UNLIMITED, "global_rate": UNLIMITED}))
+    api_runner, base_url = await start_server(api)
+
+    # Настройки бота - до импорта main: сессия и избранное
+    workdir = tempfile.mkdtemp(prefix="bench_webhook_")
+    os.environ.update({"TELEGRAM_API_URL": base_url, "REFRESH_WORKER": "0",
+                       "FAVORITES_PATH": os.path.join(workdir, "favorites.json")})
+    import main
+    import utils
+    import webhook
+    from delivery import outbound
+    logging.disable(logging.WARNING)
+    if not telegram_limits:
+        # Очередь main создана с лимитами Telegram - заменяем на неограниченную
+        main.bot.session.middleware.unregister(main.outbound_queue)
+        main.outbound_queue = outbound.OutboundQueue(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED)
+        main.bot.session.middleware(main.outbound_queue)
+
+    secret = "bench-secret"
+    try:
+        await utils.startup()
+        utils.run_warmups()
+        updates = synthetic_updates(args.updates, args.users, args.seed)
+        print(f"{len(updates)} апдейтов, {args.users} пользователей, {args.connections} соединений")
+        print(f"{'in-flight':>9} {'апд/с':>7} {'POST p50':>9} {'POST p99':>9} {'обр. p50':>9} {'обр. p99':>9}  ошибки")
+        for max_in_flight in args.in_flight:
+            runner, handler, port = await webhook.start(main.dp, main.bot, host="127.0.0.1", port=0,
+                                                        max_in_flight=max_in_flight, secret_token=secret)
+            url = f"http://127.0.0.1:{port}{webhook.WEBHOOK_PATH}"
+            started = time.perf_counter()
+            post_latencies, statuses = await post_all(url, updates, args.connections, secret)
+            while handler.in_flight():
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            stats = handler.stats()
+            await runner.cleanup()
+            errors = handler.failed + sum(count for status, count in statuses.items() if status != 200)
+            print(f"{max_in_flight:>9} {len(updates) / elapsed:>7.0f} {_percentile_ms(post_latencies, 0.5):>9.1f} "
+                  f"{_percentile_ms(post_latencies, 0.99):>9.1f} {stats['latency_p50_ms']:>9.1f} "
+                  f"{stats['latency_p99_ms']:>9.1f}  {errors}")
+
+        # Остановка посреди потока
+        runner, handler, port = await webhook.start(main.dp, main.bot, host="127.0.0.1", port=0,
+                                                    max_in_flight=args.in_flight[-1], secret_token=secret)
+        url = f"http://127.0.0.1:{port}{webhook.WEBHOOK_PATH}"
+        sender = asyncio.create_task(post_all(url, updates, args.connections, secret))
+        await asyncio.sleep(args.stop_after)
+        await runner.cleanup()
+        _, statuses = await sender
+        accepted = statuses.get(200, 0)
+        print(f"остановка через {args.stop_after} с: принято {accepted}, обработано {handler.handled}, "
+              f"с ошибкой {handler.failed}, 503 - {statuses.get(503, 0)}, без ответа (сервер закрыт) - "
+              f"{statuses.get('error', 0)}; потеряно {accepted - handler.handled - handler.failed}")
+    finally:
+        await main.outbound_queue.close(timeout=1)
+        await utils.close_favorites()
+        await main.bot.session.close()
+        await api_runner.cleanup()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--updates", type=int, default=1000)
+    arg_parser.add_argument("--users", type=int, default=500)
+    arg_parser.add_argument("--connections", type=int, default=40, help="как max_connections в setWebhook")
+    arg_parser.add_argument("--in-flight", default="4,16,64", help="значения WEBHOOK_MAX_IN_FLIGHT через запятую")
+    arg_parser.add_argument("--latency-ms", type=float, default=30.0, help="задержка ответа Bot API")
+    arg_parser.add_argument("--stop-after", type=float, default=0.5, help="через сколько секунд остановить сервер")
+    arg_parser.add_argument("--telegram-limits", action="store_true", help="лимиты частоты Bot API как у Telegram")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+    args.in_flight = [int(value) for value in args.in_flight.split(",")]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_webhook.py ---
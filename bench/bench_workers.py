@@ -0,0 +1,250 @@
+# --- START OF FILE bench_workers.py ---
+
+"""
+Память и пропускная способность при нескольких рабочих процессах (supervisor.py).
+
+Запуск из корня проекта: python -m bench.bench_workers [--workers 1,2,4] [--updates 1000] [--clients 4]
+Для каждого числа процессов бот запускается как в продакшене (python main.py,
+BOT_MODE=webhook, WEBHOOK_WORKERS=N) против bench/fake_bot_api.py, на копии
+снапшотов во временном каталоге. Синтетические апдейты (bench/bench_webhook.py)
+отправляют --clients процессов, fake Bot API - ещё один процесс: генератор
+нагрузки в одном event loop сам упирается в ядро (~300 апд/с) раньше, чем
+несколько рабочих процессов бота. Рост с числом процессов виден, только
+если ядер хватает на бота, клиентов и fake Bot API, - иначе печатается
+предупреждение. После прогона по /proc/<pid>/smaps суммируется память всех
+процессов бота: RSS (страницы, общие для процессов, считаются в каждом), PSS
+(общие страницы делятся между процессами - реальный расход) и USS (только
+собственные страницы), отдельно - отображение снапшотов (.snap).
+
+Для последнего N дополнительно: снапшот автобусов на диске заменяется
+(без одного маршрута), супервизору отправляется SIGHUP, и из журнала берётся
+строка о согласованном переключении; затем SIGTERM и проверка остановки.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+
+from timetable import snapshot
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNLIMITED = 1e9
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return pids
+    for child in children:
+        pids.extend(_process_tree(child))
+    return pids
+
+
+def _memory(pid: int) -> dict:
+    """Rss, Pss, Uss всего процесса и Rss, Pss отображений снапшотов, КБ."""
+    totals = {"rss": 0, "pss": 0, "uss": 0, "snap_rss": 0, "snap_pss": 0}
+    in_snapshot = False
+    with open(f"/proc/{pid}/smaps") as f:
+        for line in f:
+            field, _, rest = line.partition(":")
+            if " " in field or "-" in field:  # заголовок отображения: адреса, права, ..., путь
+                in_snapshot = line.rstrip().endswith(".snap")
+                continue
+            if field not in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                continue
+            kb = int(rest.split()[0])
+            if field == "Rss":
+                totals["rss"] += kb
+                if in_snapshot:
+                    totals["snap_rss"] += kb
+            elif field == "Pss":
+                totals["pss"] += kb
+                if in_snapshot:
+                    totals["snap_pss"] += kb
+            else:
+                totals["uss"] += kb
+    return totals
+
+
+async def _wait_ready(port: int, log_path: str, workers: int, timeout: float = 120.0):
+    marker = "serving, schedules" if workers > 1 else "Webhook server listening"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            if f.read().count(marker) >= (workers if workers > 1 else 1):
+                return
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"Бот не запустился за {timeout} с, см. {log_path}")
+
+
+async def _wait_log(log_path: str, marker: str, timeout: float = 60.0) -> str:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if marker in line:
+                    return line.strip()
+        await asyncio.sleep(0.1)
+    return f"(нет строки {marker!r} за {timeout} с)"
+
+
+async def _start_fake_api(latency_ms: float, log_path: str) -> tuple[subprocess.Popen, str]:
+    """fake Bot API без лимитов частоты в отдельном процессе; возвращает процесс и базовый URL."""
+    port = _free_port()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen([sys.executable, "-m", "bench.fake_bot_api", "--port", str(port),
+                                    "--latency-ms", str(latency_ms), "--unlimited"],
+                                   cwd=PROJECT_ROOT, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            await asyncio.sleep(0.1)
+    process.kill()
+    raise TimeoutError(f"fake Bot API не запустился, см. {log_path}")
+
+
+def _post_share(url: str, updates: list[dict], connections: int, secret: str) -> dict:
+    """Выполняется в процессе-клиенте: своя доля апдейтов, возвращает коды ответов."""
+    from bench.bench_webhook import post_all
+
+    return asyncio.run(post_all(url, updates, connections, secret))[1]
+
+
+async def _post_parallel(pool: ProcessPoolExecutor, clients: int, url: str, updates: list[dict],
+                         connections: int, secret: str) -> dict:
+    """Делит апдейты и соединения между clients процессами; суммарные коды ответов."""
+    loop = asyncio.get_running_loop()
+    shares = await asyncio.gather(*(
+        loop.run_in_executor(pool, _post_share, url, updates[i::clients], max(1, connections // clients), secret)
+        for i in range(clients)
+    ))
+    statuses = {}
+    for share in shares:
+        for status, count in share.items():
+            statuses[status] = statuses.get(status, 0) + count
+    return statuses
+
+
+async def run(args):
+    from bench.bench_webhook import synthetic_updates
+
+    workdir = tempfile.mkdtemp(prefix="bench_workers_")
+    bus_path = os.path.join(workdir, "bus_schedule.snap")
+    trolleybus_path = os.path.join(workdir, "trolleybus_schedule.snap")
+    for kind, name, path in ((snapshot.KIND_BUS, "bus_schedule", bus_path),
+                             (snapshot.KIND_TROLLEYBUS, "trolleybus_schedule", trolleybus_path)):
+        data = os.path.join(PROJECT_ROOT, "data", name)
+        source = snapshot.load_or_convert(data + ".snap", data + ".json", kind)  # в git только JSON
+        shutil.copy(source.path, path)
+        source.close()
+    os.environ.update({"BUS_SNAPSHOT_PATH": bus_path, "TROLLEYBUS_SNAPSHOT_PATH": trolleybus_path})
+    updates = synthetic_updates(args.updates, args.users, 1)
+
+    api_process, base_url = await _start_fake_api(args.latency_ms, os.path.join(workdir, "fake_bot_api.log"))
+    pool = ProcessPoolExecutor(args.clients, mp_context=multiprocessing.get_context("spawn"))
+    secret = "bench-secret"
+    cpus = os.cpu_count() or 1
+    print(f"ядер: {cpus}, клиентов: {args.clients}")
+    if cpus < max(args.workers) + args.clients + 1:
+        print(f"  ядер меньше, чем процессов бота ({max(args.workers)}), клиентов и fake Bot API: "
+              "пропускная способность упрётся в CPU и не покажет рост с числом процессов")
+    try:
+        # Клиенты запускаются заранее (spawn + импорт), чтобы старт процессов не попал в замер
+        await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(pool, _post_share, base_url, [], 1, "")
+                               for _ in range(args.clients)))
+        print(f"{'процессов':>9} {'апд/с':>6} {'RSS, МБ':>8} {'PSS, МБ':>8} {'USS, МБ':>8} {'снапшоты RSS/PSS, МБ':>21}")
+        for workers in args.workers:
+            port = _free_port()
+            log_path = os.path.join(workdir, f"bot_{workers}.log")
+            env = dict(os.environ, BOT_MODE="webhook", WEBHOOK_WORKERS=str(workers), WEBHOOK_URL="http://127.0.0.1",
+                       WEBHOOK_HOST="127.0.0.1", WEBHOOK_PORT=str(port), WEBHOOK_SECRET=secret,
+                       TELEGRAM_API_URL=base_url, REFRESH_WORKER="0",
+                       FAVORITES_PATH=os.path.join(workdir, f"favorites_{workers}.json"),
+                       SEND_GLOBAL_RATE=str(UNLIMITED), SEND_CHAT_RATE=str(UNLIMITED),
+                       SEND_GROUP_RATE=str(UNLIMITED), SEND_CHAT_BURST=str(UNLIMITED))
+            with open(log_path, "w") as log:
+                process = subprocess.Popen([sys.executable, "main.py"], cwd=PROJECT_ROOT, env=env,
+                                           stdout=log, stderr=subprocess.STDOUT)
+            try:
+                await _wait_ready(port, log_path, workers)
+                started = time.perf_counter()
+                statuses = await _post_parallel(pool, args.clients, f"http://127.0.0.1:{port}/webhook", updates,
+                                                args.connections, secret)
+                async with aiohttp.ClientSession() as session:
+                    # Дождаться конца обработки: health отвечает тот процесс, что принял соединение
+                    for _ in range(200):
+                        async with session.get(f"http://127.0.0.1:{port}/healthz") as response:
+                            if (await response.json())["in_flight"] == 0:
+                                break
+                        await asyncio.sleep(0.05)
+                elapsed = time.perf_counter() - started
+                pids = _process_tree(process.pid)
+                memory = [_memory(pid) for pid in pids]
+                total = {key: sum(item[key] for item in memory) / 1024 for key in memory[0]}
+                print(f"{len(pids):>9} {len(updates) / elapsed:>6.0f} {total['rss']:>8.1f} {total['pss']:>8.1f} "
+                      f"{total['uss']:>8.1f} {total['snap_rss']:>10.1f} / {total['snap_pss']:<8.1f}"
+                      + ("" if statuses.get(200) == len(updates) else f"  ответы: {statuses}"))
+
+                if workers == args.workers[-1] and workers > 1:
+                    vehicles = snapshot.Snapshot.open(bus_path).to_list()[:-1]
+                    await asyncio.to_thread(snapshot.write_snapshot, bus_path, vehicles, snapshot.KIND_BUS)
+                    process.send_signal(signal.SIGHUP)
+                    print("SIGHUP:", await _wait_log(log_path, "Reloaded bus snapshot"))
+            finally:
+                # Ждём в потоке: event loop бенчмарка отвечает на проверки готовности, не блокируем его
+                process.send_signal(signal.SIGTERM)
+                try:
+                    code = await asyncio.to_thread(process.wait, 60)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    code = process.wait()
+            if workers == args.workers[-1] and workers > 1:
+                print(f"SIGTERM: код {code};", await _wait_log(log_path, "Supervisor stopped", 1))
+    finally:
+        pool.shutdown()
+        api_process.terminate()
+        api_process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--workers", default="1,2,4", help="числа рабочих процессов через запятую")
+    arg_parser.add_argument("--updates", type=int, default=1000)
+    arg_parser.add_argument("--users", type=int, default=500)
+    arg_parser.add_argument("--connections", type=int, default=40, help="соединений на всех клиентов")
+    arg_parser.add_argument("--clients", type=int, default=max(1, min(4, (os.cpu_count() or 1) // 2)),
+                            help="процессов-генераторов нагрузки")
+    arg_parser.add_argument("--latency-ms", type=float, default=30.0, help="задержка ответа Bot API")
+    args = arg_parser.parse_args()
+    args.workers = [int(value) for value in args.workers.split(",")]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE bench_workers.py ---
@@ -0,0 +1,132 @@
+# --- START OF FILE fake_bot_api.py ---
+
+"""
+Локальный сервер, изображающий Bot API, для проверки исходящих запросов без сети.
+
+Запуск отдельно: python -m bench.fake_bot_api [--port 8081] [--latency-ms 30] [--unlimited]
+и бот с TELEGRAM_API_URL=http://127.0.0.1:8081 (см. main.py). В бенчмарках
+поднимается в том же процессе через start_server() или, когда процесс
+бенчмарка сам нагружен (bench/bench_workers.py), - отдельным процессом.
+
+Отвечает на /bot<token>/<method> правдоподобными объектами (Message для
+send*/edit*, True для остального) и, как Telegram, ограничивает частоту:
+ведро токенов на чат (CHAT_RATE/с, запас CHAT_BURST) для новых сообщений и
+общее (GLOBAL_RATE/с) для всех запросов; правки сообщений тратят только общее.
+Превышение - ответ 429 с parameters.retry_after. Все запросы записываются в
+FakeBotAPI.log: (время, метод, chat_id, код ответа).
+"""
+
+import argparse
+import asyncio
+import itertools
+import math
+import time
+
+from aiohttp import web
+
+from delivery.outbound import TokenBucket
+
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+GLOBAL_RATE = 30.0
+
+_MESSAGE_METHODS = ("sendmessage", "editmessagetext", "editmessagereplymarkup", "sendphoto", "senddocument")
+_EDIT_METHODS = ("editmessagetext", "editmessagereplymarkup", "editmessagecaption")
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.03, chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST,
+                 global_rate: float = GLOBAL_RATE):
+        self.latency = latency
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_rate, time.monotonic())
+        self.chat_buckets: dict[str, TokenBucket] = {}
+        self.log: list[tuple[float, str, str | None, int]] = []
+        self._message_ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def _limited(self, chat_id: str | None, now: float) -> float:
+        """0 - запрос проходит (токены списаны), иначе retry_after в секундах."""
+        delays = [self.global_bucket.delay(now)]
+        bucket = None
+        if chat_id is not None:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+            delays.append(bucket.delay(now))
+        delay = max(delays)
+        if delay:
+            return delay
+        self.global_bucket.take(now)
+        if bucket is not None:
+            bucket.take(now)
+        return 0.0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post()) if request.can_read_body else {}
+        chat_id = params.get("chat_id")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        retry_after = 0.0
+        if chat_id is not None:
+            retry_after = self._limited(None if method in _EDIT_METHODS else chat_id, now)
+        if retry_after:
+            self.log.append((now, method, chat_id, 429))
+            seconds = max(1, math.ceil(retry_after))
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {seconds}",
+                "parameters": {"retry_after": seconds},
+            })
+        self.log.append((now, method, chat_id, 200))
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def _result(self, method: str, params: dict):
+        if method == "getme":
+            return {"id": 42, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if method in _MESSAGE_METHODS:
+            chat_id = int(params.get("chat_id", 0))
+            return {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    def count(self, status: int, method: str | None = None) -> int:
+        return sum(1 for _, logged_method, _, code in self.log if code == status and method in (None, logged_method))
+
+
+async def start_server(api: FakeBotAPI, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+    """Запускает сервер; возвращает runner (для cleanup) и базовый URL."""
+    runner = web.AppRunner(api.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--port", type=int, default=8081)
+    arg_parser.add_argument("--latency-ms", type=float, default=30.0)
+    arg_parser.add_argument("--unlimited", action="store_true", help="без лимитов частоты (замер самого бота)")
+    args = arg_parser.parse_args()
+    limits = {"chat_rate": 1e9, "chat_burst": 1e9, "global_rate": 1e9} if args.unlimited else {}
+    web.run_app(FakeBotAPI(args.latency_ms / 1000, **limits).app(), host="127.0.0.1", port=args.port,
+                access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE fake_bot_api.py ---
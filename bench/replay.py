@@ -0,0 +1,261 @@
+# --- START OF FILE replay.py ---
+
+"""
+Запись и воспроизведение страниц mogilev.biz.
+
+    python -m bench.replay capture DIR        записать списки маршрутов и все страницы расписаний
+    python -m bench.replay synthesize DIR     собрать такой же каталог из сохранённого расписания (без сети)
+    python -m bench.replay serve DIR          локальный сервер, отдающий записанные страницы
+
+Каталог: manifest.json ({путь: {"file", "etag", "last_modified"}}), pages/*.html
+и reference.json - результат исходных парсеров (bs4) на этих страницах, с ним
+бенчмарк сравнивает результаты обхода. Сервер поддерживает ETag/If-None-Match,
+задержку ответа и периодические 503 для проверки повторов.
+Обход на записанных страницах: MOGILEV_BIZ_BASE_URL=http://127.0.0.1:PORT
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from bench import synthetic_pages
+from parsers import bus_parser, fetcher, trolleybus_parser
+
+KINDS = {
+    "bus": (bus_parser.BUS_LIST_PATH, bus_parser.parseBusList, bus_parser.process_bus),
+    "trolleybus": (trolleybus_parser.TROLLEYBUS_LIST_PATH, trolleybus_parser.parseTrolleybusList,
+                   trolleybus_parser.process_trolleybus),
+}
+
+
+def _path(url: str) -> str:
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+# --- Каталог с записью ---
+
+class Fixture:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest: dict[str, dict] = {}
+        manifest_path = os.path.join(directory, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def read(self, path: str) -> str | None:
+        entry = self.manifest.get(path)
+        if entry is None:
+            return None
+        with open(os.path.join(self.directory, "pages", entry["file"]), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def add(self, path: str, html: str, etag: str | None = None, last_modified: str | None = None):
+        os.makedirs(os.path.join(self.directory, "pages"), exist_ok=True)
+        entry = self.manifest.get(path) or {"file": f"{len(self.manifest):04d}.html"}
+        entry.update(etag=etag, last_modified=last_modified)
+        self.manifest[path] = entry
+        with open(os.path.join(self.directory, "pages", entry["file"]), "w", encoding="utf-8") as f:
+            f.write(html)
+
+    def save(self):
+        with open(os.path.join(self.directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+
+    def items(self, kind: str) -> list[dict]:
+        index_path, parse_index, _ = KINDS[kind]
+        html = self.read(index_path)
+        return parse_index(html) if html is not None else []
+
+    def reference_path(self) -> str:
+        return os.path.join(self.directory, "reference.json")
+
+    def load_reference(self) -> dict | None:
+        if not os.path.exists(self.reference_path()):
+            return None
+        with open(self.reference_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_reference(self):
+        """Разбирает записанные страницы исходным бэкендом (bs4) последовательно, без пула."""
+        reference = {}
+        for kind, (_, _, process_page) in KINDS.items():
+            results = []
+            for item in self.items(kind):
+                html = self.read(_path(fetcher.page_url(item["url"], "http://replay")))
+                result = process_page(item, html) if html is not None else None
+                if result:
+                    results.append(result)
+            reference[kind] = results
+        with open(self.reference_path(), "w", encoding="utf-8") as f:
+            json.dump(reference, f, ensure_ascii=False)
+
+
+async def capture(directory: str, base_url: str | None = None):
+    """Записывает списки маршрутов и все страницы расписаний."""
+    fixture = Fixture(directory)
+    semaphore = asyncio.Semaphore(fetcher.CONCURRENCY)
+    async with fetcher.create_session() as session:
+        async def store(url: str) -> str | None:
+            try:
+                page = await fetcher.fetch(session, url, semaphore=semaphore)
+            except fetcher.FetchError as e:
+                logging.error(f"Не записано: {e}")
+                return None
+            fixture.add(_path(url), page.text, page.etag, page.last_modified)
+            return page.text
+
+        for kind, (index_path, parse_index, _) in KINDS.items():
+            html = await store(fetcher.page_url(index_path, base_url))
+            if html is None:
+                continue
+            items = parse_index(html)
+            await asyncio.gather(*(store(fetcher.page_url(item["url"], base_url)) for item in items))
+            logging.info(f"{kind}: записано {len(items)} страниц")
+    fixture.save()
+    return fixture
+
+
+def synthesize(directory: str) -> Fixture:
+    """Каталог из синтетических страниц, собранных по сохранённому расписанию."""
+    fixture = Fixture(directory)
+    pages = synthetic_pages.site(
+        synthetic_pages.load_json(bus_parser.BUS_SCHEDULE),
+        synthetic_pages.load_json(trolleybus_parser.TROLLEYBUS_SCHEDULE),
+    )
+    for path, html in pages.items():
+        fixture.add(path, html)
+    fixture.save()
+    return fixture
+
+
+# --- Сервер воспроизведения ---
+
+class ReplayServer:
+    """
+    HTTP-сервер с записанными страницами. latency - задержка ответа в секундах,
+    fail_every - каждый N-й запрос отвечает 503 (0 - без ошибок).
+    """
+
+    def __init__(self, fixture: Fixture, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, fail_every: int = 0):
+        self.fixture = fixture
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.fail_every = fail_every
+        self.requests = 0
+        self.not_modified = 0
+        self._runner: web.AppRunner | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_every and self.requests % self.fail_every == 0:
+            return web.Response(status=503)
+        path = request.path + (f"?{request.query_string}" if request.query_string else "")
+        html = self.fixture.read(path)
+        if html is None:
+            return web.Response(status=404)
+        entry = self.fixture.manifest[path]
+        etag = entry.get("etag") or '"%s"' % hashlib.md5(html.encode("utf-8")).hexdigest()
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        headers = {"ETag": etag}
+        if entry.get("last_modified"):
+            headers["Last-Modified"] = entry["last_modified"]
+        return web.Response(text=html, content_type="text/html", charset="utf-8", headers=headers)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self):
+        """Запускает сервер в отдельном потоке со своим event loop (обход сайта идёт в своём loop)."""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        threading.Thread(target=serve, name="replay-server", daemon=True).start()
+        started.wait()
+        return self
+
+    def stop_thread(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def _serve_forever(server: ReplayServer):
+    await server.start()
+    logging.info(f"Воспроизведение {len(server.fixture.manifest)} страниц на {server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    capture_cmd = commands.add_parser("capture", help="записать страницы с сайта")
+    capture_cmd.add_argument("directory")
+    capture_cmd.add_argument("--base-url", default=None)
+    synthesize_cmd = commands.add_parser("synthesize", help="собрать страницы из сохранённого расписания")
+    synthesize_cmd.add_argument("directory")
+    serve_cmd = commands.add_parser("serve", help="отдавать записанные страницы")
+    serve_cmd.add_argument("directory")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=8080)
+    serve_cmd.add_argument("--latency", type=float, default=0.0, help="задержка ответа, мс")
+    serve_cmd.add_argument("--fail-every", type=int, default=0, help="каждый N-й запрос отвечает 503")
+    args = arg_parser.parse_args()
+
+    if args.command == "capture":
+        fixture = asyncio.run(capture(args.directory, args.base_url))
+        fixture.write_reference()
+    elif args.command == "synthesize":
+        synthesize(args.directory).write_reference()
+    else:
+        server = ReplayServer(Fixture(args.directory), args.host, args.port, args.latency / 1000, args.fail_every)
+        try:
+            asyncio.run(_serve_forever(server))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE replay.py ---
@@ -0,0 +1,127 @@
+# --- START OF FILE synthetic_pages.py ---
+
+"""
+Синтетические страницы mogilev.biz, собранные из сохранённого расписания.
+
+Разметка повторяет то, что ожидают парсеры: список маршрутов, заголовок
+"Маршрут движения ... №N:", таблицы под заголовками h2 для будних и выходных.
+Часть минут у автобусов обёрнута в <span>, чтобы задеть и медленный путь
+разбора ячеек. Используется бенчмарками, когда записанных страниц нет.
+"""
+
+import json
+from html import escape
+
+BUS_INDEX_PATH = "/spravka/transport/busgor/"
+TROLLEYBUS_INDEX_PATH = "/spravka/transport/troll/"
+
+
+def load_json(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return list(data.values()) if isinstance(data, dict) else data
+
+
+def bus_page_path(number: str) -> str:
+    return f"/spravka/transport/busgor/{escape(number.replace(' ', ''))}/"
+
+
+def trolleybus_page_path(number: str) -> str:
+    return f"/spravka/transport/troll/{escape(number.replace(' ', ''))}/"
+
+
+def _page(title: str, body: str) -> str:
+    return (
+        "<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>" + escape(title) + "</title></head>\n"
+        "<body>\n" + body + "\n</body>\n</html>\n"
+    )
+
+
+# --- Автобусы ---
+
+def bus_index(buses: list[dict]) -> str:
+    rows = ["<tr><th>Маршрут</th><th>Расписание</th></tr>"]
+    for bus in buses:
+        rows.append(
+            f"<tr><td><span>Автобус №{escape(bus['number'])}</span> {escape(bus.get('route_name', ''))}</td>"
+            f"<td><a href=\"{bus_page_path(bus['number'])}\">Расписание</a></td></tr>"
+        )
+    return _page("Городские автобусы", "<table class=\"adapt-list-schedule\">\n" + "\n".join(rows) + "\n</table>")
+
+
+def _bus_cell(times: list[str], seed: int) -> str:
+    hours: dict[str, list[str]] = {}
+    for time in times:
+        hour, _, minute = time.partition(":")
+        hours.setdefault(hour, []).append(minute[:2])
+    divs = []
+    for i, (hour, minutes) in enumerate(hours.items()):
+        if (seed + i) % 5 == 0 and len(minutes) > 1:
+            tail = " ".join(minutes[:-1]) + f" <span class=\"lowfloor\">{minutes[-1]}</span>"
+        else:
+            tail = " ".join(minutes)
+        divs.append(f"<div><b>{hour}</b> {tail}</div>")
+    return "".join(divs)
+
+
+def _bus_table(route: dict) -> str:
+    rows = []
+    for i, stop in enumerate(route.get("stops", [])):
+        rows.append(f"<tr>\n<td>{escape(stop['name'])}</td>\n<td>{_bus_cell(stop['times'], i)}</td>\n</tr>")
+    return (
+        "<table class=\"schedule\">\n<thead><tr><th colspan=\"2\"><center><strong>"
+        + escape(route.get("name", "")) + "</strong></center></th></tr></thead>\n<tbody>\n"
+        + "\n".join(rows) + "\n</tbody>\n</table>"
+    )
+
+
+def bus_page(bus: dict) -> str:
+    parts = [f"<p><strong>Маршрут движения автобуса №{escape(bus['number'])}:</strong></p>"]
+    for title, key in (("будние дни", "route_weekdays"), ("выходные дни", "route_weekends")):
+        parts.append(f"<h2>Расписание на {title}</h2>")
+        parts.extend(_bus_table(route) for route in bus.get(key) or [])
+    return _page(f"Автобус {bus['number']}", "\n".join(parts))
+
+
+# --- Троллейбусы ---
+
+def trolleybus_index(trolleybuses: list[dict]) -> str:
+    rows = ["<tr><th>№</th><th>Маршрут</th><th></th></tr>"]
+    for trolleybus in trolleybuses:
+        route_name = trolleybus.get("route_name", "").replace(" - ", " – ")
+        rows.append(
+            f"<tr><td>{escape(trolleybus['number'])}</td><td>{escape(route_name)}</td>"
+            f"<td><a href=\"{trolleybus_page_path(trolleybus['number'])}\">Расписание</a></td></tr>"
+        )
+    return _page("Троллейбусы", "<table class=\"table\">\n" + "\n".join(rows) + "\n</table>")
+
+
+def _trolleybus_block(routes: list[dict]) -> str:
+    items = []
+    for route_idx, route in enumerate(routes[:2]):
+        stops = route.get("stops", [])
+        for i, stop in enumerate(stops):
+            name = stop["name"]
+            if route_idx == 1 and i == 0 and routes[0].get("stops"):
+                # Конечная повторяется: по ней парсер находит начало обратного направления
+                name = routes[0]["stops"][-1]["name"]
+            items.append(f"<p class=\"stop\">{escape(name)}</p>\n<p>{escape(', '.join(stop['times']))}</p>")
+    return "<div class=\"schedule\">\n" + "\n".join(items) + "\n</div>"
+
+
+def trolleybus_page(trolleybus: dict) -> str:
+    parts = [f"<p><strong>Маршрут движения троллейбуса №{escape(trolleybus['number'])}:</strong></p>"]
+    for title, key in (("будние дни", "route_weekdays"), ("выходные дни", "route_weekends")):
+        parts.append(f"<h2>Расписание на {title}</h2>")
+        parts.append(_trolleybus_block(trolleybus.get(key) or []))
+    return _page(f"Троллейбус {trolleybus['number']}", "\n".join(parts))
+
+
+def site(buses: list[dict], trolleybuses: list[dict]) -> dict[str, str]:
+    """Все страницы сайта: {путь: html}."""
+    pages = {BUS_INDEX_PATH: bus_index(buses), TROLLEYBUS_INDEX_PATH: trolleybus_index(trolleybuses)}
+    pages.update((bus_page_path(bus["number"]), bus_page(bus)) for bus in buses)
+    pages.update((trolleybus_page_path(trolleybus["number"]), trolleybus_page(trolleybus)) for trolleybus in trolleybuses)
+    return pages
+
+# --- END OF FILE synthetic_pages.py ---
@@ -0,0 +1,340 @@
+# --- START OF FILE outbound.py ---
+
+"""
+Очередь исходящих запросов к Bot API с ограничением частоты.
+
+Подключается к сессии бота как request middleware (bot.session.middleware),
+поэтому хендлеры по-прежнему вызывают message.answer / edit_text и получают
+результат, а запросы с chat_id проходят через очередь:
+
+  - ведро токенов на чат (личный чат ~1 сообщение/с, группа 20/мин) и общее
+    ведро (30/с) - запрос уходит, когда есть токен в обоих;
+  - правки уже отправленных сообщений (_UNMETERED_METHODS) ведро чата не
+    тратят и не ждут, только общее: лимит чата у Telegram - на новые
+    сообщения, а с ведром чата пятое быстрое нажатие кнопки ждало бы токен
+    ~1 с. Пауза чата после 429 действует и на правки;
+  - приоритеты: INTERACTIVE (правка сообщений - ответ на нажатие кнопки)
+    раньше NORMAL (новые сообщения), NORMAL раньше BULK (рассылки, см.
+    priority()); внутри приоритета одного чата - по порядку;
+  - ответ 429 (TelegramRetryAfter): чат ставится на паузу на retry_after,
+    запрос возвращается в начало очереди чата и повторяется до MAX_RETRIES раз.
+
+Запросы без chat_id (answerCallbackQuery, getUpdates, ...) идут сразу.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+INTERACTIVE, NORMAL, BULK = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BULK: "bulk"}
+
+GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))         # запросов в секунду на бота
+CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))              # в секунду на личный чат
+GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", str(20 / 60)))   # в секунду на группу
+CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))            # запросов подряд без ожидания
+MAX_RETRIES = 3
+SWEEP_INTERVAL = 60.0
+
+# Правки уже показанных сообщений - ответ на нажатие, их ждёт пользователь
+_INTERACTIVE_METHODS = {"EditMessageText", "EditMessageReplyMarkup", "EditMessageCaption", "DeleteMessage"}
+# Из них не расходуют ведро чата - новых сообщений в чате не появляется
+_UNMETERED_METHODS = {"EditMessageText", "EditMessageReplyMarkup", "EditMessageCaption"}
+
+_priority: contextvars.ContextVar[int | None] = contextvars.ContextVar("send_priority", default=None)
+
+
+@contextlib.contextmanager
+def priority(level: int):
+    """Приоритет запросов внутри блока: with outbound.priority(outbound.BULK): await bot.send_message(...)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity про запас."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет токен (0 - уже есть)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ("call", "future", "priority", "enqueued", "retries", "metered")
+
+    def __init__(self, call, future: asyncio.Future, priority: int, enqueued: float, metered: bool = True):
+        self.call = call
+        self.future = future
+        self.priority = priority
+        self.enqueued = enqueued
+        self.retries = 0
+        self.metered = metered  # расходует ведро чата
+
+
+class _Chat:
+    __slots__ = ("bucket", "queues", "paused_until", "waiting")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.queues = tuple(deque() for _ in PRIORITY_NAMES)
+        self.paused_until = 0.0
+        self.waiting = False  # чат стоит в _waiting (ждёт токен или конец паузы)
+
+    def head(self) -> _Job | None:
+        for queue in self.queues:
+            if queue:
+                return queue[0]
+        return None
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    """
+    Request middleware сессии бота. Один планировщик на event loop выбирает
+    следующий запрос: чат с самым срочным первым запросом, у которого есть
+    токен; сами запросы выполняются отдельными задачами.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 group_rate: float = GROUP_RATE, chat_burst: float = CHAT_BURST,
+                 max_retries: int = MAX_RETRIES, clock=time.monotonic):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._chats: dict[int | str, _Chat] = {}
+        # (приоритет первого запроса, seq, chat_id) - можно отправлять. Записи одного чата
+        # могут повторяться: лишние отбрасываются при извлечении
+        self._ready: list = []
+        self._waiting: list = []  # (когда, seq, chat_id) - ждут токен или конец паузы, одна запись на чат
+        self._seq = itertools.count()
+        self._next_sweep = 0.0
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self._in_flight: set[asyncio.Task] = set()
+        # Метрики
+        self.sent = {level: 0 for level in PRIORITY_NAMES}
+        self.retried = 0
+        self.failed = 0
+        self.max_depth = 0
+        self._waits = {level: deque(maxlen=1000) for level in PRIORITY_NAMES}
+
+    # --- Request middleware ---
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        level = _priority.get()
+        if level is None:
+            level = INTERACTIVE if type(method).__name__ in _INTERACTIVE_METHODS else NORMAL
+        metered = type(method).__name__ not in _UNMETERED_METHODS
+        return await self.submit(chat_id, lambda: make_request(bot, method), level, metered)
+
+    async def submit(self, chat_id, call, level: int = NORMAL, metered: bool = True):
+        """
+        Ставит call() (корутинная функция) в очередь чата и ждёт его результат.
+        metered=False - запрос не расходует ведро чата (правка сообщения).
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chat(chat_id)
+        job = _Job(call, future, level, self.clock(), metered)
+        chat.queues[level].append(job)
+        self.max_depth = max(self.max_depth, self.depth())
+        if chat.waiting and chat.head() is job and chat.paused_until <= self.clock():
+            # Чат ждёт токен для прежнего первого запроса, а этому токен не нужен
+            chat.waiting = False
+        self._schedule(chat_id, chat)
+        return await future
+
+    # --- Планировщик ---
+
+    def _chat(self, chat_id) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            chat = self._chats[chat_id] = _Chat(TokenBucket(rate, self.chat_burst, self.clock()))
+        return chat
+
+    def _schedule(self, chat_id, chat: _Chat):
+        """Ставит чат с запросами в _ready (токен есть) или в _waiting (до появления токена)."""
+        if chat.waiting:
+            return  # станет готов по таймеру, приоритет возьмётся из очереди в тот момент
+        head = chat.head()
+        now = self.clock()
+        if head is None:
+            chat.bucket.delay(now)  # пополнить
+            if chat.paused_until <= now and chat.bucket.tokens >= chat.bucket.capacity:
+                del self._chats[chat_id]  # полное ведро и нет запросов - состояние не нужно
+            return
+        ready_at = max(chat.paused_until, now + (chat.bucket.delay(now) if head.metered else 0.0))
+        if ready_at <= now:
+            heapq.heappush(self._ready, (head.priority, next(self._seq), chat_id))
+        else:
+            chat.waiting = True
+            heapq.heappush(self._waiting, (ready_at, next(self._seq), chat_id))
+        self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run(), name="outbound-queue")
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._waiting)
+                chat = self._chats.get(chat_id)
+                if chat is not None:
+                    chat.waiting = False
+                    self._schedule(chat_id, chat)
+            if now >= self._next_sweep:
+                self._sweep(now)
+            timeout = self._waiting[0][0] - now if self._waiting else None
+            if self._ready:
+                global_delay = self._global.delay(now)
+                if global_delay:
+                    timeout = global_delay if timeout is None else min(timeout, global_delay)
+                else:
+                    self._dispatch_one(now)
+                    continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _sweep(self, now: float):
+        """Удаляет чаты без запросов, у которых ведро успело наполниться."""
+        self._next_sweep = now + SWEEP_INTERVAL
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.waiting and chat.head() is None:
+                self._schedule(chat_id, chat)
+
+    def _dispatch_one(self, now: float):
+        _, _, chat_id = heapq.heappop(self._ready)
+        chat = self._chats.get(chat_id)
+        head = chat.head() if chat else None
+        if head is None or chat.waiting:
+            return  # лишняя запись: запросы уже отправлены или чат ждёт в _waiting
+        if chat.paused_until > now or (head.metered and chat.bucket.delay(now)):
+            self._schedule(chat_id, chat)
+            return
+        chat.queues[head.priority].popleft()
+        if head.metered:
+            chat.bucket.take(now)
+        self._global.take(now)
+        self._waits[head.priority].append(now - head.enqueued)
+        task = asyncio.create_task(self._send(chat_id, head))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+        self._schedule(chat_id, chat)
+
+    async def _send(self, chat_id, job: _Job):
+        try:
+            result = await job.call()
+        except TelegramRetryAfter as e:
+            chat = self._chat(chat_id)
+            chat.paused_until = max(chat.paused_until, self.clock() + e.retry_after)
+            if job.retries < self.max_retries and not job.future.done():
+                job.retries += 1
+                self.retried += 1
+                logging.warning(f"Flood limit for chat {chat_id}: retry in {e.retry_after}s ({job.retries}/{self.max_retries})")
+                chat.queues[job.priority].appendleft(job)
+                if chat.waiting:
+                    # Чат уже ждёт в _waiting, но раньше конца паузы - поставим заново
+                    chat.waiting = False
+                self._schedule(chat_id, chat)
+                return
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent[job.priority] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+
+    # --- Метрики и остановка ---
+
+    def depth(self) -> int:
+        return sum(len(queue) for chat in self._chats.values() for queue in chat.queues)
+
+    def stats(self) -> dict:
+        """Глубина очередей по приоритетам, отправлено, повторы и ожидание в очереди (p50/p99, мс)."""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for chat in self._chats.values():
+            for level, queue in enumerate(chat.queues):
+                depth[PRIORITY_NAMES[level]] += len(queue)
+        waits = {}
+        for level, samples in self._waits.items():
+            if samples:
+                ordered = sorted(samples)
+                waits[PRIORITY_NAMES[level]] = {
+                    "p50_ms": ordered[len(ordered) // 2] * 1000,
+                    "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+                }
+        return {
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "chats": len(self._chats),
+            "in_flight": len(self._in_flight),
+            "sent": {PRIORITY_NAMES[level]: count for level, count in self.sent.items()},
+            "retried": self.retried,
+            "failed": self.failed,
+            "wait": waits,
+        }
+
+    async def close(self, timeout: float = 10.0):
+        """Ждёт отправки очереди (не дольше timeout) и останавливает планировщик."""
+        deadline = self.clock() + timeout
+        while (self.depth() or self._in_flight) and self.clock() < deadline:
+            await asyncio.sleep(0.05)
+        if self._worker is not None:
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+        logging.info(f"Outbound queue stopped: {self.stats()}")
+
+# --- END OF FILE outbound.py ---
@@ -0,0 +1,263 @@
+# --- START OF FILE reminders.py ---
+
+"""
+Напоминания об отправлении ("напомнить за N минут до рейса").
+
+Все ожидающие напоминания обслуживает один планировщик: куча (heapq) пар
+(время срабатывания, id) и одна задача, которая спит до ближайшего
+срабатывания, - а не задача с asyncio.sleep на каждое напоминание. Добавление -
+O(log n), отмена - O(1): отменённая запись остаётся в куче и пропускается при
+извлечении (куча пересобирается, когда таких больше половины). Десятки тысяч
+напоминаний - несколько мегабайт памяти и микросекунды на операцию
+(bench/bench_reminders.py).
+
+Напоминания хранятся в SQLite (storage/reminders.py) и после перезапуска
+загружаются заново. Сработавшие сначала "забираются" в базе одной транзакцией на
+пачку (разовые удаляются, у ежедневных переписывается время) и только потом
+отправляются, так что каждое срабатывание уходит не больше одного раза. Если
+рейс уже ушёл (бот не работал), напоминание не отправляется. Отправка - через
+очередь delivery/outbound.py с приоритетом BULK: сотни напоминаний в 7:50 не
+задерживают ответы на нажатия кнопок.
+
+Если напоминания добавляют и другие процессы (рабочие процессы supervisor.py),
+планировщик раз в poll_interval секунд дочитывает из базы новые строки;
+удалённые другими процессами отсеиваются при забирании.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import heapq
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramForbiddenError
+
+from delivery import outbound
+from storage.reminders import Reminder, SqliteReminderStore
+from timetable import departures
+
+MAX_SLEEP = 60.0        # планировщик просыпается не реже раза в минуту (перевод часов, сон машины)
+CLAIM_BATCH = 500       # сработавших напоминаний на одну транзакцию
+SEND_CONCURRENCY = 32   # одновременных отправок; темп всё равно задаёт очередь outbound
+LOOKAHEAD_DAYS = 8      # ближайший день нужного типа ищется не дальше недели
+RETRY_DELAY = 5.0       # пауза после ошибки базы, с
+
+GONE_TEXT = "⏰ Рейса в {time} больше нет в расписании ({label}). Напоминание удалено."
+
+
+def fire_time(day: datetime.date, departure: int, lead: int) -> float:
+    """Unix-время напоминания о рейсе departure суток обслуживания day (местное время)."""
+    departure_at = datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(minutes=departure - lead)
+    return departure_at.timestamp()
+
+
+def next_fire_at(departure: int, lead: int, day_type: str, after: float) -> float | None:
+    """Ближайшее после after срабатывание для рейса departure по дням с типом day_type."""
+    first_day = departures.service_date(datetime.datetime.fromtimestamp(after))
+    for offset in range(LOOKAHEAD_DAYS):
+        day = first_day + datetime.timedelta(days=offset)
+        if departures.day_type(day) == day_type:
+            fire_at = fire_time(day, departure, lead)
+            if fire_at > after:
+                return fire_at
+    return None
+
+
+def _percentile_ms(ordered: list[float], share: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] * 1000 if ordered else 0.0
+
+
+class ReminderScheduler:
+    """
+    Планировщик напоминаний одного процесса. render(reminder) возвращает
+    (текст, клавиатура) сообщения или None, если рейса больше нет в расписании
+    (тогда напоминание удаляется, а пользователь получает GONE_TEXT).
+    """
+
+    def __init__(self, bot, store: SqliteReminderStore, render, poll_interval: float = 0.0,
+                 concurrency: int = SEND_CONCURRENCY):
+        self.bot = bot
+        self.store = store
+        self.render = render
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self._heap: list[tuple[float, int]] = []
+        self._pending: dict[int, Reminder] = {}
+        self._max_id = 0
+        self._wakeup = asyncio.Event()
+        self._outbox: asyncio.Queue[Reminder] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._senders: list[asyncio.Task] = []
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.missed = 0   # рейс ушёл раньше, чем напоминание удалось отправить
+        self._lateness = deque(maxlen=10000)  # от fire_at до ответа Bot API, с
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    # --- Куча ---
+
+    def add(self, reminder: Reminder):
+        """Ставит сохранённое напоминание (или новую версию с тем же id) в расписание."""
+        self._pending[reminder.id] = reminder
+        heapq.heappush(self._heap, (reminder.fire_at, reminder.id))
+        if reminder.id > self._max_id:
+            self._max_id = reminder.id
+        if self._heap[0][0] >= reminder.fire_at:
+            self._wakeup.set()  # стало ближайшим - пересчитать время сна
+
+    def cancel(self, reminder_id: int) -> bool:
+        if self._pending.pop(reminder_id, None) is None:
+            return False
+        if len(self._heap) > 2 * len(self._pending) + 64:
+            self._heap = [(reminder.fire_at, reminder.id) for reminder in self._pending.values()]
+            heapq.heapify(self._heap)
+        return True
+
+    def cancel_user(self, user_id: int) -> int:
+        """Отменяет все напоминания пользователя (O(n), только когда бот заблокирован)."""
+        ids = [reminder.id for reminder in self._pending.values() if reminder.user_id == user_id]
+        for reminder_id in ids:
+            self.cancel(reminder_id)
+        return len(ids)
+
+    def pop_due(self, now: float, limit: int = CLAIM_BATCH) -> list[Reminder]:
+        """Снимает с кучи сработавшие к now напоминания (не больше limit)."""
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] <= now and len(due) < limit:
+            fire_at, reminder_id = heapq.heappop(heap)
+            reminder = self._pending.get(reminder_id)
+            if reminder is None or reminder.fire_at != fire_at:
+                continue  # отменено или перенесено - запись устарела
+            del self._pending[reminder_id]
+            due.append(reminder)
+        return due
+
+    # --- Работа ---
+
+    async def start(self):
+        """Загружает напоминания из базы и запускает планировщик и отправителей."""
+        for reminder in await asyncio.to_thread(self.store.load_pending):
+            self.add(reminder)
+        self._task = asyncio.create_task(self._run(), name="reminders")
+        self._senders = [asyncio.create_task(self._send_loop()) for _ in range(self.concurrency)]
+        logging.info(f"Reminder scheduler started: {len(self)} pending")
+
+    async def _run(self):
+        next_poll = time.monotonic() + self.poll_interval
+        while True:
+            now = time.time()
+            due = self.pop_due(now)
+            if due:
+                try:
+                    await self._fire(due, now)
+                except Exception as e:
+                    logging.error(f"Failed to claim {len(due)} reminders: {e}", exc_info=True)
+                    await asyncio.sleep(RETRY_DELAY)
+                    for reminder in due:
+                        self.add(reminder)
+                continue
+
+            timeout = MAX_SLEEP
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - now)
+            if self.poll_interval:
+                timeout = min(timeout, next_poll - time.monotonic())
+            self._wakeup.clear()
+            if timeout > 0:
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+            if self.poll_interval and time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + self.poll_interval
+                try:
+                    for reminder in await asyncio.to_thread(self.store.load_pending, self._max_id):
+                        self.add(reminder)
+                except Exception as e:
+                    logging.error(f"Failed to read new reminders: {e}", exc_info=True)
+
+    async def _fire(self, due: list[Reminder], now: float):
+        claims = []
+        for reminder in due:
+            following = None
+            if reminder.daily:
+                following = next_fire_at(reminder.departure, reminder.lead, reminder.day_type, max(now, reminder.fire_at))
+            claims.append((reminder.id, reminder.fire_at, following))
+        claimed = await asyncio.to_thread(self.store.claim, claims)
+        for reminder, (_, _, following) in zip(due, claims):
+            if reminder.id not in claimed:
+                continue
+            if following is not None:
+                self.add(reminder._replace(fire_at=following))
+            if now > reminder.fire_at + reminder.lead * 60:
+                self.missed += 1
+            else:
+                self._outbox.put_nowait(reminder)
+
+    async def _send_loop(self):
+        while True:
+            reminder = await self._outbox.get()
+            try:
+                await self._send(reminder)
+            except Exception as e:
+                self.failed += 1
+                logging.warning(f"User {reminder.user_id}: reminder {reminder.id} not sent: {e}")
+            finally:
+                self._outbox.task_done()
+
+    async def _send(self, reminder: Reminder):
+        rendered = self.render(reminder)
+        if rendered is None:
+            await asyncio.to_thread(self.store.delete, reminder.user_id, reminder.id)
+            self.cancel(reminder.id)
+            text, markup = GONE_TEXT.format(time=departures.format_time(reminder.departure), label=reminder.label), None
+        else:
+            text, markup = rendered
+        try:
+            with outbound.priority(outbound.BULK):
+                await self.bot.send_message(reminder.chat_id, text, reply_markup=markup)
+        except TelegramForbiddenError:
+            # Бот заблокирован - остальные напоминания пользователя тоже не нужны
+            self.failed += 1
+            removed = await asyncio.to_thread(self.store.delete_user, reminder.user_id)
+            self.cancel_user(reminder.user_id)
+            logging.info(f"User {reminder.user_id}: bot blocked, {len(removed)} reminders removed")
+            return
+        self.sent += 1
+        self._lateness.append(time.time() - reminder.fire_at)
+
+    def stats(self) -> dict:
+        ordered = sorted(self._lateness)
+        return {
+            "pending": len(self._pending),
+            "heap": len(self._heap),
+            "queued": self._outbox.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "missed": self.missed,
+            "lateness_p50_ms": _percentile_ms(ordered, 0.5),
+            "lateness_p99_ms": _percentile_ms(ordered, 0.99),
+        }
+
+    async def close(self, timeout: float = 10.0):
+        """Останавливает планировщик; уже забранные напоминания дожидаются отправки (не дольше timeout)."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._senders:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._outbox.join(), timeout)
+            for task in self._senders:
+                task.cancel()
+            await asyncio.gather(*self._senders, return_exceptions=True)
+            self._senders = []
+        logging.info(f"Reminder scheduler stopped: {self.stats()}")
+
+# --- END OF FILE reminders.py ---
@@ -0,0 +1,467 @@
+# --- START OF FILE callbacks.py ---
+
+"""
+Компактный формат callback data.
+
+Вместо строк вида "toggle_day_trolleybus_12_1_s23_we_1" кнопки несут
+base64url (без '=') от байтов:
+
+    [версия формата][код действия][поля действия]
+
+Целые числа упакованы varint (7 бит на байт), тип транспорта и тип дня -
+одним числом, номер маршрута "12" - числом, "11к" / "16 Д" - длиной и UTF-8.
+Ссылка на остановку ("s<ID>" или позиция, см. common_handlers.stop_ref) -
+одно число с признаком в младшем бите.
+
+Callback data разбирается один раз в PayloadMiddleware в типизированный
+объект (NamedTuple действия ниже), который хендлер получает аргументом
+payload; хендлер выбирается по объекту в CallbackRouter без перебора фильтров. Кнопки старых сообщений (строки с "_") разбираются в те же объекты.
+"""
+
+import base64
+import logging
+import re
+from typing import NamedTuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters import Filter
+from aiogram.types import CallbackQuery
+
+FORMAT_VERSION = 1
+MAX_CALLBACK_BYTES = 64  # ограничение Telegram на callback_data
+
+# Фиксированные значения (индекс в кортеже - упакованное число)
+TRANSPORT_TYPES = ("bus", "trolleybus")
+DAY_TYPES = ("wd", "we")
+
+_FIELD_KINDS = {}  # класс действия -> виды полей
+_ACTIONS = {}      # код -> класс действия
+_READERS = {}      # класс действия -> функции чтения полей (заполняется после _KINDS)
+
+
+def _action(code: int, *kinds: str):
+    """Регистрирует класс действия с кодом и видами полей (по порядку полей NamedTuple)."""
+    def register(cls):
+        assert code not in _ACTIONS and len(kinds) == len(cls._fields), cls.__name__
+        cls.code = code
+        _ACTIONS[code] = cls
+        _FIELD_KINDS[cls] = kinds
+        return cls
+    return register
+
+
+# --- Действия ---
+
+@_action(1, "transport", "uint")
+class ListPage(NamedTuple):
+    """Страница списка транспорта."""
+    transport_type: str
+    page: int
+
+@_action(2, "transport")
+class BackToList(NamedTuple):
+    transport_type: str
+
+@_action(3, "transport", "number")
+class Vehicle(NamedTuple):
+    """Выбор маршрута (и возврат к его направлениям)."""
+    transport_type: str
+    number: str
+
+@_action(4, "transport", "number", "uint")
+class Route(NamedTuple):
+    """Выбор направления."""
+    transport_type: str
+    number: str
+    route_idx: int
+
+@_action(5, "transport", "number", "uint", "ref", "day")
+class Stop(NamedTuple):
+    """Выбор остановки."""
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+    day_type: str
+
+@_action(6, "transport", "number", "uint", "ref", "day", "bool")
+class ToggleDay(NamedTuple):
+    """Переключение будни/выходные в расписании остановки."""
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+    day_type: str
+    from_favorites: bool
+
+@_action(7, "transport", "number", "uint", "ref")
+class FavoriteAdd(NamedTuple):
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+
+@_action(8, "transport", "number", "uint", "ref")
+class FavoriteShow(NamedTuple):
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+
+@_action(9, "transport", "number", "uint", "ref")
+class FavoriteDelete(NamedTuple):
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+
+@_action(10)
+class InFavorites(NamedTuple):
+    """Кнопка "Уже в избранном"."""
+
+@_action(11)
+class BackToFavorites(NamedTuple):
+    pass
+
+@_action(12)
+class BackToMain(NamedTuple):
+    pass
+
+@_action(13, "ref")
+class SearchStop(NamedTuple):
+    """Остановка из поиска (ссылка - как в search._stop_ref)."""
+    stop_ref: str
+
+@_action(14, "ref")
+class Board(NamedTuple):
+    """Табло отправлений остановки."""
+    stop_ref: str
+
+@_action(15, "transport", "number", "uint", "ref", "day", "bool")
+class ReminderPick(NamedTuple):
+    """Напоминание: выбор рейса в расписании остановки."""
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+    day_type: str
+    from_favorites: bool
+
+@_action(16, "transport", "number", "uint", "ref", "day", "bool", "uint")
+class ReminderDeparture(NamedTuple):
+    """Напоминание: рейс выбран (минута суток обслуживания), выбор времени."""
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+    day_type: str
+    from_favorites: bool
+    departure: int
+
+@_action(17, "transport", "number", "uint", "ref", "day", "bool", "uint", "uint", "bool")
+class ReminderAdd(NamedTuple):
+    """Напоминание за lead минут: один раз сегодня или каждый день с типом day_type."""
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+    day_type: str
+    from_favorites: bool
+    departure: int
+    lead: int
+    daily: bool
+
+@_action(18, "uint")
+class ReminderDelete(NamedTuple):
+    """Удаление напоминания из списка /reminders."""
+    reminder_id: int
+
+
+# --- Упаковка ---
+
+def _put_uint(out: bytearray, value: int):
+    if value < 0:
+        raise ValueError(f"Negative value {value}")
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_uint(raw: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(raw) or shift > 63:
+            raise ValueError("Truncated varint")
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _put_bool(out: bytearray, value: bool):
+    out.append(1 if value else 0)
+
+
+def _put_number(out: bytearray, value: str):
+    # "12" -> 12 << 1; "11к" -> (длина << 1 | 1) и UTF-8
+    if value.isdigit() and value.isascii() and str(int(value)) == value:
+        _put_uint(out, int(value) << 1)
+    else:
+        encoded = value.encode("utf-8")
+        _put_uint(out, len(encoded) << 1 | 1)
+        out += encoded
+
+
+def _put_ref(out: bytearray, value: str):
+    # "s23" -> 23 << 1 | 1; позиция "7" -> 7 << 1
+    if value.startswith("s"):
+        _put_uint(out, int(value[1:]) << 1 | 1)
+    else:
+        _put_uint(out, int(value) << 1)
+
+
+def _enum_writer(values: tuple):
+    codes = {value: code for code, value in enumerate(values)}
+
+    def put(out: bytearray, value: str):
+        try:
+            out.append(codes[value])
+        except KeyError:
+            raise ValueError(f"Unknown value {value!r}") from None
+    return put
+
+
+def _get_byte(raw: bytes, pos: int, limit: int) -> int:
+    if pos >= len(raw):
+        raise ValueError("Truncated payload")
+    value = raw[pos]
+    if value >= limit:
+        raise ValueError(f"Bad code {value}")
+    return value
+
+
+def _get_bool(raw: bytes, pos: int) -> tuple[bool, int]:
+    return bool(_get_byte(raw, pos, 2)), pos + 1
+
+
+def _get_number(raw: bytes, pos: int) -> tuple[str, int]:
+    value, pos = _get_uint(raw, pos)
+    if not value & 1:
+        return str(value >> 1), pos
+    end = pos + (value >> 1)
+    if end > len(raw):
+        raise ValueError("Truncated string")
+    return raw[pos:end].decode("utf-8"), end  # UnicodeDecodeError - подкласс ValueError
+
+
+def _get_ref(raw: bytes, pos: int) -> tuple[str, int]:
+    value, pos = _get_uint(raw, pos)
+    return (f"s{value >> 1}" if value & 1 else str(value >> 1)), pos
+
+
+def _enum_reader(values: tuple):
+    def get(raw: bytes, pos: int) -> tuple[str, int]:
+        return values[_get_byte(raw, pos, len(values))], pos + 1
+    return get
+
+
+# Вид поля -> (запись, чтение)
+_KINDS = {
+    "uint": (_put_uint, _get_uint),
+    "bool": (_put_bool, _get_bool),
+    "transport": (_enum_writer(TRANSPORT_TYPES), _enum_reader(TRANSPORT_TYPES)),
+    "day": (_enum_writer(DAY_TYPES), _enum_reader(DAY_TYPES)),
+    "number": (_put_number, _get_number),
+    "ref": (_put_ref, _get_ref),
+}
+
+
+def encode(payload: NamedTuple) -> str:
+    """Объект действия -> callback data. ValueError, если не помещается в 64 байта."""
+    out = bytearray((FORMAT_VERSION, payload.code))
+    for kind, value in zip(_FIELD_KINDS[type(payload)], payload):
+        _KINDS[kind][0](out, value)
+    data = base64.urlsafe_b64encode(out).rstrip(b"=").decode("ascii")
+    if len(data) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"Callback data too long ({len(data)} bytes): {payload!r}")
+    return data
+
+
+def decode(data: str) -> NamedTuple:
+    """Callback data -> объект действия. ValueError для чужих и повреждённых данных."""
+    if not data or len(data) > MAX_CALLBACK_BYTES:
+        raise ValueError("Bad callback data length")
+    try:
+        # validate: символы вне алфавита - ошибка, а не пропуск (строки старого формата)
+        raw = base64.b64decode(data + "=" * (-len(data) % 4), altchars=b"-_", validate=True)
+    except (ValueError, TypeError) as e:  # binascii.Error - подкласс ValueError
+        raise ValueError(f"Not base64url: {e}") from None
+    if len(raw) < 2 or raw[0] != FORMAT_VERSION:
+        raise ValueError("Unknown callback format version")
+    cls = _ACTIONS.get(raw[1])
+    if cls is None:
+        raise ValueError(f"Unknown action code {raw[1]}")
+    values, pos = [], 2
+    for read in _READERS[cls]:
+        value, pos = read(raw, pos)
+        values.append(value)
+    if pos != len(raw):
+        raise ValueError("Trailing bytes in callback data")
+    return cls(*values)
+
+
+_READERS.update((cls, tuple(_KINDS[kind][1] for kind in kinds)) for cls, kinds in _FIELD_KINDS.items())
+
+
+# --- Кнопки старых сообщений ---
+
+_TRANSPORT = "(bus|trolleybus)"
+_REF = r"(s?\d+)"
+_LEGACY = [
+    (re.compile(rf"list_{_TRANSPORT}_(\d+)"), lambda t, page: ListPage(t, int(page))),
+    (re.compile(rf"back_to_{_TRANSPORT}_list"), BackToList),
+    (re.compile(rf"route_{_TRANSPORT}_([^_]+)_(\d+)"), lambda t, n, r: Route(t, n, int(r))),
+    (re.compile(rf"stop_{_TRANSPORT}_([^_]+)_(\d+)_{_REF}_(wd|we)"), lambda t, n, r, s, d: Stop(t, n, int(r), s, d)),
+    (re.compile(rf"toggle_day_{_TRANSPORT}_([^_]+)_(\d+)_{_REF}_(wd|we)_([01])"),
+     lambda t, n, r, s, d, f: ToggleDay(t, n, int(r), s, d, f == "1")),
+    (re.compile(rf"favadd_{_TRANSPORT}_([^_]+)_(\d+)_{_REF}"), lambda t, n, r, s: FavoriteAdd(t, n, int(r), s)),
+    (re.compile(rf"fav_{_TRANSPORT}_([^_]+)_(\d+)_{_REF}"), lambda t, n, r, s: FavoriteShow(t, n, int(r), s)),
+    (re.compile(rf"favdel_{_TRANSPORT}_([^_]+)_(\d+)_{_REF}"), lambda t, n, r, s: FavoriteDelete(t, n, int(r), s)),
+    (re.compile("dummy_in_favorites"), InFavorites),
+    (re.compile("back_to_fav_list"), BackToFavorites),
+    (re.compile("back_to_main"), BackToMain),
+    (re.compile(rf"search_stop_{_REF}"), SearchStop),
+    (re.compile(rf"board_{_REF}"), Board),
+    (re.compile(rf"{_TRANSPORT}_([^_]+)"), Vehicle),
+]
+
+
+def decode_legacy(data: str) -> NamedTuple:
+    """Строковые callback data (до FORMAT_VERSION 1) -> объект действия."""
+    for pattern, build in _LEGACY:
+        match = pattern.fullmatch(data)
+        if match:
+            return build(*match.groups())
+    raise ValueError(f"Unknown callback data {data!r}")
+
+
+def parse(data: str) -> NamedTuple:
+    try:
+        return decode(data)
+    except ValueError:
+        return decode_legacy(data)
+
+
+# --- Маршрутизация ---
+
+class CallbackRouter:
+    """
+    Хендлеры колбэков по действию: payload -> хендлер двумя обращениями к словарю
+    (класс действия, затем значения полей-ключей, например transport_type),
+    без перебора фильтров aiogram. Порядок регистрации не важен, повторная
+    регистрация того же ключа - ошибка.
+
+        @callbacks.router(callbacks.Stop, transport_type="bus")
+        async def handler(callback: CallbackQuery, payload: callbacks.Stop): ...
+
+    Хендлер получает, как в aiogram, только объявленные аргументы: событие,
+    payload и данные middleware (bot, state, ...).
+    """
+
+    def __init__(self):
+        # класс действия -> (имена полей-ключей, {значения полей: хендлер})
+        self._routes: dict[type, tuple[tuple[str, ...], dict[tuple, CallableObject]]] = {}
+
+    def register(self, action: type, callback, **fields):
+        names = tuple(sorted(fields))
+        if not set(names) <= set(action._fields):
+            raise ValueError(f"{action.__name__} has no fields {names}")
+        known_names, handlers = self._routes.setdefault(action, (names, {}))
+        if known_names != names:
+            raise ValueError(f"{action.__name__} handlers must be keyed by the same fields: {known_names} != {names}")
+        key = tuple(fields[name] for name in names)
+        if key in handlers:
+            raise ValueError(f"Duplicate handler for {action.__name__} {fields}")
+        handlers[key] = CallableObject(callback)
+        return callback
+
+    def __call__(self, action: type, **fields):
+        """Декоратор регистрации хендлера."""
+        def decorator(callback):
+            return self.register(action, callback, **fields)
+        return decorator
+
+    def resolve(self, payload) -> CallableObject | None:
+        route = self._routes.get(type(payload))
+        if route is None:
+            return None
+        names, handlers = route
+        return handlers.get(tuple(getattr(payload, name) for name in names))
+
+    def __len__(self) -> int:
+        return sum(len(handlers) for _, handlers in self._routes.values())
+
+    def setup(self, dispatcher):
+        """
+        Подключает к диспетчеру: разбор и выбор хендлера - во внешнем middleware,
+        до фильтров; колбэки без хендлера получают ответ от запасного хендлера
+        (он же оставляет callback_query в resolve_used_update_types).
+        """
+        dispatcher.callback_query.outer_middleware(PayloadMiddleware(self))
+        dispatcher.callback_query.register(_unhandled)
+
+
+async def _unhandled(callback: CallbackQuery, payload=None):
+    logging.warning(f"User {callback.from_user.id}: no handler for callback {payload!r}")
+    await callback.answer("Кнопка устарела. Откройте меню заново.", show_alert=True)
+
+
+# Общий маршрутизатор хендлеров бота
+router = CallbackRouter()
+
+
+# --- Middleware и фильтр ---
+
+class PayloadMiddleware(BaseMiddleware):
+    """
+    Разбирает callback data один раз и вызывает хендлер из CallbackRouter,
+    передавая объект в аргументе payload. Для действий без хендлера в
+    маршрутизаторе событие идёт дальше по цепочке aiogram (фильтр On).
+    Нераспознанные данные (повреждённые или от удалённых кнопок) до хендлеров не доходят.
+    """
+
+    def __init__(self, callback_router: CallbackRouter | None = None):
+        self.callback_router = callback_router
+
+    async def __call__(self, handler, event: CallbackQuery, data: dict):
+        try:
+            payload = data["payload"] = parse(event.data or "")
+        except ValueError as e:
+            logging.warning(f"User {event.from_user.id}: unknown callback data {event.data!r}: {e}")
+            await event.answer("Кнопка устарела. Откройте меню заново.", show_alert=True)
+            return None
+        if self.callback_router is not None:
+            routed = self.callback_router.resolve(payload)
+            if routed is not None:
+                return await routed.call(event, **data)
+        return await handler(event, data)
+
+
+class On(Filter):
+    """
+    Фильтр хендлера aiogram по классу действия и значениям полей: On(Stop, transport_type="bus").
+    Перебирается линейно вместе с остальными фильтрами - для хендлеров бота используется CallbackRouter.
+    """
+
+    def __init__(self, action: type, **fields):
+        self.action = action
+        self.fields = fields
+
+    async def __call__(self, callback: CallbackQuery, payload=None) -> bool:
+        return type(payload) is self.action and all(getattr(payload, name) == value for name, value in self.fields.items())
+
+# --- END OF FILE callbacks.py ---
@@ -1,11 +1,13 @@
 # --- START OF FILE common_handlers.py ---
 
-import datetime
-from aiogram.types import CallbackQuery, InlineKeyboardButton, Message
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.exceptions import TelegramBadRequest
 import logging # Добавим логирование
+import os
 import utils # Импортируем utils для проверки избранного
+from timetable import departures, snapshot
+from handlers import callbacks, render_cache
 
 # --- Константы для типов транспорта и дней ---
 TYPE_BUS = "bus"
@@ -18,27 +20,17 @@ TRANSPORT_CONFIG = {
         "emoji": "🚌",
         "name_singular": "Автобус",
         "name_plural": "Автобусы",
-        "callback_prefix": "bus",
-        "fav_add_prefix": "favadd_bus",
-        "fav_show_prefix": "fav_bus",
-        "fav_del_prefix": "favdel_bus",
-        "toggle_day_prefix": "toggle_day_bus" # Префикс для переключения дня
     },
     TYPE_TROLLEYBUS: {
         "emoji": "🚎",
         "name_singular": "Троллейбус",
         "name_plural": "Троллейбусы",
-        "callback_prefix": "trolleybus",
-        "fav_add_prefix": "favadd_trolleybus",
-        "fav_show_prefix": "fav_trolleybus",
-        "fav_del_prefix": "favdel_trolleybus",
-        "toggle_day_prefix": "toggle_day_trolleybus" # Префикс для переключения дня
     },
 }
 
 def get_current_day_type() -> str:
-    """Возвращает текущий тип дня ('wd' или 'we')."""
-    return DAY_WD if datetime.datetime.today().weekday() < 5 else DAY_WE
+    """Возвращает текущий тип дня ('wd' или 'we') по суткам обслуживания (в 00:30 субботы ещё пятница)."""
+    return departures.day_type(departures.service_date())
 
 def get_opposite_day_type(day_type: str) -> str:
     """Возвращает противоположный тип дня."""
@@ -62,27 +54,151 @@ def get_day_type_name(day_type: str, case: str = "nominative") -> str:
         return "выходные" # именительный
     return "неизвестный день"
 
-# --- Общие функции ---
+def stop_ref(stop_id: int, stop_idx: int) -> str:
+    """
+    Ссылка на остановку в callback data и ключах избранного: "s<ID>" - постоянный ID
+    из реестра остановок (переживает обновления расписания), без ID - позиция в направлении.
+    """
+    return f"s{stop_id}" if stop_id else str(stop_idx)
 
-async def show_directions(callback: CallbackQuery, transport_type: str, transport_data: dict, number: str):
-    """Отображает выбор направления для указанного транспорта."""
+def resolve_stop(transport_data: snapshot.Snapshot, number: str, day_type: str, route_idx: int, ref: str) -> tuple[int, int]:
+    """
+    (route_idx, stop_idx) по ссылке stop_ref за O(1). Числовая ссылка - позиция
+    (кнопки старых сообщений и старое избранное). KeyError/ValueError, если не найдено.
+    """
+    if ref.startswith("s"):
+        return transport_data.find_stop(number, day_type, route_idx, int(ref[1:]))
+    return route_idx, int(ref)
+
+def fav_key(number: str, route_idx: int, ref: str) -> str:
+    """Ключ записи избранного: "номер_направление_ссылка" (ссылка - stop_ref)."""
+    return f"{number}_{route_idx}_{ref}"
+
+def parse_fav_key(key: str) -> tuple[str, int, str]:
+    """(номер, направление, ссылка) из ключа избранного. ValueError для чужих ключей."""
+    number, route_idx, ref = key.split("_")
+    return number, int(route_idx), ref
+
+# --- Список транспорта ---
+
+MESSAGE_LIMIT = 4096
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "18"))  # номеров на странице списка
+LIST_COLUMNS = 3
+
+VIEW_CACHE_SIZE = int(os.getenv("VIEW_CACHE_SIZE", "512"))
+
+
+class RenderedView:
+    """Готовое сообщение навигации: текст и клавиатура строятся один раз на версию данных."""
+
+    __slots__ = ("text", "markup")
+
+    def __init__(self, text: str, markup: InlineKeyboardMarkup):
+        self.text = text
+        self.markup = markup
+
+
+# Ключи начинаются с типа транспорта и версии данных (см. render_cache)
+# (тип, версия) -> [RenderedView] - страницы списка
+list_pages = render_cache.register("list_pages", render_cache.LRUCache(8))
+# (тип, версия, номер, тип дня) -> RenderedView - выбор направления
+direction_views = render_cache.register("direction_views", render_cache.LRUCache(VIEW_CACHE_SIZE))
+# (тип, версия, номер, направление, тип дня) -> RenderedView - список остановок
+stop_views = render_cache.register("stop_views", render_cache.LRUCache(VIEW_CACHE_SIZE))
+
+
+def _number_sort_key(number: str):
+    return (0, int(number)) if number.isdigit() else (1, number)
+
+
+def list_callback(transport_type: str, page: int) -> str:
+    return callbacks.encode(callbacks.ListPage(transport_type, page))
+
+
+def _build_list_pages(transport_type: str, transport_data: snapshot.Snapshot) -> list[RenderedView]:
+    """
+    Разбивает список на страницы по LIST_PAGE_SIZE номеров и не длиннее MESSAGE_LIMIT:
+    строки не режутся посередине, поэтому HTML-теги остаются целыми.
+    """
     config = TRANSPORT_CONFIG[transport_type]
-    try:
-        vehicle = transport_data[number]
-    except KeyError:
-        await callback.answer(f"{config['name_singular']} №{number} не найден.", show_alert=True)
+    title = f"<b>Список {config['name_plural']}:</b>\n"
+    chunks, lines, numbers = [], [], []
+    for number in sorted(transport_data.keys(), key=_number_sort_key):
+        vehicle = transport_data.vehicle(number)
+        line = f"<b>{config['emoji']} {config['name_singular']} №{vehicle.number}</b> — <code>{vehicle.route_name}</code>\n"
+        # Запас под заголовок со счётчиком страниц
+        if numbers and (len(numbers) >= LIST_PAGE_SIZE or len(title) + 16 + sum(map(len, lines)) + len(line) > MESSAGE_LIMIT):
+            chunks.append((lines, numbers))
+            lines, numbers = [], []
+        lines.append(line)
+        numbers.append(number)
+    if numbers:
+        chunks.append((lines, numbers))
+
+    pages = []
+    for page, (lines, numbers) in enumerate(chunks):
+        kb = InlineKeyboardBuilder()
+        for number in numbers:
+            kb.button(text=f"{config['emoji']} №{number}", callback_data=callbacks.encode(callbacks.Vehicle(transport_type, number)))
+        kb.adjust(LIST_COLUMNS)
+        header = title
+        if len(chunks) > 1:
+            header = f"<b>Список {config['name_plural']} ({page + 1}/{len(chunks)}):</b>\n"
+            kb.row(
+                InlineKeyboardButton(text="◀️", callback_data=list_callback(transport_type, (page - 1) % len(chunks))),
+                InlineKeyboardButton(text=f"{page + 1}/{len(chunks)}", callback_data=list_callback(transport_type, page)),
+                InlineKeyboardButton(text="▶️", callback_data=list_callback(transport_type, (page + 1) % len(chunks))),
+            )
+        pages.append(RenderedView(header + "".join(lines), kb.as_markup()))
+    return pages
+
+
+def get_list_pages(transport_type: str, transport_data: snapshot.Snapshot) -> list[RenderedView]:
+    """Страницы списка для текущей версии данных (из кэша; сбрасываются при перезагрузке расписания)."""
+    return list_pages.get_or_build(
+        (transport_type, getattr(transport_data, "version", None)),
+        lambda: _build_list_pages(transport_type, transport_data)
+    )
+
+
+async def show_transport_list(target: Message | CallbackQuery, transport_type: str, transport_data: snapshot.Snapshot, page: int = 0):
+    """
+    Показывает страницу списка: на сообщение - отвечает новым сообщением,
+    на колбэк - редактирует то же сообщение (листание и возврат к списку без новых отправок).
+    """
+    config = TRANSPORT_CONFIG[transport_type]
+    pages = get_list_pages(transport_type, transport_data) if transport_data else []
+    if not pages:
+        text = f"Не удалось загрузить расписание {config['name_plural']}. Попробуйте позже."
+        if isinstance(target, CallbackQuery):
+            await target.answer(text, show_alert=True)
+        else:
+            await target.answer(text)
         return
 
-    # Определяем маршруты на СЕГОДНЯ для отображения списка направлений
-    today_type = get_current_day_type()
-    routes_key = "route_weekdays" if today_type == DAY_WD else "route_weekends"
-    routes = vehicle.get(routes_key, [])
+    list_page = pages[min(max(page, 0), len(pages) - 1)]
+    if not isinstance(target, CallbackQuery):
+        await target.answer(list_page.text, reply_markup=list_page.markup)
+        return
+    try:
+        # Нажатие на счётчик текущей страницы ничего не меняет - не тратим запрос
+        if target.message.html_text != list_page.text.rstrip("\n"):
+            await target.message.edit_text(list_page.text, reply_markup=list_page.markup)
+    except TelegramBadRequest:
+        pass
+    await target.answer()
+
+# --- Общие функции ---
+
+def _build_direction_view(transport_type: str, transport_data: snapshot.Snapshot, number: str, today_type: str) -> RenderedView:
+    config = TRANSPORT_CONFIG[transport_type]
+    vehicle = transport_data.vehicle(number)
+    routes = vehicle.routes(today_type)
 
     if not routes:
         # Проверим, есть ли маршруты на другой день
         opposite_day_type = get_opposite_day_type(today_type)
-        opposite_routes_key = "route_weekdays" if opposite_day_type == DAY_WD else "route_weekends"
-        has_opposite_routes = bool(vehicle.get(opposite_routes_key))
+        has_opposite_routes = bool(vehicle.routes(opposite_day_type))
 
         message_text = (
             f"<b>{config['emoji']} {config['name_singular']} №{number}</b>\n\n"
@@ -94,80 +210,178 @@ async def show_directions(callback: CallbackQuery, transport_type: str, transpor
              message_text += "Данных на другие дни также нет."
 
         # Кнопка назад все равно нужна
-        kb = InlineKeyboardBuilder().button(text="🔙 Назад к списку", callback_data=f"back_to_{transport_type}_list")
-        await callback.message.edit_text(message_text, reply_markup=kb.as_markup())
-        return
+        kb = InlineKeyboardBuilder().button(text="🔙 Назад к списку", callback_data=callbacks.encode(callbacks.BackToList(transport_type)))
+        return RenderedView(message_text, kb.as_markup())
 
     arrows = ["⬅️", "➡️"]
-    direction_text = "\n".join([f"{arrows[i]} {route.get('name', 'Без названия')}" for i, route in enumerate(routes)])
+    direction_text = "\n".join([f"{arrows[i]} {route.name}" for i, route in enumerate(routes)])
 
     kb = InlineKeyboardBuilder()
     buttons = [
         InlineKeyboardButton(
             text=arrows[i],
-            callback_data=f"route_{config['callback_prefix']}_{number}_{i}"
+            callback_data=callbacks.encode(callbacks.Route(transport_type, number, i))
         ) for i in range(len(routes))
     ]
     kb.row(*buttons)
-    kb.row(InlineKeyboardButton(text="🔙 Назад к списку", callback_data=f"back_to_{transport_type}_list"))
+    kb.row(InlineKeyboardButton(text="🔙 Назад к списку", callback_data=callbacks.encode(callbacks.BackToList(transport_type))))
+    return RenderedView(
+        f"<b>{config['emoji']} {config['name_singular']} №{number}</b>\n\n"
+        f"Доступные направления (на {get_day_type_name(today_type, 'accusative')}):\n{direction_text}\n\n"
+        f"Выберите направление:",
+        kb.as_markup()
+    )
+
 
+async def show_directions(callback: CallbackQuery, transport_type: str, transport_data: snapshot.Snapshot, number: str):
+    """Отображает выбор направления для указанного транспорта."""
+    config = TRANSPORT_CONFIG[transport_type]
+    # Определяем маршруты на СЕГОДНЯ для отображения списка направлений
+    today_type = get_current_day_type()
     try:
-        await callback.message.edit_text(
-            f"<b>{config['emoji']} {config['name_singular']} №{number}</b>\n\n"
-            f"Доступные направления (на {get_day_type_name(today_type, 'accusative')}):\n{direction_text}\n\n"
-            f"Выберите направление:",
-            reply_markup=kb.as_markup()
+        view = direction_views.get_or_build(
+            (transport_type, getattr(transport_data, "version", None), number, today_type),
+            lambda: _build_direction_view(transport_type, transport_data, number, today_type)
         )
+    except KeyError:
+        await callback.answer(f"{config['name_singular']} №{number} не найден.", show_alert=True)
+        return
+
+    try:
+        await callback.message.edit_text(view.text, reply_markup=view.markup)
     except TelegramBadRequest:
         await callback.answer()
 
 
-async def show_stops(callback: CallbackQuery, transport_type: str, transport_data: dict, number: str, route_idx: int):
+def _build_stop_view(transport_type: str, transport_data: snapshot.Snapshot, number: str, route_idx: int, day_type: str) -> RenderedView:
+    config = TRANSPORT_CONFIG[transport_type]
+    route = transport_data.route(number, day_type, route_idx)
+    stops = route.stops
+    kb = InlineKeyboardBuilder()
+    if stops:
+        for i, stop in enumerate(stops):
+            # Добавляем тип дня в callback_data
+            stop_callback_data = callbacks.encode(callbacks.Stop(transport_type, number, route_idx, stop_ref(stop.stop_id, i), day_type))
+            kb.button(text=stop.name, callback_data=stop_callback_data)
+        kb.adjust(1)
+        extra_text = f"Выберите остановку (расписание на {get_day_type_name(day_type, 'accusative')}):"
+    else:
+        extra_text = "На данном маршруте нет остановок."
+
+    kb.row(InlineKeyboardButton(text="🔙 Назад к направлениям", callback_data=callbacks.encode(callbacks.Vehicle(transport_type, number))))
+    return RenderedView(
+        f"<b>{config['emoji']} {config['name_singular']} №{number}</b>\n"
+        f"<b>{route.name}</b>\n\n"
+        f"{extra_text}",
+        kb.as_markup()
+    )
+
+
+async def show_stops(callback: CallbackQuery, transport_type: str, transport_data: snapshot.Snapshot, number: str, route_idx: int):
     """Отображает список остановок для выбранного маршрута."""
     config = TRANSPORT_CONFIG[transport_type]
     # Определяем тип дня СЕЙЧАС, чтобы передать его в колбэки остановок
     initial_day_type = get_current_day_type()
-    routes_key = "route_weekdays" if initial_day_type == DAY_WD else "route_weekends"
 
     try:
-        vehicle = transport_data[number]
-        routes = vehicle.get(routes_key, [])
-        if not routes or route_idx >= len(routes):
-            raise IndexError("Route index out of bounds or no routes found for today")
-        route = routes[route_idx]
-        stops = route.get("stops", [])
+        view = stop_views.get_or_build(
+            (transport_type, getattr(transport_data, "version", None), number, route_idx, initial_day_type),
+            lambda: _build_stop_view(transport_type, transport_data, number, route_idx, initial_day_type)
+        )
     except (KeyError, IndexError):
         await callback.answer(f"Ошибка: Не удалось найти маршрут для {config['name_singular']}а №{number} на {get_day_type_name(initial_day_type, 'accusative')}.", show_alert=True)
         return
 
-    kb = InlineKeyboardBuilder()
-    if stops:
-        for i, stop in enumerate(stops):
-            # Добавляем initial_day_type в callback_data
-            stop_callback_data = f"stop_{config['callback_prefix']}_{number}_{route_idx}_{i}_{initial_day_type}"
-            kb.button(text=stop.get('name', 'Без названия'), callback_data=stop_callback_data)
-        kb.adjust(1)
-        extra_text = f"Выберите остановку (расписание на {get_day_type_name(initial_day_type, 'accusative')}):"
-    else:
-        extra_text = "На данном маршруте нет остановок."
+    try:
+        await callback.message.edit_text(view.text, reply_markup=view.markup)
+    except TelegramBadRequest:
+        await callback.answer()
 
-    kb.row(InlineKeyboardButton(text="🔙 Назад к направлениям", callback_data=f"{config['callback_prefix']}_{number}"))
 
+class ScheduleFragment:
+    """
+    Готовый текст расписания остановки без персональных частей.
+    Хвост с ближайшими рейсами запоминается на текущую минуту.
+    """
+
+    __slots__ = ("text", "minutes", "stop_id", "schedule_exists", "opposite_schedule_exists", "_tail_minute", "_tail")
+
+    def __init__(self, text: str, minutes, stop_id: int, schedule_exists: bool, opposite_schedule_exists: bool):
+        self.text = text
+        self.stop_id = stop_id
+        self.minutes = minutes
+        self.schedule_exists = schedule_exists
+        self.opposite_schedule_exists = opposite_schedule_exists
+        self._tail_minute = None
+        self._tail = ""
+
+    def nearest_text(self, now_minute: int) -> str:
+        """Блок 'Ближайшие рейсы' для минуты now_minute (пересчитывается раз в минуту)."""
+        if now_minute != self._tail_minute:
+            # Минуты отсортированы по суткам обслуживания, поэтому в 23:50 следующим будет рейс 00:15
+            nearest = departures.next_departures(self.minutes, now_minute, 5)
+            self._tail = (
+                f'<b>Ближайшие рейсы сегодня:</b>\n'
+                f'{" ".join(f"<code>{departures.format_time(m)}</code>" for m in nearest) if nearest else "Нет рейсов до конца дня"}'
+            )
+            self._tail_minute = now_minute
+        return self._tail
+
+
+def _build_schedule_fragment(transport_type: str, transport_data: snapshot.Snapshot, number: str,
+                             route_idx: int, stop_idx: int, day_type: str) -> ScheduleFragment:
+    """Строит статическую часть сообщения с расписанием. Бросает KeyError/IndexError, если данных нет."""
+    config = TRANSPORT_CONFIG[transport_type]
+    route = transport_data.route(number, day_type, route_idx)
+    stop = route.stops[stop_idx]
+    minutes = stop.minutes
+
+    schedule_exists = bool(minutes)
+    opposite_day_type = get_opposite_day_type(day_type)
+
+    # Проверяем наличие расписания на другой день: та же остановка (по ID), а не та же позиция
     try:
-        await callback.message.edit_text(
-            f"<b>{config['emoji']} {config['name_singular']} №{number}</b>\n"
-            f"<b>{route.get('name', 'Без названия')}</b>\n\n"
-            f"{extra_text}",
-            reply_markup=kb.as_markup()
+        opposite_route_idx, opposite_stop_idx = resolve_stop(
+            transport_data, number, opposite_day_type, route_idx, stop_ref(stop.stop_id, stop_idx)
         )
-    except TelegramBadRequest:
-        await callback.answer()
+        opposite_schedule_exists = bool(
+            transport_data.stop(number, opposite_day_type, opposite_route_idx, opposite_stop_idx).minutes
+        )
+    except (KeyError, IndexError):
+        opposite_schedule_exists = False
+
+    schedule_day_name = get_day_type_name(day_type, 'accusative')
+    opposite_day_name = get_day_type_name(opposite_day_type, 'accusative')
+
+    text = (
+        f"<b>{config['emoji']} {config['name_singular']} №{route.number}</b>\n"
+        f"<b>Маршрут:</b> {route.name}\n"
+        f"<b>Остановка:</b> {stop.name}\n\n"
+    )
+
+    if schedule_exists:
+        # --- ВОЗВРАЩАЕМ ВАШ ФОРМАТ ВРЕМЕНИ ---
+        formatted_schedule = "<code>" + "\n".join(
+             ' '.join(hour_times)
+             for hour_times in departures.group_by_hour(minutes)
+        ) + "</code>"
+        # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+
+        text += f"<b>Расписание на {schedule_day_name}:</b>\n{formatted_schedule}\n\n"
+    else: # Расписания на запрошенный тип дня нет
+        text += f"❌ Расписание на {schedule_day_name} не найдено."
+        if opposite_schedule_exists:
+            text += f"\n\nПопробовать посмотреть на {opposite_day_name}?"
+        else:
+            text += "\n\nДанных на другие дни также нет."
+
+    return ScheduleFragment(text, minutes, stop.stop_id, schedule_exists, opposite_schedule_exists)
 
 
 async def show_schedule_details(
     callback_or_message: CallbackQuery | Message,
     transport_type: str,
-    transport_data: dict,
+    transport_data: snapshot.Snapshot,
     number: str,
     route_idx: int,
     stop_idx: int,
@@ -181,29 +395,13 @@ async def show_schedule_details(
 
     logging.info(f"User {user_id}: Showing schedule details for {transport_type} #{number}, route:{route_idx}, stop:{stop_idx}, day:{day_type}, is_fav:{is_from_favorites}")
 
-    times = []
-    route_name = "Неизвестный маршрут"
-    stop_name = "Неизвестная остановка"
-    vehicle_number_display = number
-
+    # Статическая часть сообщения одинакова для всех пользователей - берём её из кэша
+    fragment_key = (transport_type, getattr(transport_data, "version", None), number, route_idx, stop_idx, day_type)
     try:
-        vehicle = transport_data[number]
-        vehicle_number_display = vehicle.get('number', number)
-        routes_key = "route_weekdays" if day_type == DAY_WD else "route_weekends"
-        routes = vehicle.get(routes_key, [])
-
-        if not routes or route_idx >= len(routes):
-            raise IndexError(f"Route index {route_idx} out of bounds or no routes found for {day_type}")
-        route = routes[route_idx]
-        route_name = route.get('name', 'Без названия')
-        stops = route.get("stops", [])
-
-        if not stops or stop_idx >= len(stops):
-             raise IndexError(f"Stop index {stop_idx} out of bounds or no stops found")
-        stop = stops[stop_idx]
-        stop_name = stop.get('name', 'Без названия')
-        times = stop.get("times", [])
-
+        fragment = render_cache.schedule_fragments.get_or_build(
+            fragment_key,
+            lambda: _build_schedule_fragment(transport_type, transport_data, number, route_idx, stop_idx, day_type)
+        )
     except (KeyError, IndexError) as e:
         logging.warning(f"User {user_id}: Data error showing schedule: {e}")
         error_text = f"Ошибка: Не удалось найти данные для {config['name_singular']}а №{number} (маршрут {route_idx}, остановка {stop_idx}) на {get_day_type_name(day_type, 'accusative')}."
@@ -216,103 +414,40 @@ async def show_schedule_details(
 
     # --- Логика отображения и кнопки переключения ---
     kb = InlineKeyboardBuilder()
-    text = ""
-    schedule_exists = bool(times)
+    text = fragment.text
     opposite_day_type = get_opposite_day_type(day_type)
-    opposite_schedule_exists = False
-
-    # Проверяем наличие расписания на другой день
-    try:
-        opposite_routes_key = "route_weekdays" if opposite_day_type == DAY_WD else "route_weekends"
-        opposite_routes = vehicle.get(opposite_routes_key, [])
-        if opposite_routes and route_idx < len(opposite_routes):
-            opposite_route = opposite_routes[route_idx]
-            opposite_stops = opposite_route.get("stops", [])
-            if opposite_stops and stop_idx < len(opposite_stops):
-                opposite_stop = opposite_stops[stop_idx]
-                if opposite_stop.get("times"):
-                    opposite_schedule_exists = True
-    except Exception as e:
-        logging.error(f"User {user_id}: Error checking opposite schedule: {e}")
-
-    schedule_day_name = get_day_type_name(day_type, 'accusative')
     opposite_day_name = get_day_type_name(opposite_day_type, 'accusative')
 
-    base_text = (
-        f"<b>{config['emoji']} {config['name_singular']} №{vehicle_number_display}</b>\n"
-        f"<b>Маршрут:</b> {route_name}\n"
-        f"<b>Остановка:</b> {stop_name}\n\n"
-    )
-
-    if schedule_exists:
-        now = datetime.datetime.now()
-        nearest = []
-        now_time = now.time()
-        current_day_matches_schedule_day = (get_current_day_type() == day_type)
-
-        for t_str in times:
-            try:
-                t_dt = datetime.datetime.strptime(t_str, "%H:%M")
-                # Ближайшие показываем только если тип дня совпадает с сегодняшним
-                if current_day_matches_schedule_day and t_dt.time() >= now_time:
-                    nearest.append(t_str)
-            except ValueError: continue
-
-        hours_schedule = {}
-        for t in times:
-            try:
-                hour = int(t.split(":")[0])
-                hours_schedule.setdefault(hour, []).append(t)
-            except (ValueError, IndexError): continue
-
-        # --- ВОЗВРАЩАЕМ ВАШ ФОРМАТ ВРЕМЕНИ ---
-        formatted_schedule = "<code>" + "\n".join(
-             ' '.join(sorted(minutes))
-             for hour, minutes in sorted(hours_schedule.items())
-        ) + "</code>"
-        # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-
-        text = base_text + (
-            f"<b>Расписание на {schedule_day_name}:</b>\n{formatted_schedule}\n\n"
-        )
+    if fragment.schedule_exists:
         # Показываем ближайшие только если отображается расписание на сегодня
-        if current_day_matches_schedule_day:
-            text += (
-                f'<b>Ближайшие рейсы сегодня:</b>\n'
-                f'{" ".join(list(map(lambda a: f"<code>{a}</code>", nearest[:5]))) if nearest else "Нет рейсов до конца дня"}'
-            )
+        if get_current_day_type() == day_type:
+            text += fragment.nearest_text(departures.current_service_minute())
         else:
             text += f'<i>Ближайшие рейсы показаны только для сегодняшнего дня ({get_day_type_name(get_current_day_type(), "genitive")}).</i>'
 
-
-        # Добавляем кнопку переключения, если есть расписание на другой день
-        if opposite_schedule_exists:
-            toggle_callback_data = f"{config['toggle_day_prefix']}_{number}_{route_idx}_{stop_idx}_{opposite_day_type}_{int(is_from_favorites)}"
-            kb.button(text=f"🗓️ Показать на {opposite_day_name}", callback_data=toggle_callback_data)
-
-    else: # Расписания на запрошенный тип дня нет
-        text = base_text + f"❌ Расписание на {schedule_day_name} не найдено."
-        if opposite_schedule_exists:
-            text += f"\n\nПопробовать посмотреть на {opposite_day_name}?"
-            toggle_callback_data = f"{config['toggle_day_prefix']}_{number}_{route_idx}_{stop_idx}_{opposite_day_type}_{int(is_from_favorites)}"
-            kb.button(text=f"🗓️ Показать на {opposite_day_name}", callback_data=toggle_callback_data)
-        else:
-            text += "\n\nДанных на другие дни также нет."
+    # Добавляем кнопку переключения, если есть расписание на другой день
+    ref = stop_ref(fragment.stop_id, stop_idx)
+    if fragment.opposite_schedule_exists:
+        toggle_callback_data = callbacks.encode(
+            callbacks.ToggleDay(transport_type, number, route_idx, ref, opposite_day_type, is_from_favorites)
+        )
+        kb.button(text=f"🗓️ Показать на {opposite_day_name}", callback_data=toggle_callback_data)
+    if fragment.schedule_exists:
+        kb.button(text="⏰ Напомнить", callback_data=callbacks.encode(
+            callbacks.ReminderPick(transport_type, number, route_idx, ref, day_type, is_from_favorites)))
 
     # --- Добавляем кнопки "В избранное"/"Удалить" и "Назад" ---
-    fav_key = f"{number}_{route_idx}_{stop_idx}"
     if is_from_favorites:
-        kb.button(text="🗑️ Удалить", callback_data=f"{config['fav_del_prefix']}_{fav_key}")
-        back_callback = "back_to_fav_list"
+        kb.button(text="🗑️ Удалить", callback_data=callbacks.encode(callbacks.FavoriteDelete(transport_type, number, route_idx, ref)))
+        back_callback = callbacks.encode(callbacks.BackToFavorites())
     else:
-        user_favs = utils.load_favorites(user_id)
         fav_section = "buses" if transport_type == TYPE_BUS else "trolleys"
-        if fav_key not in user_favs.get(fav_section, {}):
-             kb.button(text="⭐ В избранное", callback_data=f"{config['fav_add_prefix']}_{fav_key}")
+        if not await utils.is_favorite(user_id, fav_section, fav_key(number, route_idx, ref)):
+             kb.button(text="⭐ В избранное", callback_data=callbacks.encode(callbacks.FavoriteAdd(transport_type, number, route_idx, ref)))
         else:
-             kb.button(text="✅ В избранном", callback_data="dummy_in_favorites") # Dummy callback
+             kb.button(text="✅ В избранном", callback_data=callbacks.encode(callbacks.InFavorites())) # Dummy callback
 
-        back_callback = f"route_{config['callback_prefix']}_{number}_{route_idx}"
+        back_callback = callbacks.encode(callbacks.Route(transport_type, number, route_idx))
 
     kb.button(text="🔙 Назад", callback_data=back_callback)
     kb.adjust(1) # Кнопки друг под другом
@@ -333,21 +468,16 @@ async def show_schedule_details(
 
 # --- Функции для обработки колбэков "Назад" ---
 
-async def back_to_transport_list(callback: CallbackQuery, transport_type: str, start_handler_func):
-    """Возвращает к списку автобусов/троллейбусов."""
-    if callback.message:
-        await start_handler_func(callback.message)
-        try:
-           await callback.message.edit_reply_markup(reply_markup=None)
-        except TelegramBadRequest: pass
-    await callback.answer()
+async def back_to_transport_list(callback: CallbackQuery, transport_type: str, transport_data: snapshot.Snapshot):
+    """Возвращает к списку автобусов/троллейбусов в том же сообщении."""
+    await show_transport_list(callback, transport_type, transport_data)
 
-async def back_to_directions(callback: CallbackQuery, transport_type: str, transport_data: dict, number: str):
+async def back_to_directions(callback: CallbackQuery, transport_type: str, transport_data: snapshot.Snapshot, number: str):
     """Возвращает к выбору направления."""
     await show_directions(callback, transport_type, transport_data, number)
     await callback.answer()
 
-async def back_to_stops(callback: CallbackQuery, transport_type: str, transport_data: dict, number: str, route_idx: int):
+async def back_to_stops(callback: CallbackQuery, transport_type: str, transport_data: snapshot.Snapshot, number: str, route_idx: int):
     """Возвращает к выбору остановки."""
     await show_stops(callback, transport_type, transport_data, number, route_idx)
     await callback.answer()
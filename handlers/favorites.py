@@ -5,8 +5,9 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.exceptions import TelegramBadRequest
 import utils
-from handlers import common_handlers
-import datetime
+from handlers import callbacks, common_handlers
+from timetable import snapshot
+from timetable.stop_index import normalize_stop_name
 import logging # Добавим логирование
 
 # Логируем момент загрузки модуля и создания роутера
@@ -17,23 +18,56 @@ router = Router()
 BUS_CONFIG = common_handlers.TRANSPORT_CONFIG[common_handlers.TYPE_BUS]
 TROLLEYBUS_CONFIG = common_handlers.TRANSPORT_CONFIG[common_handlers.TYPE_TROLLEYBUS]
 
+# --- Перевод старых ключей избранного на ID остановок ---
+async def _upgrade_legacy_keys(user_id: int, section: str, section_favs: dict, transport_data: snapshot.Snapshot) -> dict:
+    """
+    Старые ключи "номер_направление_позиция" ломаются, когда на сайте меняется порядок
+    остановок. Находим остановку по сохранённому названию и переписываем ключ на
+    "номер_направление_s<ID>". Не найденные записи остаются как есть.
+    """
+    upgraded = dict(section_favs)
+    for key, value in section_favs.items():
+        number, _, ref = key.rpartition("_")
+        if not ref.isdigit():
+            continue
+        number, _, route_part = number.rpartition("_")
+        wanted = normalize_stop_name(value.get("stop", ""))
+        for day_type in (common_handlers.DAY_WD, common_handlers.DAY_WE):
+            try:
+                stops = transport_data.route(number, day_type, int(route_part)).stops
+            except (KeyError, IndexError, ValueError):
+                continue
+            stop = next((stop for stop in stops if stop.stop_id and normalize_stop_name(stop.name) == wanted), None)
+            if stop is not None:
+                new_key = f"{number}_{route_part}_{common_handlers.stop_ref(stop.stop_id, 0)}"
+                await utils.add_favorite(user_id, section, new_key, value)
+                await utils.remove_favorite(user_id, section, key)
+                upgraded[new_key] = upgraded.pop(key)
+                logging.info(f"User {user_id}: favorite {key} -> {new_key}")
+                break
+    return upgraded
+
+def _show_callback(transport_type: str, key: str) -> str:
+    number, route_idx, ref = common_handlers.parse_fav_key(key)
+    return callbacks.encode(callbacks.FavoriteShow(transport_type, number, route_idx, ref))
+
 # --- Вспомогательная функция для генерации сообщения со списком избранного ---
-def _build_favorites_message(user_id: int) -> tuple[str, InlineKeyboardBuilder | None]:
+async def _build_favorites_message(user_id: int) -> tuple[str, InlineKeyboardBuilder | None]:
     """Строит текст и клавиатуру для списка избранного."""
-    favs = utils.load_favorites(user_id)
-    bus_favs = favs.get("buses", {})
-    trolley_favs = favs.get("trolleys", {})
+    favs = await utils.load_favorites(user_id)
+    bus_favs = await _upgrade_legacy_keys(user_id, "buses", favs.get("buses", {}), utils.getBusSchedule())
+    trolley_favs = await _upgrade_legacy_keys(user_id, "trolleys", favs.get("trolleys", {}), utils.getTrolleybusSchedule())
 
     # Если избранное пусто, создаем кнопки для перехода к спискам
     if not bus_favs and not trolley_favs:
         kb = InlineKeyboardBuilder()
         kb.button(
             text=f"{BUS_CONFIG['emoji']} Показать автобусы",
-            callback_data=f"back_to_{common_handlers.TYPE_BUS}_list" # Существующий callback
+            callback_data=callbacks.encode(callbacks.BackToList(common_handlers.TYPE_BUS)) # Существующий callback
         )
         kb.button(
             text=f"{TROLLEYBUS_CONFIG['emoji']} Показать троллейбусы",
-            callback_data=f"back_to_{common_handlers.TYPE_TROLLEYBUS}_list" # Существующий callback
+            callback_data=callbacks.encode(callbacks.BackToList(common_handlers.TYPE_TROLLEYBUS)) # Существующий callback
         )
         kb.adjust(1) # Кнопки друг под другом
         return "У вас пока нет избранных остановок.\n\nВыберите, что посмотреть:", kb # Возвращаем текст и билдер
@@ -50,7 +84,7 @@ def _build_favorites_message(user_id: int) -> tuple[str, InlineKeyboardBuilder |
         for key in sorted_bus_keys:
             val = bus_favs[key]
             fav_counter += 1
-            kb.button(text=f"#{fav_counter}", callback_data=f"{BUS_CONFIG['fav_show_prefix']}_{key}")
+            kb.button(text=f"#{fav_counter}", callback_data=_show_callback(common_handlers.TYPE_BUS, key))
             msg_text += (f"{fav_counter}. <b>№{val.get('number', '?')}</b>, "
                          f"ост. \"{val.get('stop', 'Неизвестно')}\" "
                          f"(<i>{val.get('route', 'Маршрут не указан')}</i>)\n")
@@ -63,7 +97,7 @@ def _build_favorites_message(user_id: int) -> tuple[str, InlineKeyboardBuilder |
         for key in sorted_trolley_keys:
             val = trolley_favs[key]
             fav_counter += 1
-            kb.button(text=f"#{fav_counter}", callback_data=f"{TROLLEYBUS_CONFIG['fav_show_prefix']}_{key}")
+            kb.button(text=f"#{fav_counter}", callback_data=_show_callback(common_handlers.TYPE_TROLLEYBUS, key))
             msg_text += (f"{fav_counter}. <b>№{val.get('number', '?')}</b>, "
                          f"ост. \"{val.get('stop', 'Неизвестно')}\" "
                          f"(<i>{val.get('route', 'Маршрут не указан')}</i>)\n")
@@ -80,7 +114,7 @@ async def show_favorites_handler(message: Message):
     """Отображает список избранного в ответ на команду."""
     logging.info(f"HANDLER: show_favorites_handler triggered for user {message.from_user.id} ({message.from_user.username})")
     user_id = message.from_user.id
-    msg_text, kb = _build_favorites_message(user_id)
+    msg_text, kb = await _build_favorites_message(user_id)
 
     reply_markup = kb.as_markup() if kb else None
 
@@ -94,7 +128,7 @@ async def show_favorites_handler(message: Message):
 
 
 # --- Добавление в избранное ---
-async def _add_favorite_common(callback: CallbackQuery, transport_type: str, transport_data: dict, key: str):
+async def _add_favorite_common(callback: CallbackQuery, transport_type: str, transport_data: snapshot.Snapshot, key: str):
     """Общая логика добавления в избранное."""
     config = common_handlers.TRANSPORT_CONFIG[transport_type]
     fav_section = "buses" if transport_type == common_handlers.TYPE_BUS else "trolleys"
@@ -102,34 +136,20 @@ async def _add_favorite_common(callback: CallbackQuery, transport_type: str, tra
     logging.info(f"User {user_id}: Attempting to add favorite {transport_type} with key {key}")
 
     try:
-        number, route_idx_str, stop_idx_str = key.split("_")
-        route_idx = int(route_idx_str)
-        stop_idx = int(stop_idx_str)
-
-        # Валидация данных перед сохранением
-        vehicle = transport_data[number]
-        today = datetime.datetime.today().weekday() # Нужен для определения ключа маршрутов
-        routes_key = "route_weekdays" if today < 5 else "route_weekends"
-        # Используем get для безопасного доступа и проверки наличия маршрутов/остановок
-        routes = vehicle.get(routes_key, [])
-        if route_idx >= len(routes): raise IndexError("Route index out of range")
-        route = routes[route_idx]
-        stops = route.get("stops", [])
-        if stop_idx >= len(stops): raise IndexError("Stop index out of range")
-        stop = stops[stop_idx]
-
-        # Загружаем и обновляем избранное
-        favs = utils.load_favorites(user_id)
-        # Убеждаемся, что секция существует
-        if fav_section not in favs:
-            favs[fav_section] = {}
-
-        favs[fav_section][key] = {
-            "number": vehicle.get('number', number), # Сохраняем номер из данных, если есть
-            "route": route.get('name', 'Без названия'),
-            "stop": stop.get('name', 'Без названия')
-        }
-        utils.save_favorites(user_id, favs)
+        number, route_idx, stop_ref = common_handlers.parse_fav_key(key)
+
+        # Валидация данных перед сохранением; тип дня - как в show_stops
+        today_type = common_handlers.get_current_day_type()
+        route_idx, stop_idx = common_handlers.resolve_stop(transport_data, number, today_type, route_idx, stop_ref)
+        route = transport_data.route(number, today_type, route_idx)
+        stop = route.stops[stop_idx]
+
+        # Записываем одну запись избранного (без перезаписи остальных)
+        await utils.add_favorite(user_id, fav_section, key, {
+            "number": route.number,
+            "route": route.name,
+            "stop": stop.name
+        })
         logging.info(f"User {user_id}: Successfully added favorite {key}")
         await callback.answer(f"{config['name_singular']} добавлен в избранное ⭐")
 
@@ -142,94 +162,46 @@ async def _add_favorite_common(callback: CallbackQuery, transport_type: str, tra
          await callback.answer(f"Произошла ошибка при добавлении в избранное.", show_alert=True)
 
 
-@router.callback_query(F.data.startswith(f"{BUS_CONFIG['fav_add_prefix']}_"))
-async def add_bus_favorite_handler(callback: CallbackQuery):
-    """Добавляет автобус в избранное."""
-    try:
-        # favadd_bus_KEY -> извлекаем ключ
-        key = callback.data.split("_", 2)[2]
-        bus_data = utils.getBusSchedule()
-        await _add_favorite_common(callback, common_handlers.TYPE_BUS, bus_data, key)
-    except IndexError:
-         logging.warning(f"User {callback.from_user.id}: Invalid add bus favorite callback format: {callback.data}")
-         await callback.answer("Ошибка: Некорректный формат данных для добавления.", show_alert=True)
-
-
-@router.callback_query(F.data.startswith(f"{TROLLEYBUS_CONFIG['fav_add_prefix']}_"))
-async def add_trolleybus_favorite_handler(callback: CallbackQuery):
-    """Добавляет троллейбус в избранное."""
-    try:
-        # favadd_trolleybus_KEY -> извлекаем ключ
-        key = callback.data.split("_", 2)[2]
-        trolleybus_data = utils.getTrolleybusSchedule()
-        await _add_favorite_common(callback, common_handlers.TYPE_TROLLEYBUS, trolleybus_data, key)
-    except IndexError:
-         logging.warning(f"User {callback.from_user.id}: Invalid add trolleybus favorite callback format: {callback.data}")
-         await callback.answer("Ошибка: Некорректный формат данных для добавления.", show_alert=True)
+def _schedule_getter(transport_type: str):
+    return utils.getBusSchedule if transport_type == common_handlers.TYPE_BUS else utils.getTrolleybusSchedule
+
+
+@callbacks.router(callbacks.FavoriteAdd)
+async def add_favorite_handler(callback: CallbackQuery, payload: callbacks.FavoriteAdd):
+    """Добавляет автобус или троллейбус в избранное."""
+    key = common_handlers.fav_key(payload.number, payload.route_idx, payload.stop_ref)
+    transport_data = _schedule_getter(payload.transport_type)()
+    await _add_favorite_common(callback, payload.transport_type, transport_data, key)
 
 
 # --- Просмотр расписания из избранного ---
 
-@router.callback_query(F.data.startswith(f"{BUS_CONFIG['fav_show_prefix']}_"))
-async def show_fav_bus_schedule_handler(callback: CallbackQuery):
-    """Показывает расписание для избранного автобуса."""
-    logging.info(f"User {callback.from_user.id}: Showing favorite bus schedule via callback {callback.data}")
+@callbacks.router(callbacks.FavoriteShow)
+async def show_fav_schedule_handler(callback: CallbackQuery, payload: callbacks.FavoriteShow):
+    """Показывает расписание для избранного автобуса или троллейбуса."""
+    config = common_handlers.TRANSPORT_CONFIG[payload.transport_type]
+    logging.info(f"User {callback.from_user.id}: Showing favorite {payload.transport_type} schedule via callback {payload}")
+    transport_data = _schedule_getter(payload.transport_type)()
+    # Определяем ТЕКУЩИЙ тип дня для ПЕРВОНАЧАЛЬНОГО показа
+    initial_day_type = common_handlers.get_current_day_type()
     try:
-        # fav_bus_KEY -> извлекаем ключ
-        key = callback.data.split("_", 2)[2]
-        number, route_idx_str, stop_idx_str = key.split("_")
-        route_idx = int(route_idx_str)
-        stop_idx = int(stop_idx_str)
-        bus_data = utils.getBusSchedule()
-        # Определяем ТЕКУЩИЙ тип дня для ПЕРВОНАЧАЛЬНОГО показа
-        initial_day_type = common_handlers.get_current_day_type()
-        await common_handlers.show_schedule_details(
-            callback,
-            common_handlers.TYPE_BUS,
-            bus_data,
-            number,
-            route_idx,
-            stop_idx,
-            day_type=initial_day_type, # Передаем начальный тип дня
-            is_from_favorites=True     # Указываем, что это из избранного
+        route_idx, stop_idx = common_handlers.resolve_stop(
+            transport_data, payload.number, initial_day_type, payload.route_idx, payload.stop_ref
         )
-    except (IndexError, ValueError) as e:
-        logging.warning(f"User {callback.from_user.id}: Invalid favorite bus callback data: {callback.data} - {e}")
-        await callback.answer("Ошибка: Некорректный формат данных избранного.", show_alert=True)
-    except KeyError as e:
-         logging.warning(f"User {callback.from_user.id}: Favorite bus key {key} data not found: {e}")
-         await callback.answer("Ошибка: Автобус из избранного не найден в текущем расписании.", show_alert=True)
-
-
-@router.callback_query(F.data.startswith(f"{TROLLEYBUS_CONFIG['fav_show_prefix']}_"))
-async def show_fav_trolleybus_schedule_handler(callback: CallbackQuery):
-    """Показывает расписание для избранного троллейбуса."""
-    logging.info(f"User {callback.from_user.id}: Showing favorite trolleybus schedule via callback {callback.data}")
-    try:
-        # fav_trolleybus_KEY -> извлекаем ключ
-        key = callback.data.split("_", 2)[2]
-        number, route_idx_str, stop_idx_str = key.split("_")
-        route_idx = int(route_idx_str)
-        stop_idx = int(stop_idx_str)
-        trolleybus_data = utils.getTrolleybusSchedule()
-        # Определяем ТЕКУЩИЙ тип дня для ПЕРВОНАЧАЛЬНОГО показа
-        initial_day_type = common_handlers.get_current_day_type()
-        await common_handlers.show_schedule_details(
-            callback,
-            common_handlers.TYPE_TROLLEYBUS,
-            trolleybus_data,
-            number,
-            route_idx,
-            stop_idx,
-            day_type=initial_day_type, # Передаем начальный тип дня
-            is_from_favorites=True     # Указываем, что это из избранного
-        )
-    except (IndexError, ValueError) as e:
-        logging.warning(f"User {callback.from_user.id}: Invalid favorite trolleybus callback data: {callback.data} - {e}")
-        await callback.answer("Ошибка: Некорректный формат данных избранного.", show_alert=True)
-    except KeyError as e:
-        logging.warning(f"User {callback.from_user.id}: Favorite trolleybus key {key} data not found: {e}")
-        await callback.answer("Ошибка: Троллейбус из избранного не найден в текущем расписании.", show_alert=True)
+    except (KeyError, ValueError) as e:
+        logging.warning(f"User {callback.from_user.id}: Favorite {payload} data not found: {e}")
+        await callback.answer(f"Ошибка: {config['name_singular']} из избранного не найден в текущем расписании.", show_alert=True)
+        return
+    await common_handlers.show_schedule_details(
+        callback,
+        payload.transport_type,
+        transport_data,
+        payload.number,
+        route_idx,
+        stop_idx,
+        day_type=initial_day_type, # Передаем начальный тип дня
+        is_from_favorites=True     # Указываем, что это из избранного
+    )
 
 
 # --- Удаление из избранного ---
@@ -240,17 +212,13 @@ async def _delete_favorite_common(callback: CallbackQuery, transport_type: str,
     user_id = callback.from_user.id
     logging.info(f"User {user_id}: Attempting to delete favorite {transport_type} with key {key}")
 
-    favs = utils.load_favorites(user_id)
-
-    # Проверяем наличие ключа в нужной секции
-    if fav_section in favs and key in favs[fav_section]:
-        del favs[fav_section][key] # Удаляем элемент
-        utils.save_favorites(user_id, favs) # Сохраняем изменения
+    # Удаляем одну запись; False - если её уже нет
+    if await utils.remove_favorite(user_id, fav_section, key):
         logging.info(f"User {user_id}: Successfully deleted favorite {key}")
         await callback.answer("Удалено из избранного")
 
         # Обновляем сообщение, показывая актуальный список избранного (или кнопки, если список стал пустым)
-        msg_text, kb = _build_favorites_message(user_id)
+        msg_text, kb = await _build_favorites_message(user_id)
         reply_markup = kb.as_markup() if kb else None
         try:
             # Проверяем, что сообщение существует перед редактированием
@@ -271,7 +239,7 @@ async def _delete_favorite_common(callback: CallbackQuery, transport_type: str,
         logging.warning(f"User {user_id}: Attempted to delete non-existent favorite key {key} in section {fav_section}")
         await callback.answer("Эта запись уже удалена из избранного.", show_alert=True)
         # Можно также обновить сообщение на всякий случай, если оно неактуально
-        msg_text, kb = _build_favorites_message(user_id)
+        msg_text, kb = await _build_favorites_message(user_id)
         reply_markup = kb.as_markup() if kb else None
         try:
             if callback.message and (callback.message.html_text != msg_text or callback.message.reply_markup != reply_markup):
@@ -279,38 +247,22 @@ async def _delete_favorite_common(callback: CallbackQuery, transport_type: str,
         except TelegramBadRequest: pass # Игнорируем ошибку, если не удалось обновить
 
 
-@router.callback_query(F.data.startswith(f"{BUS_CONFIG['fav_del_prefix']}_"))
-async def delete_bus_favorite_handler(callback: CallbackQuery):
-    """Удаляет автобус из избранного."""
-    try:
-        # favdel_bus_KEY -> извлекаем ключ
-        key = callback.data.split("_", 2)[2]
-        await _delete_favorite_common(callback, common_handlers.TYPE_BUS, key)
-    except IndexError:
-        logging.warning(f"User {callback.from_user.id}: Invalid delete bus favorite callback format: {callback.data}")
-        await callback.answer("Ошибка: Некорректный формат данных для удаления.", show_alert=True)
-
-@router.callback_query(F.data.startswith(f"{TROLLEYBUS_CONFIG['fav_del_prefix']}_"))
-async def delete_trolleybus_favorite_handler(callback: CallbackQuery):
-    """Удаляет троллейбус из избранного."""
-    try:
-        # favdel_trolleybus_KEY -> извлекаем ключ
-        key = callback.data.split("_", 2)[2]
-        await _delete_favorite_common(callback, common_handlers.TYPE_TROLLEYBUS, key)
-    except IndexError:
-        logging.warning(f"User {callback.from_user.id}: Invalid delete trolleybus favorite callback format: {callback.data}")
-        await callback.answer("Ошибка: Некорректный формат данных для удаления.", show_alert=True)
+@callbacks.router(callbacks.FavoriteDelete)
+async def delete_favorite_handler(callback: CallbackQuery, payload: callbacks.FavoriteDelete):
+    """Удаляет автобус или троллейбус из избранного."""
+    key = common_handlers.fav_key(payload.number, payload.route_idx, payload.stop_ref)
+    await _delete_favorite_common(callback, payload.transport_type, key)
 
 
 # --- Возврат к списку избранного ---
 
-@router.callback_query(F.data == "back_to_fav_list")
+@callbacks.router(callbacks.BackToFavorites)
 async def back_to_favorites_handler(callback: CallbackQuery):
     """Обновляет текущее сообщение, показывая список избранного."""
     user_id = callback.from_user.id
     logging.info(f"User {user_id}: Returning to favorites list.")
     # Эта функция теперь вернет либо список с кнопками, либо сообщение с кнопками "Показать..."
-    msg_text, kb = _build_favorites_message(user_id)
+    msg_text, kb = await _build_favorites_message(user_id)
     reply_markup = kb.as_markup() if kb else None
     try:
         # Проверяем, что сообщение существует
@@ -0,0 +1,107 @@
+# --- START OF FILE journey.py ---
+
+import html
+import re
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+import utils
+from handlers import common_handlers, search
+from timetable import departures
+from timetable.planner import JourneyPlanner, Itinerary
+import logging
+
+router = Router()
+
+MAX_ITINERARIES = 3
+# "Откуда -> Куда", "Откуда → Куда"
+JOURNEY_RE = re.compile(r"^\s*(.+?)\s*(?:→|->|—>|=>)\s*(.+?)\s*$")
+USAGE_TEXT = (
+    "Чтобы построить поездку, напишите две остановки через стрелку:\n"
+    "<code>Зеленый луг -> Железнодорожный вокзал</code>\n"
+    "или командой <code>/route Откуда -> Куда</code>"
+)
+
+_planner: JourneyPlanner | None = None
+
+
+def get_planner() -> JourneyPlanner:
+    """Планировщик поверх текущего индекса остановок. Таблицы связей строятся один раз на загрузку данных."""
+    global _planner
+    index = search.get_stop_index()
+    if _planner is None or _planner.index is not index:
+        _planner = JourneyPlanner(index, search.get_sources())
+        logging.info(f"Journey planner built: { {day: len(table) for day, table in _planner.tables.items()} } connections")
+    return _planner
+
+
+def _reset_planner(transport_type: str):
+    global _planner
+    _planner = None
+
+
+utils.add_reload_listener(_reset_planner)
+utils.add_warmup(get_planner)
+
+
+def _format_itinerary(planner: JourneyPlanner, number: int, itinerary: Itinerary) -> str:
+    names = planner.index.names
+    duration = itinerary.arrival - itinerary.departure
+    transfers = f", пересадок: {itinerary.transfers}" if itinerary.transfers else ", без пересадок"
+    lines = [
+        f"<b>{number}) {departures.format_time(itinerary.departure)} → {departures.format_time(itinerary.arrival)}</b> "
+        f"({duration} мин{transfers})"
+    ]
+    for leg in itinerary.legs:
+        config = common_handlers.TRANSPORT_CONFIG[leg.line.transport_type]
+        lines.append(
+            f"  {config['emoji']} №{leg.line.number}: "
+            f"<code>{departures.format_time(leg.departure)}</code> {names[leg.from_stop]} → "
+            f"<code>{departures.format_time(leg.arrival)}</code> {names[leg.to_stop]}"
+        )
+    return "\n".join(lines)
+
+
+async def _answer_journey(message: Message, from_query: str, to_query: str):
+    planner = get_planner()
+    index = planner.index
+    from_results = index.search(from_query, 1)
+    to_results = index.search(to_query, 1)
+    if not from_results or not to_results:
+        missing = from_query if not from_results else to_query
+        await message.answer(f"Остановка «{html.escape(missing)}» не найдена.")
+        return
+    from_stop, to_stop = from_results[0], to_results[0]
+    if from_stop == to_stop:
+        await message.answer("Начальная и конечная остановки совпадают.")
+        return
+
+    day_type = common_handlers.get_current_day_type()
+    itineraries = planner.plan(from_stop, to_stop, day_type, departures.current_service_minute(), MAX_ITINERARIES)
+    header = f"<b>🧭 {index.names[from_stop]} → {index.names[to_stop]}</b>\n\n"
+    if not itineraries:
+        await message.answer(header + "Сегодня подходящих поездок больше нет.")
+        return
+    await message.answer(
+        header + "\n\n".join(_format_itinerary(planner, i + 1, it) for i, it in enumerate(itineraries))
+    )
+
+
+@router.message(Command("route"))
+async def route_command_handler(message: Message, command: CommandObject):
+    """Команда /route Откуда -> Куда."""
+    match = JOURNEY_RE.match(command.args or "")
+    if not match:
+        await message.answer(USAGE_TEXT)
+        return
+    logging.info(f"User {message.from_user.id}: journey '{command.args}'")
+    await _answer_journey(message, match.group(1), match.group(2))
+
+
+@router.message(F.text.regexp(JOURNEY_RE).as_("match"))
+async def journey_text_handler(message: Message, match: re.Match):
+    """Текст вида 'Откуда -> Куда'."""
+    logging.info(f"User {message.from_user.id}: journey '{message.text}'")
+    await _answer_journey(message, match.group(1), match.group(2))
+
+# --- END OF FILE journey.py ---
@@ -0,0 +1,244 @@
+# --- START OF FILE reminders.py ---
+
+"""
+Напоминания об отправлении: кнопка "⏰ Напомнить" в расписании остановки и список /reminders.
+
+Выбор в два шага: рейс (ближайшие по времени), затем за сколько минут
+напомнить - один раз сегодня или каждый день с тем же типом (будни/выходные).
+Отправляет напоминания планировщик delivery/reminders.py; он запускается и
+останавливается вместе с диспетчером (хуки startup/shutdown этого роутера).
+"""
+
+import datetime
+import html
+import logging
+import time
+
+from aiogram import Bot, F, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+import utils
+from delivery.reminders import fire_time, next_fire_at
+from handlers import callbacks, common_handlers
+from storage.reminders import Reminder
+from timetable import departures
+
+router = Router()
+
+REMINDER_LEADS = (5, 10, 15)  # минут до рейса
+PICK_COUNT = 8                # рейсов на выбор
+
+# Источники данных по типам транспорта
+_DATA_GETTERS = {
+    common_handlers.TYPE_BUS: utils.getBusSchedule,
+    common_handlers.TYPE_TROLLEYBUS: utils.getTrolleybusSchedule,
+}
+
+
+def _find_stop(transport_type: str, number: str, route_idx: int, ref: str, day_type: str):
+    """(маршрут, остановка) из текущего расписания. KeyError/IndexError/ValueError, если не найдено."""
+    transport_data = _DATA_GETTERS[transport_type]()
+    route_idx, stop_idx = common_handlers.resolve_stop(transport_data, number, day_type, route_idx, ref)
+    route = transport_data.route(number, day_type, route_idx)
+    return route, route.stops[stop_idx]
+
+
+def _label(transport_type: str, route, stop) -> str:
+    return f"{common_handlers.TRANSPORT_CONFIG[transport_type]['emoji']} №{route.number}, ост. {stop.name}"
+
+
+def _repeat_name(daily: bool, day_type: str) -> str:
+    if not daily:
+        return "один раз"
+    return "каждые " + common_handlers.get_day_type_name(day_type, "accusative")
+
+
+def _clock(timestamp: float) -> str:
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    if moment.date() == datetime.date.today():
+        return moment.strftime("%H:%M")
+    return moment.strftime("%d.%m в %H:%M")
+
+
+async def _edit(callback: CallbackQuery, text: str, markup: InlineKeyboardMarkup, answer: str | None = None):
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        logging.warning(f"User {callback.from_user.id}: Error editing reminder message: {e}")
+    await callback.answer(answer)
+
+
+# --- Выбор рейса и времени ---
+
+@callbacks.router(callbacks.ReminderPick)
+async def pick_departure_handler(callback: CallbackQuery, payload: callbacks.ReminderPick):
+    """Ближайшие по времени суток рейсы остановки."""
+    try:
+        route, stop = _find_stop(payload.transport_type, payload.number, payload.route_idx, payload.stop_ref, payload.day_type)
+    except (KeyError, IndexError, ValueError):
+        await callback.answer("Остановка не найдена. Попробуйте выбрать маршрут заново.", show_alert=True)
+        return
+    minutes = stop.minutes
+    now_minute = departures.current_service_minute()
+    options = list(departures.next_departures(minutes, now_minute, PICK_COUNT))
+    # После последнего рейса - первые утренние: для них (и для другого типа дня) доступно только ежедневное
+    options += minutes[:min(PICK_COUNT, len(minutes)) - len(options)]
+    if not options:
+        await callback.answer("В расписании нет рейсов.", show_alert=True)
+        return
+
+    kb = InlineKeyboardBuilder()
+    for minute in options:
+        kb.button(text=departures.format_time(minute), callback_data=callbacks.encode(
+            callbacks.ReminderDeparture(*payload, minute)))
+    kb.button(text="🔙 Назад", callback_data=callbacks.encode(callbacks.ToggleDay(*payload)))  # назад к расписанию
+    kb.adjust(*[4] * (len(options) // 4), *([len(options) % 4] if len(options) % 4 else []), 1)
+    text = (
+        f"<b>⏰ Напоминание</b>\n{html.escape(_label(payload.transport_type, route, stop))}\n"
+        f"Расписание на {common_handlers.get_day_type_name(payload.day_type, 'accusative')}.\n\n"
+        f"Выберите рейс:"
+    )
+    await _edit(callback, text, kb.as_markup())
+
+
+@callbacks.router(callbacks.ReminderDeparture)
+async def pick_lead_handler(callback: CallbackQuery, payload: callbacks.ReminderDeparture):
+    """За сколько минут напомнить: один раз сегодня (если ещё не поздно) или каждый такой день."""
+    try:
+        route, stop = _find_stop(payload.transport_type, payload.number, payload.route_idx, payload.stop_ref, payload.day_type)
+    except (KeyError, IndexError, ValueError):
+        await callback.answer("Остановка не найдена. Попробуйте выбрать маршрут заново.", show_alert=True)
+        return
+    back = callbacks.ReminderPick(*payload[:-1])
+    kb = InlineKeyboardBuilder()
+    once = []
+    if payload.day_type == common_handlers.get_current_day_type():
+        now_minute = departures.current_service_minute()
+        once = [lead for lead in REMINDER_LEADS if payload.departure - lead > now_minute]
+    for lead in once:
+        kb.button(text=f"🔔 за {lead} мин", callback_data=callbacks.encode(callbacks.ReminderAdd(*payload, lead, False)))
+    for lead in REMINDER_LEADS:
+        kb.button(text=f"🔁 за {lead} мин", callback_data=callbacks.encode(callbacks.ReminderAdd(*payload, lead, True)))
+    kb.button(text="🔙 Назад", callback_data=callbacks.encode(back))
+    kb.adjust(*([len(once)] if once else []), len(REMINDER_LEADS), 1)
+    repeat = _repeat_name(True, payload.day_type)
+    text = (
+        f"<b>⏰ Рейс в {departures.format_time(payload.departure)}</b>\n{html.escape(_label(payload.transport_type, route, stop))}\n\n"
+        + ("🔔 - напомнить один раз сегодня, " if once else "")
+        + f"🔁 - {repeat}.\nЗа сколько минут до рейса напомнить?"
+    )
+    await _edit(callback, text, kb.as_markup())
+
+
+@callbacks.router(callbacks.ReminderAdd)
+async def add_reminder_handler(callback: CallbackQuery, payload: callbacks.ReminderAdd):
+    """Сохраняет напоминание и показывает подтверждение."""
+    user_id = callback.from_user.id
+    try:
+        route, stop = _find_stop(payload.transport_type, payload.number, payload.route_idx, payload.stop_ref, payload.day_type)
+    except (KeyError, IndexError, ValueError):
+        await callback.answer("Остановка не найдена. Попробуйте выбрать маршрут заново.", show_alert=True)
+        return
+    if payload.departure not in stop.minutes or payload.lead not in REMINDER_LEADS:
+        await callback.answer("Этого рейса нет в расписании.", show_alert=True)
+        return
+    if len(await utils.list_reminders(user_id)) >= utils.REMINDERS_PER_USER:
+        await callback.answer(f"Можно завести не больше {utils.REMINDERS_PER_USER} напоминаний. "
+                              f"Удалите лишние: /reminders", show_alert=True)
+        return
+
+    now = time.time()
+    if payload.daily:
+        fire_at = next_fire_at(payload.departure, payload.lead, payload.day_type, now)
+    else:
+        fire_at = fire_time(departures.service_date(), payload.departure, payload.lead)
+    if fire_at is None or fire_at <= now or (not payload.daily and payload.day_type != common_handlers.get_current_day_type()):
+        await callback.answer("Напомнить об этом рейсе уже не получится.", show_alert=True)
+        return
+
+    label = _label(payload.transport_type, route, stop)
+    chat_id = callback.message.chat.id if callback.message else user_id
+    reminder = await utils.add_reminder(Reminder(
+        0, user_id, chat_id, payload.transport_type, payload.number, payload.route_idx, payload.stop_ref,
+        payload.day_type, payload.departure, payload.lead, payload.daily, fire_at, label
+    ))
+    logging.info(f"User {user_id}: reminder {reminder.id} for {payload}")
+
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🔙 К расписанию", callback_data=callbacks.encode(callbacks.ToggleDay(*payload[:6])))
+    text = (
+        f"✅ <b>Напоминание сохранено</b>\n{html.escape(label)}\n"
+        f"Рейс в {departures.format_time(payload.departure)}, напомню за {payload.lead} мин "
+        f"({_repeat_name(payload.daily, payload.day_type)}), ближайшее - {_clock(fire_at)}.\n\n"
+        f"Все напоминания: /reminders"
+    )
+    await _edit(callback, text, kb.as_markup(), "🔔 Напоминание сохранено")
+
+
+# --- Список напоминаний ---
+
+async def _build_reminders_message(user_id: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    reminders = await utils.list_reminders(user_id)
+    if not reminders:
+        return ("У вас нет напоминаний.\n\nЧтобы добавить, откройте расписание остановки "
+                "и нажмите «⏰ Напомнить».", None)
+    kb = InlineKeyboardBuilder()
+    text = "<b>⏰ Ваши напоминания:</b>\n\n"
+    for counter, reminder in enumerate(reminders, 1):
+        text += (f"{counter}. {html.escape(reminder.label)}\n"
+                 f"    рейс в {departures.format_time(reminder.departure)}, за {reminder.lead} мин, "
+                 f"{_repeat_name(reminder.daily, reminder.day_type)}\n")
+        kb.button(text=f"❌ {counter}", callback_data=callbacks.encode(callbacks.ReminderDelete(reminder.id)))
+    kb.adjust(5)
+    return text + "\nНажмите номер, чтобы удалить напоминание.", kb.as_markup()
+
+
+@router.message(F.text == "/reminders")
+async def show_reminders_handler(message: Message):
+    text, markup = await _build_reminders_message(message.from_user.id)
+    await message.answer(text, reply_markup=markup)
+
+
+@callbacks.router(callbacks.ReminderDelete)
+async def delete_reminder_handler(callback: CallbackQuery, payload: callbacks.ReminderDelete):
+    removed = await utils.remove_reminder(callback.from_user.id, payload.reminder_id)
+    text, markup = await _build_reminders_message(callback.from_user.id)
+    await _edit(callback, text, markup, "Напоминание удалено" if removed else "Напоминание уже удалено")
+
+
+# --- Текст напоминания (вызывает планировщик) ---
+
+def render(reminder: Reminder) -> tuple[str, InlineKeyboardMarkup] | None:
+    """Сообщение напоминания; None, если рейса больше нет в текущем расписании."""
+    try:
+        _, stop = _find_stop(reminder.transport_type, reminder.number, reminder.route_idx, reminder.stop_ref, reminder.day_type)
+    except (KeyError, IndexError, ValueError):
+        return None
+    if reminder.departure not in stop.minutes:
+        return None
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🗓️ Расписание", callback_data=callbacks.encode(callbacks.Stop(
+        reminder.transport_type, reminder.number, reminder.route_idx, reminder.stop_ref, reminder.day_type)))
+    text = (
+        f"⏰ <b>Через {reminder.lead} мин рейс в {departures.format_time(reminder.departure)}</b>\n"
+        f"{html.escape(reminder.label)}"
+    )
+    if reminder.daily:
+        text += f"\n\n<i>Напоминание повторяется {_repeat_name(True, reminder.day_type)}. Отключить: /reminders</i>"
+    return text, kb.as_markup()
+
+
+# --- Планировщик вместе с диспетчером ---
+
+@router.startup()
+async def start_reminder_scheduler(bot: Bot):
+    await utils.start_reminders(bot, render)
+
+
+@router.shutdown()
+async def stop_reminder_scheduler():
+    await utils.close_reminders()
+
+# --- END OF FILE reminders.py ---
@@ -0,0 +1,83 @@
+# --- START OF FILE render_cache.py ---
+
+"""
+Кэш готовых фрагментов сообщений.
+
+Ключи всех кэшей начинаются с типа транспорта, поэтому при замене расписания
+в utils сбрасываются только записи этого типа.
+"""
+
+import logging
+import os
+from collections import OrderedDict
+
+import utils
+
+SCHEDULE_CACHE_SIZE = int(os.getenv("SCHEDULE_CACHE_SIZE", "1024"))
+
+
+class LRUCache:
+    """Простой LRU-кэш со счётчиками попаданий и промахов."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get_or_build(self, key, builder):
+        """Возвращает значение из кэша или строит его через builder(). Исключения builder не кэшируются."""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            value = builder()
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return value
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def invalidate(self, transport_type: str | None = None):
+        """Удаляет записи указанного типа транспорта (или все)."""
+        if transport_type is None:
+            self._data.clear()
+            return
+        for key in [k for k in self._data if k[0] == transport_type]:
+            del self._data[key]
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# Статическая часть сообщения с расписанием остановки (см. common_handlers.ScheduleFragment)
+schedule_fragments = LRUCache(SCHEDULE_CACHE_SIZE)
+
+_caches = {"schedule_fragments": schedule_fragments}
+
+
+def register(name: str, cache: LRUCache) -> LRUCache:
+    """Регистрирует кэш для общего сброса при перезагрузке данных и для статистики."""
+    _caches[name] = cache
+    return cache
+
+
+def invalidate(transport_type: str | None = None):
+    # Счётчики за время жизни прежних данных - видно, какие кэши работают
+    logging.info("Render caches before reload: " + ", ".join(
+        f"{name} {cache.hits}/{cache.hits + cache.misses}" for name, cache in _caches.items()
+    ))
+    for cache in _caches.values():
+        cache.invalidate(transport_type)
+
+
+def stats() -> dict:
+    """Статистика всех кэшей: {имя: {size, maxsize, hits, misses}}."""
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+utils.add_reload_listener(invalidate)
+
+# --- END OF FILE render_cache.py ---
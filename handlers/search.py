@@ -0,0 +1,214 @@
+# --- START OF FILE search.py ---
+
+import html
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.exceptions import TelegramBadRequest
+import utils
+from handlers import callbacks, common_handlers
+from timetable import departures
+from timetable.board import DepartureBoard, route_destination
+from timetable.stop_index import StopIndex
+import logging
+
+router = Router()
+
+BOARD_SIZE = 12
+MIN_QUERY_LENGTH = 2
+MAX_RESULTS = 10
+MAX_ROUTE_BUTTONS = 40
+
+# Источники данных по типам транспорта
+_DATA_GETTERS = {
+    common_handlers.TYPE_BUS: utils.getBusSchedule,
+    common_handlers.TYPE_TROLLEYBUS: utils.getTrolleybusSchedule,
+}
+
+def get_sources() -> dict:
+    """Текущие данные расписания: {тип транспорта: данные}."""
+    return {transport_type: getter() or {} for transport_type, getter in _DATA_GETTERS.items()}
+
+
+_stop_index: StopIndex | None = None
+_departure_board: DepartureBoard | None = None
+
+
+def get_stop_index() -> StopIndex:
+    """Возвращает индекс остановок, строит его при первом обращении после загрузки данных."""
+    global _stop_index
+    if _stop_index is None:
+        _stop_index = StopIndex(get_sources())
+        logging.info(f"Stop index built: {len(_stop_index)} stops")
+    return _stop_index
+
+
+def get_departure_board() -> DepartureBoard:
+    """Табло отправлений по всем остановкам индекса (строится вместе с индексом)."""
+    global _departure_board
+    if _departure_board is None or _departure_board.index is not get_stop_index():
+        _departure_board = DepartureBoard(get_stop_index(), get_sources())
+    return _departure_board
+
+
+def _reset_stop_index(transport_type: str):
+    global _stop_index, _departure_board
+    _stop_index = None
+    _departure_board = None
+
+
+utils.add_reload_listener(_reset_stop_index)
+
+
+def _stop_ref(index: StopIndex, key_id: int) -> str:
+    """Ссылка на остановку индекса в callback data: "s<ID>" переживает перестройку индекса."""
+    return common_handlers.stop_ref(index.stop_ids[key_id], key_id)
+
+
+def _resolve_stop(index: StopIndex, ref: str) -> int:
+    """Идентификатор в индексе по ссылке _stop_ref (числовая - из старых сообщений)."""
+    key_id = index.by_stop_id(int(ref[1:])) if ref.startswith("s") else int(ref)
+    if key_id is None or not 0 <= key_id < len(index):
+        raise IndexError(f"Stop {ref} not found")
+    return key_id
+
+
+def _number_sort_key(number: str):
+    return (0, int(number)) if number.isdigit() else (1, number)
+
+
+def _build_stop_message(index: StopIndex, key_id: int) -> tuple[str, InlineKeyboardBuilder]:
+    """Текст и кнопки со всеми маршрутами, проходящими через остановку (на сегодняшний тип дня)."""
+    day_type = common_handlers.get_current_day_type()
+    occurrences = [occ for occ in index.occurrences[key_id] if occ.day_type == day_type]
+    if not occurrences:
+        # Сегодня остановку никто не обслуживает - покажем другой тип дня
+        day_type = common_handlers.get_opposite_day_type(day_type)
+        occurrences = [occ for occ in index.occurrences[key_id] if occ.day_type == day_type]
+
+    occurrences.sort(key=lambda occ: (occ.transport_type != common_handlers.TYPE_BUS, _number_sort_key(occ.number), occ.route_idx))
+
+    kb = InlineKeyboardBuilder()
+    lines = []
+    for occ in occurrences[:MAX_ROUTE_BUTTONS]:
+        config = common_handlers.TRANSPORT_CONFIG[occ.transport_type]
+        ref = common_handlers.stop_ref(index.stop_ids[key_id], occ.stop_idx)
+        try:
+            route_name = _DATA_GETTERS[occ.transport_type]().route(occ.number, occ.day_type, occ.route_idx).name
+        except (KeyError, IndexError):
+            continue
+        lines.append(f"{config['emoji']} <b>№{occ.number}</b> — {route_name}")
+        kb.button(
+            text=f"{config['emoji']} №{occ.number}: {route_name}",
+            callback_data=callbacks.encode(callbacks.Stop(occ.transport_type, occ.number, occ.route_idx, ref, occ.day_type))
+        )
+    kb.adjust(1)
+    if lines:
+        kb.row(InlineKeyboardButton(text="🕒 Табло отправлений", callback_data=callbacks.encode(callbacks.Board(_stop_ref(index, key_id)))))
+
+    if not lines:
+        return f"Через остановку «{index.names[key_id]}» маршрутов не найдено.", kb
+    text = (
+        f"<b>🚏 Остановка «{index.names[key_id]}»</b>\n"
+        f"Маршруты (на {common_handlers.get_day_type_name(day_type, 'accusative')}):\n\n"
+        + "\n".join(lines)
+        + "\n\nВыберите маршрут, чтобы открыть расписание:"
+    )
+    return text, kb
+
+
+@callbacks.router(callbacks.SearchStop)
+async def search_stop_callback_handler(callback: CallbackQuery, payload: callbacks.SearchStop):
+    """Выбор остановки из результатов поиска."""
+    try:
+        index = get_stop_index()
+        key_id = _resolve_stop(index, payload.stop_ref)
+    except (IndexError, ValueError) as e:
+        logging.warning(f"Stop from search not found: {payload} - {e}")
+        await callback.answer("Ошибка: Остановка не найдена, повторите поиск.", show_alert=True)
+        return
+
+    text, kb = _build_stop_message(index, key_id)
+    try:
+        await callback.message.edit_text(text, reply_markup=kb.as_markup())
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
+def _build_board_message(key_id: int) -> tuple[str, InlineKeyboardBuilder]:
+    """Ближайшие отправления со всех маршрутов остановки."""
+    board = get_departure_board()
+    name = board.index.names[key_id]
+    day_type = common_handlers.get_current_day_type()
+    upcoming = board.upcoming(key_id, day_type, departures.current_service_minute(), BOARD_SIZE)
+
+    if upcoming:
+        rows = []
+        for departure in upcoming:
+            occ = departure.line.occurrence
+            config = common_handlers.TRANSPORT_CONFIG[occ.transport_type]
+            rows.append(
+                f"<code>{departures.format_time(departure.minute)}</code> "
+                f"{config['emoji']} <b>№{occ.number}</b> → {route_destination(departure.line.route_name)}"
+            )
+        text = f"<b>🕒 Табло: «{name}»</b>\n\n" + "\n".join(rows)
+    else:
+        text = f"<b>🕒 Табло: «{name}»</b>\n\nНет рейсов до конца дня."
+
+    kb = InlineKeyboardBuilder()
+    ref = _stop_ref(board.index, key_id)
+    kb.button(text="🔄 Обновить", callback_data=callbacks.encode(callbacks.Board(ref)))
+    kb.button(text="🔙 К маршрутам", callback_data=callbacks.encode(callbacks.SearchStop(ref)))
+    kb.adjust(2)
+    return text, kb
+
+
+@callbacks.router(callbacks.Board)
+async def departure_board_handler(callback: CallbackQuery, payload: callbacks.Board):
+    """Табло отправлений остановки по всем маршрутам."""
+    try:
+        key_id = _resolve_stop(get_stop_index(), payload.stop_ref)
+    except (IndexError, ValueError) as e:
+        logging.warning(f"Board stop not found: {payload} - {e}")
+        await callback.answer("Ошибка: Остановка не найдена, повторите поиск.", show_alert=True)
+        return
+
+    text, kb = _build_board_message(key_id)
+    try:
+        if callback.message.html_text != text:
+            await callback.message.edit_text(text, reply_markup=kb.as_markup())
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
+# Должен подключаться последним: ловит любой текст, не обработанный другими роутерами
+@router.message(F.text, ~F.text.startswith("/"))
+async def stop_search_handler(message: Message):
+    """Поиск остановки по введённому названию."""
+    query = message.text.strip()
+    logging.info(f"User {message.from_user.id}: stop search '{query}'")
+    if len(query) < MIN_QUERY_LENGTH:
+        await message.answer("Введите хотя бы пару букв названия остановки.")
+        return
+
+    index = get_stop_index()
+    results = index.search(query, MAX_RESULTS)
+    if not results:
+        await message.answer(f"Остановка «{html.escape(query)}» не найдена. Проверьте название или воспользуйтесь меню.")
+        return
+
+    # Однозначное совпадение - сразу показываем маршруты через остановку
+    if len(results) == 1 or index.lookup(query) == results[0]:
+        text, kb = _build_stop_message(index, results[0])
+        await message.answer(text, reply_markup=kb.as_markup())
+        return
+
+    kb = InlineKeyboardBuilder()
+    for key_id in results:
+        kb.button(text=f"🚏 {index.names[key_id]}", callback_data=callbacks.encode(callbacks.SearchStop(_stop_ref(index, key_id))))
+    kb.adjust(1)
+    await message.answer(f"Найдено остановок: {len(results)}. Выберите нужную:", reply_markup=kb.as_markup())
+
+# --- END OF FILE search.py ---
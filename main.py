@@ -7,6 +7,8 @@ from aiogram import Bot, Dispatcher, F, Router
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
 from environs import Env
 
@@ -16,9 +18,14 @@ env.read_env() # Пытается прочитать .env для локальн
 # Пример получения токена в bot.py
 # bot_token = os.getenv("API_TOKEN") -> заменяем на:
 bot_token = env.str("API_TOKEN")
+# "polling" (по умолчанию) или "webhook" - приём апдейтов aiohttp-сервером, см. webhook.py
+BOT_MODE = env.str("BOT_MODE", "polling")
 # Импортируем роутеры и общие хендлеры
-from handlers import bus, trolleybus, favorites, common_handlers
+from handlers import bus, trolleybus, favorites, reminders, journey, search, common_handlers, callbacks
 import utils # Нужен для инициализации данных при старте
+import webhook
+import supervisor
+from delivery import outbound
 
 # Настройка логирования для отладки
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
@@ -28,9 +35,17 @@ if not bot_token:
     logging.critical("API_TOKEN environment variable not set!")
     raise ValueError("Необходимо установить переменную окружения API_TOKEN")
 
-bot = Bot(token=bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Свой сервер Bot API (например, bench/fake_bot_api.py для проверок без сети)
+api_url = env.str("TELEGRAM_API_URL", "")
+session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else AiohttpSession()
+bot = Bot(token=bot_token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Все исходящие запросы с chat_id - через очередь с лимитами Telegram и приоритетами
+outbound_queue = outbound.OutboundQueue()
+bot.session.middleware(outbound_queue)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
+# callback data разбирается один раз, хендлер выбирается по действию до фильтров aiogram
+callbacks.router.setup(dp)
 
 # --- Главное меню ---
 main_menu_keyboard = ReplyKeyboardMarkup(
@@ -42,7 +57,7 @@ main_menu_keyboard = ReplyKeyboardMarkup(
          [KeyboardButton(text="⭐ Избранное")]
     ],
     resize_keyboard=True,
-    input_field_placeholder="Выберите тип транспорта или Избранное"
+    input_field_placeholder="Выберите транспорт или введите остановку"
 )
 
 
@@ -54,7 +69,8 @@ async def start_command_handler(message: Message):
     logging.info(f"User {message.from_user.id} ({message.from_user.username}) triggered /start")
     await message.answer(
         f"👋 Добро пожаловать, {message.from_user.first_name}!\n"
-        "Я помогу вам узнать расписание общественного транспорта.",
+        "Я помогу вам узнать расписание общественного транспорта.\n"
+        "Просто напишите название остановки, чтобы сразу увидеть её маршруты.",
         reply_markup=main_menu_keyboard
     )
 
@@ -64,7 +80,7 @@ async def back_to_main_menu_handler(message: Message):
     logging.info(f"User {message.from_user.id} ({message.from_user.username}) requested main menu via ReplyKeyboard")
     await message.answer("Вы вернулись в главное меню.", reply_markup=main_menu_keyboard)
 
-@dp.callback_query(F.data == "back_to_main")
+@callbacks.router(callbacks.BackToMain)
 async def back_to_main_menu_inline_handler(callback: CallbackQuery):
     """Обработчик инлайн-кнопки 'На главную'"""
     logging.info(f"User {callback.from_user.id} ({callback.from_user.username}) requested main menu via InlineKeyboard")
@@ -85,51 +101,58 @@ async def back_to_main_menu_inline_handler(callback: CallbackQuery):
 dp.include_router(bus.router)           # Проверит F.text == "🚌 Автобусы" здесь
 dp.include_router(trolleybus.router)    # Проверит F.text == "🚎 Троллейбусы" здесь
 dp.include_router(favorites.router)     # Проверит F.text == "⭐ Избранное" здесь
+dp.include_router(reminders.router)     # /reminders; запуск и остановка планировщика напоминаний
+dp.include_router(journey.router)       # "Откуда -> Куда" и /route
+dp.include_router(search.router)        # Последним: любой другой текст - поиск остановки
 
 
-# --- Функция для периодического обновления данных (пример) ---
-async def scheduled_reload(interval_seconds: int):
-    """Периодически вызывает принудительную перезагрузку кэша."""
-    while True:
-        await asyncio.sleep(interval_seconds)
-        logging.info(f"Scheduled task: Reloading schedule data...")
-        try:
-            await asyncio.to_thread(utils.force_reload_all_schedules)
-            logging.info("Scheduled task: Schedule data reloaded successfully.")
-        except Exception as e:
-            logging.error(f"Scheduled task: Error reloading schedules: {e}", exc_info=True)
-
 # --- Запуск бота ---
 async def main():
-    logging.info("Initializing schedule data...")
-    try:
-        utils.getBusSchedule()
-        utils.getTrolleybusSchedule()
-        logging.info("Schedule data initialized successfully.")
-    except Exception as e:
-        logging.error(f"Failed to initialize schedule data on startup: {e}", exc_info=True)
-        # raise # Раскомментировать, если без данных бот работать не может
+    # Снапшоты расписаний, избранное и сброс вебхука - одновременно; индексы прогреваются в фоне.
+    # В режиме вебхука он не сбрасывается, а регистрируется заново, когда сервер уже слушает
+    pending = () if BOT_MODE == "webhook" else (bot.delete_webhook(drop_pending_updates=True),)
+    warmup_task = await utils.startup(*pending)
 
-    # Запуск фоновой задачи обновления - раскомментируйте при необходимости
-    # reload_interval = 7 * 24 * 60 * 60
-    # logging.info(f"Scheduling data reload every {reload_interval} seconds.")
-    # asyncio.create_task(scheduled_reload(reload_interval))
+    # Плановое обновление расписаний в отдельном процессе (окна и интервал - REFRESH_* в .env)
+    refresh_task = utils.start_refresh_scheduler()
 
-    logging.info("Starting bot polling...")
-    await bot.delete_webhook(drop_pending_updates=True)
     try:
-        # Указываем allowed_updates для эффективности
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if BOT_MODE == "webhook":
+            logging.info("Starting bot in webhook mode...")
+            await webhook.serve(dp, bot)
+        else:
+            logging.info("Starting bot polling...")
+            # Указываем allowed_updates для эффективности
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except Exception as e:
-        logging.critical(f"Polling failed: {e}", exc_info=True)
+        logging.critical(f"{BOT_MODE.capitalize()} failed: {e}", exc_info=True)
     finally:
-        logging.info("Closing bot session.")
-        await bot.session.close()
+        if refresh_task is not None:
+            refresh_task.cancel()
+            try:
+                await refresh_task
+            except asyncio.CancelledError:
+                pass
+        await shutdown()
+
+
+async def shutdown():
+    """Остановка после того, как апдейты больше не принимаются (и в рабочих процессах supervisor.py)."""
+    logging.info("Flushing favorites.")
+    await utils.close_favorites()
+    logging.info("Draining outbound queue.")
+    await outbound_queue.close()
+    logging.info("Closing bot session.")
+    await bot.session.close()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if BOT_MODE == "webhook" and supervisor.WEBHOOK_WORKERS > 1:
+            # Несколько процессов на общем сокете и общих снапшотах
+            supervisor.run(dp, bot, shutdown)
+        else:
+            asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
         logging.info("Bot stopped by user.")
     except Exception as e:
@@ -1,17 +1,9 @@
-from bs4 import BeautifulSoup
-import requests
 import re
-import json
 import os
 import time
-import multiprocessing
-from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict
 import logging
 
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 # === Настройка логгера ===
 logging.basicConfig(
     level=logging.INFO,
@@ -20,27 +12,28 @@ logging.basicConfig(
 )
 
 from dotenv import load_dotenv
+from timetable import snapshot, stop_registry
+# bs4 и aiohttp (fetcher) импортируются только при разборе и обходе сайта:
+# запуск бота со снапшота их не загружает
+from parsers import crawl_state, html_backend
 
 load_dotenv()
-BUS_SCHEDULE = os.getenv("BUS_SCHEDULE_PATH")
+BUS_LIST_PATH = "/spravka/transport/busgor/"
+EXCLUDED_BUSES = ["50", "28к"]
+TITLE_RE = re.compile("Маршрут движения автобуса")
+MINUTES_RE = re.compile(r"\d{2}")
+BUS_SCHEDULE = os.getenv("BUS_SCHEDULE_PATH") # Старый JSON, используется только для конвертации
+BUS_SNAPSHOT = os.getenv("BUS_SNAPSHOT_PATH") or snapshot.default_snapshot_path(BUS_SCHEDULE)
 
 def saveScheduleToFile(buses: List[Dict]):
     try:
-        with open(BUS_SCHEDULE, "w", encoding="utf-8") as f:
-            json.dump(buses, f, indent=4, ensure_ascii=False)
+        snapshot.write_snapshot(BUS_SNAPSHOT, buses, snapshot.KIND_BUS)
         logging.info(f"Сохранено расписание ({len(buses)} автобусов)")
     except Exception as e:
         logging.error(f"Ошибка при сохранении: {e}")
 
-def loadScheduleFromFile() -> List[Dict]:
-    if not os.path.exists(BUS_SCHEDULE):
-        return None
-    try:
-        with open(BUS_SCHEDULE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logging.warning(f"Ошибка загрузки файла: {e}")
-        return None
+def loadScheduleFromFile() -> snapshot.Snapshot | None:
+    return snapshot.load_or_convert(BUS_SNAPSHOT, BUS_SCHEDULE, snapshot.KIND_BUS)
 
 def getRoutes(bus_number, table1, table2):
     routes = []
@@ -59,7 +52,7 @@ def getRoutes(bus_number, table1, table2):
                     try:
                         hour = div.b.text.strip()
                         raw = div.decode_contents().split("</b>")[1]
-                        minutes = re.findall(r"\d{2}", raw)
+                        minutes = MINUTES_RE.findall(raw)
                         times.extend([f"{hour}:{minute}" for minute in minutes])
                     except Exception:
                         continue
@@ -69,12 +62,77 @@ def getRoutes(bus_number, table1, table2):
             logging.warning(f"Ошибка в таблице маршрута {bus_number}: {e}")
     return routes
 
-def getSchedule(url):
+def getRoutesLxml(bus_number, table1, table2):
+    """То же, что getRoutes, для таблиц lxml."""
+    routes = []
+    for table in [table1, table2]:
+        try:
+            header = table
+            for tag in ("thead", "tr", "th", "center", "strong"):
+                header = html_backend.find(header, tag)
+            name = html_backend.text(header).strip()
+            route = {"bus_number": bus_number, "name": name, "stops": []}
+            for row in html_backend.find(table, "tbody").iterdescendants("tr"):
+                cells = list(row.iterdescendants("td"))
+                if len(cells) < 2:
+                    continue
+                stop_name = html_backend.text(cells[0]).strip()
+                times = []
+                for div in cells[1].iterdescendants("div"):
+                    try:
+                        b = html_backend.find(div, "b")
+                        hour = html_backend.text(b).strip()
+                        if b.getparent() is div and b.getnext() is None:
+                            raw = b.tail or ""  # обычная ячейка: "<b>6</b> 05 35"
+                        else:
+                            raw = html_backend.contents_after(div, b).split("</b>")[0]
+                        minutes = MINUTES_RE.findall(raw)
+                        times.extend([f"{hour}:{minute}" for minute in minutes])
+                    except Exception:
+                        continue
+                route["stops"].append({"name": stop_name, "times": times})
+            routes.append(route)
+        except Exception as e:
+            logging.warning(f"Ошибка в таблице маршрута {bus_number}: {e}")
+    return routes
+
+def parseScheduleLxml(html: str, url: str = "") -> list:
+    """То же, что parseSchedule, на lxml."""
     try:
-        response = requests.get(url, timeout=10, verify=False)
-        soup = BeautifulSoup(response.text, "html.parser")
+        root = html_backend.document(html)
 
-        title = soup.find("strong", string=re.compile("Маршрут движения автобуса"))
+        title = html_backend.find_by_string(root, "strong", TITLE_RE)
+        if title is None:
+            raise ValueError("Не найден заголовок маршрута")
+
+        bus_number = html_backend.text(title).split("№")[1][:-1].strip()
+
+        def find_tables(keyword):
+            h2 = html_backend.find_by_string(root, "h2", re.compile(keyword))
+            if h2 is None:
+                return []
+            t1 = html_backend.next_sibling_tag(h2)
+            t2 = html_backend.next_sibling_tag(t1) if t1 is not None and t1.tag != "p" else None
+            if t1 is not None and t2 is not None:
+                return getRoutesLxml(bus_number, t1, t2)
+            return []
+
+        return [find_tables("будние дни"), find_tables("выходные дни")]
+
+    except Exception as e:
+        logging.error(f"Ошибка при разборе расписания {url}: {e}")
+        return [[], []]
+
+def parseSchedule(html: str, url: str = "", backend: str | None = None) -> list:
+    """Разбирает страницу расписания автобуса: [маршруты по будням, маршруты по выходным]."""
+    if html_backend.get_backend(backend) == "lxml":
+        return parseScheduleLxml(html, url)
+    try:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+
+        title = soup.find("strong", string=TITLE_RE)
         if not title:
             raise ValueError("Не найден заголовок маршрута")
 
@@ -93,29 +151,40 @@ def getSchedule(url):
         return [find_tables("будние дни"), find_tables("выходные дни")]
 
     except Exception as e:
-        logging.error(f"Ошибка при получении расписания с {url}: {e}")
+        logging.error(f"Ошибка при разборе расписания {url}: {e}")
         return [[], []]
 
-def process_bus(bus_html, base_url):
-    try:
-        tds = bus_html.find_all("td")
-        if len(tds) < 2:
-            return None
-        desc_td, link_td = tds
-        span = desc_td.find("span")
-        bus_num = span.text.split("№")[1].strip() if span else "??"
-        route_name = span.next_sibling.strip() if span and span.next_sibling else "Без названия"
-
-        if bus_num in ["50", "28к"]:
-            return None
+def parseBusList(html: str) -> List[Dict]:
+    """Список автобусов со страницы-справочника: номер, название и ссылка на расписание."""
+    from bs4 import BeautifulSoup
 
-        relative_url = link_td.find("a")["href"]
-        url = base_url + relative_url
-        route_weekdays, route_weekends = getSchedule(url)
+    soup = BeautifulSoup(html, "html.parser")
+    buses = []
+    for bus_html in soup.find("table", class_="adapt-list-schedule").find_all("tr")[1:]:
+        try:
+            tds = bus_html.find_all("td")
+            if len(tds) < 2:
+                continue
+            desc_td, link_td = tds
+            span = desc_td.find("span")
+            bus_num = span.text.split("№")[1].strip() if span else "??"
+            route_name = span.next_sibling.strip() if span and span.next_sibling else "Без названия"
+
+            if bus_num in EXCLUDED_BUSES:
+                continue
+
+            buses.append({"number": bus_num, "route_name": route_name, "url": link_td.find("a")["href"]})
+        except Exception as e:
+            logging.warning(f"Ошибка обработки автобуса: {e}")
+    return buses
 
+def process_bus(bus: Dict, html: str):
+    """Выполняется в пуле процессов: получает только строки, возвращает словарь автобуса."""
+    try:
+        route_weekdays, route_weekends = parseSchedule(html, bus["url"])
         return {
-            "number": bus_num,
-            "route_name": route_name,
+            "number": bus["number"],
+            "route_name": bus["route_name"],
             "route_weekdays": route_weekdays,
             "route_weekends": route_weekends
         }
@@ -123,34 +192,35 @@ def process_bus(bus_html, base_url):
         logging.warning(f"Ошибка обработки автобуса: {e}")
         return None
 
-def getBusesParallel():
+def getBusesParallel(refresh: bool = False):
+    """
+    Расписание автобусов: из снапшота, а если его нет - обходом сайта.
+    refresh=True - инкрементальное обновление: заново разбираются только
+    изменившиеся страницы, остальное берётся из текущего снапшота.
+    """
     start_time = time.time()
     buses = loadScheduleFromFile()
-    if buses:
+    if buses and not refresh:
         logging.info("Загружено из кэша.")
     else:
-        url = "https://mogilev.biz/spravka/transport/busgor/"
-        base_url = "https://mogilev.biz"
-        response = requests.get(url, verify=False)
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        bus_rows = soup.find("table", class_="adapt-list-schedule").find_all("tr")[1:]
-        total = len(bus_rows)
-
-        print("Скачиваем расписания:")
-        with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-            results = []
-            for i, result in enumerate(executor.map(process_bus, bus_rows, [base_url] * total)):
-                if result:
-                    results.append(result)
-                print(f"[{i+1}/{total}] ✓", end="\r", flush=True)
-
-        buses = results
-        saveScheduleToFile(buses)
+        from parsers import fetcher
+
+        state = crawl_state.CrawlState(crawl_state.state_path(BUS_SNAPSHOT))
+        results, changed = fetcher.run(fetcher.refresh(BUS_LIST_PATH, parseBusList, process_bus, buses, state))
+        if changed or not buses:
+            # Нормализация названий: постоянные ID остановок и единое написание для всех видов транспорта
+            with stop_registry.updating() as registry:
+                results = stop_registry.normalize(results, registry)
+            stop_registry.log_near_duplicates(registry)
+            saveScheduleToFile(results)
+            # Отдаём данные через снапшот (mmap); если запись не удалась - снапшот в памяти
+            buses = loadScheduleFromFile() or snapshot.Snapshot(snapshot.build_snapshot(results, snapshot.KIND_BUS))
+        else:
+            logging.info("Расписание не изменилось.")
 
     elapsed = time.time() - start_time
     logging.info(f"Обработка завершена за {elapsed:.2f} сек.")
-    return {bus["number"]: bus for bus in buses}
+    return buses
 
 if __name__ == "__main__":
     getBusesParallel()
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Состояние последнего обхода сайта: для каждой страницы расписания хранятся
+ETag, Last-Modified, хэш содержимого и строка из списка маршрутов, по которой
+она была разобрана. Файл лежит рядом со снапшотом (<снапшот>.crawl.json).
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+
+def state_path(snapshot_path: str) -> str:
+    return f"{snapshot_path}.crawl.json"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CrawlState:
+    """{url: {"etag", "last_modified", "hash", "item"}}"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pages: dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.pages = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logging.warning(f"Состояние обхода {path} не прочитано, будет полный обход: {e}")
+
+    def get(self, url: str) -> dict:
+        return self.pages.get(url, {})
+
+    def update(self, url: str, item: dict, text_hash: str, etag: str | None, last_modified: str | None):
+        self.pages[url] = {"etag": etag, "last_modified": last_modified, "hash": text_hash, "item": item}
+
+    def retain(self, urls):
+        """Забывает страницы, которых больше нет в списке маршрутов."""
+        urls = set(urls)
+        self.pages = {url: page for url, page in self.pages.items() if url in urls}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.pages, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            logging.error(f"Ошибка при сохранении состояния обхода: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
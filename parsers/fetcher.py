@@ -0,0 +1,195 @@
+"""
+Асинхронная загрузка страниц mogilev.biz.
+
+Одна aiohttp-сессия на весь обход: keep-alive соединения, ограничение
+параллельности, таймаут на запрос и повторы с экспоненциальной паузой.
+Базовый адрес задаётся MOGILEV_BIZ_BASE_URL, поэтому обход можно направить
+на локальный сервер с записанными страницами.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urljoin
+
+import aiohttp
+
+from dotenv import load_dotenv
+from parsers.crawl_state import CrawlState, content_hash
+
+load_dotenv()
+
+BASE_URL = os.getenv("MOGILEV_BIZ_BASE_URL", "https://mogilev.biz")
+CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT", "10"))
+RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+BACKOFF_SECONDS = 0.5
+# Разбор HTML - в небольшом пуле процессов, которому передаются только строки
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(2, multiprocessing.cpu_count()))))
+
+# Статусы, при которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+USER_AGENT = "mglv-public-transport-bot"
+
+
+class FetchError(Exception):
+    """Страницу не удалось загрузить после всех повторов."""
+
+
+class _RetryableStatus(Exception):
+    """Временная ошибка сервера, запрос стоит повторить."""
+
+
+def page_url(path: str, base_url: str | None = None) -> str:
+    """Абсолютный адрес страницы: относительные ссылки разрешаются от базового адреса."""
+    return urljoin((base_url or BASE_URL).rstrip("/") + "/", path)
+
+
+def create_session(concurrency: int = CONCURRENCY, timeout: float = TIMEOUT_SECONDS) -> aiohttp.ClientSession:
+    """Сессия с пулом keep-alive соединений. Сертификат сайта не проверяем (как и раньше с verify=False)."""
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, ssl=False, keepalive_timeout=30)
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+class Page(NamedTuple):
+    status: int
+    text: str | None  # None для 304 Not Modified
+    etag: str | None
+    last_modified: str | None
+
+
+async def fetch(session: aiohttp.ClientSession, url: str, headers: dict | None = None, retries: int = RETRIES,
+                semaphore: asyncio.Semaphore | None = None) -> Page:
+    """Загружает страницу с повторами. Бросает FetchError, если все попытки неудачны."""
+    last_error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(BACKOFF_SECONDS * 2 ** (attempt - 1))
+        try:
+            if semaphore is None:
+                return await _get(session, url, headers)
+            async with semaphore:
+                return await _get(session, url, headers)
+        except (_RetryableStatus, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_error = e
+        logging.warning(f"Ошибка загрузки {url} (попытка {attempt + 1}/{retries + 1}): {last_error!r}")
+    raise FetchError(f"{url}: {last_error!r}")
+
+
+async def fetch_text(session: aiohttp.ClientSession, url: str, retries: int = RETRIES,
+                     semaphore: asyncio.Semaphore | None = None) -> str:
+    return (await fetch(session, url, retries=retries, semaphore=semaphore)).text
+
+
+async def _get(session: aiohttp.ClientSession, url: str, headers: dict | None = None) -> Page:
+    async with session.get(url, headers=headers) as response:
+        if response.status in RETRY_STATUSES:
+            raise _RetryableStatus(f"HTTP {response.status}")
+        if response.status >= 400:
+            raise FetchError(f"{url}: HTTP {response.status}")
+        text = None if response.status == 304 else await response.text()
+        return Page(response.status, text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+
+async def refresh(index_path: str, parse_index, process_page, current, state: CrawlState,
+                  base_url: str | None = None, concurrency: int = CONCURRENCY,
+                  parse_workers: int = PARSE_WORKERS) -> tuple[list, int]:
+    """
+    Инкрементальный обход. current - текущие данные {номер: транспорт} или None.
+
+    Для страниц, уже разобранных в current, отправляются условные запросы
+    (If-None-Match / If-Modified-Since). При ответе 304 или совпадении хэша
+    содержимого транспорт берётся из current без разбора; он же остаётся,
+    если страницу не удалось загрузить или разобрать. Возвращает (весь транспорт в порядке
+    списка маршрутов, число изменений: разобранные заново и исчезнувшие).
+    """
+    base_url = base_url or BASE_URL
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    stats = {"parsed": 0, "not_modified": 0, "same_hash": 0, "failed": 0}
+    async with create_session(concurrency) as session:
+        items = parse_index(await fetch_text(session, page_url(index_path, base_url), semaphore=semaphore))
+
+        with ProcessPoolExecutor(max_workers=max(1, parse_workers)) as pool:
+            async def handle(item):
+                url = page_url(item["url"], base_url)
+                known = state.get(url)
+                reusable = current is not None and item["number"] in current and known.get("item") == item
+                headers = {}
+                if reusable and known.get("etag"):
+                    headers["If-None-Match"] = known["etag"]
+                if reusable and known.get("last_modified"):
+                    headers["If-Modified-Since"] = known["last_modified"]
+                try:
+                    page = await fetch(session, url, headers, semaphore=semaphore)
+                    if page.text is None:
+                        if reusable:
+                            stats["not_modified"] += 1
+                            return current[item["number"]]
+                        raise FetchError(f"{url}: HTTP {page.status} без содержимого")
+                    text_hash = content_hash(page.text)
+                    if reusable and text_hash == known.get("hash"):
+                        stats["same_hash"] += 1
+                        state.update(url, item, text_hash, page.etag, page.last_modified)
+                        return current[item["number"]]
+                    result = await loop.run_in_executor(pool, process_page, item, page.text)
+                except FetchError as e:
+                    stats["failed"] += 1
+                    logging.error(f"Страница пропущена: {e}")
+                    return current[item["number"]] if reusable else None
+                if not result:
+                    # process_page сам ловит ошибки разбора и возвращает None - как при ошибке загрузки
+                    stats["failed"] += 1
+                    logging.error(f"Страница пропущена: {url}: не удалось разобрать")
+                    return current[item["number"]] if reusable else None
+                stats["parsed"] += 1
+                state.update(url, item, text_hash, page.etag, page.last_modified)
+                return result
+
+            results = [result for result in await asyncio.gather(*(handle(item) for item in items)) if result]
+
+    state.retain(page_url(item["url"], base_url) for item in items)
+    state.save()
+    numbers = {result["number"] for result in results}
+    removed = sum(1 for number in current or () if number not in numbers)
+    logging.info(
+        f"Обновление {index_path}: разобрано {stats['parsed']}, без изменений {stats['not_modified']} (304) + "
+        f"{stats['same_hash']} (хэш), ошибок {stats['failed']}, удалено {removed}"
+    )
+    return results, stats["parsed"] + removed
+
+
+def run(coro):
+    """
+    Выполняет корутину из синхронного кода.
+    Если в этом потоке уже работает event loop (вызов из хендлера), корутина
+    выполняется в отдельном потоке со своим loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    result = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=runner, name="crawler")
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
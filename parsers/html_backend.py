@@ -0,0 +1,135 @@
+"""
+Выбор HTML-бэкенда для разбора страниц расписаний.
+
+"bs4"  - BeautifulSoup с html.parser (исходная реализация).
+"lxml" - дерево lxml (libxml2): в несколько раз быстрее, результат совпадает
+         с bs4. Хелперы ниже повторяют семантику BeautifulSoup, на которую
+         опираются парсеры (.string, find_next_sibling, .children, .text).
+
+Бэкенд задаётся переменной PARSER_BACKEND или set_backend() во время работы.
+"""
+
+import html
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKENDS = ("bs4", "lxml")
+BACKEND = os.getenv("PARSER_BACKEND", "bs4")
+
+
+def set_backend(name: str):
+    global BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {name}")
+    BACKEND = name
+
+
+def get_backend(name: str | None = None) -> str:
+    name = name or BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {name}")
+    return name
+
+
+# --- Хелперы lxml ---
+
+def document(markup: str):
+    import lxml.html
+    return lxml.html.document_fromstring(markup)
+
+
+def is_tag(node) -> bool:
+    """Элемент, а не комментарий или инструкция."""
+    return isinstance(node.tag, str)
+
+
+def text(node) -> str:
+    """Аналог Tag.text: весь текст элемента и его потомков."""
+    return str(node.text_content())
+
+
+def string(node) -> str | None:
+    """Аналог Tag.string: текст, если у элемента единственный потомок-строка (в т.ч. через вложенные теги)."""
+    children = list(node)
+    if not children:
+        return node.text
+    if len(children) == 1 and not node.text and not children[0].tail and is_tag(children[0]):
+        return string(children[0])
+    return None
+
+
+def find(node, tag: str):
+    """Аналог Tag.find(tag) / Tag.<tag>: первый потомок с таким тегом или None."""
+    return next(node.iterdescendants(tag), None)
+
+
+def find_by_string(node, tag: str, pattern):
+    """Аналог find(tag, string=re.compile(...))."""
+    for element in node.iterdescendants(tag):
+        value = string(element)
+        if value is not None and pattern.search(value):
+            return element
+    return None
+
+
+def next_sibling_tag(node):
+    """Аналог find_next_sibling(): следующий соседний элемент, строки и комментарии пропускаются."""
+    for sibling in node.itersiblings():
+        if is_tag(sibling):
+            return sibling
+    return None
+
+
+def children(node) -> list:
+    """
+    Аналог list(tag.children): элементы и строки между ними в порядке
+    документа. Комментарии превращаются в пустые строки (у bs4 их .text пустой).
+    """
+    items = []
+    if node.text is not None:
+        items.append(node.text)
+    for child in node:
+        items.append(child if is_tag(child) else "")
+        if child.tail is not None:
+            items.append(child.tail)
+    return items
+
+
+def same_node(a, b) -> bool:
+    """Аналог == для узлов bs4: строки сравниваются по значению, теги - по имени, атрибутам и содержимому."""
+    if isinstance(a, str) or isinstance(b, str):
+        return isinstance(a, str) and isinstance(b, str) and a == b
+    if a.tag != b.tag or dict(a.attrib) != dict(b.attrib):
+        return False
+    a_children, b_children = children(a), children(b)
+    return len(a_children) == len(b_children) and all(map(same_node, a_children, b_children))
+
+
+def node_text(node) -> str:
+    """.text для элемента списка children()."""
+    return node if isinstance(node, str) else text(node)
+
+
+def contents_after(container, first) -> str:
+    """
+    Разметка внутри container после закрывающего тега first, как часть
+    container.decode_contents() после первого вхождения "</tag>".
+    Обычно это просто хвостовой текст, сериализация нужна только при вложенной разметке.
+    """
+    import lxml.html
+
+    parts = []
+    node = first
+    while node is not container:
+        parts.append(html.escape(node.tail or "", quote=False))
+        for sibling in node.itersiblings():
+            parts.append(lxml.html.tostring(sibling, encoding="unicode", with_tail=True))
+        node = node.getparent()
+        if node is None:
+            break
+        if node is not container:
+            parts.append(f"</{node.tag}>")
+    return "".join(parts)
@@ -0,0 +1,175 @@
+"""
+Обновление расписаний в отдельном процессе по расписанию.
+
+Обход сайта и разбор HTML выполняются в отдельном процессе интерпретатора
+(без копии бота, его потоков и event loop), который записывает новый снапшот
+на диск атомарной заменой файла. Бот получает от процесса только
+контрольную сумму снапшота, открывает файл (mmap, доли миллисекунды) и
+подставляет его в кэш в потоке event loop. Хендлеры в это время не делят
+GIL с разбором страниц.
+
+Запуски попадают в окна низкой нагрузки (REFRESH_WINDOWS, местное время,
+например "02:00-05:00,14:00-15:00") со случайным сдвигом до
+REFRESH_JITTER_MINUTES, не чаще раза в REFRESH_INTERVAL_HOURS. После
+неудачи - повтор через REFRESH_RETRY_MINUTES (тоже в окне).
+"""
+
+import asyncio
+import datetime
+import logging
+import json
+import os
+import random
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WINDOWS = os.getenv("REFRESH_WINDOWS", "02:00-05:00")
+INTERVAL = datetime.timedelta(hours=float(os.getenv("REFRESH_INTERVAL_HOURS", "24")))
+JITTER = datetime.timedelta(minutes=float(os.getenv("REFRESH_JITTER_MINUTES", "30")))
+RETRY = datetime.timedelta(minutes=float(os.getenv("REFRESH_RETRY_MINUTES", "30")))
+TIMEOUT_SECONDS = float(os.getenv("REFRESH_TIMEOUT_MINUTES", "30")) * 60
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- Окна запуска ---
+
+def parse_windows(spec: str) -> list[tuple[datetime.time, datetime.time]]:
+    """'02:00-05:00,23:30-00:30' -> [(начало, конец), ...]. Окно может переходить через полночь."""
+    windows = []
+    for part in filter(None, (chunk.strip() for chunk in spec.split(","))):
+        start, _, end = part.partition("-")
+        windows.append((datetime.time.fromisoformat(start.strip()), datetime.time.fromisoformat(end.strip())))
+    return windows
+
+
+def next_run(after: datetime.datetime, windows, jitter: datetime.timedelta = JITTER, rng=random) -> datetime.datetime:
+    """Ближайший момент не раньше after внутри одного из окон, со случайным сдвигом, не выходящим за окно."""
+    if not windows:
+        return after + jitter * rng.random()
+    best = None
+    for day_offset in (-1, 0, 1, 2):
+        day = after.date() + datetime.timedelta(days=day_offset)
+        for start, end in windows:
+            window_start = datetime.datetime.combine(day, start)
+            window_end = datetime.datetime.combine(day, end)
+            if window_end <= window_start:
+                window_end += datetime.timedelta(days=1)
+            if window_end <= after:
+                continue
+            candidate = max(window_start, after)
+            if best is None or candidate < best[0]:
+                best = (candidate, window_end)
+    candidate, window_end = best
+    return candidate + min(jitter, window_end - candidate) * rng.random()
+
+
+# --- Дочерний процесс ---
+
+def refresh_in_worker(transport_type: str) -> dict:
+    """Выполняется в дочернем процессе: инкрементальное обновление и запись снапшота."""
+    if transport_type == "bus":
+        from parsers import bus_parser
+        data, path = bus_parser.getBusesParallel(refresh=True), bus_parser.BUS_SNAPSHOT
+    elif transport_type == "trolleybus":
+        from parsers import trolleybus_parser
+        data, path = trolleybus_parser.getTrolleybusesParallel(refresh=True), trolleybus_parser.TROLLEYBUS_SNAPSHOT
+    else:
+        raise ValueError(f"Unknown transport type: {transport_type}")
+    version = getattr(data, "version", None)
+    if version is None:
+        raise RuntimeError(f"Снапшот {path} не записан")
+    return {"version": version, "vehicles": len(data), "path": path}
+
+
+async def run_worker(transport_type: str, timeout: float = TIMEOUT_SECONDS) -> dict:
+    """
+    Запускает обновление отдельным процессом (python -m parsers.refresh_worker) и
+    ждёт результат, не блокируя event loop. Журнал процесса идёт в stderr бота,
+    результат - строкой JSON в stdout. При отмене или таймауте процесс завершается.
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "parsers.refresh_worker", transport_type,
+        stdout=asyncio.subprocess.PIPE, cwd=PROJECT_ROOT,
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    lines = stdout.decode("utf-8", "replace").strip().splitlines()
+    try:
+        result = json.loads(lines[-1])
+    except (IndexError, json.JSONDecodeError):
+        raise RuntimeError(f"Процесс обновления завершился с кодом {process.returncode} без результата") from None
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+
+# --- Планировщик в боте ---
+
+class RefreshScheduler:
+    """
+    targets: {transport_type: (ScheduleCache, open_snapshot)}, где open_snapshot()
+    открывает записанный процессом снапшот. on_adopted() вызывается в отдельном
+    потоке после подстановки новых данных (прогрев индексов).
+    """
+
+    def __init__(self, targets: dict, windows=None, interval: datetime.timedelta = INTERVAL,
+                 jitter: datetime.timedelta = JITTER, retry: datetime.timedelta = RETRY, on_adopted=None):
+        self.targets = targets
+        self.windows = parse_windows(WINDOWS) if windows is None else windows
+        self.interval = interval
+        self.jitter = jitter
+        self.retry = retry
+        self.on_adopted = on_adopted
+        self.next_run_at: datetime.datetime | None = None
+
+    def _first_run_after(self) -> datetime.datetime:
+        loaded = [cache.loaded_at for cache, _ in self.targets.values() if cache.loaded_at is not None]
+        return min(loaded) + self.interval if loaded else datetime.datetime.now()
+
+    async def run(self):
+        after = self._first_run_after()
+        while True:
+            self.next_run_at = next_run(max(after, datetime.datetime.now()), self.windows, self.jitter)
+            logging.info(f"Next schedule refresh at {self.next_run_at:%Y-%m-%d %H:%M}")
+            await asyncio.sleep(max(0.0, (self.next_run_at - datetime.datetime.now()).total_seconds()))
+            ok = await self.refresh_all()
+            after = datetime.datetime.now() + (self.interval if ok else self.retry)
+
+    async def refresh_all(self) -> bool:
+        ok = True
+        adopted = False
+        for transport_type, (cache, open_snapshot) in self.targets.items():
+            started = time.perf_counter()
+            try:
+                info = await run_worker(transport_type)
+                new_data = await asyncio.to_thread(open_snapshot)
+                if getattr(new_data, "version", None) != info["version"]:
+                    raise RuntimeError(f"Снапшот {info['path']} изменился после обновления")
+                cache.adopt(new_data, time.perf_counter() - started)
+                adopted = True
+            except Exception as e:
+                ok = False
+                cache.record_failure(e, time.perf_counter() - started)
+        if adopted and self.on_adopted is not None:
+            await asyncio.to_thread(self.on_adopted)
+        return ok
+
+
+if __name__ == "__main__":
+    # stdout - только для результата: прогресс и журнал парсеров уходят в stderr
+    result_stream, sys.stdout = sys.stdout, sys.stderr
+    try:
+        result = refresh_in_worker(sys.argv[1])
+    except Exception as e:
+        logging.error(f"Ошибка обновления: {e}", exc_info=True)
+        result = {"error": f"{type(e).__name__}: {e}"}
+    print(json.dumps(result), file=result_stream, flush=True)
+    sys.exit(1 if "error" in result else 0)
@@ -1,16 +1,9 @@
-from bs4 import BeautifulSoup
-import requests
 import re
-import json
 import os
 import time
-import multiprocessing
-from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict
 import logging
 import sys
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # === Настройка логгера ===
 logging.basicConfig(
@@ -20,28 +13,28 @@ logging.basicConfig(
 )
 
 from dotenv import load_dotenv
+from timetable import snapshot, stop_registry
+# bs4 и aiohttp (fetcher) импортируются только при разборе и обходе сайта:
+# запуск бота со снапшота их не загружает
+from parsers import crawl_state, html_backend
 
 load_dotenv()
 
-TROLLEYBUS_SCHEDULE = os.getenv("TROLLEYBUS_SCHEDULE_PATH")
+TROLLEYBUS_LIST_PATH = "/spravka/transport/troll/"
+TITLE_RE = re.compile("Маршрут движения троллейбуса")
+
+TROLLEYBUS_SCHEDULE = os.getenv("TROLLEYBUS_SCHEDULE_PATH") # Старый JSON, используется только для конвертации
+TROLLEYBUS_SNAPSHOT = os.getenv("TROLLEYBUS_SNAPSHOT_PATH") or snapshot.default_snapshot_path(TROLLEYBUS_SCHEDULE)
 
 def saveScheduleToFile(Trolleybuses: List[Dict]):
     try:
-        with open(TROLLEYBUS_SCHEDULE, "w", encoding="utf-8") as f:
-            json.dump(Trolleybuses, f, indent=4, ensure_ascii=False)
+        snapshot.write_snapshot(TROLLEYBUS_SNAPSHOT, Trolleybuses, snapshot.KIND_TROLLEYBUS)
         logging.info(f"Сохранено расписание ({len(Trolleybuses)} троллейбусов)")
     except Exception as e:
         logging.error(f"Ошибка при сохранении: {e}")
 
-def loadScheduleFromFile() -> List[Dict]:
-    if not os.path.exists(TROLLEYBUS_SCHEDULE):
-        return None
-    try:
-        with open(TROLLEYBUS_SCHEDULE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logging.warning(f"Ошибка загрузки файла: {e}")
-        return None
+def loadScheduleFromFile() -> snapshot.Snapshot | None:
+    return snapshot.load_or_convert(TROLLEYBUS_SNAPSHOT, TROLLEYBUS_SCHEDULE, snapshot.KIND_TROLLEYBUS)
 
 def getRoutes(trolleybus_number, table, route_name):
     try:
@@ -60,8 +53,8 @@ def getRoutes(trolleybus_number, table, route_name):
         route2 = {"trolleybus_number": trolleybus_number, "name": " - ".join(name[::-1]), "stops": []}
 
         for i, data in enumerate(zip(names, times)):
+            # Название - как на сайте: регистр и написание приводит stop_registry.normalize
             stop_name, time = list(map(lambda a: a.text, data))
-            stop_name = stop_name.title().replace("Мвд", "МВД").replace("Оао", "ОАО").replace("тэц", "ТЭЦ")
             (route1 if i <= break_index else route2)["stops"].append({"name": stop_name, "times": time.split(", ")})
         
         return [route1, route2]
@@ -69,12 +62,67 @@ def getRoutes(trolleybus_number, table, route_name):
         logging.warning(f"Ошибка в таблице маршрута {trolleybus_number}: {e}")
     return []
 
-def getSchedule(url, route_name):
+def getRoutesLxml(trolleybus_number, table, route_name):
+    """То же, что getRoutes, для таблицы lxml."""
     try:
-        response = requests.get(url, timeout=10, verify=False)
-        soup = BeautifulSoup(response.text, "html.parser")
+        name = list(map(lambda q: q.strip().title(), route_name.split("–")))
+        _ = [child for child in html_backend.children(table) if not (isinstance(child, str) and child == "\n")]
+        names = _[::2]
+        times = _[1::2]
+        break_index = 0
+        for i in range(len(names) - 1):
+            if html_backend.same_node(names[i], names[i + 1]):
+                break_index = i
+                break
+
+        route1 = {"trolleybus_number": trolleybus_number, "name": " - ".join(name), "stops": []}
+        route2 = {"trolleybus_number": trolleybus_number, "name": " - ".join(name[::-1]), "stops": []}
+
+        for i, data in enumerate(zip(names, times)):
+            stop_name, time = map(html_backend.node_text, data)
+            (route1 if i <= break_index else route2)["stops"].append({"name": stop_name, "times": time.split(", ")})
+
+        return [route1, route2]
+    except Exception as e:
+        logging.warning(f"Ошибка в таблице маршрута {trolleybus_number}: {e}")
+    return []
 
-        title = soup.find("strong", string=re.compile("Маршрут движения троллейбуса"))
+def parseScheduleLxml(html: str, route_name: str, url: str = "") -> list:
+    """То же, что parseSchedule, на lxml."""
+    try:
+        root = html_backend.document(html)
+
+        title = html_backend.find_by_string(root, "strong", TITLE_RE)
+        if title is None:
+            raise ValueError("Не найден заголовок маршрута")
+
+        trolleybus_number = html_backend.text(title).split("№")[1][:-1].strip()
+
+        def find_tables(keyword):
+            h2 = html_backend.find_by_string(root, "h2", re.compile(keyword))
+            if h2 is None:
+                return []
+            t1 = html_backend.next_sibling_tag(h2)
+            if t1 is not None:
+                return getRoutesLxml(trolleybus_number, t1, route_name)
+            return []
+
+        return [find_tables("будние дни"), find_tables("выходные дни")]
+
+    except Exception as e:
+        logging.error(f"Ошибка при разборе расписания {url}: {e}")
+        return [[], []]
+
+def parseSchedule(html: str, route_name: str, url: str = "", backend: str | None = None) -> list:
+    """Разбирает страницу расписания троллейбуса: [маршруты по будням, маршруты по выходным]."""
+    if html_backend.get_backend(backend) == "lxml":
+        return parseScheduleLxml(html, route_name, url)
+    try:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+
+        title = soup.find("strong", string=TITLE_RE)
         if not title:
             raise ValueError("Не найден заголовок маршрута")
 
@@ -92,22 +140,33 @@ def getSchedule(url, route_name):
         return [find_tables("будние дни"), find_tables("выходные дни")]
 
     except Exception as e:
-        logging.error(f"Ошибка при получении расписания с {url}: {e}")
+        logging.error(f"Ошибка при разборе расписания {url}: {e}")
         return [[], []]
 
-def process_trolleybus(trolleybus_html, base_url):
+def parseTrolleybusList(html: str) -> List[Dict]:
+    """Список троллейбусов со страницы-справочника: номер, название и ссылка на расписание."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    trolleybuses = []
+    for trolleybus_html in soup.find("table", class_="table").find_all("tr")[1:]:
+        try:
+            tds = trolleybus_html.find_all("td")
+            if len(tds) < 3:
+                continue
+            trolleybus_num, route_name, link_td = map(lambda a: a.text, tds)
+            trolleybuses.append({"number": trolleybus_num, "route_name": route_name, "url": tds[-1].a["href"]})
+        except Exception as e:
+            logging.warning(f"Ошибка обработки троллейбуса: {e}")
+    return trolleybuses
+
+def process_trolleybus(trolleybus: Dict, html: str):
+    """Выполняется в пуле процессов: получает только строки, возвращает словарь троллейбуса."""
     try:
-        tds = trolleybus_html.find_all("td")
-        if len(tds) < 3:
-            return None
-        trolleybus_num, route_name, link_td = map(lambda a: a.text, tds)
-        link = tds[-1].a["href"]
-
-        url = base_url + link
-        route_weekdays, route_weekends = getSchedule(url, route_name)
-
+        route_name = trolleybus["route_name"]
+        route_weekdays, route_weekends = parseSchedule(html, route_name, trolleybus["url"])
         return {
-            "number": trolleybus_num,
+            "number": trolleybus["number"],
             "route_name": route_name.title(),
             "route_weekdays": route_weekdays,
             "route_weekends": route_weekends
@@ -116,37 +175,40 @@ def process_trolleybus(trolleybus_html, base_url):
         logging.warning(f"Ошибка обработки троллейбуса: {e}")
         return None
 
-def getTrolleybusesParallel():
+def getTrolleybusesParallel(refresh: bool = False):
+    """
+    Расписание троллейбусов: из снапшота, а если его нет - обходом сайта.
+    refresh=True - инкрементальное обновление: заново разбираются только
+    изменившиеся страницы, остальное берётся из текущего снапшота.
+    """
     start_time = time.time()
-    if len(sys.argv) == 1:
-        trolleybuses = loadScheduleFromFile()
-    else: 
-        trolleybuses = None
-    if trolleybuses:
+    trolleybuses = loadScheduleFromFile()
+    if trolleybuses and not refresh:
         logging.info("Загружено из кэша.")
     else:
-        url = "https://mogilev.biz/spravka/transport/troll/"
-        base_url = "https://mogilev.biz"
-        response = requests.get(url, verify=False)
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        trolleybus_rows = soup.find("table", class_="table").find_all("tr")[1:]
-        total = len(trolleybus_rows)
-        
-        print("Скачиваем расписания:")
-        with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-            results = []
-            for i, result in enumerate(executor.map(process_trolleybus, trolleybus_rows, [base_url] * total)):
-                if result:
-                    results.append(result)
-                print(f"[{i+1}/{total}] ✓", end="\r", flush=True)
-
-        trolleybuses = results
-        saveScheduleToFile(trolleybuses)
+        from parsers import fetcher
+
+        state = crawl_state.CrawlState(crawl_state.state_path(TROLLEYBUS_SNAPSHOT))
+        results, changed = fetcher.run(
+            fetcher.refresh(TROLLEYBUS_LIST_PATH, parseTrolleybusList, process_trolleybus, trolleybuses, state)
+        )
+        if changed or not trolleybuses:
+            # Нормализация названий: постоянные ID остановок и единое написание для всех видов транспорта
+            with stop_registry.updating() as registry:
+                results = stop_registry.normalize(results, registry)
+            stop_registry.log_near_duplicates(registry)
+            saveScheduleToFile(results)
+            # Отдаём данные через снапшот (mmap); если запись не удалась - снапшот в памяти
+            trolleybuses = loadScheduleFromFile() or snapshot.Snapshot(
+                snapshot.build_snapshot(results, snapshot.KIND_TROLLEYBUS)
+            )
+        else:
+            logging.info("Расписание не изменилось.")
 
     elapsed = time.time() - start_time
     logging.info(f"Обработка завершена за {elapsed:.2f} сек.")
-    return {trolleybus["number"]: trolleybus for trolleybus in trolleybuses}
+    return trolleybuses
 
 if __name__ == "__main__":
-    getTrolleybusesParallel()
\ No newline at end of file
+    # Любой аргумент командной строки - обновить с сайта
+    getTrolleybusesParallel(refresh=len(sys.argv) > 1)
\ No newline at end of file
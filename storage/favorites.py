@@ -0,0 +1,268 @@
+# --- START OF FILE favorites.py ---
+
+"""
+Хранилища избранного.
+
+Данные пользователя имеют вид {"buses": {key: value}, "trolleys": {key: value}},
+где key - "НОМЕР_МАРШРУТ_ОСТАНОВКА", а value - {"number", "route", "stop"}.
+
+JsonFavoritesStore - прежний формат (весь файл читается и переписывается).
+SqliteFavoritesStore - SQLite в режиме WAL: чтение по индексу пользователя
+и запись одной строки на изменение.
+"""
+
+import abc
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+SECTIONS = ("buses", "trolleys")
+
+
+def empty_favorites() -> dict:
+    return {section: {} for section in SECTIONS}
+
+
+class FavoritesStore(abc.ABC):
+    """Интерфейс хранилища избранного."""
+
+    @abc.abstractmethod
+    def get(self, user_id: int) -> dict:
+        """Всё избранное пользователя (всегда содержит обе секции)."""
+
+    def contains(self, user_id: int, section: str, key: str) -> bool:
+        return key in self.get(user_id).get(section, {})
+
+    @abc.abstractmethod
+    def put(self, user_id: int, section: str, key: str, value: dict):
+        """Добавляет или обновляет одну запись."""
+
+    @abc.abstractmethod
+    def delete(self, user_id: int, section: str, key: str) -> bool:
+        """Удаляет одну запись. Возвращает False, если её не было."""
+
+    @abc.abstractmethod
+    def replace(self, user_id: int, favs: dict):
+        """Полностью заменяет избранное пользователя."""
+
+    def replace_many(self, users: dict[int, dict]):
+        """Заменяет избранное нескольких пользователей за одну запись."""
+        for user_id, favs in users.items():
+            self.replace(user_id, favs)
+
+    @abc.abstractmethod
+    def load_users(self) -> dict[int, dict]:
+        """Избранное всех пользователей: {user_id: favs}."""
+
+    def close(self):
+        pass
+
+
+class JsonFavoritesStore(FavoritesStore):
+    """Старый формат: один JSON-файл на всех пользователей."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load_all(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logging.error(f"Error loading favorites file: {e}")
+            return {}
+
+    def write_all(self, all_data: dict):
+        """Атомарная запись: временный файл + os.replace."""
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(all_data, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            logging.error(f"Error writing favorites file: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, user_id: int) -> dict:
+        favs = empty_favorites()
+        favs.update(self.load_all().get(str(user_id), {}))
+        return favs
+
+    def put(self, user_id: int, section: str, key: str, value: dict):
+        with self._lock:
+            all_data = self.load_all()
+            favs = all_data.setdefault(str(user_id), empty_favorites())
+            favs.setdefault(section, {})[key] = value
+            self.write_all(all_data)
+
+    def delete(self, user_id: int, section: str, key: str) -> bool:
+        with self._lock:
+            all_data = self.load_all()
+            section_data = all_data.get(str(user_id), {}).get(section, {})
+            if key not in section_data:
+                return False
+            del section_data[key]
+            self.write_all(all_data)
+            return True
+
+    def replace(self, user_id: int, favs: dict):
+        self.replace_many({user_id: favs})
+
+    def replace_many(self, users: dict[int, dict]):
+        with self._lock:
+            all_data = self.load_all()
+            for user_id, favs in users.items():
+                all_data[str(user_id)] = favs
+            self.write_all(all_data)
+
+    def load_users(self) -> dict[int, dict]:
+        users = {}
+        for user_id, data in self.load_all().items():
+            favs = empty_favorites()
+            favs.update(data)
+            users[int(user_id)] = favs
+        return users
+
+
+class SqliteFavoritesStore(FavoritesStore):
+    """SQLite (WAL): одна строка на запись избранного, первичный ключ (user_id, section, fav_key)."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS favorites (
+            user_id INTEGER NOT NULL,
+            section TEXT NOT NULL,
+            fav_key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (user_id, section, fav_key)
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Соединение используется и из потока фоновой записи, доступ защищён блокировкой
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute(self.SCHEMA)
+
+    def get(self, user_id: int) -> dict:
+        favs = empty_favorites()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT section, fav_key, value FROM favorites WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        for section, key, value in rows:
+            favs.setdefault(section, {})[key] = json.loads(value)
+        return favs
+
+    def contains(self, user_id: int, section: str, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM favorites WHERE user_id = ? AND section = ? AND fav_key = ?", (user_id, section, key)
+            ).fetchone()
+        return row is not None
+
+    def put(self, user_id: int, section: str, key: str, value: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO favorites (user_id, section, fav_key, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, section, fav_key) DO UPDATE SET value = excluded.value",
+                (user_id, section, key, json.dumps(value, ensure_ascii=False))
+            )
+
+    def delete(self, user_id: int, section: str, key: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM favorites WHERE user_id = ? AND section = ? AND fav_key = ?", (user_id, section, key)
+            )
+        return cursor.rowcount > 0
+
+    def replace(self, user_id: int, favs: dict):
+        self.replace_many({user_id: favs})
+
+    def replace_many(self, users: dict[int, dict]):
+        """Одна транзакция на всю пачку пользователей."""
+        rows = [
+            (user_id, section, key, json.dumps(value, ensure_ascii=False))
+            for user_id, favs in users.items()
+            for section, items in favs.items() for key, value in items.items()
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM favorites WHERE user_id = ?", [(user_id,) for user_id in users])
+                self._conn.executemany(
+                    "INSERT INTO favorites (user_id, section, fav_key, value) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load_users(self) -> dict[int, dict]:
+        users = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, section, fav_key, value FROM favorites").fetchall()
+        for user_id, section, key, value in rows:
+            users.setdefault(user_id, empty_favorites()).setdefault(section, {})[key] = json.loads(value)
+        return users
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_to_sqlite(json_path: str, db_path: str) -> int:
+    """Переносит избранное из JSON-файла в SQLite. Возвращает число перенесённых записей."""
+    source = JsonFavoritesStore(json_path)
+    target = SqliteFavoritesStore(db_path)
+    users = source.load_users()
+    try:
+        target.replace_many(users)
+        migrated = sum(len(items) for favs in users.values() for items in favs.values())
+    finally:
+        target.close()
+    return migrated
+
+
+def create_store(backend: str, json_path: str, db_path: str) -> FavoritesStore:
+    """
+    Создаёт хранилище по имени бэкенда ("sqlite" или "json").
+    При первом запуске SQLite-хранилища переносит в него существующий JSON-файл.
+    """
+    if backend == "json":
+        return JsonFavoritesStore(json_path)
+    if backend != "sqlite":
+        raise ValueError(f"Unknown favorites backend: {backend}")
+    if not os.path.exists(db_path) and json_path and os.path.exists(json_path):
+        # Переносим во временную базу, чтобы прерванный перенос не оставил полупустой файл
+        tmp_path = f"{db_path}.migrating"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        migrated = migrate_json_to_sqlite(json_path, tmp_path)
+        os.replace(tmp_path, db_path)
+        logging.info(f"Favorites migrated from {json_path} to {db_path}: {migrated} entries")
+    return SqliteFavoritesStore(db_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    arg_parser = argparse.ArgumentParser(description="Перенос избранного из JSON в SQLite")
+    arg_parser.add_argument("json_path")
+    arg_parser.add_argument("db_path")
+    args = arg_parser.parse_args()
+    logging.info(f"Перенесено записей: {migrate_json_to_sqlite(args.json_path, args.db_path)}")
+
+# --- END OF FILE favorites.py ---
@@ -0,0 +1,159 @@
+# --- START OF FILE favorites_cache.py ---
+
+"""
+Кэш избранного в памяти с отложенной записью.
+
+Чтение и изменение идут только в память, а изменённые пользователи помечаются
+"грязными". Единственная фоновая задача ждёт короткую паузу, чтобы собрать
+всплеск изменений, и записывает их одной операцией бэкенда в отдельном потоке
+(для JSON - одна атомарная перезапись файла, для SQLite - одна транзакция).
+"""
+
+import asyncio
+import atexit
+import logging
+import threading
+
+from storage.favorites import FavoritesStore, empty_favorites
+
+FLUSH_DELAY_SECONDS = 0.5
+
+
+def _copy(favs: dict) -> dict:
+    return {section: dict(items) for section, items in favs.items()}
+
+
+class CachedFavoritesStore(FavoritesStore):
+    """Обёртка над хранилищем: всё избранное в памяти, запись в фоне."""
+
+    def __init__(self, backend: FavoritesStore, flush_delay: float = FLUSH_DELAY_SECONDS):
+        self.backend = backend
+        self.flush_delay = flush_delay
+        self.flushes = 0
+        self.flushed_users = 0
+        self._users: dict[int, dict] = {}
+        self._loaded = False
+        self._dirty: set[int] = set()
+        self._lock = threading.Lock()       # защищает _users/_dirty от потока записи
+        self._flush_lock = threading.Lock()  # одна запись в бэкенд за раз
+        self._wakeup: asyncio.Event | None = None
+        self._writer: asyncio.Task | None = None
+        self._closing = False
+        atexit.register(self.flush)
+
+    # --- Загрузка ---
+
+    def preload(self):
+        """Загружает избранное всех пользователей (блокирующая операция, вызывать вне event loop)."""
+        users = self.backend.load_users()
+        with self._lock:
+            for user_id, favs in users.items():
+                self._users.setdefault(user_id, favs)
+            self._loaded = True
+        logging.info(f"Favorites cache loaded: {len(users)} users")
+
+    def _user(self, user_id: int) -> dict:
+        favs = self._users.get(user_id)
+        if favs is None:
+            # Без предзагрузки читаем пользователя из бэкенда один раз
+            favs = empty_favorites() if self._loaded else self.backend.get(user_id)
+            self._users[user_id] = favs
+        return favs
+
+    # --- Интерфейс FavoritesStore ---
+
+    def get(self, user_id: int) -> dict:
+        with self._lock:
+            return _copy(self._user(user_id))
+
+    def contains(self, user_id: int, section: str, key: str) -> bool:
+        with self._lock:
+            return key in self._user(user_id).get(section, {})
+
+    def put(self, user_id: int, section: str, key: str, value: dict):
+        with self._lock:
+            self._user(user_id).setdefault(section, {})[key] = value
+            self._dirty.add(user_id)
+        self._schedule_flush()
+
+    def delete(self, user_id: int, section: str, key: str) -> bool:
+        with self._lock:
+            items = self._user(user_id).get(section, {})
+            if key not in items:
+                return False
+            del items[key]
+            self._dirty.add(user_id)
+        self._schedule_flush()
+        return True
+
+    def replace(self, user_id: int, favs: dict):
+        with self._lock:
+            self._users[user_id] = _copy(favs)
+            self._dirty.add(user_id)
+        self._schedule_flush()
+
+    def load_users(self) -> dict[int, dict]:
+        with self._lock:
+            return {user_id: _copy(favs) for user_id, favs in self._users.items()}
+
+    # --- Запись ---
+
+    @property
+    def pending(self) -> int:
+        """Сколько пользователей ждут записи."""
+        return len(self._dirty)
+
+    def flush(self):
+        """Синхронно записывает все изменения в бэкенд."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                batch = {user_id: _copy(self._users[user_id]) for user_id in self._dirty}
+                self._dirty.clear()
+            try:
+                self.backend.replace_many(batch)
+                self.flushes += 1
+                self.flushed_users += len(batch)
+            except Exception as e:
+                logging.error(f"Error flushing favorites ({len(batch)} users): {e}", exc_info=True)
+                with self._lock:
+                    # Вернём пользователей в очередь, если их не изменили заново
+                    self._dirty.update(batch)
+
+    def _schedule_flush(self):
+        if self._wakeup is not None and not self._closing:
+            self._wakeup.set()
+        else:
+            # Фоновый писатель не запущен (скрипты, тесты) - пишем сразу
+            self.flush()
+
+    async def start(self):
+        """Запускает фоновую задачу записи в текущем event loop."""
+        if self._writer is None:
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._writer_loop(), name="favorites-writer")
+
+    async def _writer_loop(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            # Ждём немного, чтобы собрать всплеск изменений в одну запись
+            await asyncio.sleep(self.flush_delay)
+            self._wakeup.clear()
+            await asyncio.to_thread(self.flush)
+
+    async def close(self):
+        """Останавливает писатель и дописывает всё, что осталось."""
+        self._closing = True
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+            self._wakeup = None
+        await asyncio.to_thread(self.flush)
+        self.backend.close()
+
+# --- END OF FILE favorites_cache.py ---
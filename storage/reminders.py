@@ -0,0 +1,170 @@
+# --- START OF FILE reminders.py ---
+
+"""
+Хранилище напоминаний об отправлении (планировщик - delivery/reminders.py).
+
+SQLite в режиме WAL, как избранное: одна строка на напоминание, индексы по
+пользователю (список /reminders) и по времени срабатывания. fire_at - Unix-время
+ближайшего срабатывания; у ежедневного напоминания оно переписывается при
+каждом срабатывании, разовое после срабатывания удаляется.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import NamedTuple
+
+
+class Reminder(NamedTuple):
+    id: int                 # 0 - ещё не сохранено
+    user_id: int
+    chat_id: int
+    transport_type: str
+    number: str
+    route_idx: int
+    stop_ref: str
+    day_type: str           # расписание, к которому относится рейс
+    departure: int          # минута суток обслуживания (см. snapshot.service_minute)
+    lead: int               # за сколько минут до рейса напомнить
+    daily: bool             # каждый день с типом day_type; иначе - один раз
+    fire_at: float          # ближайшее срабатывание, Unix-время
+    label: str              # "🚌 №12, ост. Центр" - для списка и текста напоминания
+
+
+_COLUMNS = ", ".join(Reminder._fields)
+
+
+def _row(row) -> Reminder:
+    values = list(row)
+    values[10] = bool(values[10])
+    return Reminder(*values)
+
+
+class SqliteReminderStore:
+    """SQLite (WAL): одна строка на напоминание; повторная подписка на тот же рейс заменяет прежнюю."""
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            transport_type TEXT NOT NULL,
+            number TEXT NOT NULL,
+            route_idx INTEGER NOT NULL,
+            stop_ref TEXT NOT NULL,
+            day_type TEXT NOT NULL,
+            departure INTEGER NOT NULL,
+            lead INTEGER NOT NULL,
+            daily INTEGER NOT NULL,
+            fire_at REAL NOT NULL,
+            label TEXT NOT NULL,
+            UNIQUE (user_id, transport_type, number, route_idx, stop_ref, day_type, departure, daily)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS reminders_fire_at ON reminders (fire_at)",
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Соединение используется из потоков asyncio.to_thread, доступ защищён блокировкой
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    def add(self, reminder: Reminder) -> Reminder:
+        """
+        Сохраняет напоминание и возвращает его с присвоенным id. Прежняя подписка
+        на тот же рейс удаляется, новая получает новый id (больше всех прежних) -
+        так её увидит планировщик другого процесса (load_pending(after_id)).
+        """
+        values = reminder[1:]
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT OR REPLACE INTO reminders ({_COLUMNS}) VALUES (NULL{', ?' * len(values)})", values
+            )
+        return reminder._replace(id=cursor.lastrowid)
+
+    def get(self, reminder_id: int) -> Reminder | None:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM reminders WHERE id = ?", (reminder_id,)).fetchone()
+        return _row(row) if row else None
+
+    def for_user(self, user_id: int) -> list[Reminder]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM reminders WHERE user_id = ? ORDER BY departure, id", (user_id,)
+            ).fetchall()
+        return [_row(row) for row in rows]
+
+    def delete(self, user_id: int, reminder_id: int) -> bool:
+        """Удаляет напоминание пользователя. False, если его нет (или оно чужое)."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM reminders WHERE id = ? AND user_id = ?", (reminder_id, user_id))
+        return cursor.rowcount > 0
+
+    def delete_user(self, user_id: int) -> list[int]:
+        """Удаляет все напоминания пользователя, возвращает их id."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                ids = [row[0] for row in self._conn.execute("SELECT id FROM reminders WHERE user_id = ?", (user_id,))]
+                self._conn.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def load_pending(self, after_id: int = 0) -> list[Reminder]:
+        """Все напоминания с id больше after_id (0 - все) в порядке id."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM reminders WHERE id > ? ORDER BY id", (after_id,)
+            ).fetchall()
+        return [_row(row) for row in rows]
+
+    def claim(self, claims: list[tuple[int, float, float | None]]) -> set[int]:
+        """
+        Забирает сработавшие напоминания одной транзакцией: claims - (id, fire_at,
+        следующее fire_at или None). Запись с тем же fire_at переносится на
+        следующее время или удаляется; возвращаются id забранных. Удалённые или
+        заменённые с тех пор (другим процессом) не забираются - их не отправляют.
+        """
+        claimed = set()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for reminder_id, fire_at, next_fire_at in claims:
+                    if next_fire_at is None:
+                        cursor = self._conn.execute(
+                            "DELETE FROM reminders WHERE id = ? AND fire_at = ?", (reminder_id, fire_at)
+                        )
+                    else:
+                        cursor = self._conn.execute(
+                            "UPDATE reminders SET fire_at = ? WHERE id = ? AND fire_at = ?",
+                            (next_fire_at, reminder_id, fire_at)
+                        )
+                    if cursor.rowcount:
+                        claimed.add(reminder_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# --- END OF FILE reminders.py ---
@@ -0,0 +1,379 @@
+# --- START OF FILE supervisor.py ---
+
+"""
+Несколько рабочих процессов в режиме вебхука (BOT_MODE=webhook, WEBHOOK_WORKERS > 1).
+
+Супервизор один раз загружает снапшоты расписаний и строит индексы, открывает
+слушающий сокет и регистрирует вебхук, после чего порождает (fork)
+WEBHOOK_WORKERS рабочих процессов. Каждый принимает соединения на общем
+сокете - ядро распределяет их между процессами - и обрабатывает апдейты своим
+диспетчером (webhook.py). Расписания не копируются: снапшот - mmap одного файла
+только для чтения, его страницы общие для всех процессов, а индексы, построенные
+до fork, остаются общими copy-on-write (gc.freeze не даёт сборщику мусора их
+переписывать). Избранное - в общей SQLite (WAL), без кэша в памяти процесса:
+каждое чтение видит записи всех процессов (строгая согласованность вместо кэша,
+который у каждого процесса разошёлся бы с остальными). Цена - запрос к базе на
+каждое обращение; он выполняется в потоке (utils._favorites_call), так что
+ожидание чужой записи (busy_timeout до 5 с) задерживает только этот апдейт, а не
+event loop процесса.
+Напоминания об отправлении отправляет только процесс 0, добавленные другими
+процессами он дочитывает из общей базы (delivery/reminders.py).
+
+Расписания обновляет только супервизор (планировщик parsers/refresh_worker.py)
+и переключает процессы вместе, в две фазы: все открывают новый снапшот и
+сверяют контрольную сумму ("prepare"), и только когда готовы все - подставляют
+его ("commit"); иначе все остаются на старой версии. SIGHUP супервизору делает
+то же для снапшотов, уже лежащих на диске. Упавший процесс перезапускается;
+SIGTERM/SIGINT передаётся процессам, и они дорабатывают начатые апдейты.
+"""
+
+import asyncio
+import gc
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import parsers.refresh_worker
+import utils
+import webhook
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+RELOAD_TIMEOUT = 30.0   # ожидание ответа процесса на prepare/commit, с
+RESTART_DELAY = 1.0     # пауза перед перезапуском упавшего процесса, с
+STOP_TIMEOUT = webhook.WEBHOOK_DRAIN_TIMEOUT + 10
+
+
+# --- Рабочий процесс ---
+
+class _Control:
+    """
+    Команды супервизора в рабочем процессе: (операция, id, тип транспорта, версия).
+    Ответ - (id, ошибка или None, время выполнения по time.time()).
+    """
+
+    def __init__(self, conn, stop: asyncio.Event):
+        self.conn = conn
+        self.stop = stop
+        self._prepared = {}
+        self._tasks = set()
+
+    def start(self):
+        asyncio.get_running_loop().add_reader(self.conn.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        try:
+            message = self.conn.recv()
+        except (EOFError, OSError):
+            # Супервизора больше нет - останавливаемся, как по SIGTERM
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            logging.warning("Supervisor connection lost, stopping worker")
+            self.stop.set()
+            return
+        task = asyncio.create_task(self._handle(*message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, operation: str, request_id: int, transport_type: str, version: int):
+        error = None
+        try:
+            cache, open_snapshot = utils.refresh_targets()[transport_type]
+            if operation == "prepare":
+                started = time.perf_counter()
+                data = await asyncio.to_thread(open_snapshot)
+                if getattr(data, "version", None) != version:
+                    raise RuntimeError(f"на диске другой снапшот {transport_type}: {getattr(data, 'version', None)}")
+                self._prepared[transport_type] = (data, time.perf_counter() - started)
+            elif operation == "commit":
+                data, duration = self._prepared.pop(transport_type)
+                cache.adopt(data, duration)
+                self._warmup()
+            elif operation == "abort":
+                self._prepared.pop(transport_type, None)
+            else:
+                raise ValueError(f"Unknown operation {operation}")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.conn.send((request_id, error, time.time()))
+
+    def _warmup(self):
+        task = asyncio.create_task(asyncio.to_thread(utils.run_warmups))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+async def _serve_worker(index: int, sock: socket.socket, conn, dispatcher, bot, shutdown):
+    # Данные загружены супервизором до fork; здесь кэши только привязываются к event loop процесса
+    await utils.load_schedules()
+    await utils.start_favorites()
+    # Напоминания отправляет один процесс; остальные только пишут их в базу
+    utils.REMINDERS_SCHEDULER = index == 0
+    stop = webhook.stop_on_signals()
+    control = _Control(conn, stop)
+    control.start()
+    runner, handler, _ = await webhook.start(dispatcher, bot, sock=sock)
+    logging.info(f"Worker {index} (pid {os.getpid()}) serving, schedules {utils.schedule_versions()}")
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await shutdown()
+
+
+def _worker_main(index: int, sock: socket.socket, conn, dispatcher, bot, shutdown):
+    """Тело процесса после fork. Не возвращается."""
+    # Сигналы унаследованы от event loop супервизора (его self-pipe) - сбрасываем
+    signal.set_wakeup_fd(-1)
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    code = 0
+    try:
+        asyncio.run(_serve_worker(index, sock, conn, dispatcher, bot, shutdown))
+    except BaseException as e:
+        logging.critical(f"Worker {index} failed: {e}", exc_info=True)
+        code = 1
+    finally:
+        logging.shutdown()
+        os._exit(code)
+
+
+# --- Супервизор ---
+
+class _WorkerHandle:
+    __slots__ = ("index", "pid", "conn")
+
+    def __init__(self, index: int, pid: int, conn):
+        self.index = index
+        self.pid = pid
+        self.conn = conn
+
+
+class CoordinatedRefresh(parsers.refresh_worker.RefreshScheduler):
+    """Плановое обновление: процесс обновления пишет снапшот, супервизор переключает на него все процессы."""
+
+    def __init__(self, supervisor: "Supervisor", **kwargs):
+        super().__init__(utils.refresh_targets(), **kwargs)
+        self.supervisor = supervisor
+
+    async def refresh_all(self) -> bool:
+        ok = True
+        for transport_type, (cache, _) in self.targets.items():
+            started = time.perf_counter()
+            try:
+                info = await parsers.refresh_worker.run_worker(transport_type)
+                if not await self.supervisor.reload(transport_type, info["version"]):
+                    raise RuntimeError(f"Рабочие процессы не переключились на снапшот {info['version']:08x}")
+            except Exception as e:
+                ok = False
+                cache.record_failure(e, time.perf_counter() - started)
+        return ok
+
+
+class Supervisor:
+    def __init__(self, dispatcher, bot, shutdown, sock: socket.socket, workers: int = WEBHOOK_WORKERS):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.shutdown = shutdown
+        self.sock = sock
+        self.size = workers
+        self.workers: dict[int, _WorkerHandle] = {}
+        self.restarts = 0
+        self._replies: dict[tuple[int, int], asyncio.Future] = {}
+        self._request_ids = itertools.count(1)
+        self._reload_lock = asyncio.Lock()  # перезагрузка и перезапуск процессов не пересекаются
+        self._stop = asyncio.Event()
+        self._stopping = False
+        self._tasks = set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        # Кэши - к этому event loop (первый asyncio.run загрузки уже завершён)
+        await utils.load_schedules()
+        loop.add_signal_handler(signal.SIGTERM, self._stop.set)
+        loop.add_signal_handler(signal.SIGINT, self._stop.set)
+        loop.add_signal_handler(signal.SIGHUP, lambda: self._background(self.reload_all()))
+        loop.add_signal_handler(signal.SIGCHLD, self._reap)
+        for index in range(self.size):
+            self._spawn(index)
+        refresh_task = None
+        if utils.REFRESH_WORKER:
+            refresh_task = asyncio.create_task(CoordinatedRefresh(self).run(), name="schedule-refresh")
+        logging.info(f"Supervisor (pid {os.getpid()}) started {self.size} workers on "
+                     f"{webhook.WEBHOOK_HOST}:{webhook.WEBHOOK_PORT}{webhook.WEBHOOK_PATH}")
+        try:
+            await self._stop.wait()
+        finally:
+            if refresh_task is not None:
+                refresh_task.cancel()
+            await self._stop_workers()
+
+    def _background(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # --- Процессы ---
+
+    def _spawn(self, index: int):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        pid = os.fork()
+        if pid == 0:
+            parent_conn.close()
+            for handle in self.workers.values():
+                handle.conn.close()
+            _worker_main(index, self.sock, child_conn, self.dispatcher, self.bot, self.shutdown)
+        child_conn.close()
+        handle = _WorkerHandle(index, pid, parent_conn)
+        self.workers[pid] = handle
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), self._on_reply, handle)
+        logging.info(f"Worker {index} started (pid {pid})")
+
+    def _on_reply(self, handle: _WorkerHandle):
+        try:
+            request_id, error, at = handle.conn.recv()
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(handle.conn.fileno())
+            return  # процесс завершился - разберётся _reap
+        future = self._replies.pop((handle.pid, request_id), None)
+        if future is not None and not future.done():
+            future.set_result((error, at))
+
+    def _reap(self):
+        for pid, handle in list(self.workers.items()):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if not done:
+                continue
+            del self.workers[pid]
+            asyncio.get_running_loop().remove_reader(handle.conn.fileno())
+            handle.conn.close()
+            for (reply_pid, request_id), future in list(self._replies.items()):
+                if reply_pid == pid:
+                    del self._replies[reply_pid, request_id]
+                    if not future.done():
+                        future.set_result((f"процесс {pid} завершился", None))
+            if self._stopping:
+                continue
+            logging.warning(f"Worker {handle.index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            self._background(self._restart(handle.index))
+
+    async def _restart(self, index: int):
+        await asyncio.sleep(RESTART_DELAY)
+        async with self._reload_lock:
+            if not self._stopping:
+                self.restarts += 1
+                self._spawn(index)
+
+    async def _stop_workers(self):
+        self._stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while self.workers and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            self._reap()
+        for pid in list(self.workers):
+            logging.warning(f"Worker pid {pid} did not stop in {STOP_TIMEOUT}s, killing")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self.workers[pid]
+        logging.info(f"Supervisor stopped (restarts: {self.restarts})")
+
+    # --- Согласованная перезагрузка расписаний ---
+
+    async def _request(self, handle: _WorkerHandle, operation: str, transport_type: str, version: int):
+        """Команда процессу; результат - (ошибка или None, когда выполнена)."""
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._replies[handle.pid, request_id] = future
+        try:
+            handle.conn.send((operation, request_id, transport_type, version))
+            return await asyncio.wait_for(future, RELOAD_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            self._replies.pop((handle.pid, request_id), None)
+            return f"{type(e).__name__}: {e}", None
+
+    async def _broadcast(self, handles: list, operation: str, transport_type: str, version: int) -> list:
+        return await asyncio.gather(*(self._request(handle, operation, transport_type, version) for handle in handles))
+
+    async def reload(self, transport_type: str, version: int | None = None) -> bool:
+        """
+        Переключает все процессы на снапшот transport_type, лежащий на диске
+        (version - ожидаемая контрольная сумма). True - переключены все или
+        версия уже текущая; False - не переключён никто.
+        """
+        async with self._reload_lock:
+            cache, open_snapshot = utils.refresh_targets()[transport_type]
+            started = time.perf_counter()
+            data = await asyncio.to_thread(open_snapshot)
+            new_version = getattr(data, "version", None)
+            if new_version is None or (version is not None and new_version != version):
+                logging.error(f"Reload {transport_type}: snapshot on disk is {new_version}, expected {version}")
+                return False
+            if new_version == getattr(cache.data, "version", None):
+                logging.info(f"Reload {transport_type}: snapshot {new_version:08x} is already current")
+                return True
+            handles = list(self.workers.values())
+            prepared = await self._broadcast(handles, "prepare", transport_type, new_version)
+            errors = [(handle.pid, error) for handle, (error, _) in zip(handles, prepared) if error]
+            if errors:
+                await self._broadcast(handles, "abort", transport_type, new_version)
+                logging.error(f"Reload {transport_type} aborted, all workers keep the old snapshot: {errors}")
+                return False
+            prepare_ms = (time.perf_counter() - started) * 1000
+            # Супервизор переключается первым: процессы, перезапущенные позже, получат новую версию
+            cache.adopt(data, time.perf_counter() - started)
+            committed = await self._broadcast(handles, "commit", transport_type, new_version)
+            for handle, (error, _) in zip(handles, committed):
+                if error:
+                    # Не смог подставить уже открытый снапшот - перезапуск поднимет процесс на новой версии
+                    logging.error(f"Worker pid {handle.pid} failed to commit {transport_type}: {error}, restarting it")
+                    os.kill(handle.pid, signal.SIGTERM)
+            times = [at for error, at in committed if not error]
+            spread_ms = (max(times) - min(times)) * 1000 if times else 0.0
+            logging.info(f"Reloaded {transport_type} snapshot {new_version:08x} in {len(times)}/{len(handles)} workers: "
+                         f"prepare {prepare_ms:.0f} ms, commit spread {spread_ms:.1f} ms")
+            await asyncio.to_thread(utils.run_warmups)
+            return True
+
+    async def reload_all(self):
+        for transport_type in utils.refresh_targets():
+            try:
+                await self.reload(transport_type)
+            except Exception as e:
+                logging.error(f"Reload {transport_type} failed: {e}", exc_info=True)
+
+
+async def _prepare(dispatcher, bot):
+    """До fork: снапшоты, индексы, перенос избранного в SQLite и регистрация вебхука."""
+    warmup_task = await utils.startup()
+    await warmup_task
+    await webhook.set_webhook(bot, dispatcher)
+    await utils.close_favorites()
+    # Сессия откроется заново в каждом процессе - соединения не делятся между ними
+    await bot.session.close()
+
+
+def run(dispatcher, bot, shutdown, workers: int = WEBHOOK_WORKERS):
+    """Точка входа из main.py: подготовка, fork рабочих процессов и надзор до SIGTERM/SIGINT."""
+    webhook.check_config()
+    utils.use_shared_storage()
+    sock = socket.create_server((webhook.WEBHOOK_HOST, webhook.WEBHOOK_PORT), backlog=1024)
+    asyncio.run(_prepare(dispatcher, bot))
+    # Всё загруженное - в постоянное поколение: сборщик мусора не будет трогать эти объекты
+    # в рабочих процессах, и их страницы останутся общими
+    gc.freeze()
+    try:
+        asyncio.run(Supervisor(dispatcher, bot, shutdown, sock, workers).run())
+    finally:
+        sock.close()
+
+# --- END OF FILE supervisor.py ---
@@ -0,0 +1,103 @@
+# --- START OF FILE test_board.py ---
+
+"""Табло отправлений (DepartureBoard.upcoming, timetable/board.py)."""
+
+import random
+
+import pytest
+
+from timetable.board import DepartureBoard
+from timetable.stop_index import StopIndex
+
+
+def _route(name: str, stops: dict[str, list[str]]) -> dict:
+    return {"name": name, "stops": [{"name": stop, "times": times} for stop, times in stops.items()]}
+
+
+SOURCES = {
+    "bus": {
+        "1": {
+            "route_weekdays": [
+                _route("Вокзал - Центр", {"Вокзал": ["06:00", "07:00", "23:50", "00:20"], "Центр": ["06:10", "07:10"]}),
+                _route("Центр - Вокзал", {"Центр": ["06:30", "07:30"], "Вокзал": ["06:40", "07:40"]}),
+            ],
+            "route_weekends": [_route("Вокзал - Центр", {"Вокзал": ["09:00"], "Центр": ["09:10"]})],
+        },
+        "2": {
+            "route_weekdays": [_route("Вокзал - Рынок", {"вокзал.": ["06:40", "06:50"], "Рынок": ["07:00", "07:10"]})],
+            "route_weekends": [],
+        },
+    },
+    "trolleybus": {
+        "3": {
+            "route_weekdays": [_route("Вокзал - Завод", {"Вокзал": ["05:55", "06:40"], "Завод": ["06:15", "07:00"]})],
+            "route_weekends": [],
+        },
+    },
+}
+
+
+@pytest.fixture(scope="module")
+def board():
+    return DepartureBoard(StopIndex(SOURCES), SOURCES)
+
+
+def _upcoming(board, stop: str, day_type: str, now_minute: int, limit: int = 10) -> list[tuple[int, str, str]]:
+    key_id = board.index.lookup(stop)
+    return [(departure.minute, departure.line.occurrence.transport_type, departure.line.occurrence.number)
+            for departure in board.upcoming(key_id, day_type, now_minute, limit)]
+
+
+def test_merges_all_routes_in_time_order(board):
+    # "Вокзал" и "вокзал." - одна остановка; 00:20 - после 23:50 (сутки обслуживания)
+    assert _upcoming(board, "Вокзал", "wd", 6 * 60) == [
+        (360, "bus", "1"), (400, "bus", "1"), (400, "bus", "2"), (400, "trolleybus", "3"),
+        (410, "bus", "2"), (420, "bus", "1"), (460, "bus", "1"), (1430, "bus", "1"), (1460, "bus", "1"),
+    ]
+
+
+def test_now_minute_is_inclusive_and_limit(board):
+    assert _upcoming(board, "Вокзал", "wd", 400, limit=2) == [(400, "bus", "1"), (400, "bus", "2")]
+    assert _upcoming(board, "Вокзал", "wd", 401, limit=1) == [(410, "bus", "2")]
+    assert _upcoming(board, "Вокзал", "wd", 0, limit=0) == []
+
+
+def test_after_last_departure_and_unknown(board):
+    assert _upcoming(board, "Вокзал", "wd", 1461) == []
+    assert _upcoming(board, "Рынок", "we", 0) == []
+    assert board.upcoming(len(board.index) + 5, "wd", 0) == []
+
+
+def test_day_type(board):
+    assert _upcoming(board, "Вокзал", "we", 0) == [(540, "bus", "1")]
+
+
+def test_lines_keep_route_names(board):
+    departure = board.upcoming(board.index.lookup("Центр"), "wd", 6 * 60 + 15, 1)[0]
+    assert departure.minute == 390
+    assert departure.line.route_name == "Центр - Вокзал"
+    assert departure.line.occurrence.stop_idx == 0
+
+
+def test_matches_full_sort():
+    rng = random.Random(5)
+    stops = [f"Остановка {i}" for i in range(6)]
+    sources = {"bus": {}}
+    for number in range(1, 15):
+        routes = []
+        for _ in range(2):
+            chosen = rng.sample(stops, 3)
+            routes.append(_route(f"r{number}", {
+                stop: [f"{rng.randrange(24):02d}:{rng.randrange(60):02d}" for _ in range(rng.randrange(0, 12))]
+                for stop in chosen
+            }))
+        sources["bus"][str(number)] = {"route_weekdays": routes, "route_weekends": []}
+    board = DepartureBoard(StopIndex(sources), sources)
+    for key_id in range(len(board.index)):
+        everything = sorted(minute for line in board.lines(key_id, "wd") for minute in line.minutes)
+        for now_minute in range(0, 28 * 60, 37):
+            for limit in (1, 5, 40):
+                upcoming = [departure.minute for departure in board.upcoming(key_id, "wd", now_minute, limit)]
+                assert upcoming == [minute for minute in everything if minute >= now_minute][:limit]
+
+# --- END OF FILE test_board.py ---
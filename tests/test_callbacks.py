@@ -0,0 +1,142 @@
+# --- START OF FILE test_callbacks.py ---
+
+"""Формат callback data (handlers/callbacks.py): обратимость, длина, кнопки старых сообщений."""
+
+import base64
+import itertools
+
+import pytest
+
+from handlers import callbacks
+
+# Значения полей по имени: обычные варианты
+SAMPLES = {
+    "transport_type": ("bus", "trolleybus"),
+    "number": ("1", "46", "11к", "16 Д"),
+    "page": (0, 3),
+    "route_idx": (0, 1),
+    "stop_ref": ("0", "17", "s1", "s2750"),
+    "day_type": ("wd", "we"),
+    "from_favorites": (False, True),
+    "departure": (0, 1439),
+    "lead": (5, 15),
+    "daily": (False, True),
+    "reminder_id": (1, 123456),
+}
+# Наибольшие значения, какие допускают данные: stop_id и позиции - uint32 снапшота,
+# минуты - uint16, id напоминания - rowid SQLite
+WORST = {
+    "transport_type": "trolleybus",
+    "number": "Экспресс 116к",  # нецифровой номер, 22 байта UTF-8; в данных - не длиннее 6 ("16 Д")
+    "page": 2**16 - 1,
+    "route_idx": 2**16 - 1,
+    "stop_ref": f"s{2**32 - 1}",
+    "day_type": "we",
+    "from_favorites": True,
+    "departure": 2**16 - 1,
+    "lead": 24 * 60,
+    "daily": True,
+    "reminder_id": 2**63 - 1,
+}
+ACTIONS = sorted(callbacks._ACTIONS.values(), key=lambda cls: cls.code)
+
+
+def _payloads(cls):
+    """Все сочетания значений из SAMPLES (для действий без полей - один объект)."""
+    return [cls(*values) for values in itertools.product(*(SAMPLES[name] for name in cls._fields))]
+
+
+def test_samples_cover_all_fields():
+    fields = {name for cls in ACTIONS for name in cls._fields}
+    assert fields <= SAMPLES.keys()
+    assert fields <= WORST.keys()
+
+
+@pytest.mark.parametrize("cls", ACTIONS, ids=lambda cls: cls.__name__)
+def test_round_trip(cls):
+    for payload in _payloads(cls):
+        data = callbacks.encode(payload)
+        assert callbacks.decode(data) == payload
+        assert callbacks.parse(data) == payload
+        assert type(callbacks.decode(data)) is cls
+
+
+@pytest.mark.parametrize("cls", ACTIONS, ids=lambda cls: cls.__name__)
+def test_worst_case_fits(cls):
+    payload = cls(*(WORST[name] for name in cls._fields))
+    data = callbacks.encode(payload)
+    assert len(data) <= callbacks.MAX_CALLBACK_BYTES
+    assert callbacks.decode(data) == payload
+
+
+def test_too_long_is_rejected():
+    with pytest.raises(ValueError):
+        callbacks.encode(callbacks.Vehicle("bus", "№" * 40))
+
+
+def _raw(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+@pytest.mark.parametrize("data", [
+    "", "A" * 65, "не base64", "list_bus_2",
+    _raw(b"\x01"),                  # нет кода действия
+    _raw(b"\x02\x01\x00\x00"),      # другая версия формата
+    _raw(b"\x01\x63"),              # неизвестное действие
+    _raw(b"\x01\x01\x02\x00"),      # неизвестный тип транспорта
+    _raw(b"\x01\x0c\x00"),          # лишние байты
+    _raw(b"\x01\x03\x00\x07\xd0"),  # обрезанная строка номера
+])
+def test_bad_data(data):
+    with pytest.raises(ValueError):
+        callbacks.decode(data)
+
+
+@pytest.mark.parametrize("cls", ACTIONS, ids=lambda cls: cls.__name__)
+def test_truncated(cls):
+    data = callbacks.encode(cls(*(WORST[name] for name in cls._fields)))
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    for end in range(2, len(raw)):
+        with pytest.raises(ValueError):
+            callbacks.decode(_raw(raw[:end]))
+
+
+# Одна строка на каждый шаблон _LEGACY, по порядку
+LEGACY = [
+    ("list_bus_2", callbacks.ListPage("bus", 2)),
+    ("back_to_trolleybus_list", callbacks.BackToList("trolleybus")),
+    ("route_bus_11к_1", callbacks.Route("bus", "11к", 1)),
+    ("stop_trolleybus_16 Д_0_s23_we", callbacks.Stop("trolleybus", "16 Д", 0, "s23", "we")),
+    ("toggle_day_bus_12_1_7_wd_1", callbacks.ToggleDay("bus", "12", 1, "7", "wd", True)),
+    ("favadd_bus_12_0_s5", callbacks.FavoriteAdd("bus", "12", 0, "s5")),
+    ("fav_trolleybus_7_1_3", callbacks.FavoriteShow("trolleybus", "7", 1, "3")),
+    ("favdel_bus_46к_0_s120", callbacks.FavoriteDelete("bus", "46к", 0, "s120")),
+    ("dummy_in_favorites", callbacks.InFavorites()),
+    ("back_to_fav_list", callbacks.BackToFavorites()),
+    ("back_to_main", callbacks.BackToMain()),
+    ("search_stop_s11", callbacks.SearchStop("s11")),
+    ("board_s66", callbacks.Board("s66")),
+    ("trolleybus_16 Д", callbacks.Vehicle("trolleybus", "16 Д")),
+]
+
+
+def test_legacy_samples_cover_all_patterns():
+    assert len(LEGACY) == len(callbacks._LEGACY)
+    for (data, _), (pattern, _) in zip(LEGACY, callbacks._LEGACY):
+        assert pattern.fullmatch(data), data
+
+
+@pytest.mark.parametrize("data, expected", LEGACY, ids=[data for data, _ in LEGACY])
+def test_legacy(data, expected):
+    assert callbacks.decode_legacy(data) == expected
+    assert callbacks.parse(data) == expected
+    # Тот же объект в новом формате
+    assert callbacks.decode(callbacks.encode(expected)) == expected
+
+
+@pytest.mark.parametrize("data", ["unknown", "list_tram_1", "stop_bus_12_0_s1_mo", "route_bus_12_x"])
+def test_legacy_unknown(data):
+    with pytest.raises(ValueError):
+        callbacks.parse(data)
+
+# --- END OF FILE test_callbacks.py ---
@@ -0,0 +1,119 @@
+# --- START OF FILE test_favorites.py ---
+
+"""Хранилища избранного (storage/favorites.py): интерфейс, JSON и SQLite, перенос JSON -> SQLite."""
+
+import json
+import os
+
+import pytest
+
+from storage import favorites
+from storage.favorites import FavoritesStore, JsonFavoritesStore, SqliteFavoritesStore
+
+STOP = {"number": "12", "route": "Вокзал - Центр", "stop": "Поликлиника № 12"}
+LEGACY = {
+    "101": {"buses": {"12_0_s5": STOP, "46к_1_s120": {"number": "46к", "route": "Рынок", "stop": "ТЭЦ «Восточная»"}},
+            "trolleys": {}},
+    "202": {"trolleys": {"7_1_3": {"number": "7", "route": "Депо", "stop": "Площадь Ленина"}}},  # секции неполные
+    "303": {"buses": {}, "trolleys": {}},
+}
+
+
+@pytest.fixture
+def legacy_json(tmp_path):
+    path = str(tmp_path / "favorites.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(LEGACY, f, ensure_ascii=False)
+    return path
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        store = JsonFavoritesStore(str(tmp_path / "favorites.json"))
+    else:
+        store = SqliteFavoritesStore(str(tmp_path / "favorites.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        FavoritesStore()
+
+    class Partial(FavoritesStore):
+        def get(self, user_id):
+            return favorites.empty_favorites()
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_store_contract(store):
+    assert store.get(1) == {"buses": {}, "trolleys": {}}
+    store.put(1, "buses", "12_0_s5", STOP)
+    store.put(2, "trolleys", "7_1_3", STOP)
+    assert store.contains(1, "buses", "12_0_s5") and not store.contains(2, "buses", "12_0_s5")
+    assert store.get(1) == {"buses": {"12_0_s5": STOP}, "trolleys": {}}
+
+    assert store.delete(1, "buses", "12_0_s5")
+    assert not store.delete(1, "buses", "12_0_s5")
+    store.replace(2, {"buses": {"1_0_0": STOP}, "trolleys": {}})
+    users = store.load_users()
+    assert users[2] == {"buses": {"1_0_0": STOP}, "trolleys": {}}
+    # Пользователь без записей: JSON хранит пустые секции, SQLite - ничего
+    assert users.get(1, favorites.empty_favorites()) == favorites.empty_favorites()
+
+
+def test_migrate_json_to_sqlite(legacy_json, tmp_path):
+    db_path = str(tmp_path / "favorites.sqlite3")
+    assert favorites.migrate_json_to_sqlite(legacy_json, db_path) == 3
+
+    migrated = SqliteFavoritesStore(db_path)
+    try:
+        # Пользователи без записей в SQLite не хранятся, у остальных - то же избранное
+        expected = JsonFavoritesStore(legacy_json).load_users()
+        del expected[303]
+        assert migrated.load_users() == expected
+        assert migrated.get(202) == {"buses": {}, "trolleys": LEGACY["202"]["trolleys"]}
+        assert migrated.get(101)["buses"]["46к_1_s120"]["stop"] == "ТЭЦ «Восточная»"
+    finally:
+        migrated.close()
+
+
+def test_create_store_migrates_once(legacy_json, tmp_path):
+    db_path = str(tmp_path / "favorites.sqlite3")
+    with open(db_path + ".migrating", "wb") as f:
+        f.write(b"leftover from an interrupted migration")
+
+    store = favorites.create_store("sqlite", legacy_json, db_path)
+    try:
+        assert isinstance(store, SqliteFavoritesStore)
+        assert store.get(101)["buses"]["12_0_s5"] == STOP
+        store.put(101, "buses", "1_0_0", STOP)
+    finally:
+        store.close()
+    assert not os.path.exists(db_path + ".migrating")
+    assert os.path.exists(legacy_json)  # исходный файл не трогаем
+
+    # База уже есть: JSON больше не читается, изменения в базе сохраняются
+    with open(legacy_json, "w", encoding="utf-8") as f:
+        json.dump({"101": {"buses": {}, "trolleys": {}}}, f)
+    store = favorites.create_store("sqlite", legacy_json, db_path)
+    try:
+        assert sorted(store.get(101)["buses"]) == ["12_0_s5", "1_0_0", "46к_1_s120"]
+    finally:
+        store.close()
+
+
+def test_create_store_without_json(tmp_path):
+    store = favorites.create_store("sqlite", str(tmp_path / "missing.json"), str(tmp_path / "favorites.sqlite3"))
+    try:
+        assert store.load_users() == {}
+    finally:
+        store.close()
+    assert isinstance(favorites.create_store("json", str(tmp_path / "f.json"), ""), JsonFavoritesStore)
+    with pytest.raises(ValueError):
+        favorites.create_store("redis", "", "")
+
+# --- END OF FILE test_favorites.py ---
@@ -0,0 +1,147 @@
+# --- START OF FILE test_favorites_cache.py ---
+
+"""Кэш избранного с отложенной записью (storage/favorites_cache.py)."""
+
+import asyncio
+
+from storage.favorites import FavoritesStore, SqliteFavoritesStore, empty_favorites
+from storage.favorites_cache import CachedFavoritesStore
+
+STOP = {"number": "12", "route": "Вокзал - Центр", "stop": "Центр"}
+
+
+class RecordingStore(FavoritesStore):
+    """Бэкенд в памяти: запоминает каждую пачку replace_many."""
+
+    def __init__(self, users: dict[int, dict] | None = None):
+        self.users = users or {}
+        self.batches: list[dict[int, dict]] = []
+        self.reads = 0
+        self.fail = 0
+        self.closed = False
+
+    def get(self, user_id: int) -> dict:
+        self.reads += 1
+        return self.users.get(user_id, empty_favorites())
+
+    def put(self, user_id, section, key, value):
+        raise AssertionError("кэш пишет только пачками")
+
+    def delete(self, user_id, section, key):
+        raise AssertionError("кэш пишет только пачками")
+
+    def replace(self, user_id, favs):
+        self.replace_many({user_id: favs})
+
+    def replace_many(self, users):
+        if self.fail:
+            self.fail -= 1
+            raise OSError("disk full")
+        self.batches.append(users)
+        self.users.update(users)
+
+    def load_users(self):
+        return dict(self.users)
+
+    def close(self):
+        self.closed = True
+
+
+def test_burst_is_written_once():
+    async def scenario():
+        backend = RecordingStore()
+        cache = CachedFavoritesStore(backend, flush_delay=0.05)
+        await cache.start()
+        for user_id in range(1, 6):
+            cache.put(user_id, "buses", f"{user_id}_0_s1", STOP)
+        cache.put(1, "trolleys", "7_0_0", STOP)
+        assert cache.delete(2, "buses", "2_0_s1")
+        assert not cache.delete(2, "buses", "2_0_s1")
+        # Изменения сразу видны из кэша, а бэкенд ещё не тронут
+        assert cache.contains(1, "trolleys", "7_0_0") and backend.batches == []
+        assert cache.pending == 5
+
+        await asyncio.sleep(0.2)
+        assert cache.pending == 0
+        assert len(backend.batches) == 1 and sorted(backend.batches[0]) == [1, 2, 3, 4, 5]
+        assert backend.users[1] == {"buses": {"1_0_s1": STOP}, "trolleys": {"7_0_0": STOP}}
+        assert backend.users[2] == {"buses": {}, "trolleys": {}}
+
+        # Следующий всплеск - следующая пачка, только с изменёнными пользователями
+        cache.put(3, "buses", "3_1_s2", STOP)
+        await asyncio.sleep(0.2)
+        assert [sorted(batch) for batch in backend.batches] == [[1, 2, 3, 4, 5], [3]]
+        await cache.close()
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert (cache.flushes, cache.flushed_users) == (2, 6)
+
+
+def test_close_writes_the_rest():
+    async def scenario():
+        backend = RecordingStore()
+        cache = CachedFavoritesStore(backend, flush_delay=60)
+        await cache.start()
+        cache.put(1, "buses", "1_0_s1", STOP)
+        await asyncio.sleep(0)
+        assert backend.batches == []
+        await cache.close()
+        return backend
+
+    backend = asyncio.run(scenario())
+    assert backend.batches == [{1: {"buses": {"1_0_s1": STOP}, "trolleys": {}}}]
+    assert backend.closed
+
+
+def test_failed_flush_is_retried():
+    backend = RecordingStore()
+    backend.fail = 1
+    cache = CachedFavoritesStore(backend)
+    cache.put(1, "buses", "1_0_s1", STOP)  # писатель не запущен - запись сразу, и она не удалась
+    assert cache.pending == 1 and backend.batches == []
+    cache.put(2, "buses", "2_0_s1", STOP)
+    assert cache.pending == 0
+    assert sorted(backend.batches[0]) == [1, 2]
+
+
+def test_preload_and_lazy_reads():
+    backend = RecordingStore({1: {"buses": {"1_0_s1": STOP}, "trolleys": {}}})
+    lazy = CachedFavoritesStore(backend)
+    assert lazy.get(1)["buses"] == {"1_0_s1": STOP}
+    lazy.get(1)
+    assert backend.reads == 1  # пользователь читается из бэкенда один раз
+
+    preloaded = CachedFavoritesStore(backend)
+    preloaded.preload()
+    assert preloaded.load_users() == backend.users
+    assert preloaded.get(2) == empty_favorites() and backend.reads == 1
+
+    # Копия: изменения снаружи не попадают в кэш
+    favs = preloaded.get(1)
+    favs["buses"].clear()
+    assert preloaded.contains(1, "buses", "1_0_s1")
+
+
+def test_sqlite_backend(tmp_path):
+    path = str(tmp_path / "favorites.sqlite3")
+
+    async def scenario():
+        cache = CachedFavoritesStore(SqliteFavoritesStore(path), flush_delay=0.01)
+        cache.preload()
+        await cache.start()
+        for i in range(50):
+            cache.put(i % 5, "buses", f"{i}_0_s1", STOP)
+        await cache.close()
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.flushes == 1
+    store = SqliteFavoritesStore(path)
+    try:
+        assert sorted(store.load_users()) == [0, 1, 2, 3, 4]
+        assert len(store.get(3)["buses"]) == 10
+    finally:
+        store.close()
+
+# --- END OF FILE test_favorites_cache.py ---
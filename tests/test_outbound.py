@@ -0,0 +1,201 @@
+# --- START OF FILE test_outbound.py ---
+
+"""Очередь исходящих запросов (delivery/outbound.py) на подставных часах: вёдра, приоритеты, 429, правки."""
+
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, EditMessageText, SendMessage
+
+from delivery.outbound import BULK, INTERACTIVE, NORMAL, OutboundQueue
+
+START = 1000.0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = START
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _queue(**kwargs) -> tuple[OutboundQueue, FakeClock]:
+    clock = FakeClock()
+    settings = {"global_rate": 1000, "chat_rate": 1000, "group_rate": 1000, "chat_burst": 1000}
+    settings.update(kwargs)
+    return OutboundQueue(clock=clock, **settings), clock
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _advance(queue: OutboundQueue, clock: FakeClock, seconds: float, step: float = 0.01):
+    """Двигает часы шагами step; на каждом шаге будит планировщик и даёт отработать задачам."""
+    await _settle()
+    for _ in range(round(seconds / step)):
+        clock.now = round(clock.now + step, 6)
+        queue._wake()
+        await _settle()
+
+
+def _sender(clock: FakeClock, log: list, label):
+    async def call():
+        log.append((label, round(clock.now - START, 2)))
+        return label
+    return call
+
+
+async def _results(*jobs):
+    """Результаты запросов; те, что не ушли за время теста, не ждём бесконечно."""
+    return await asyncio.wait_for(asyncio.gather(*jobs), 1)
+
+
+def _run(scenario):
+    return asyncio.run(scenario())
+
+
+def test_chat_bucket_rate():
+    async def scenario():
+        queue, clock = _queue(chat_rate=1, group_rate=0.5, chat_burst=3)
+        log = []
+        jobs = [asyncio.create_task(queue.submit(1, _sender(clock, log, ("private", i)))) for i in range(6)]
+        jobs += [asyncio.create_task(queue.submit(-5, _sender(clock, log, ("group", i)))) for i in range(5)]
+        await _advance(queue, clock, 5)
+        await _results(*jobs)
+        await queue.close()
+        return log
+
+    log = _run(scenario)
+    # Запас ведра - сразу, дальше по токену в секунду (группа - раз в две секунды)
+    assert [t for (kind, _), t in log if kind == "private"] == [0, 0, 0, 1, 2, 3]
+    assert [t for (kind, _), t in log if kind == "group"] == [0, 0, 0, 2, 4]
+    assert [i for (kind, i), _ in log if kind == "private"] == list(range(6))
+
+
+def test_global_bucket_rate():
+    async def scenario():
+        queue, clock = _queue(global_rate=10)
+        log = []
+        jobs = [asyncio.create_task(queue.submit(chat_id, _sender(clock, log, chat_id))) for chat_id in range(1, 31)]
+        await _advance(queue, clock, 3)
+        await _results(*jobs)
+        await queue.close()
+        return log
+
+    times = [t for _, t in _run(scenario)]
+    assert len(times) == 30
+    assert times[:10] == [0] * 10
+    # После запаса - не чаще global_rate в секунду: к моменту t ушло не больше 10 + 10 * t
+    assert all(sent <= 10 + 10 * t + 1e-6 for sent, t in enumerate(times, 1))
+    assert times[-1] == pytest.approx(2.0, abs=0.02)
+
+
+def test_interactive_before_bulk():
+    async def scenario():
+        queue, clock = _queue(global_rate=1)
+        log = []
+        jobs = [asyncio.create_task(queue.submit(chat_id, _sender(clock, log, ("bulk", chat_id)), BULK))
+                for chat_id in range(1, 4)]
+        jobs.append(asyncio.create_task(queue.submit(2, _sender(clock, log, ("normal", 2)), NORMAL)))
+        jobs.append(asyncio.create_task(queue.submit(3, _sender(clock, log, ("interactive", 3)), INTERACTIVE)))
+        await _advance(queue, clock, 5, step=0.1)
+        await _results(*jobs)
+        stats = queue.stats()
+        await queue.close()
+        return log, stats
+
+    log, stats = _run(scenario)
+    # Общее ведро - 1 в секунду: всё ждёт в очереди, и первым уходит запрос интерактивного приоритета,
+    # даже поставленный последним и в чат, где раньше него стоит рассылка
+    assert [label for label, _ in log] == [("interactive", 3), ("normal", 2), ("bulk", 1), ("bulk", 2), ("bulk", 3)]
+    assert [t for _, t in log] == [0, 1, 2, 3, 4]
+    assert stats["sent"] == {"interactive": 1, "normal": 1, "bulk": 3}
+
+
+def test_retry_after_pauses_chat_and_requeues_first():
+    async def scenario():
+        queue, clock = _queue(chat_rate=1, chat_burst=1)
+        log = []
+        attempts = []
+
+        async def flooded():
+            attempts.append(round(clock.now - START, 2))
+            if len(attempts) == 1:
+                raise TelegramRetryAfter(SendMessage(chat_id=1, text="a"), "Flood control exceeded", 5)
+            return "a"
+
+        first = asyncio.create_task(queue.submit(1, flooded))
+        second = asyncio.create_task(queue.submit(1, _sender(clock, log, "b")))
+        other = asyncio.create_task(queue.submit(2, _sender(clock, log, "other chat")))
+        await _advance(queue, clock, 8, step=0.1)
+        results = await _results(first, second, other)
+        stats = queue.stats()
+        await queue.close()
+        return attempts, log, results, stats
+
+    attempts, log, results, stats = _run(scenario)
+    assert results == ["a", "b", "other chat"]
+    # Пауза retry_after = 5 с: повтор - первым в чате, следующий запрос ждёт за ним; другой чат не задет
+    assert attempts == [0, 5]
+    assert log == [("other chat", 0), ("b", 6)]
+    assert stats["retried"] == 1 and stats["failed"] == 0
+
+
+def test_retry_after_gives_up():
+    async def scenario():
+        queue, clock = _queue(max_retries=2)
+
+        async def flooded():
+            raise TelegramRetryAfter(SendMessage(chat_id=1, text="a"), "Flood control exceeded", 1)
+
+        job = asyncio.create_task(queue.submit(1, flooded))
+        await _advance(queue, clock, 4, step=0.1)
+        with pytest.raises(TelegramRetryAfter):
+            await job
+        stats = queue.stats()
+        await queue.close()
+        return stats
+
+    stats = _run(scenario)
+    assert stats["retried"] == 2 and stats["failed"] == 1
+
+
+def test_edits_skip_chat_bucket():
+    async def scenario():
+        queue, clock = _queue(chat_rate=1, chat_burst=1)
+        log = []
+
+        async def make_request(bot, method):
+            log.append((type(method).__name__, round(clock.now - START, 2)))
+            return True
+
+        send = [asyncio.create_task(queue(make_request, None, SendMessage(chat_id=1, text=str(i)))) for i in range(2)]
+        edits = [asyncio.create_task(queue(make_request, None, EditMessageText(chat_id=1, message_id=1, text=str(i))))
+                 for i in range(5)]
+        await _advance(queue, clock, 2, step=0.1)
+        await _results(*send, *edits)
+        await queue.close()
+        return log
+
+    log = _run(scenario)
+    # Правки уходят сразу и раньше новых сообщений, токен чата не тратят: его хватает первому SendMessage
+    assert log == [("EditMessageText", 0)] * 5 + [("SendMessage", 0), ("SendMessage", 1)]
+
+
+def test_requests_without_chat_are_not_queued():
+    async def scenario():
+        queue, _ = _queue(global_rate=1)
+
+        async def make_request(bot, method):
+            return "ok"
+
+        result = await queue(make_request, None, AnswerCallbackQuery(callback_query_id="1"))
+        return result, queue._worker
+
+    assert _run(scenario) == ("ok", None)
+
+# --- END OF FILE test_outbound.py ---
@@ -0,0 +1,75 @@
+# --- START OF FILE test_parsers.py ---
+
+"""HTML-бэкенды парсеров (parsers/html_backend.py): bs4 и lxml дают побайтно одинаковый результат."""
+
+import json
+import os
+
+import pytest
+
+from bench import synthetic_pages
+from parsers import bus_parser, html_backend, trolleybus_parser
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def _parse(kind: str, html: str, backend: str):
+    if kind == "bus":
+        return bus_parser.parseSchedule(html, backend=backend)
+    return trolleybus_parser.parseSchedule(html, "", backend=backend)
+
+
+def _pages() -> list[tuple[str, str, str]]:
+    """Страницы, собранные из сохранённого расписания (как в bench/bench_parsers.py)."""
+    pages = [("bus", bus["number"], synthetic_pages.bus_page(bus))
+             for bus in synthetic_pages.load_json(os.path.join(DATA, "bus_schedule.json"))]
+    pages += [("trolleybus", trolleybus["number"], synthetic_pages.trolleybus_page(trolleybus))
+              for trolleybus in synthetic_pages.load_json(os.path.join(DATA, "trolleybus_schedule.json"))]
+    return pages
+
+
+PAGES = _pages()
+
+# Разметка, которой нет в синтетических страницах: сущности, комментарии, пробелы, пустые ячейки
+QUIRKS = [
+    ("bus", synthetic_pages._page("Автобус 1", (
+        "<p><strong>Маршрут движения автобуса №1к:</strong></p>\n<h2>Расписание на будние дни</h2>\n"
+        "<table class=\"schedule\"><thead><tr><th colspan=\"2\"><center><strong>Вокзал &ndash; Завод &laquo;Строммашина&raquo;"
+        "</strong></center></th></tr></thead>\n<tbody>\n"
+        "<tr>\n<td>  Вокзал&nbsp;(пл. Ленина) </td>\n<td><div><b>05</b> 10 <!-- ночной --> 40</div>"
+        "<div><b>06</b>\n05 <span class=\"lowfloor\">35</span></div></td>\n</tr>\n"
+        "<tr>\n<td>Завод &amp; депо</td>\n<td></td>\n</tr>\n"
+        "</tbody>\n</table>\n<h2>Расписание на выходные дни</h2>\n<p>Не ходит</p>"
+    ))),
+    ("trolleybus", synthetic_pages._page("Троллейбус 2", (
+        "<p><strong>Маршрут движения троллейбуса №2:</strong></p>\n<h2>Расписание на будние дни</h2>\n"
+        "<div class=\"schedule\">\n<p class=\"stop\">Вокзал&nbsp;&amp; рынок</p>\n<p>05:10, 05:40,  06:05</p>\n"
+        "<p class=\"stop\"><b>Завод</b></p>\n<p>05:30, <i>06:00</i></p>\n</div>\n"
+        "<h2>Расписание на выходные дни</h2>\n<div class=\"schedule\">\n</div>"
+    ))),
+]
+
+
+def test_pages_are_built():
+    assert {kind for kind, _, _ in PAGES} == {"bus", "trolleybus"}
+
+
+@pytest.mark.parametrize("kind, name, html", PAGES, ids=[f"{kind}-{name}" for kind, name, _ in PAGES])
+def test_backends_match(kind, name, html):
+    outputs = [json.dumps(_parse(kind, html, backend), ensure_ascii=False) for backend in html_backend.BACKENDS]
+    assert outputs[0] == outputs[1]
+    assert json.loads(outputs[0])  # страница действительно разобрана
+
+
+@pytest.mark.parametrize("kind, html", QUIRKS, ids=[kind for kind, _ in QUIRKS])
+def test_backends_match_on_quirky_markup(kind, html):
+    outputs = [json.dumps(_parse(kind, html, backend), ensure_ascii=False) for backend in html_backend.BACKENDS]
+    assert outputs[0] == outputs[1]
+    assert json.loads(outputs[0])[0]  # будние разобраны
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        html_backend.get_backend("html5lib")
+
+# --- END OF FILE test_parsers.py ---
@@ -0,0 +1,79 @@
+# --- START OF FILE test_planner.py ---
+
+"""Планировщик поездок (timetable/planner.py): рейсы, пересадки, остановки в одну минуту."""
+
+from timetable.planner import TRANSFER_MINUTES, JourneyPlanner
+from timetable.stop_index import StopIndex
+
+
+def _route(number: str, name: str, stops: list[tuple[str, list[str]]]) -> dict:
+    return {"bus_number": number, "name": name, "stops": [{"name": stop, "times": times} for stop, times in stops]}
+
+
+def _planner(routes: dict[str, list[dict]]) -> tuple[JourneyPlanner, StopIndex]:
+    sources = {"bus": {number: {"number": number, "route_weekdays": lines, "route_weekends": []}
+                       for number, lines in routes.items()}}
+    index = StopIndex(sources)
+    return JourneyPlanner(index, sources), index
+
+
+def _plan(planner, index, from_name, to_name, start="07:00", count=3):
+    hours, minutes = map(int, start.split(":"))
+    return planner.plan(index.lookup(from_name), index.lookup(to_name), "wd", hours * 60 + minutes, count)
+
+
+def test_one_transfer():
+    planner, index = _planner({
+        "1": [_route("1", "Вокзал - Центр", [("Вокзал", ["08:00", "09:00"]), ("Центр", ["08:10", "09:10"])])],
+        # 08:11 - меньше TRANSFER_MINUTES после прибытия, успеваем только на 08:15
+        "2": [_route("2", "Центр - Рынок", [("Центр", ["08:11", "08:15", "09:30"]),
+                                           ("Рынок", ["08:20", "08:25", "09:40"])])],
+    })
+    found = _plan(planner, index, "Вокзал", "Рынок")
+    assert [(it.departure, it.arrival, it.transfers) for it in found] == [(480, 505, 1), (540, 580, 1)]
+
+    first, second = found[0].legs
+    assert (first.line.number, second.line.number) == ("1", "2")
+    assert first.to_stop == second.from_stop == index.lookup("Центр")
+    assert second.departure - first.arrival >= TRANSFER_MINUTES
+    assert (first.departure, first.arrival, second.departure, second.arrival) == (480, 490, 495, 505)
+
+
+def test_direct_trip_is_preferred():
+    planner, index = _planner({
+        "1": [_route("1", "Вокзал - Рынок", [("Вокзал", ["08:00"]), ("Центр", ["08:10"]), ("Рынок", ["08:30"])])],
+        "2": [_route("2", "Центр - Рынок", [("Центр", ["08:12"]), ("Рынок", ["08:20"])])],
+    })
+    (itinerary,) = _plan(planner, index, "Вокзал", "Рынок", count=1)
+    assert itinerary.transfers == 1 and itinerary.arrival == 500
+
+    (direct,) = _plan(planner, index, "Вокзал", "Центр", count=1)
+    assert direct.transfers == 0 and direct.legs[0].line.route_name == "Вокзал - Рынок"
+
+
+def test_stops_in_the_same_minute():
+    """Рейс проходит три остановки в одну минуту: каждая достижима, и с середины цепочки можно пересесть."""
+    planner, index = _planner({
+        "1": [_route("1", "Яблоневая - Акациевая", [("Яблоневая", ["10:00"]), ("Берёзовая", ["10:00"]),
+                                                    ("Акациевая", ["10:00"])])],
+        "2": [_route("2", "Берёзовая - Дубовая", [("Берёзовая", ["10:02"]), ("Дубовая", ["10:10"])])],
+    })
+    for target in ("Берёзовая", "Акациевая"):
+        (itinerary,) = _plan(planner, index, "Яблоневая", target, start="09:00", count=1)
+        assert (itinerary.departure, itinerary.arrival, itinerary.transfers) == (600, 600, 0)
+        assert itinerary.legs[0].to_stop == index.lookup(target)
+
+    (itinerary,) = _plan(planner, index, "Яблоневая", "Дубовая", start="09:00", count=1)
+    assert [(leg.line.number, leg.departure, leg.arrival) for leg in itinerary.legs] == [("1", 600, 600), ("2", 602, 610)]
+
+
+def test_no_route():
+    planner, index = _planner({
+        "1": [_route("1", "Вокзал - Центр", [("Вокзал", ["08:00"]), ("Центр", ["08:10"])])],
+        "2": [_route("2", "Рынок - Депо", [("Рынок", ["08:00"]), ("Депо", ["08:10"])])],
+    })
+    assert _plan(planner, index, "Вокзал", "Депо") == []
+    assert _plan(planner, index, "Вокзал", "Центр", start="08:01") == []
+    assert _plan(planner, index, "Центр", "Вокзал") == []
+
+# --- END OF FILE test_planner.py ---
@@ -0,0 +1,108 @@
+# --- START OF FILE test_reminders_store.py ---
+
+"""Забирание сработавших напоминаний (SqliteReminderStore.claim, storage/reminders.py)."""
+
+import sqlite3
+import threading
+
+import pytest
+
+from storage.reminders import Reminder, SqliteReminderStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteReminderStore(str(tmp_path / "reminders.sqlite3"))
+    yield store
+    store.close()
+
+
+def _reminder(user_id: int = 1, departure: int = 480, daily: bool = False, fire_at: float = 1000.0) -> Reminder:
+    return Reminder(0, user_id, user_id, "bus", "12", 0, "s5", "wd", departure, 10, daily, fire_at, "🚌 №12, ост. Центр")
+
+
+def test_one_shot_is_deleted(store):
+    reminder = store.add(_reminder())
+    assert store.claim([(reminder.id, reminder.fire_at, None)]) == {reminder.id}
+    assert store.get(reminder.id) is None
+    assert len(store) == 0
+
+
+def test_daily_is_moved_to_next_time(store):
+    reminder = store.add(_reminder(daily=True))
+    assert store.claim([(reminder.id, reminder.fire_at, reminder.fire_at + 86400)]) == {reminder.id}
+    assert store.get(reminder.id) == reminder._replace(fire_at=reminder.fire_at + 86400)
+
+
+def test_claimed_once(store):
+    one_shot = store.add(_reminder(departure=480))
+    daily = store.add(_reminder(departure=490, daily=True))
+    claims = [(one_shot.id, one_shot.fire_at, None), (daily.id, daily.fire_at, daily.fire_at + 86400)]
+    assert store.claim(claims) == {one_shot.id, daily.id}
+    # Второй процесс с теми же (уже устаревшими) fire_at ничего не получает
+    assert store.claim(claims) == set()
+    assert store.get(daily.id).fire_at == daily.fire_at + 86400
+
+
+def test_deleted_or_replaced_is_not_claimed(store):
+    deleted = store.add(_reminder(departure=480))
+    replaced = store.add(_reminder(departure=490))
+    kept = store.add(_reminder(departure=500))
+    assert store.delete(deleted.user_id, deleted.id)
+    # Повторная подписка на тот же рейс - новая строка с новым id
+    renewed = store.add(replaced._replace(fire_at=2000.0))
+    assert renewed.id > replaced.id and store.get(replaced.id) is None
+    claims = [(reminder.id, reminder.fire_at, None) for reminder in (deleted, replaced, kept)]
+    assert store.claim(claims) == {kept.id}
+    assert [reminder.id for reminder in store.load_pending()] == [renewed.id]
+
+
+def test_changed_fire_at_is_not_claimed(store):
+    reminder = store.add(_reminder(daily=True))
+    store.claim([(reminder.id, reminder.fire_at, 5000.0)])
+    assert store.claim([(reminder.id, reminder.fire_at, 9000.0)]) == set()
+    assert store.get(reminder.id).fire_at == 5000.0
+
+
+def test_empty_and_unknown(store):
+    assert store.claim([]) == set()
+    assert store.claim([(42, 1000.0, None)]) == set()
+
+
+def test_failed_batch_is_rolled_back(store):
+    first = store.add(_reminder(departure=480))
+    second = store.add(_reminder(departure=490))
+    with pytest.raises(sqlite3.Error):  # параметр, который нельзя записать
+        store.claim([(first.id, first.fire_at, None), (second.id, second.fire_at, object())])
+    assert store.get(first.id) == first
+    assert store.claim([(first.id, first.fire_at, None), (second.id, second.fire_at, None)]) == {first.id, second.id}
+
+
+def test_concurrent_claims_do_not_overlap(tmp_path):
+    """Два соединения (как два процесса) забирают одну пачку: каждое напоминание достаётся одному."""
+    path = str(tmp_path / "reminders.sqlite3")
+    stores = [SqliteReminderStore(path) for _ in range(2)]
+    try:
+        saved = [stores[0].add(_reminder(user_id=user_id)) for user_id in range(1, 201)]
+        claims = [(reminder.id, reminder.fire_at, None) for reminder in saved]
+        results = [set(), set()]
+        barrier = threading.Barrier(2)
+
+        def claim(index):
+            barrier.wait()
+            for start in range(0, len(claims), 20):
+                results[index] |= stores[index].claim(claims[start:start + 20])
+
+        threads = [threading.Thread(target=claim, args=(index,)) for index in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not results[0] & results[1]
+        assert results[0] | results[1] == {reminder.id for reminder in saved}
+        assert len(stores[0]) == 0
+    finally:
+        for store in stores:
+            store.close()
+
+# --- END OF FILE test_reminders_store.py ---
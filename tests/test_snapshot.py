@@ -0,0 +1,158 @@
+# --- START OF FILE test_snapshot.py ---
+
+"""Бинарный снапшот (timetable/snapshot.py): запись, чтение, конвертация JSON, сутки обслуживания."""
+
+import datetime
+import json
+import os
+
+import pytest
+
+from timetable import departures, snapshot
+
+VEHICLES = [
+    {
+        "number": "1",
+        "route_name": "Вокзал - Центр",
+        "route_weekdays": [
+            {"bus_number": "1", "name": "Вокзал - Центр", "stops": [
+                # Рейсы до 03:00 - продолжение вечера; мусор и дубли из разметки
+                {"name": "Вокзал", "times": ["23:50", "00:20", "5:28", "02:59", "03:00", "8:35:00 PM", "ВД"]},
+                {"name": "Центр", "times": ["00:00", "23:59"]},
+            ]},
+            {"bus_number": "1", "name": "Центр - Вокзал", "stops": [
+                {"name": "Центр", "times": ["23:50", "00:20", "5:28", "02:59", "03:00", "8:35:00 PM", "ВД"]},
+            ]},
+        ],
+        "route_weekends": [],
+    },
+    {"number": "11к", "route_name": "", "route_weekdays": [], "route_weekends": [
+        {"bus_number": "11к", "name": "Рынок", "stops": [{"name": "Рынок", "times": []}]},
+    ]},
+]
+
+
+def test_service_minutes():
+    assert snapshot.service_minute(0) == 1440
+    assert snapshot.service_minute(179) == 1619
+    assert snapshot.service_minute(180) == 180
+    assert snapshot.normalize_times(["00:20", "23:50", "03:00", "мусор"]) == [180, 1430, 1460]
+    assert snapshot.format_time(1460) == "00:20"
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "bus.snap")
+    snapshot.write_snapshot(path, VEHICLES, snapshot.KIND_BUS)
+    snap = snapshot.Snapshot.open(path)
+    try:
+        assert snap.kind == snapshot.KIND_BUS
+        assert list(snap) == ["1", "11к"]
+        stop = snap.stop("1", "wd", 0, 0)
+        # uint16: 03:00 .. 23:59 - как есть, 00:00 .. 02:59 - 1440 + минуты, по порядку суток обслуживания
+        assert list(stop.minutes) == [180, 328, 1235, 1430, 1460, 1619]
+        assert list(stop["times"]) == ["03:00", "05:28", "20:35", "23:50", "00:20", "02:59"]
+        assert list(snap.stop("1", "wd", 0, 1).minutes) == [1439, 1440]
+        assert list(snap.route("11к", "we", 0).stops[0]["times"]) == []
+        assert snap.route("1", "wd", 1).name == "Центр - Вокзал"
+
+        # Повторная запись выгруженных данных даёт тот же файл
+        again = str(tmp_path / "again.snap")
+        snapshot.write_snapshot(again, snap.to_list(), snapshot.KIND_BUS)
+        with open(path, "rb") as a, open(again, "rb") as b:
+            assert a.read() == b.read()
+    finally:
+        snap.close()
+
+
+def test_bisect_after_midnight(tmp_path):
+    path = str(tmp_path / "bus.snap")
+    snapshot.write_snapshot(path, VEHICLES, snapshot.KIND_BUS)
+    snap = snapshot.Snapshot.open(path)
+    try:
+        minutes = snap.stop("1", "wd", 0, 0).minutes
+        # 23:45 - ближайшие рейсы уже после полуночи, но в тех же сутках обслуживания
+        now = departures.current_service_minute(datetime.datetime(2026, 1, 5, 23, 45))
+        assert list(departures.next_departures(minutes, now, 3)) == [1430, 1460, 1619]
+        # 00:30 - это 24:30 вчерашних суток: вечерние рейсы уже ушли
+        now = departures.current_service_minute(datetime.datetime(2026, 1, 6, 0, 30))
+        assert now == 1470
+        assert list(departures.next_departures(minutes, now, 3)) == [1619]
+        assert list(departures.next_departures(minutes, 1620, 3)) == []
+    finally:
+        snap.close()
+
+
+def test_in_memory_snapshot():
+    snap = snapshot.Snapshot(snapshot.build_snapshot(VEHICLES, snapshot.KIND_BUS))
+    assert snap.stop("1", "wd", 0, 0).minutes.tobytes() == snap.stop("1", "wd", 1, 0).minutes.tobytes()
+    assert snap.to_list()[0]["route_weekdays"][1]["stops"][0]["times"][-1] == "02:59"
+
+
+def test_corrupted_file(tmp_path):
+    path = str(tmp_path / "bus.snap")
+    snapshot.write_snapshot(path, VEHICLES, snapshot.KIND_BUS)
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.Snapshot.open(path)
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    json_path = str(tmp_path / "bus_schedule.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(VEHICLES, f, ensure_ascii=False)
+    return json_path, str(tmp_path / "bus_schedule.snap"), str(tmp_path / "stop_registry.json")
+
+
+def test_load_or_convert_builds_missing_snapshot(schedule):
+    json_path, snap_path, registry_path = schedule
+    snap = snapshot.load_or_convert(snap_path, json_path, snapshot.KIND_BUS, registry_path)
+    try:
+        assert os.path.exists(snap_path) and os.path.exists(registry_path)
+        assert list(snap.stop("1", "wd", 0, 0).minutes) == [180, 328, 1235, 1430, 1460, 1619]
+        # ID из реестра: "Центр" на обоих направлениях - одна остановка
+        assert snap.stop("1", "wd", 0, 1).stop_id == snap.stop("1", "wd", 1, 0).stop_id != 0
+        version = snap.version
+    finally:
+        snap.close()
+
+    # Второй запуск открывает готовый снапшот, без конвертации
+    os.utime(json_path, (1, 1))
+    reopened = snapshot.load_or_convert(snap_path, json_path, snapshot.KIND_BUS, registry_path)
+    try:
+        assert reopened.version == version
+    finally:
+        reopened.close()
+
+
+def test_load_or_convert_rebuilds_stale_or_broken(schedule):
+    json_path, snap_path, registry_path = schedule
+    with open(snap_path, "wb") as f:
+        f.write(b"not a snapshot")
+    snap = snapshot.load_or_convert(snap_path, json_path, snapshot.KIND_BUS, registry_path)
+    try:
+        assert list(snap) == ["1", "11к"]
+    finally:
+        snap.close()
+
+    # JSON новее снапшота - пересборка
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(VEHICLES[:1], f, ensure_ascii=False)
+    stat = os.stat(snap_path)
+    os.utime(json_path, (stat.st_atime + 10, stat.st_mtime + 10))
+    snap = snapshot.load_or_convert(snap_path, json_path, snapshot.KIND_BUS, registry_path)
+    try:
+        assert list(snap) == ["1"]
+    finally:
+        snap.close()
+
+
+def test_load_or_convert_without_data(tmp_path):
+    assert snapshot.load_or_convert(None) is None
+    assert snapshot.load_or_convert(str(tmp_path / "missing.snap"), str(tmp_path / "missing.json")) is None
+
+# --- END OF FILE test_snapshot.py ---
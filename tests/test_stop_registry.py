@@ -0,0 +1,139 @@
+# --- START OF FILE test_stop_registry.py ---
+
+"""Реестр остановок (timetable/stop_registry.py): постоянные ID, написания, похожие названия, запись."""
+
+import json
+import logging
+import multiprocessing
+
+import pytest
+
+from timetable import stop_registry
+from timetable.stop_registry import StopRegistry
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "stop_registry.json"), str(tmp_path / "stops.json")
+
+
+def _crawl(path: str, seed: str, names: list[str]) -> dict[str, int]:
+    """Одно обновление расписания: ID для всех названий страницы, реестр сохраняется."""
+    with stop_registry.updating(path, seed) as registry:
+        return {name: registry.resolve(name) for name in names}
+
+
+def test_ids_are_stable_across_crawls(paths):
+    first = _crawl(*paths, ["Вокзал", "Центр", "Рынок"])
+    assert sorted(first.values()) == [1, 2, 3]
+    # Следующее обновление: другой порядок, одна остановка пропала, одна новая
+    second = _crawl(*paths, ["Рынок", "Новая", "Вокзал"])
+    assert second["Рынок"] == first["Рынок"] and second["Вокзал"] == first["Вокзал"]
+    assert second["Новая"] == 4
+    # Пропавшая остановка сохраняет ID, если вернётся
+    assert _crawl(*paths, ["Центр"])["Центр"] == first["Центр"]
+
+
+def test_spellings_resolve_to_one_id(paths):
+    ids = _crawl(*paths, [
+        "Поликлиника № 12", "Поликлиника  №12", "поликлиника №12",
+        'ТЭЦ "Восточная"', "Тэц «Восточная»",
+        "Могилевский Лесхоз", "Могилевский лесхоз",
+    ])
+    assert ids["Поликлиника № 12"] == ids["Поликлиника  №12"] == ids["поликлиника №12"]
+    assert ids['ТЭЦ "Восточная"'] == ids["Тэц «Восточная»"]
+    assert ids["Могилевский Лесхоз"] == ids["Могилевский лесхоз"]
+    assert len(set(ids.values())) == 3
+
+    registry = StopRegistry(*paths)
+    assert registry.name(ids["Поликлиника № 12"]) == "Поликлиника № 12"
+    assert registry.name(ids['ТЭЦ "Восточная"']) == "ТЭЦ «Восточная»"
+    assert registry.name(ids["Могилевский лесхоз"]) == "Могилевский лесхоз"  # меньше заглавных
+    assert sorted(registry.spellings()[ids["Поликлиника № 12"]]) == sorted(
+        ["Поликлиника № 12", "Поликлиника  №12", "поликлиника №12"])
+
+
+def test_tidy_name():
+    assert stop_registry.tidy_name("  ДК  ЖЕЛЕЗНОДОРОЖНИКОВ ") == "ДК Железнодорожников"
+    assert stop_registry.tidy_name('Школа №5 "Солнышко"') == "Школа № 5 «Солнышко»"
+    assert stop_registry.tidy_name("ровд") == "РОВД"
+
+
+def test_normalize(paths):
+    vehicles = [{"number": "1", "route_weekdays": [{"name": "r", "stops": [
+        {"name": "Поликлиника  №12", "times": ["06:00"]}, {"name": "Вокзал", "times": []}]}], "route_weekends": None}]
+    with stop_registry.updating(*paths) as registry:
+        normalized = stop_registry.normalize(vehicles, registry)
+    stops = normalized[0]["route_weekdays"][0]["stops"]
+    assert stops == [{"name": "Поликлиника № 12", "stop_id": 1, "times": ["06:00"]},
+                     {"name": "Вокзал", "stop_id": 2, "times": []}]
+    assert normalized[0]["route_weekends"] == []
+    assert vehicles[0]["route_weekdays"][0]["stops"][0] == {"name": "Поликлиника  №12", "times": ["06:00"]}
+
+
+def test_near_duplicates(paths, caplog):
+    _crawl(*paths, ["Улица Мовчанского", "Вокзал"])
+    with stop_registry.updating(*paths) as registry:
+        typo = registry.resolve("Улица Мовчанскго")
+        registry.resolve("Вокзал")
+    pairs = registry.near_duplicates()
+    assert [(id_a, id_b) for _, id_a, id_b in pairs] == [(1, typo)]
+    assert 0.8 <= pairs[0][0] < 1
+    assert registry.near_duplicates(ids=[2]) == []
+    with caplog.at_level(logging.WARNING):
+        stop_registry.log_near_duplicates(registry)
+    assert "Улица Мовчанского" in caplog.text and "Улица Мовчанскго" in caplog.text
+
+    # Известные остановки повторно не докладываются
+    caplog.clear()
+    with stop_registry.updating(*paths) as registry:
+        registry.resolve("Улица Мовчанскго")
+    stop_registry.log_near_duplicates(registry)
+    assert caplog.text == ""
+
+
+def test_seed_is_not_modified(paths):
+    path, seed = paths
+    _crawl(path, str(seed) + ".none", ["Вокзал", "Центр"])
+    with open(path, "rb") as f:
+        seed_bytes = f.read()
+    with open(seed, "wb") as f:
+        f.write(seed_bytes)
+    runtime = path + ".runtime"
+    ids = _crawl(runtime, seed, ["Центр", "Рынок"])
+    assert ids == {"Центр": 2, "Рынок": 3}
+    with open(seed, "rb") as f:
+        assert f.read() == seed_bytes
+    with open(runtime, encoding="utf-8") as f:
+        assert [stop["id"] for stop in json.load(f)["stops"]] == [1, 2, 3]
+    # Рабочий реестр уже есть - начальный больше не читается
+    assert StopRegistry(runtime, None).keys == StopRegistry(runtime, seed).keys
+
+
+def test_unreadable_file_is_ignored(paths, caplog):
+    path, seed = paths
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{не json")
+    assert len(StopRegistry(path, seed)) == 0
+    assert "не прочитан" in caplog.text
+
+
+def _add_names(path: str, seed: str, worker: int, count: int):
+    for i in range(count):
+        _crawl(path, seed, [f"Остановка {worker}-{i}"])
+
+
+def test_processes_do_not_lose_updates(paths):
+    """Несколько процессов дополняют реестр одновременно: ни одно название не теряется, ID не повторяются."""
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_add_names, args=(*paths, worker, 25)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    registry = StopRegistry(*paths)
+    assert len(registry) == 100
+    assert sorted(registry.names) == list(range(1, 101))
+
+# --- END OF FILE test_stop_registry.py ---
@@ -0,0 +1,86 @@
+# --- START OF FILE board.py ---
+
+"""
+Табло отправлений остановки по всем автобусам и троллейбусам.
+
+Для каждой остановки (по нормализованному названию из StopIndex) заранее
+собираются отсортированные массивы минут всех маршрутов, а запрос - это
+bisect в каждом массиве и k-путевое слияние через кучу, пока не набрано
+нужное число рейсов.
+"""
+
+import heapq
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from typing import NamedTuple
+
+from timetable.departures import stop_minutes
+from timetable.stop_index import StopIndex, StopOccurrence
+
+_ROUTE_KEYS = {"wd": "route_weekdays", "we": "route_weekends"}
+
+
+class BoardLine(NamedTuple):
+    """Маршрут, проходящий через остановку, и его времена отправления."""
+    occurrence: StopOccurrence
+    route_name: str
+    minutes: Sequence[int]
+
+
+class Departure(NamedTuple):
+    minute: int
+    line: BoardLine
+
+
+def route_destination(route_name: str) -> str:
+    """'Зеленый Луг - Завод «Могилевтрансмаш»' -> 'Завод «Могилевтрансмаш»'."""
+    for separator in (" – ", " - ", "–"):
+        if separator in route_name:
+            return route_name.rsplit(separator, 1)[1].strip()
+    return route_name
+
+
+class DepartureBoard:
+    """Табло для всех остановок индекса: {(id остановки, тип дня): [BoardLine, ...]}."""
+
+    def __init__(self, index: StopIndex, sources: Mapping[str, Mapping]):
+        self.index = index
+        self._lines: dict[tuple[int, str], list[BoardLine]] = {}
+        for key_id, occurrences in enumerate(index.occurrences):
+            for occ in occurrences:
+                try:
+                    route = sources[occ.transport_type][occ.number][_ROUTE_KEYS[occ.day_type]][occ.route_idx]
+                    minutes = stop_minutes(route["stops"][occ.stop_idx])
+                except (KeyError, IndexError):
+                    continue
+                if minutes:
+                    self._lines.setdefault((key_id, occ.day_type), []).append(
+                        BoardLine(occ, route.get("name", "Без названия"), minutes)
+                    )
+
+    def lines(self, key_id: int, day_type: str) -> list[BoardLine]:
+        return self._lines.get((key_id, day_type), [])
+
+    def upcoming(self, key_id: int, day_type: str, now_minute: int, limit: int = 10) -> list[Departure]:
+        """Ближайшие limit отправлений с остановки по всем маршрутам начиная с now_minute."""
+        heap = []
+        for line_idx, line in enumerate(self.lines(key_id, day_type)):
+            pos = bisect_left(line.minutes, now_minute)
+            if pos < len(line.minutes):
+                heap.append((line.minutes[pos], line_idx, pos))
+        heapq.heapify(heap)
+
+        lines = self._lines[(key_id, day_type)] if heap else ()
+        result = []
+        while heap and len(result) < limit:
+            minute, line_idx, pos = heap[0]
+            line = lines[line_idx]
+            result.append(Departure(minute, line))
+            pos += 1
+            if pos < len(line.minutes):
+                heapq.heapreplace(heap, (line.minutes[pos], line_idx, pos))
+            else:
+                heapq.heappop(heap)
+        return result
+
+# --- END OF FILE board.py ---
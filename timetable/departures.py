@@ -0,0 +1,64 @@
+# --- START OF FILE departures.py ---
+
+"""
+Поиск ближайших рейсов по отсортированным массивам минут.
+
+Все функции работают с минутами суток обслуживания (см. snapshot.service_minute):
+массивы остановок в снапшоте уже отсортированы, поэтому поиск - это один bisect.
+"""
+
+import datetime
+from bisect import bisect_left
+from collections.abc import Sequence
+
+from timetable.snapshot import SERVICE_DAY_START, format_time, normalize_times, service_minute
+
+
+def stop_minutes(stop) -> Sequence[int]:
+    """
+    Отсортированные минуты остановки.
+    Для снапшота - массив без копирования, для словаря из парсера - нормализуем строки.
+    """
+    minutes = getattr(stop, "minutes", None)
+    if minutes is not None:
+        return minutes
+    return normalize_times(stop.get("times") or [])
+
+
+def current_service_minute(now: datetime.datetime | None = None) -> int:
+    """Текущее время в минутах суток обслуживания (в 00:30 это 24:30 вчерашних суток)."""
+    now = now or datetime.datetime.now()
+    return service_minute(now.hour * 60 + now.minute)
+
+
+def service_date(now: datetime.datetime | None = None) -> datetime.date:
+    """Календарная дата суток обслуживания: до SERVICE_DAY_START это ещё вчера."""
+    now = now or datetime.datetime.now()
+    return (now - datetime.timedelta(minutes=SERVICE_DAY_START)).date()
+
+
+def day_type(day: datetime.date) -> str:
+    """Тип дня расписания для даты суток обслуживания: "wd" (пн-пт) или "we"."""
+    return "wd" if day.weekday() < 5 else "we"
+
+
+def next_departures(minutes: Sequence[int], now_minute: int, count: int = 5) -> Sequence[int]:
+    """Ближайшие count рейсов начиная с now_minute (включительно). O(log n)."""
+    start = bisect_left(minutes, now_minute)
+    return minutes[start:start + count]
+
+
+def group_by_hour(minutes: Sequence[int]) -> list[list[str]]:
+    """Группирует отсортированные минуты по часам: [['05:45', '05:58'], ['06:11', ...], ...]."""
+    rows = []
+    current_hour = None
+    for m in minutes:
+        hour = m // 60
+        if hour != current_hour:
+            rows.append([])
+            current_hour = hour
+        rows[-1].append(format_time(m))
+    return rows
+
+
+# --- END OF FILE departures.py ---
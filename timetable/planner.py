@@ -0,0 +1,212 @@
+# --- START OF FILE planner.py ---
+
+"""
+Планировщик поездок по расписанию (Connection Scan Algorithm).
+
+В данных есть только времена отправления по каждой остановке, поэтому рейсы
+восстанавливаются цепочкой: отправление с остановки i связывается с первым
+ещё не занятым отправлением с остановки i+1, которое не раньше его и не позже
+MAX_HOP_MINUTES. Каждая пара соседних остановок рейса - это "связь"
+(connection). Все связи одного типа дня хранятся в компактных массивах,
+отсортированных по (отправление, прибытие), а при равенстве - по порядку
+остановок рейса: связь с нулевым временем в пути (две остановки в одну
+минуту) идёт после связей, которые к ней подвозят. Запрос - один линейный
+проход от момента отправления до первой связи позже лучшего прибытия.
+
+Пересадки возможны между остановками с одинаковым нормализованным названием
+(идентификаторы остановок берутся из StopIndex).
+"""
+
+import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import NamedTuple
+
+from timetable.departures import stop_minutes
+from timetable.stop_index import StopIndex
+
+_ROUTE_KEYS = {"wd": "route_weekdays", "we": "route_weekends"}
+
+MAX_HOP_MINUTES = 30
+TRANSFER_MINUTES = 2
+MAX_TRANSFERS = 3
+_INF = 1 << 30
+
+
+class Line(NamedTuple):
+    """Направление маршрута, к которому относится рейс."""
+    transport_type: str
+    number: str
+    route_idx: int
+    route_name: str
+
+
+class Leg(NamedTuple):
+    """Участок поездки на одном рейсе."""
+    line: Line
+    from_stop: int
+    to_stop: int
+    departure: int
+    arrival: int
+
+
+class Itinerary(NamedTuple):
+    legs: tuple[Leg, ...]
+
+    @property
+    def departure(self) -> int:
+        return self.legs[0].departure
+
+    @property
+    def arrival(self) -> int:
+        return self.legs[-1].arrival
+
+    @property
+    def transfers(self) -> int:
+        return len(self.legs) - 1
+
+
+class ConnectionTable:
+    """Связи одного типа дня, отсортированные по (отправление, прибытие)."""
+
+    def __init__(self, index: StopIndex, sources: Mapping[str, Mapping], day_type: str):
+        self.lines: list[Line] = []
+        trip_lines = array.array("I")
+        connections = []  # (dep, arr, dep_stop, arr_stop, trip)
+        routes_key = _ROUTE_KEYS[day_type]
+
+        for transport_type, data in sources.items():
+            for number in data:
+                for route_idx, route in enumerate(data[number].get(routes_key) or []):
+                    stops = route.get("stops") or []
+                    stop_ids = [index.lookup(stop.get("name") or "") for stop in stops]
+                    if len(stops) < 2 or None in stop_ids:
+                        continue
+                    line_idx = len(self.lines)
+                    self.lines.append(Line(transport_type, number, route_idx, route.get("name", "Без названия")))
+                    self._chain_trips(stops, stop_ids, line_idx, trip_lines, connections)
+
+        # Сортировка устойчивая: равные (dep, arr) остаются в порядке остановок рейса
+        connections.sort(key=lambda c: (c[0], c[1]))
+        self.dep = array.array("H", (c[0] for c in connections))
+        self.arr = array.array("H", (c[1] for c in connections))
+        self.dep_stop = array.array("I", (c[2] for c in connections))
+        self.arr_stop = array.array("I", (c[3] for c in connections))
+        self.trip = array.array("I", (c[4] for c in connections))
+        self.trip_lines = trip_lines
+        self.n_stops = len(index)
+
+    @staticmethod
+    def _chain_trips(stops, stop_ids, line_idx, trip_lines, connections):
+        """Восстанавливает рейсы направления по временам соседних остановок."""
+        minutes = [stop_minutes(stop) for stop in stops]
+        trip_of = [None] * len(minutes[0])
+        for i in range(len(stops) - 1):
+            current, following = minutes[i], minutes[i + 1]
+            next_trip_of = [None] * len(following)
+            ptr = 0
+            for j, departure in enumerate(current):
+                trip = trip_of[j]
+                if trip is None:
+                    trip = len(trip_lines)
+                    trip_lines.append(line_idx)
+                while ptr < len(following) and following[ptr] < departure:
+                    ptr += 1
+                if ptr == len(following):
+                    break
+                arrival = following[ptr]
+                if arrival - departure > MAX_HOP_MINUTES:
+                    continue
+                connections.append((departure, arrival, stop_ids[i], stop_ids[i + 1], trip))
+                next_trip_of[ptr] = trip
+                ptr += 1
+            trip_of = next_trip_of
+
+    def __len__(self) -> int:
+        return len(self.dep)
+
+    def earliest_arrival(self, sources: set[int], targets: set[int], start_minute: int) -> Itinerary | None:
+        """Самая ранняя поездка из любой остановки sources в любую из targets с отправлением не раньше start_minute."""
+        ready = [_INF] * self.n_stops           # когда на остановке можно сесть в другой рейс
+        arrival = [_INF] * self.n_stops
+        journey_in: list[tuple[int, int] | None] = [None] * self.n_stops  # (связь посадки, связь высадки)
+        legs_count = [0] * self.n_stops
+        boarded: dict[int, int] = {}            # рейс -> связь, на которой в него сели
+        for stop in sources:
+            ready[stop] = start_minute
+            arrival[stop] = start_minute
+
+        dep, arr, dep_stop, arr_stop, trips = self.dep, self.arr, self.dep_stop, self.arr_stop, self.trip
+        best = _INF
+        for c in range(bisect_left(dep, start_minute), len(dep)):
+            departure = dep[c]
+            if departure >= best:
+                break
+            trip = trips[c]
+            board = boarded.get(trip)
+            if board is None:
+                stop = dep_stop[c]
+                if ready[stop] > departure or legs_count[stop] > MAX_TRANSFERS:
+                    continue
+                board = boarded[trip] = c
+            to_stop = arr_stop[c]
+            if arr[c] < arrival[to_stop]:
+                arrival[to_stop] = arr[c]
+                ready[to_stop] = arr[c] + TRANSFER_MINUTES
+                journey_in[to_stop] = (board, c)
+                legs_count[to_stop] = legs_count[dep_stop[board]] + 1
+                if to_stop in targets and arr[c] < best:
+                    best = arr[c]
+
+        target = min(targets, key=lambda stop: arrival[stop], default=None)
+        if target is None or arrival[target] >= _INF or target in sources:
+            return None
+        return self._reconstruct(journey_in, sources, target)
+
+    def _reconstruct(self, journey_in, sources, target) -> Itinerary | None:
+        legs = []
+        stop = target
+        while stop not in sources:
+            if journey_in[stop] is None or len(legs) > MAX_TRANSFERS + 1:
+                return None
+            board, alight = journey_in[stop]
+            legs.append(Leg(
+                self.lines[self.trip_lines[self.trip[board]]],
+                self.dep_stop[board], self.arr_stop[alight], self.dep[board], self.arr[alight]
+            ))
+            stop = self.dep_stop[board]
+        legs.reverse()
+        return Itinerary(tuple(legs))
+
+
+class JourneyPlanner:
+    """Планировщик для обоих типов дня: таблицы связей строятся один раз на снапшот."""
+
+    def __init__(self, index: StopIndex, sources: Mapping[str, Mapping]):
+        self.index = index
+        self.tables = {day_type: ConnectionTable(index, sources, day_type) for day_type in _ROUTE_KEYS}
+
+    def plan(self, from_stop: int, to_stop: int, day_type: str, start_minute: int, count: int = 3) -> list[Itinerary]:
+        """
+        До count поездок с отправлением не раньше start_minute.
+        Следующий вариант ищется с отправлением после предыдущего; если он
+        прибывает так же, оставляем тот, что выезжает позже.
+        """
+        table = self.tables[day_type]
+        sources, targets = {from_stop}, {to_stop}
+        found: list[Itinerary] = []
+        minute = start_minute
+        for _ in range(count * 4):
+            itinerary = table.earliest_arrival(sources, targets, minute)
+            if itinerary is None:
+                break
+            if found and itinerary.arrival <= found[-1].arrival:
+                found[-1] = itinerary
+            elif len(found) == count:
+                break
+            else:
+                found.append(itinerary)
+            minute = itinerary.departure + 1
+        return found
+
+# --- END OF FILE planner.py ---
@@ -0,0 +1,211 @@
+# --- START OF FILE schedule_cache.py ---
+
+"""
+Кэш расписания одного типа транспорта по схеме stale-while-revalidate.
+
+get() всегда сразу возвращает текущие данные. Если они устарели, запускается
+фоновое обновление в отдельном потоке, причём одно на кэш: повторные
+обращения во время обновления его не дублируют. Готовые данные подставляются
+одной заменой ссылки; если кэш привязан к event loop бота, замена и
+уведомление подписчиков выполняются в потоке loop, между обработкой
+апдейтов, чтобы хендлеры не видели наполовину сброшенные индексы.
+Блокирующей остаётся только самая первая загрузка (и принудительное
+обновление, которое вызывающий явно ждёт).
+"""
+
+import asyncio
+import datetime
+import logging
+import threading
+import time
+
+
+RETRY_INTERVAL = datetime.timedelta(minutes=15)
+
+
+def _running_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class ScheduleCache:
+    def __init__(self, transport_type: str, loader, max_age: datetime.timedelta, on_reload=None,
+                 retry_interval: datetime.timedelta = RETRY_INTERVAL, empty=dict):
+        """
+        loader(refresh: bool) возвращает данные расписания: refresh=False - прочитать
+        сохранённые, refresh=True - обновить с сайта. on_reload(transport_type, old, new)
+        вызывается после подстановки новых данных. empty() - пустые данные того же
+        типа, которые отдаются, пока загрузить ничего не удалось.
+        """
+        self.transport_type = transport_type
+        self.loader = loader
+        self.empty = empty
+        self.max_age = max_age
+        self.retry_interval = retry_interval
+        self.on_reload = on_reload
+        # False - устаревшие данные не обновляются в потоке бота (их обновляет внешний планировщик)
+        self.auto_refresh = True
+        self.data = None
+        self.loaded_at: datetime.datetime | None = None
+        # Метрики обновлений
+        self.refreshes = 0
+        self.failures = 0
+        self.last_duration: float | None = None
+        self.last_error: str | None = None
+        self.last_failure_at: datetime.datetime | None = None
+        self._refresh_lock = threading.Lock()   # одно обновление за раз
+        self._state_lock = threading.Lock()
+        self._background: threading.Thread | None = None
+        self._loads = 0  # успешные загрузки, меняется под _refresh_lock
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    # --- Доступ к данным ---
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or datetime.datetime.now() - self.loaded_at >= self.max_age
+
+    def _may_retry(self) -> bool:
+        """После неудачного обновления следующая фоновая попытка - не раньше чем через retry_interval."""
+        return self.last_failure_at is None or datetime.datetime.now() - self.last_failure_at >= self.retry_interval
+
+    def get(self, force_reload: bool = False):
+        """Текущие данные. Устаревшие обновляются в фоне, force_reload обновляет синхронно."""
+        self._remember_loop()
+        if self.data is None or force_reload:
+            return self.refresh(force_reload)
+        if self.auto_refresh and self.is_stale() and self._may_retry():
+            self.refresh_in_background()
+        return self.data
+
+    async def get_async(self):
+        """То же, что get(), но первая загрузка идёт в отдельном потоке, а не в event loop."""
+        self._remember_loop()
+        if self.data is None:
+            return await asyncio.to_thread(self.refresh)
+        return self.get()
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Event loop, в потоке которого подставляются данные фонового обновления."""
+        self._loop = loop
+
+    def _remember_loop(self):
+        if self._loop is None:
+            self._loop = _running_loop()
+
+    # --- Обновление ---
+
+    def refresh(self, force: bool = False):
+        """
+        Синхронное обновление. Если обновление уже идёт, ждёт его и
+        возвращает его результат вместо повторного обхода.
+        """
+        loads = self._loads
+        with self._refresh_lock:
+            if self._loads != loads and self.data is not None:
+                return self.data
+            new_data = self._load(force)
+        # Ждём замены вне блокировки: иначе обновление из потока loop могло бы ждать само себя
+        if new_data is not None:
+            self._publish(new_data, wait=True)
+        return self.data if self.data is not None else self.empty()
+
+    def refresh_in_background(self) -> bool:
+        """Запускает фоновое обновление, если оно ещё не идёт. Возвращает True, если запущено."""
+        with self._state_lock:
+            if self._background is not None:
+                return False
+            self._background = threading.Thread(
+                target=self._background_refresh, name=f"refresh-{self.transport_type}", daemon=True
+            )
+            self._background.start()
+        return True
+
+    @property
+    def refreshing(self) -> bool:
+        return self._background is not None or self._refresh_lock.locked()
+
+    def _background_refresh(self):
+        try:
+            with self._refresh_lock:
+                new_data = self._load()
+                if new_data is not None:
+                    # Пока замена ждёт очереди в loop, данные уже не считаются устаревшими
+                    self.loaded_at = datetime.datetime.now()
+                    self._publish(new_data, wait=False)
+        finally:
+            with self._state_lock:
+                self._background = None
+
+    def _load(self, force: bool = False):
+        """Загружает данные, считая время и ошибки. None - обновить не удалось."""
+        started = time.perf_counter()
+        # Данные уже есть (или обновление принудительное) - обновляем с сайта; нет - читаем сохранённые
+        refresh = force or self.data is not None
+        logging.info(f"Reloading {self.transport_type} schedule data (refresh={refresh})...")
+        try:
+            new_data = self.loader(refresh)
+        except Exception as e:
+            self.record_failure(e, time.perf_counter() - started)
+            return None
+        self._loads += 1
+        self._record_success(time.perf_counter() - started)
+        return new_data
+
+    def _record_success(self, duration: float):
+        self.refreshes += 1
+        self.last_duration = duration
+        logging.info(f"{self.transport_type.capitalize()} schedule data reloaded in {duration:.2f}s.")
+
+    def record_failure(self, error: Exception, duration: float):
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        self.last_failure_at = datetime.datetime.now()
+        self.last_duration = duration
+        logging.error(f"Error reloading {self.transport_type} schedule: {error}", exc_info=error)
+
+    def adopt(self, new_data, duration: float):
+        """Подставляет данные, загруженные извне (например, процессом обновления)."""
+        self._loads += 1
+        self._record_success(duration)
+        self._publish(new_data, wait=False)
+
+    def _publish(self, new_data, wait: bool):
+        """Подставляет данные в потоке привязанного event loop (или сразу, если loop нет или это его поток)."""
+        loop = self._loop
+        if loop is None or not loop.is_running() or _running_loop() is loop:
+            self._adopt(new_data)
+            return
+        adopted = threading.Event()
+
+        def adopt():
+            try:
+                self._adopt(new_data)
+            finally:
+                adopted.set()
+
+        loop.call_soon_threadsafe(adopt)
+        if wait:
+            adopted.wait()
+
+    def _adopt(self, new_data):
+        old_data = self.data
+        self.data = new_data
+        self.loaded_at = datetime.datetime.now()
+        if self.on_reload is not None:
+            self.on_reload(self.transport_type, old_data, new_data)
+
+    def status(self) -> dict:
+        return {
+            "loaded_at": self.loaded_at,
+            "stale": self.is_stale(),
+            "refreshing": self.refreshing,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "last_failure_at": self.last_failure_at,
+        }
+
+# --- END OF FILE schedule_cache.py ---
@@ -0,0 +1,653 @@
+# --- START OF FILE snapshot.py ---
+
+"""
+Бинарный снапшот расписания.
+
+Файл читается через mmap: при открытии проверяется только заголовок и
+контрольная сумма, а строки и времена разбираются по требованию при обращении.
+
+Раскладка (little-endian, все секции выровнены по 4 байта):
+
+    заголовок      _HEADER (64 байта)
+    str_offsets    uint32[n_strings + 1]  - смещения строк в str_blob
+    str_blob       utf-8 байты всех строк (номера, названия маршрутов и остановок)
+    vehicles       uint32[n_vehicles * 6] - number, route_name, wd_first, wd_count, we_first, we_count
+    routes         uint32[n_routes * 3]   - name, first_stop, stop_count
+    stops          uint32[n_stops * 4]    - name, stop_id, first_time, time_count
+    times          uint16[n_times]        - минуты суток обслуживания, по возрастанию
+                                            (одинаковые массивы, например будни и выходные
+                                            одной остановки, записываются один раз)
+
+Времена каждой остановки хранятся отсортированными в порядке суток обслуживания:
+рейсы до SERVICE_DAY_START (00:15, 01:05) считаются продолжением вечера и
+записываются как 1440 + минуты, поэтому идут после 23:xx.
+
+stop_id - постоянный ID остановки из реестра (timetable.stop_registry), 0 - нет ID.
+По нему find_stop() находит остановку за O(1) и после обновления расписания,
+даже если остановки в направлении переставлены.
+
+Хендлеры обращаются к данным через типизированные свойства и методы
+(snap.route(number, "wd", route_idx).stops[i].name) - без словарей и цепочек
+.get(). Для совместимости с кодом, который работает со словарями из JSON,
+Snapshot и его представления также реализуют Mapping/Sequence с теми же
+ключами ("number", "route_weekdays", "stops", "times", ...).
+"""
+
+import array
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from collections.abc import Mapping, Sequence
+
+from timetable import stop_registry
+
+MAGIC = b"MGLVSNAP"
+FORMAT_VERSION = 3
+
+KIND_BUS = "bus"
+KIND_TROLLEYBUS = "trolleybus"
+
+# magic, version, flags, checksum, kind, n_strings, n_vehicles, n_routes, n_stops, n_times,
+# off_str_offsets, off_str_blob, off_vehicles, off_routes, off_stops, off_times
+_HEADER = struct.Struct("<8sHHI12I")
+
+_VEHICLE_FIELDS = 6
+_ROUTE_FIELDS = 3
+_STOP_FIELDS = 4
+
+# Сутки обслуживания начинаются в 03:00: более ранние рейсы относятся к предыдущему дню
+SERVICE_DAY_START = 3 * 60
+MINUTES_PER_DAY = 24 * 60
+
+_ROUTE_KEYS = {0: "route_weekdays", 1: "route_weekends"}
+# Типы дня, как в хендлерах и индексах: "wd" - будни, "we" - выходные
+_DAY_INDEX = {"wd": 0, "we": 1}
+
+_TIME_RE = re.compile(r"^\s*(\d{1,2}):(\d{2})(?::\d{2})?\s*([AaPp][Mm])?\s*$")
+
+
+class SnapshotError(Exception):
+    """Файл снапшота повреждён или имеет неподдерживаемую версию."""
+
+
+def parse_time(value: str) -> int | None:
+    """
+    Переводит строку времени в минуты от полуночи.
+    Понимает "5:28", "05:45" и "8:35:00 PM". Для мусора вроде "ВД" возвращает None.
+    """
+    match = _TIME_RE.match(value)
+    if not match:
+        return None
+    hour, minute, suffix = int(match.group(1)), int(match.group(2)), match.group(3)
+    if suffix:
+        hour = hour % 12 + (12 if suffix.lower() == "pm" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+
+def format_time(minutes: int) -> str:
+    """Минуты от полуночи (или минуты суток обслуживания) -> 'HH:MM'."""
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+
+def service_minute(minutes: int) -> int:
+    """Минуты от полуночи -> минуты суток обслуживания (00:15 -> 24:15)."""
+    return minutes + MINUTES_PER_DAY if minutes < SERVICE_DAY_START else minutes
+
+
+def normalize_times(times) -> list[int]:
+    """Строки времени -> отсортированные минуты суток обслуживания (мусор отбрасывается)."""
+    return sorted(service_minute(m) for m in map(parse_time, times) if m is not None)
+
+
+def default_snapshot_path(json_path: str | None) -> str | None:
+    """Путь снапшота рядом с JSON-файлом расписания: data/bus_schedule.json -> data/bus_schedule.snap."""
+    if not json_path:
+        return None
+    return os.path.splitext(json_path)[0] + ".snap"
+
+
+# --- Запись ---
+
+def _pad4(buf: bytearray):
+    buf.extend(b"\0" * (-len(buf) % 4))
+
+
+def _as_le(arr: array.array) -> bytes:
+    if sys.byteorder != "little":
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def build_snapshot(vehicles, kind: str) -> bytes:
+    """
+    Собирает снапшот из данных в формате парсеров.
+    vehicles - список словарей транспорта или словарь {номер: транспорт}.
+    """
+    if isinstance(vehicles, Mapping):
+        vehicles = list(vehicles.values())
+    # Как и раньше при сборке словаря по номеру: при дублях побеждает последний
+    vehicles = list({v["number"]: v for v in vehicles}.values())
+
+    strings: dict[str, int] = {}
+
+    def sid(text) -> int:
+        text = "" if text is None else str(text)
+        if text not in strings:
+            strings[text] = len(strings)
+        return strings[text]
+
+    kind_sid = sid(kind)
+    vehicle_tab = array.array("I")
+    route_tab = array.array("I")
+    stop_tab = array.array("I")
+    times = array.array("H")
+    runs: dict[tuple, int] = {}  # массив времён -> его смещение в times
+
+    for vehicle in vehicles:
+        entry = [sid(vehicle.get("number")), sid(vehicle.get("route_name"))]
+        for day in (0, 1):
+            routes = vehicle.get(_ROUTE_KEYS[day]) or []
+            entry += [len(route_tab) // _ROUTE_FIELDS, len(routes)]
+            for route in routes:
+                stops = route.get("stops") or []
+                route_tab.extend((sid(route.get("name")), len(stop_tab) // _STOP_FIELDS, len(stops)))
+                for stop in stops:
+                    minutes = tuple(normalize_times(stop.get("times") or []))
+                    first = runs.get(minutes)
+                    if first is None:
+                        first = runs[minutes] = len(times)
+                        times.extend(minutes)
+                    stop_tab.extend((sid(stop.get("name")), stop.get("stop_id") or 0, first, len(minutes)))
+        vehicle_tab.extend(entry)
+
+    blob = bytearray()
+    str_offsets = array.array("I", [0])
+    for text in strings:  # dict сохраняет порядок вставки = порядок идентификаторов
+        blob += text.encode("utf-8")
+        str_offsets.append(len(blob))
+
+    body = bytearray()
+    offsets = []
+    for section in (_as_le(str_offsets), bytes(blob), _as_le(vehicle_tab),
+                    _as_le(route_tab), _as_le(stop_tab), _as_le(times)):
+        offsets.append(_HEADER.size + len(body))
+        body += section
+        _pad4(body)
+
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, 0, zlib.crc32(body), kind_sid, len(strings),
+        len(vehicle_tab) // _VEHICLE_FIELDS, len(route_tab) // _ROUTE_FIELDS,
+        len(stop_tab) // _STOP_FIELDS, len(times), *offsets
+    )
+    return header + bytes(body)
+
+
+def write_snapshot(path: str, vehicles, kind: str):
+    """
+    Атомарно записывает снапшот: временный файл + os.replace.
+    Процессы, которые уже держат mmap старого файла, продолжают читать старую версию.
+    """
+    data = build_snapshot(vehicles, kind)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _detect_kind(vehicles) -> str:
+    for vehicle in vehicles:
+        for key in _ROUTE_KEYS.values():
+            for route in vehicle.get(key) or []:
+                if "trolleybus_number" in route:
+                    return KIND_TROLLEYBUS
+                if "bus_number" in route:
+                    return KIND_BUS
+    raise ValueError("Не удалось определить тип транспорта по данным")
+
+
+def convert_json(json_path: str, snapshot_path: str | None = None, kind: str | None = None,
+                 registry_path: str | None = stop_registry.REGISTRY_PATH) -> str:
+    """
+    Конвертирует JSON-файл расписания (формат saveScheduleToFile) в снапшот, присваивая
+    остановкам ID из реестра registry_path (None - без реестра). Возвращает путь снапшота.
+    """
+    snapshot_path = snapshot_path or default_snapshot_path(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        vehicles = json.load(f)
+    kind = kind or _detect_kind(vehicles)
+    if registry_path:
+        with stop_registry.updating(registry_path) as registry:
+            vehicles = stop_registry.normalize(vehicles, registry)
+    write_snapshot(snapshot_path, vehicles, kind)
+    return snapshot_path
+
+
+def load_or_convert(snapshot_path: str | None, json_path: str | None = None, kind: str | None = None,
+                    registry_path: str | None = stop_registry.REGISTRY_PATH):
+    """
+    Открывает снапшот. Если его нет (или JSON новее), конвертирует старый JSON-файл
+    (ID остановок - из реестра registry_path, см. convert_json).
+    Возвращает Snapshot или None, если данных нет.
+    """
+    if not snapshot_path:
+        return None
+    try:
+        json_exists = bool(json_path) and os.path.exists(json_path)
+        if os.path.exists(snapshot_path):
+            stale = json_exists and os.path.getmtime(json_path) > os.path.getmtime(snapshot_path)
+            if not stale:
+                try:
+                    return Snapshot.open(snapshot_path)
+                except SnapshotError as e:
+                    if not json_exists:
+                        raise
+                    logging.warning(f"Снапшот {snapshot_path} не подходит ({e}), пересобираем из JSON")
+        if json_exists:
+            logging.info(f"Конвертируем {json_path} -> {snapshot_path}")
+            convert_json(json_path, snapshot_path, kind, registry_path)
+            return Snapshot.open(snapshot_path)
+    except (OSError, ValueError, SnapshotError) as e:
+        logging.warning(f"Ошибка загрузки снапшота {snapshot_path}: {e}")
+    return None
+
+
+# --- Чтение ---
+
+class Snapshot(Mapping):
+    """Снапшот расписания одного типа транспорта: {номер: VehicleView}."""
+
+    __slots__ = ("path", "kind", "version", "_mm", "_buf", "_str_offsets", "_str_blob",
+                 "_vehicles", "_routes", "_stops", "_times", "_strings", "_numbers", "_stop_refs")
+
+    def __init__(self, buffer, path: str | None = None, mm: mmap.mmap | None = None):
+        self.path = path
+        self._mm = mm
+        # Проверка - на временном view: при ошибке он отпускается, и open() может закрыть mmap
+        with memoryview(buffer) as view:
+            if len(view) < _HEADER.size:
+                raise SnapshotError("файл короче заголовка")
+            (magic, version, _flags, checksum, kind_sid, n_strings, n_vehicles, n_routes, n_stops, n_times,
+             off_str_offsets, off_str_blob, off_vehicles, off_routes, off_stops, off_times) = _HEADER.unpack_from(view)
+            if magic != MAGIC:
+                raise SnapshotError("неверная сигнатура")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"версия формата {version}, ожидается {FORMAT_VERSION}")
+            if zlib.crc32(view[_HEADER.size:]) != checksum:
+                raise SnapshotError("контрольная сумма не совпадает")
+        self._buf = memoryview(buffer)
+        self.version = checksum
+
+        self._str_offsets = self._section(off_str_offsets, n_strings + 1, "I")
+        self._str_blob = self._buf[off_str_blob:off_str_blob + self._str_offsets[n_strings]]
+        self._vehicles = self._section(off_vehicles, n_vehicles * _VEHICLE_FIELDS, "I")
+        self._routes = self._section(off_routes, n_routes * _ROUTE_FIELDS, "I")
+        self._stops = self._section(off_stops, n_stops * _STOP_FIELDS, "I")
+        self._times = self._section(off_times, n_times, "H")
+        self._strings: list[str | None] = [None] * n_strings
+        self.kind = self.string(kind_sid)
+        self._numbers = {self.string(self._vehicles[i * _VEHICLE_FIELDS]): i for i in range(n_vehicles)}
+        self._stop_refs: dict[tuple, list[tuple[int, int]]] | None = None
+
+    def _section(self, offset: int, count: int, typecode: str):
+        size = array.array(typecode).itemsize
+        raw = self._buf[offset:offset + count * size]
+        if len(raw) != count * size:
+            raise SnapshotError("секция выходит за границы файла")
+        if sys.byteorder == "little":
+            return raw.cast(typecode)
+        arr = array.array(typecode, raw.tobytes())
+        arr.byteswap()
+        return arr
+
+    @classmethod
+    def open(cls, path: str) -> "Snapshot":
+        """Отображает файл в память (только чтение)."""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(mm, path=path, mm=mm)
+        except Exception:
+            mm.close()
+            raise
+
+    def string(self, sid: int) -> str:
+        """Строка из таблицы строк (декодируется один раз и интернируется)."""
+        text = self._strings[sid]
+        if text is None:
+            text = sys.intern(str(self._str_blob[self._str_offsets[sid]:self._str_offsets[sid + 1]], "utf-8"))
+            self._strings[sid] = text
+        return text
+
+    @classmethod
+    def empty(cls, kind: str) -> "Snapshot":
+        """Снапшот без транспорта (в памяти) - пока данные не загружены."""
+        return cls(build_snapshot([], kind))
+
+    # --- Типизированный доступ (O(1): номер -> индекс, дальше арифметика по таблицам) ---
+
+    def vehicle(self, number: str) -> "VehicleView":
+        """Транспорт по номеру. KeyError, если его нет."""
+        return VehicleView(self, self._numbers[number])
+
+    def route(self, number: str, day_type: str, route_idx: int) -> "RouteView":
+        """Направление транспорта на тип дня ("wd"/"we"). KeyError/IndexError, если его нет."""
+        vehicle_idx = self._numbers[number]
+        return RouteView(self, vehicle_idx, self._route_id(vehicle_idx, day_type, route_idx))
+
+    def stop(self, number: str, day_type: str, route_idx: int, stop_idx: int) -> "StopView":
+        """Остановка направления. KeyError/IndexError, если её нет."""
+        base = self._route_id(self._numbers[number], day_type, route_idx) * _ROUTE_FIELDS
+        return StopView(self, _nth(self._routes[base + 1], self._routes[base + 2], stop_idx, "stop"))
+
+    def _route_id(self, vehicle_idx: int, day_type: str, route_idx: int) -> int:
+        base = vehicle_idx * _VEHICLE_FIELDS + 2 + 2 * _DAY_INDEX[day_type]
+        return _nth(self._vehicles[base], self._vehicles[base + 1], route_idx, "route")
+
+    def find_stop(self, number: str, day_type: str, route_idx: int, stop_id: int) -> tuple[int, int]:
+        """
+        (route_idx, stop_idx) остановки с постоянным ID stop_id. Предпочитает направление
+        route_idx; если там её нет (направления переставлены) - первое направление с ней.
+        KeyError, если у транспорта в этот тип дня такой остановки нет.
+        """
+        if self._stop_refs is None:
+            self._stop_refs = self._build_stop_refs()
+        refs = self._stop_refs[(self._numbers[number], _DAY_INDEX[day_type], stop_id)]
+        for ref in refs:
+            if ref[0] == route_idx:
+                return ref
+        return refs[0]
+
+    def _build_stop_refs(self) -> dict:
+        refs: dict[tuple, list[tuple[int, int]]] = {}
+        for vehicle_idx in range(len(self._numbers)):
+            for day, day_index in _DAY_INDEX.items():
+                base = vehicle_idx * _VEHICLE_FIELDS + 2 + 2 * day_index
+                first_route, route_count = self._vehicles[base], self._vehicles[base + 1]
+                for route_idx in range(route_count):
+                    route_base = (first_route + route_idx) * _ROUTE_FIELDS
+                    first_stop, stop_count = self._routes[route_base + 1], self._routes[route_base + 2]
+                    for stop_idx in range(stop_count):
+                        stop_id = self._stops[(first_stop + stop_idx) * _STOP_FIELDS + 1]
+                        if stop_id:
+                            key = (vehicle_idx, day_index, stop_id)
+                            positions = refs.setdefault(key, [])
+                            # Кольцевой маршрут проходит остановку дважды - ссылка ведёт на первое появление
+                            if not positions or positions[-1][0] != route_idx:
+                                positions.append((route_idx, stop_idx))
+        return refs
+
+    def stop_minutes(self, row: int) -> memoryview:
+        """Отсортированные минуты суток обслуживания остановки (строка row таблицы остановок, uint16, без копирования)."""
+        base = row * _STOP_FIELDS
+        first = self._stops[base + 2]
+        return self._times[first:first + self._stops[base + 3]]
+
+    def __getitem__(self, number: str) -> "VehicleView":
+        return VehicleView(self, self._numbers[number])
+
+    def __iter__(self):
+        return iter(self._numbers)
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def __contains__(self, number) -> bool:
+        return number in self._numbers
+
+    def to_list(self) -> list[dict]:
+        """Выгружает снапшот в обычные словари (формат JSON-файла парсеров)."""
+        return [_to_plain(vehicle) for vehicle in self.values()]
+
+    def close(self):
+        """Закрывает отображение. Если живы представления, память освободится сборщиком мусора."""
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass
+
+    def __repr__(self):
+        return f"<Snapshot {self.kind} v{FORMAT_VERSION} {self.version:08x} vehicles={len(self)} path={self.path!r}>"
+
+
+def _nth(first: int, count: int, idx: int, what: str) -> int:
+    """Номер записи idx-го элемента последовательности (first, count), с отрицательными индексами как у list."""
+    if idx < 0:
+        idx += count
+    if not 0 <= idx < count:
+        raise IndexError(f"{what} index out of range")
+    return first + idx
+
+
+def _to_plain(value):
+    if isinstance(value, Mapping):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+class VehicleView(Mapping):
+    """Транспорт: ключи number, route_name, route_weekdays, route_weekends."""
+
+    __slots__ = ("_snap", "_idx")
+    _KEYS = ("number", "route_name", "route_weekdays", "route_weekends")
+
+    def __init__(self, snap: Snapshot, idx: int):
+        self._snap = snap
+        self._idx = idx
+
+    @property
+    def number(self) -> str:
+        return self._snap.string(self._snap._vehicles[self._idx * _VEHICLE_FIELDS])
+
+    @property
+    def route_name(self) -> str:
+        return self._snap.string(self._snap._vehicles[self._idx * _VEHICLE_FIELDS + 1])
+
+    def routes(self, day_type: str) -> "RouteListView":
+        """Направления на тип дня: "wd" - будни, "we" - выходные."""
+        base = self._idx * _VEHICLE_FIELDS + 2 + 2 * _DAY_INDEX[day_type]
+        table = self._snap._vehicles
+        return RouteListView(self._snap, self._idx, table[base], table[base + 1])
+
+    def __getitem__(self, key):
+        base = self._idx * _VEHICLE_FIELDS
+        table = self._snap._vehicles
+        if key == "number":
+            return self._snap.string(table[base])
+        if key == "route_name":
+            return self._snap.string(table[base + 1])
+        if key == "route_weekdays":
+            return RouteListView(self._snap, self._idx, table[base + 2], table[base + 3])
+        if key == "route_weekends":
+            return RouteListView(self._snap, self._idx, table[base + 4], table[base + 5])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+
+class RouteListView(Sequence):
+    """Список направлений транспорта на один тип дня."""
+
+    __slots__ = ("_snap", "_vehicle_idx", "_first", "_count")
+
+    def __init__(self, snap: Snapshot, vehicle_idx: int, first: int, count: int):
+        self._snap = snap
+        self._vehicle_idx = vehicle_idx
+        self._first = first
+        self._count = count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._count))]
+        return RouteView(self._snap, self._vehicle_idx, _nth(self._first, self._count, idx, "route"))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class RouteView(Mapping):
+    """Направление: ключи <kind>_number, name, stops."""
+
+    __slots__ = ("_snap", "_vehicle_idx", "_idx")
+
+    def __init__(self, snap: Snapshot, vehicle_idx: int, idx: int):
+        self._snap = snap
+        self._vehicle_idx = vehicle_idx
+        self._idx = idx
+
+    @property
+    def number(self) -> str:
+        """Номер транспорта (в снапшоте не повторяется в каждом направлении)."""
+        return self._snap.string(self._snap._vehicles[self._vehicle_idx * _VEHICLE_FIELDS])
+
+    @property
+    def name(self) -> str:
+        return self._snap.string(self._snap._routes[self._idx * _ROUTE_FIELDS])
+
+    @property
+    def stops(self) -> "StopListView":
+        base = self._idx * _ROUTE_FIELDS
+        return StopListView(self._snap, self._snap._routes[base + 1], self._snap._routes[base + 2])
+
+    def _keys(self):
+        return (f"{self._snap.kind}_number", "name", "stops")
+
+    def __getitem__(self, key):
+        if key == "name":
+            return self.name
+        if key == "stops":
+            return self.stops
+        if key == f"{self._snap.kind}_number":
+            return self.number
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return 3
+
+
+class StopListView(Sequence):
+    """Список остановок направления."""
+
+    __slots__ = ("_snap", "_first", "_count")
+
+    def __init__(self, snap: Snapshot, first: int, count: int):
+        self._snap = snap
+        self._first = first
+        self._count = count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._count))]
+        return StopView(self._snap, _nth(self._first, self._count, idx, "stop"))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class StopView(Mapping):
+    """Остановка: ключи name, stop_id, times. Сырые минуты доступны через .minutes."""
+
+    __slots__ = ("_snap", "_idx")
+    _KEYS = ("name", "stop_id", "times")
+
+    def __init__(self, snap: Snapshot, idx: int):
+        self._snap = snap
+        self._idx = idx
+
+    @property
+    def name(self) -> str:
+        return self._snap.string(self._snap._stops[self._idx * _STOP_FIELDS])
+
+    @property
+    def stop_id(self) -> int:
+        """Постоянный ID остановки из реестра (0 - снапшот собран без реестра)."""
+        return self._snap._stops[self._idx * _STOP_FIELDS + 1]
+
+    @property
+    def minutes(self) -> memoryview:
+        return self._snap.stop_minutes(self._idx)
+
+    def __getitem__(self, key):
+        if key == "name":
+            return self.name
+        if key == "stop_id":
+            return self.stop_id
+        if key == "times":
+            return TimesView(self.minutes)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+
+class TimesView(Sequence):
+    """Времена остановки в виде строк 'HH:MM' (форматируются при обращении)."""
+
+    __slots__ = ("_minutes",)
+
+    def __init__(self, minutes):
+        self._minutes = minutes
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [format_time(m) for m in self._minutes[idx]]
+        return format_time(self._minutes[idx])
+
+    def __len__(self) -> int:
+        return len(self._minutes)
+
+
+# --- Конвертер ---
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    arg_parser = argparse.ArgumentParser(description="Конвертер JSON-расписания в бинарный снапшот")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert", help="JSON -> снапшот")
+    conv.add_argument("json_path")
+    conv.add_argument("-o", "--output", help="путь снапшота (по умолчанию рядом с JSON, .snap)")
+    conv.add_argument("--kind", choices=[KIND_BUS, KIND_TROLLEYBUS])
+    info = sub.add_parser("info", help="показать заголовок снапшота")
+    info.add_argument("snapshot_path")
+    args = arg_parser.parse_args()
+
+    if args.command == "convert":
+        out = convert_json(args.json_path, args.output, args.kind)
+        logging.info(f"Готово: {out} ({os.path.getsize(out)} байт)")
+    else:
+        snap = Snapshot.open(args.snapshot_path)
+        n_times = len(snap._times)
+        print(f"{snap!r}\nмаршрутов: {len(snap._routes) // _ROUTE_FIELDS}, "
+              f"остановок: {len(snap._stops) // _STOP_FIELDS}, времён: {n_times}, строк: {len(snap._strings)}")
+
+# --- END OF FILE snapshot.py ---
@@ -0,0 +1,155 @@
+# --- START OF FILE stop_index.py ---
+
+"""
+Индекс остановок по названию для обоих типов транспорта.
+
+Название нормализуется (регистр, ё/е, кавычки и пунктуация), после чего
+поиск идёт в три этапа: точное совпадение, префикс любого слова
+(отсортированный список суффиксов + bisect) и нечёткое совпадение по триграммам.
+"""
+
+import re
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import NamedTuple
+
+DAY_WD = "wd"
+DAY_WE = "we"
+_ROUTE_KEYS = {DAY_WD: "route_weekdays", DAY_WE: "route_weekends"}
+
+_PUNCT_RE = re.compile(r"[^\w]+")
+
+FUZZY_THRESHOLD = 0.45
+
+
+class StopOccurrence(NamedTuple):
+    """Одно появление остановки в расписании."""
+    transport_type: str
+    number: str
+    day_type: str
+    route_idx: int
+    stop_idx: int
+
+
+def normalize_stop_name(name: str) -> str:
+    """'Зелёный Луг' / 'зеленый  луг.' -> 'зеленый луг'."""
+    name = name.lower().replace("ё", "е")
+    return " ".join(_PUNCT_RE.sub(" ", name).split())
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StopIndex:
+    """
+    Индекс {нормализованное название: [StopOccurrence, ...]}.
+    Строится из словаря {тип транспорта: данные расписания}.
+    """
+
+    def __init__(self, sources: Mapping[str, Mapping]):
+        occurrences: dict[str, list[StopOccurrence]] = {}
+        display: dict[str, str] = {}
+        stop_ids: dict[str, int] = {}
+        for transport_type, data in sources.items():
+            for number in data:
+                vehicle = data[number]
+                for day_type, routes_key in _ROUTE_KEYS.items():
+                    for route_idx, route in enumerate(vehicle.get(routes_key) or []):
+                        for stop_idx, stop in enumerate(route.get("stops") or []):
+                            name = stop.get("name") or ""
+                            key = normalize_stop_name(name)
+                            if not key:
+                                continue
+                            display.setdefault(key, name)
+                            if stop.get("stop_id"):
+                                stop_ids.setdefault(key, stop["stop_id"])
+                            occurrences.setdefault(key, []).append(
+                                StopOccurrence(transport_type, number, day_type, route_idx, stop_idx)
+                            )
+
+        self.keys: list[str] = sorted(occurrences)
+        self.names: list[str] = [display[key] for key in self.keys]
+        self.occurrences: list[list[StopOccurrence]] = [occurrences[key] for key in self.keys]
+        self._ids = {key: i for i, key in enumerate(self.keys)}
+        # Постоянные ID остановок (реестр): не меняются при перестройке индекса после обновления
+        self.stop_ids: list[int] = [stop_ids.get(key, 0) for key in self.keys]
+        self._by_stop_id = {stop_id: key_id for key_id, stop_id in enumerate(self.stop_ids) if stop_id}
+
+        # Суффиксы по словам: 'зеленый луг' -> 'зеленый луг', 'луг'
+        suffixes = []
+        for key_id, key in enumerate(self.keys):
+            words = key.split(" ")
+            for i in range(len(words)):
+                suffixes.append((" ".join(words[i:]), key_id))
+        suffixes.sort()
+        self._suffixes = suffixes
+
+        self._trigram_index: dict[str, list[int]] = {}
+        self._trigram_counts: list[int] = []
+        for key_id, key in enumerate(self.keys):
+            grams = _trigrams(key)
+            self._trigram_counts.append(len(grams))
+            for gram in grams:
+                self._trigram_index.setdefault(gram, []).append(key_id)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, name: str) -> int | None:
+        """Идентификатор остановки по точному (после нормализации) названию."""
+        return self._ids.get(normalize_stop_name(name))
+
+    def by_stop_id(self, stop_id: int) -> int | None:
+        """Идентификатор в индексе по постоянному ID остановки."""
+        return self._by_stop_id.get(stop_id)
+
+    def prefix_search(self, query: str, limit: int = 10) -> list[int]:
+        """Остановки, у которых одно из слов (с продолжением) начинается с query."""
+        query = normalize_stop_name(query)
+        if not query:
+            return []
+        found = []
+        i = bisect_left(self._suffixes, (query, -1))
+        while i < len(self._suffixes) and len(found) < limit:
+            suffix, key_id = self._suffixes[i]
+            if not suffix.startswith(query):
+                break
+            if key_id not in found:
+                found.append(key_id)
+            i += 1
+        return found
+
+    def fuzzy_search(self, query: str, limit: int = 10, threshold: float = FUZZY_THRESHOLD) -> list[int]:
+        """Поиск с опечатками: коэффициент Дайса по триграммам."""
+        query = normalize_stop_name(query)
+        if not query:
+            return []
+        grams = _trigrams(query)
+        common: dict[int, int] = {}
+        for gram in grams:
+            for key_id in self._trigram_index.get(gram, ()):
+                common[key_id] = common.get(key_id, 0) + 1
+        scored = []
+        for key_id, shared in common.items():
+            score = 2 * shared / (len(grams) + self._trigram_counts[key_id])
+            if score >= threshold:
+                scored.append((-score, self.keys[key_id], key_id))
+        scored.sort()
+        return [key_id for _, _, key_id in scored[:limit]]
+
+    def search(self, query: str, limit: int = 10) -> list[int]:
+        """Точное совпадение, затем префиксные, затем нечёткие результаты (без повторов)."""
+        results = []
+        exact = self.lookup(query)
+        if exact is not None:
+            results.append(exact)
+        for key_id in self.prefix_search(query, limit) + self.fuzzy_search(query, limit):
+            if len(results) >= limit:
+                break
+            if key_id not in results:
+                results.append(key_id)
+        return results
+
+# --- END OF FILE stop_index.py ---
@@ -0,0 +1,254 @@
+# --- START OF FILE stop_registry.py ---
+
+"""
+Реестр остановок: постоянные целые ID по каноническому названию.
+
+Одна и та же остановка на сайте пишется по-разному ("Поликлиника № 12" у
+автобусов, "Поликлиника  №12" у троллейбусов, кавычки "" и «»). Этап
+нормализации после разбора страниц (normalize) сводит все написания к одному
+ключу (stop_index.normalize_stop_name), выдаёт ключу ID и записывает в каждую
+остановку "stop_id" и единое отображаемое название. ID хранятся в файле
+(STOP_REGISTRY_PATH) и не меняются между обновлениями расписания, поэтому
+на них могут ссылаться избранное и callback data.
+
+Файл: {"stops": [{"id", "key", "name"}], "aliases": {написание: id}}.
+
+В git лежит только начальный реестр (STOP_REGISTRY_SEED, data/stops.json) -
+его не меняют. Рабочий реестр, который дополняется при обновлениях, - отдельный
+файл; при первом запуске он начинается с копии начального. Его меняют и бот,
+и процесс обновления (parsers/refresh_worker.py), поэтому updating() держит
+блокировку файла (flock на <путь>.lock) от чтения до записи, а запись идёт
+через временный файл и os.replace.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from timetable.stop_index import normalize_stop_name
+
+load_dotenv()
+
+REGISTRY_PATH = os.getenv("STOP_REGISTRY_PATH", "data/stop_registry.json")
+SEED_PATH = os.getenv("STOP_REGISTRY_SEED", "data/stops.json")
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Аббревиатуры, которые .title() портит ("Мвд"), а сайт местами пишет строчными ("тэц")
+ABBREVIATIONS = ("МВД", "ОАО", "ЗАО", "ОДО", "ТЭЦ", "ГАИ", "ДК", "СШ", "РОВД")
+
+_ABBREVIATION_RE = re.compile(r"\b(" + "|".join(ABBREVIATIONS) + r")\b", re.IGNORECASE)
+_QUOTED_RE = re.compile(r'"([^"]*)"')
+_SPACES_RE = re.compile(r"\s+")
+_NUMBER_SIGN_RE = re.compile(r"№\s*")
+
+_lock = threading.Lock()
+
+
+def tidy_name(name: str) -> str:
+    """Приводит написание к одному виду: пробелы, кавычки «», '№ 12', регистр аббревиатур."""
+    name = _SPACES_RE.sub(" ", name).strip()
+    letters = [char for char in name if char.isalpha()]
+    if letters and (all(char.isupper() for char in letters) or all(char.islower() for char in letters)):
+        name = name.title()  # НАЗВАНИЕ КАПСОМ / название строчными -> Название
+    name = _QUOTED_RE.sub(r"«\1»", name)
+    name = _NUMBER_SIGN_RE.sub("№ ", name)
+    return _ABBREVIATION_RE.sub(lambda match: match.group(1).upper(), name)
+
+
+def _capitals(name: str) -> int:
+    return sum(char.isupper() for char in name)
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StopRegistry:
+    """{ID: каноническое название}; ключ и любое встреченное написание -> ID за O(1)."""
+
+    def __init__(self, path: str | None = REGISTRY_PATH, seed_path: str | None = SEED_PATH):
+        """path - рабочий реестр (сюда сохраняется); пока его нет, читается начальный seed_path."""
+        self.path = path
+        self.names: dict[int, str] = {}
+        self.keys: dict[str, int] = {}
+        self.aliases: dict[str, int] = {}
+        self.added: list[int] = []  # ID, выданные этим экземпляром
+        self._dirty = False
+        source = path if path and os.path.exists(path) else seed_path
+        if source and os.path.exists(source):
+            try:
+                with open(source, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for stop in data.get("stops", []):
+                    self.names[stop["id"]] = stop["name"]
+                    self.keys[stop["key"]] = stop["id"]
+                self.aliases = {alias: int(stop_id) for alias, stop_id in data.get("aliases", {}).items()}
+            except (json.JSONDecodeError, KeyError, IOError) as e:
+                # Без файла ID раздаются заново: ссылки в избранном останутся, но могут указать мимо
+                logging.error(f"Реестр остановок {source} не прочитан: {e}")
+            self._dirty = source != path  # копия начального реестра сохранится в рабочий
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def resolve(self, raw_name: str) -> int:
+        """ID остановки по любому написанию; новое название получает следующий свободный ID."""
+        stop_id = self.aliases.get(raw_name)
+        if stop_id is not None:
+            return stop_id
+        display = tidy_name(raw_name)
+        key = normalize_stop_name(display)
+        stop_id = self.keys.get(key)
+        if stop_id is None:
+            stop_id = max(self.names, default=0) + 1
+            self.keys[key] = stop_id
+            self.names[stop_id] = display
+            self.added.append(stop_id)
+        elif _capitals(display) < _capitals(self.names[stop_id]):
+            # "Могилевский лесхоз" предпочтительнее "Могилевский Лесхоз"; ID при этом не меняется
+            self.names[stop_id] = display
+        self.aliases[raw_name] = stop_id
+        self._dirty = True
+        return stop_id
+
+    def name(self, stop_id: int) -> str:
+        return self.names[stop_id]
+
+    def spellings(self) -> dict[int, list[str]]:
+        """{ID: все встреченные написания}."""
+        spellings: dict[int, list[str]] = {}
+        for alias, stop_id in self.aliases.items():
+            spellings.setdefault(stop_id, []).append(alias)
+        return spellings
+
+    def near_duplicates(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, ids=None) -> list[tuple[float, int, int]]:
+        """
+        Пары разных ID с похожими ключами (коэффициент Дайса по триграммам):
+        кандидаты в опечатки сайта ("Улица Мовчанского" / "Ул. Мовчанского").
+        ids - только пары, в которых есть один из этих ID.
+        """
+        ids = set(ids) if ids is not None else None
+        keys = sorted(self.keys.items(), key=lambda item: item[1])
+        grams = [(_trigrams(key), stop_id) for key, stop_id in keys]
+        pairs = []
+        for i, (grams_a, id_a) in enumerate(grams):
+            for grams_b, id_b in grams[i + 1:]:
+                score = 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+                if score >= threshold and (ids is None or id_a in ids or id_b in ids):
+                    pairs.append((score, id_a, id_b))
+        pairs.sort(reverse=True)
+        return pairs
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        data = {
+            "stops": [{"id": stop_id, "key": key, "name": self.names[stop_id]}
+                      for key, stop_id in sorted(self.keys.items(), key=lambda item: item[1])],
+            "aliases": dict(sorted(self.aliases.items())),
+        }
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except IOError as e:
+            logging.error(f"Ошибка при сохранении реестра остановок: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+@contextmanager
+def _file_lock(path: str | None):
+    """Исключительная блокировка реестра между процессами (flock на <path>.lock)."""
+    if not path:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def updating(path: str | None = REGISTRY_PATH, seed_path: str | None = SEED_PATH):
+    """
+    Реестр для изменения: читается с диска и сохраняется на выходе.
+    Автобусы и троллейбусы при старте конвертируются параллельно, а процесс
+    обновления работает рядом с ботом - изменения идут по очереди (потоки -
+    через _lock, процессы - через блокировку файла).
+    """
+    with _lock, _file_lock(path):
+        registry = StopRegistry(path, seed_path)
+        yield registry
+        registry.save()
+
+
+def normalize(vehicles, registry: StopRegistry):
+    """
+    Этап нормализации после разбора: каждой остановке - "stop_id" и каноническое
+    название из реестра. vehicles - список словарей транспорта (формат парсеров).
+    Возвращает список словарей (представления снапшота копируются).
+    """
+    normalized = []
+    for vehicle in vehicles:
+        vehicle = dict(vehicle)
+        for routes_key in ("route_weekdays", "route_weekends"):
+            routes = []
+            for route in vehicle.get(routes_key) or []:
+                route = dict(route)
+                stops = []
+                for stop in route.get("stops") or []:
+                    stop_id = registry.resolve(stop.get("name") or "")
+                    stops.append({"name": registry.name(stop_id), "stop_id": stop_id, "times": list(stop.get("times") or [])})
+                route["stops"] = stops
+                routes.append(route)
+            vehicle[routes_key] = routes
+        normalized.append(vehicle)
+    return normalized
+
+
+def log_near_duplicates(registry: StopRegistry, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+    """Предупреждения о новых остановках, похожих на уже известные (или друг на друга)."""
+    if not registry.added:
+        return
+    for score, id_a, id_b in registry.near_duplicates(threshold, registry.added):
+        logging.warning(f"Похожие названия остановок: «{registry.name(id_a)}» (#{id_a}) "
+                        f"и «{registry.name(id_b)}» (#{id_b}), сходство {score:.2f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Реестр остановок: написания и похожие названия")
+    arg_parser.add_argument("path", nargs="?", default=REGISTRY_PATH)
+    arg_parser.add_argument("--threshold", type=float, default=NEAR_DUPLICATE_THRESHOLD)
+    args = arg_parser.parse_args()
+
+    registry = StopRegistry(args.path)
+    spellings = registry.spellings()
+    variants = {stop_id: aliases for stop_id, aliases in spellings.items() if len(aliases) > 1}
+    print(f"Остановок: {len(registry)}, написаний: {len(registry.aliases)}, с несколькими написаниями: {len(variants)}")
+    for stop_id, aliases in sorted(variants.items()):
+        print(f"  #{stop_id} «{registry.name(stop_id)}»: " + " | ".join(sorted(aliases)))
+    pairs = registry.near_duplicates(args.threshold)
+    print(f"\nПохожие названия (сходство >= {args.threshold}): {len(pairs)}")
+    for score, id_a, id_b in pairs:
+        print(f"  {score:.2f}  #{id_a} «{registry.name(id_a)}»  ~  #{id_b} «{registry.name(id_b)}»")
+
+# --- END OF FILE stop_registry.py ---
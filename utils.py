@@ -2,8 +2,15 @@
 
 import parsers.trolleybus_parser
 import parsers.bus_parser
+import storage.favorites
+import storage.favorites_cache
+import storage.reminders
+import delivery.reminders
+from timetable import snapshot
+from timetable.schedule_cache import ScheduleCache
 
-import json
+import asyncio
+import logging
 import os
 import datetime
 from dotenv import load_dotenv
@@ -15,51 +22,100 @@ TROLLEYBUS_SCHEDULE_PATH = os.getenv("TROLLEYBUS_SCHEDULE_PATH") # Пути к 
 BUS_SCHEDULE_PATH = os.getenv("BUS_SCHEDULE_PATH")
 
 # --- Кэширование данных расписания ---
-_bus_schedule_cache = None
-_trolleybus_schedule_cache = None
+# Данные отдаются сразу; устаревшие (старше _cache_expiry_time) обновляются в фоне,
+# см. timetable/schedule_cache.py
 _cache_expiry_time = datetime.timedelta(days=7) # Время жизни кэша - 7 дней
-_bus_cache_timestamp = None
-_trolleybus_cache_timestamp = None
 
-def _is_cache_valid(timestamp):
-    """Проверяет, действителен ли кэш."""
-    if timestamp is None:
-        return False
-    return (datetime.datetime.now() - timestamp) < _cache_expiry_time
+# Подписчики на замену данных: listener(transport_type), transport_type - "bus" или "trolleybus"
+_reload_listeners = []
 
-def getBusSchedule(force_reload: bool = False):
-    """Возвращает данные расписания автобусов, используя кэш."""
-    global _bus_schedule_cache, _bus_cache_timestamp
-    now = datetime.datetime.now()
-    if force_reload or not _is_cache_valid(_bus_cache_timestamp) or _bus_schedule_cache is None:
-        print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Reloading bus schedule data...")
+def add_reload_listener(listener):
+    """Регистрирует функцию, которая вызывается после того, как в кэш подставлены новые данные."""
+    _reload_listeners.append(listener)
+
+def _notify_reload(transport_type: str):
+    for listener in _reload_listeners:
         try:
-            # Предполагаем, что парсеры возвращают данные или бросают исключение
-            _bus_schedule_cache = parsers.bus_parser.getBusesParallel()
-            _bus_cache_timestamp = now
-            print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Bus schedule data reloaded successfully.")
+            listener(transport_type)
         except Exception as e:
-            print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Error reloading bus schedule: {e}")
-            # Возвращаем старый кэш, если он есть, иначе пустой словарь
-            return _bus_schedule_cache if _bus_schedule_cache else {}
-    return _bus_schedule_cache
+            print(f"Error in reload listener {listener}: {e}")
 
-def getTrolleybusSchedule(force_reload: bool = False):
-    """Возвращает данные расписания троллейбусов, используя кэш."""
-    global _trolleybus_schedule_cache, _trolleybus_cache_timestamp
-    now = datetime.datetime.now()
-    if force_reload or not _is_cache_valid(_trolleybus_cache_timestamp) or _trolleybus_schedule_cache is None:
-        print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Reloading trolleybus schedule data...")
+# Прогрев после замены данных: функции, которые заранее строят индексы, чтобы первый запрос не ждал
+_warmups = []
+
+def add_warmup(warmup):
+    """Регистрирует функцию прогрева (вызывается вне event loop после загрузки и обновления данных)."""
+    _warmups.append(warmup)
+
+def run_warmups():
+    for warmup in _warmups:
         try:
-            # Предполагаем, что парсеры возвращают данные или бросают исключение
-            _trolleybus_schedule_cache = parsers.trolleybus_parser.getTrolleybusesParallel()
-            _trolleybus_cache_timestamp = now
-            print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Trolleybus schedule data reloaded successfully.")
+            warmup()
         except Exception as e:
-            print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Error reloading trolleybus schedule: {e}")
-             # Возвращаем старый кэш, если он есть, иначе пустой словарь
-            return _trolleybus_schedule_cache if _trolleybus_schedule_cache else {}
-    return _trolleybus_schedule_cache
+            print(f"Error in warmup {warmup}: {e}")
+
+def _same_data(old, new) -> bool:
+    """Обновление ничего не поменяло: тот же снапшот (по контрольной сумме)."""
+    version = getattr(new, "version", None)
+    return version is not None and version == getattr(old, "version", None)
+
+def _on_schedule_reload(transport_type: str, old, new):
+    if not _same_data(old, new):
+        _notify_reload(transport_type)
+
+_bus_schedule = ScheduleCache(
+    "bus", lambda refresh: parsers.bus_parser.getBusesParallel(refresh=refresh),
+    _cache_expiry_time, _on_schedule_reload, empty=lambda: snapshot.Snapshot.empty(snapshot.KIND_BUS)
+)
+_trolleybus_schedule = ScheduleCache(
+    "trolleybus", lambda refresh: parsers.trolleybus_parser.getTrolleybusesParallel(refresh=refresh),
+    _cache_expiry_time, _on_schedule_reload, empty=lambda: snapshot.Snapshot.empty(snapshot.KIND_TROLLEYBUS)
+)
+
+def getBusSchedule(force_reload: bool = False):
+    """
+    Возвращает данные расписания автобусов, используя кэш.
+    Не блокирует: устаревшие данные обновляются в фоне. Блокирующие только первая
+    загрузка и force_reload.
+    """
+    return _bus_schedule.get(force_reload)
+
+def getTrolleybusSchedule(force_reload: bool = False):
+    """Возвращает данные расписания троллейбусов, используя кэш (см. getBusSchedule)."""
+    return _trolleybus_schedule.get(force_reload)
+
+async def load_schedules():
+    """Первая загрузка обоих расписаний вне event loop (при старте бота)."""
+    loop = asyncio.get_running_loop()
+    for cache in (_bus_schedule, _trolleybus_schedule):
+        cache.bind_loop(loop)
+    await asyncio.gather(_bus_schedule.get_async(), _trolleybus_schedule.get_async())
+
+def schedule_status() -> dict:
+    """Состояние кэшей расписания: возраст, идёт ли обновление, длительность и ошибки обновлений."""
+    return {"bus": _bus_schedule.status(), "trolleybus": _trolleybus_schedule.status()}
+
+# --- Плановое обновление в отдельном процессе ---
+# REFRESH_WORKER=0 отключает планировщик: тогда устаревшие данные обновляются в потоке бота.
+# Окна, интервал и разброс - см. parsers/refresh_worker.py
+REFRESH_WORKER = os.getenv("REFRESH_WORKER", "1") != "0"
+
+def refresh_targets() -> dict:
+    """{transport_type: (ScheduleCache, open_snapshot)} - кэши и функции, открывающие записанный снапшот."""
+    return {
+        "bus": (_bus_schedule, parsers.bus_parser.loadScheduleFromFile),
+        "trolleybus": (_trolleybus_schedule, parsers.trolleybus_parser.loadScheduleFromFile),
+    }
+
+def start_refresh_scheduler():
+    """Запускает планировщик обновлений в текущем event loop. Возвращает задачу или None."""
+    if not REFRESH_WORKER:
+        return None
+    import parsers.refresh_worker
+    scheduler = parsers.refresh_worker.RefreshScheduler(refresh_targets(), on_adopted=run_warmups)
+    for cache in (_bus_schedule, _trolleybus_schedule):
+        cache.auto_refresh = False
+    return asyncio.create_task(scheduler.run(), name="schedule-refresh")
 
 def force_reload_all_schedules():
     """Принудительно перезагружает кэш обоих типов транспорта."""
@@ -69,48 +125,193 @@ def force_reload_all_schedules():
     print("All schedules reloaded.")
 
 
-# --- Работа с избранным (JSON) ---
+# --- Работа с избранным ---
+# Бэкенд выбирается переменной FAVORITES_BACKEND: "sqlite" (по умолчанию) или "json" (старый формат).
+# При первом запуске SQLite-хранилище переносит в себя существующий FAVORITES_PATH.
+# Поверх бэкенда работает кэш в памяти с фоновой записью (FAVORITES_CACHE=0 отключает).
+
+FAVORITES_BACKEND = os.getenv("FAVORITES_BACKEND", "sqlite")
+FAVORITES_DB_PATH = os.getenv("FAVORITES_DB_PATH") or os.path.splitext(FAVORITES_PATH)[0] + ".sqlite3"
+FAVORITES_CACHE = os.getenv("FAVORITES_CACHE", "1") != "0"
+
+_favorites_store = None
 
-def load_favorites(user_id: int) -> dict:
+def get_favorites_store():
+    """Возвращает хранилище избранного (создаётся при первом обращении)."""
+    global _favorites_store
+    if _favorites_store is None:
+        store = storage.favorites.create_store(FAVORITES_BACKEND, FAVORITES_PATH, FAVORITES_DB_PATH)
+        if FAVORITES_CACHE:
+            store = storage.favorites_cache.CachedFavoritesStore(store)
+        _favorites_store = store
+    return _favorites_store
+
+async def start_favorites():
+    """Открывает хранилище и загружает кэш вне event loop, затем запускает фоновую запись."""
+    store = await asyncio.to_thread(get_favorites_store)
+    if isinstance(store, storage.favorites_cache.CachedFavoritesStore):
+        await asyncio.to_thread(store.preload)
+        await store.start()
+
+async def close_favorites():
+    """Дописывает отложенные изменения и закрывает хранилище. Вызывать при остановке бота."""
+    global _favorites_store
+    store = _favorites_store
+    if store is None:
+        return
+    if isinstance(store, storage.favorites_cache.CachedFavoritesStore):
+        await store.close()
+    else:
+        store.close()
+    _favorites_store = None
+
+async def _favorites_call(method: str, *args):
+    """
+    Вызов хранилища избранного из хендлера. Кэш в памяти отвечает сразу; без
+    него (рабочие процессы supervisor.py) запрос к SQLite идёт в потоке, чтобы
+    ожидание блокировки другого процесса (busy_timeout) не останавливало event loop.
+    """
+    store = get_favorites_store()
+    if isinstance(store, storage.favorites_cache.CachedFavoritesStore):
+        return getattr(store, method)(*args)
+    return await asyncio.to_thread(getattr(store, method), *args)
+
+async def load_favorites(user_id: int) -> dict:
     """
     Загружает избранное для пользователя.
     Возвращает словарь вида {'buses': {}, 'trolleys': {}}
     """
-    user_id_str = str(user_id)
-    default_favs = {"buses": {}, "trolleys": {}}
-    if not os.path.exists(FAVORITES_PATH):
-        return default_favs
     try:
-        with open(FAVORITES_PATH, "r", encoding="utf-8") as f:
-            all_data = json.load(f)
-        # Возвращаем данные пользователя или структуру по умолчанию
-        return all_data.get(user_id_str, default_favs)
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"Error loading favorites file: {e}")
-        return default_favs # Возвращаем пустую структуру при ошибке
-
-def save_favorites(user_id: int, favs: dict):
+        return await _favorites_call("get", user_id)
+    except Exception as e:
+        print(f"Error loading favorites: {e}")
+        return storage.favorites.empty_favorites() # Возвращаем пустую структуру при ошибке
+
+async def is_favorite(user_id: int, section: str, key: str) -> bool:
+    """Проверяет одну запись избранного, не загружая весь список пользователя."""
+    try:
+        return await _favorites_call("contains", user_id, section, key)
+    except Exception as e:
+        print(f"Error checking favorite: {e}")
+        return False
+
+async def add_favorite(user_id: int, section: str, key: str, value: dict):
+    """Добавляет (или обновляет) одну запись избранного."""
+    await _favorites_call("put", user_id, section, key, value)
+
+async def remove_favorite(user_id: int, section: str, key: str) -> bool:
+    """Удаляет одну запись избранного. Возвращает False, если её не было."""
+    return await _favorites_call("delete", user_id, section, key)
+
+async def save_favorites(user_id: int, favs: dict):
+    """Полностью заменяет избранное пользователя."""
+    try:
+        await _favorites_call("replace", user_id, favs)
+    except Exception as e:
+        print(f"Error writing favorites: {e}")
+
+# --- Напоминания об отправлении ---
+# Хранилище - SQLite рядом с базой избранного (REMINDERS_DB_PATH), планировщик -
+# delivery/reminders.py. Планировщик запускается при старте диспетчера
+# (handlers/reminders.py); из рабочих процессов supervisor.py - только в одном.
+
+REMINDERS_DB_PATH = os.getenv("REMINDERS_DB_PATH") or os.path.join(os.path.dirname(FAVORITES_DB_PATH), "reminders.sqlite3")
+REMINDERS_PER_USER = int(os.getenv("REMINDERS_PER_USER", "10"))
+REMINDERS_SCHEDULER = True     # запускать ли планировщик в этом процессе
+REMINDERS_POLL_INTERVAL = 0.0  # > 0: дочитывать из базы напоминания, добавленные другими процессами
+
+_reminders_store = None
+_reminder_scheduler = None
+
+def get_reminders_store():
+    """Возвращает хранилище напоминаний (создаётся при первом обращении)."""
+    global _reminders_store
+    if _reminders_store is None:
+        _reminders_store = storage.reminders.SqliteReminderStore(REMINDERS_DB_PATH)
+    return _reminders_store
+
+async def start_reminders(bot, render):
+    """Открывает хранилище и, если планировщик работает в этом процессе, запускает его."""
+    global _reminder_scheduler
+    store = await asyncio.to_thread(get_reminders_store)
+    if REMINDERS_SCHEDULER and _reminder_scheduler is None:
+        scheduler = delivery.reminders.ReminderScheduler(bot, store, render, REMINDERS_POLL_INTERVAL)
+        await scheduler.start()
+        _reminder_scheduler = scheduler
+
+async def close_reminders():
+    """Останавливает планировщик (забранные напоминания дожидаются отправки) и закрывает хранилище."""
+    global _reminders_store, _reminder_scheduler
+    if _reminder_scheduler is not None:
+        await _reminder_scheduler.close()
+        _reminder_scheduler = None
+    if _reminders_store is not None:
+        _reminders_store.close()
+        _reminders_store = None
+
+# Запросы к базе - в потоке: они ждут транзакций планировщика (claim) и других процессов
+
+async def list_reminders(user_id: int) -> list:
+    return await asyncio.to_thread(get_reminders_store().for_user, user_id)
+
+async def add_reminder(reminder):
+    """Сохраняет напоминание и ставит его в планировщик. Возвращает напоминание с id."""
+    reminder = await asyncio.to_thread(get_reminders_store().add, reminder)
+    if _reminder_scheduler is not None:
+        _reminder_scheduler.add(reminder)
+    return reminder
+
+async def remove_reminder(user_id: int, reminder_id: int) -> bool:
+    """Удаляет напоминание пользователя. Возвращает False, если его не было."""
+    removed = await asyncio.to_thread(get_reminders_store().delete, user_id, reminder_id)
+    if removed and _reminder_scheduler is not None:
+        _reminder_scheduler.cancel(reminder_id)
+    return removed
+
+def reminder_stats() -> dict | None:
+    """Метрики планировщика напоминаний (None - в этом процессе он не работает)."""
+    return _reminder_scheduler.stats() if _reminder_scheduler is not None else None
+
+# --- Запуск бота ---
+
+async def _load_schedules_logged():
+    logging.info("Initializing schedule data...")
+    try:
+        # Загрузка вне event loop; дальше устаревшие данные обновляются в фоне
+        await load_schedules()
+        logging.info("Schedule data initialized successfully.")
+    except Exception as e:
+        logging.error(f"Failed to initialize schedule data on startup: {e}", exc_info=True)
+
+async def startup(*pending):
     """
-    Сохраняет избранное для пользователя.
-    ОПАСНОСТЬ: Не потокобезопасно для JSON! Используйте с осторожностью.
+    Подготовка к приёму апдейтов. Оба снапшота расписания, хранилище избранного и
+    переданные корутины (bot.delete_webhook) выполняются одновременно. Прогрев
+    индексов поиска и планировщика идёт в фоне, уже после начала опроса: запрос,
+    пришедший раньше, построит нужный индекс сам. Возвращает задачу прогрева.
     """
-    user_id_str = str(user_id)
-    all_data = {}
-    if os.path.exists(FAVORITES_PATH):
-        try:
-            with open(FAVORITES_PATH, "r", encoding="utf-8") as f:
-                all_data = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error reading favorites file before saving: {e}")
-            # В случае ошибки чтения, пытаемся сохранить только данные текущего пользователя,
-            # но это может привести к потере данных других пользователей!
-            all_data = {} # Перезаписываем все
-
-    all_data[user_id_str] = favs
-    try:
-        with open(FAVORITES_PATH, "w", encoding="utf-8") as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
-    except IOError as e:
-        print(f"Error writing favorites file: {e}")
+    await asyncio.gather(_load_schedules_logged(), start_favorites(), *pending)
+    return asyncio.create_task(asyncio.to_thread(run_warmups), name="warmups")
+
+# --- Несколько рабочих процессов (supervisor.py) ---
+
+def schedule_versions() -> dict:
+    """Контрольные суммы текущих снапшотов: {"bus": ..., "trolleybus": ...} (None - данных нет)."""
+    return {transport_type: getattr(cache.data, "version", None) for transport_type, (cache, _) in refresh_targets().items()}
+
+def use_shared_storage():
+    """
+    Режим рабочего процесса (см. supervisor.py). Расписания обновляет только
+    супервизор - сам процесс их не перезагружает. Избранное читается и пишется
+    прямо в SQLite: кэш в памяти у каждого процесса свой и разошёлся бы с остальными.
+    Напоминания, добавленные другими процессами, планировщик дочитывает из базы.
+    """
+    global FAVORITES_CACHE, REMINDERS_POLL_INTERVAL
+    if FAVORITES_BACKEND != "sqlite":
+        raise ValueError("Несколько рабочих процессов поддерживаются только с FAVORITES_BACKEND=sqlite")
+    FAVORITES_CACHE = False
+    REMINDERS_POLL_INTERVAL = 5.0
+    for cache in (_bus_schedule, _trolleybus_schedule):
+        cache.auto_refresh = False
 
 # --- END OF FILE utils.py ---
\ No newline at end of file
@@ -0,0 +1,206 @@
+# --- START OF FILE webhook.py ---
+
+"""
+Приём апдейтов через вебхук (BOT_MODE=webhook) вместо long polling.
+
+aiohttp-сервер слушает WEBHOOK_HOST:WEBHOOK_PORT по пути WEBHOOK_PATH; Telegram
+(или reverse proxy перед ботом) шлёт апдейты на публичный WEBHOOK_URL + путь,
+который регистрируется через setWebhook при старте. Апдейты обрабатываются
+параллельно, но не больше WEBHOOK_MAX_IN_FLIGHT одновременно: при заполнении
+ответ Telegram задерживается, и он сам сбавляет темп. При остановке (SIGTERM)
+новые апдейты получают 503 (Telegram повторит их), начатые дорабатываются не
+дольше WEBHOOK_DRAIN_TIMEOUT секунд.
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import socket
+import time
+from collections import deque
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, ip_filter_middleware, setup_application
+from aiogram.webhook.security import IPFilter
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")     # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or 8080)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")           # сверяется с X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "64"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # параметр setWebhook
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "20"))
+# Пропускать только адреса Telegram (за прокси - по X-Forwarded-For)
+WEBHOOK_CHECK_IP = os.getenv("WEBHOOK_CHECK_IP", "0") == "1"
+HEALTH_PATH = "/healthz"
+
+
+def _percentile_ms(ordered: list[float], share: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] * 1000 if ordered else 0.0
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    SimpleRequestHandler с ограничением числа одновременно обрабатываемых апдейтов
+    и остановкой с дообработкой. Отвечает 200 сразу после постановки апдейта в
+    обработку; сессию бота при закрытии не трогает - её закрывает main.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+                 drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT, secret_token: str | None = None, **data):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.max_in_flight = max_in_flight
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.accepting = True
+        # Метрики
+        self.handled = 0
+        self.failed = 0
+        self.rejected = 0
+        self._latencies = deque(maxlen=10000)  # от получения запроса до конца обработки, с
+
+    async def handle(self, request: web.Request) -> web.Response:
+        received = time.perf_counter()
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.bot):
+            return web.Response(body="Unauthorized", status=401)
+        if not self.accepting:
+            self.rejected += 1
+            return web.Response(status=503)
+        update = await request.json(loads=self.bot.session.json_loads)
+        await self._slots.acquire()
+        if not self.accepting:
+            # Остановка началась, пока ждали места: Telegram доставит апдейт повторно
+            self._slots.release()
+            self.rejected += 1
+            return web.Response(status=503)
+        task = asyncio.create_task(self._process(update, received))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=self.bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def _process(self, update: dict, received: float):
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=self.bot, update=update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Error processing webhook update {update.get('update_id')}: {e}", exc_info=True)
+        else:
+            self.handled += 1
+        finally:
+            self._slots.release()
+            self._latencies.append(time.perf_counter() - received)
+
+    def in_flight(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    def stats(self) -> dict:
+        ordered = sorted(self._latencies)
+        return {
+            "pid": os.getpid(),
+            "accepting": self.accepting,
+            "in_flight": self.in_flight(),
+            "handled": self.handled,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "latency_p50_ms": _percentile_ms(ordered, 0.5),
+            "latency_p99_ms": _percentile_ms(ordered, 0.99),
+        }
+
+    async def close(self):
+        """Перестаёт принимать апдейты и ждёт начатые (не дольше drain_timeout), остальные отменяет."""
+        self.accepting = False
+        pending = set(self._background_feed_update_tasks)
+        if pending:
+            logging.info(f"Draining {len(pending)} webhook updates...")
+            _, pending = await asyncio.wait(pending, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.warning(f"Cancelled {len(pending)} webhook updates after {self.drain_timeout}s")
+            await asyncio.gather(*pending, return_exceptions=True)
+        logging.info(f"Webhook handler stopped: {self.stats()}")
+
+
+def build_app(dispatcher: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH, max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+              secret_token: str = WEBHOOK_SECRET, check_ip: bool = WEBHOOK_CHECK_IP) -> tuple[web.Application, BoundedRequestHandler]:
+    """aiohttp-приложение с обработчиком вебхука на path и проверкой живости на HEALTH_PATH."""
+    app = web.Application(middlewares=[ip_filter_middleware(IPFilter.default())] if check_ip else [])
+    handler = BoundedRequestHandler(dispatcher, bot, max_in_flight=max_in_flight, secret_token=secret_token or None)
+    handler.register(app, path=path)
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(handler.stats(), status=200 if handler.accepting else 503)
+
+    app.router.add_get(HEALTH_PATH, health)
+    # startup/shutdown диспетчера - как при start_polling; shutdown идёт после дообработки апдейтов
+    setup_application(app, dispatcher, bot=bot)
+    return app, handler
+
+
+async def start(dispatcher: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                sock: socket.socket | None = None, **app_options) -> tuple[web.AppRunner, BoundedRequestHandler, int]:
+    """
+    Запускает сервер на host:port или на уже открытом сокете sock (общем для
+    рабочих процессов супервизора). Возвращает runner (остановка - runner.cleanup()),
+    обработчик и порт.
+    """
+    app, handler = build_app(dispatcher, bot, **app_options)
+    runner = web.AppRunner(app, access_log=None, shutdown_timeout=handler.drain_timeout)
+    await runner.setup()
+    site = web.SockSite(runner, sock) if sock is not None else web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, handler, port
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher, url: str = WEBHOOK_URL, path: str = WEBHOOK_PATH,
+                      secret_token: str = WEBHOOK_SECRET):
+    """Регистрирует публичный адрес вебхука; как и при опросе, накопившиеся апдейты сбрасываются."""
+    await bot.set_webhook(
+        url + path,
+        secret_token=secret_token or None,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        drop_pending_updates=True,
+    )
+    logging.info(f"Webhook set to {url}{path}")
+
+
+def stop_on_signals() -> asyncio.Event:
+    """Событие, которое выставляется по SIGINT/SIGTERM (обработчики ставятся в текущем event loop)."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+def check_config():
+    if not WEBHOOK_URL:
+        raise ValueError("Для BOT_MODE=webhook нужна переменная окружения WEBHOOK_URL")
+
+
+async def serve(dispatcher: Dispatcher, bot: Bot):
+    """Работает до SIGINT/SIGTERM, затем останавливается с дообработкой начатых апдейтов."""
+    check_config()
+    runner, handler, port = await start(dispatcher, bot)
+    logging.info(f"Webhook server listening on {WEBHOOK_HOST}:{port}{WEBHOOK_PATH}")
+    stop = stop_on_signals()
+    try:
+        await set_webhook(bot, dispatcher)
+        await stop.wait()
+        logging.info("Stopping webhook server...")
+    finally:
+        await runner.cleanup()
+
+# --- END OF FILE webhook.py ---